@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class LotteryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'lottery'
+    
+    def ready(self):
+        import lottery.signals  # Импорт сигналов при загрузке приложения
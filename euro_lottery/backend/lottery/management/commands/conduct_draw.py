@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
 from lottery.models import Draw
+from lottery.utils.draw_execution import conduct_draw_exclusively
 import logging
 import traceback
 import sys
@@ -62,8 +63,13 @@ class Command(BaseCommand):
                     f"DRY RUN: Would conduct draw #{draw.draw_number} for {draw.lottery_game.name}"
                 ))
             else:
-                # Conduct the draw
-                draw.conduct_draw()
+                # Conduct the draw under its execution lease
+                draw = conduct_draw_exclusively(draw.id)
+                if draw is None:
+                    self.stdout.write(self.style.WARNING(
+                        f"Draw ID {draw_id} is being conducted by another worker or is no longer scheduled"
+                    ))
+                    return
                 self.stdout.write(self.style.SUCCESS(
                     f"Successfully conducted draw #{draw.draw_number} for {draw.lottery_game.name}"
                 ))
@@ -94,8 +100,12 @@ class Command(BaseCommand):
                 ))
             else:
                 try:
-                    # Conduct the draw
-                    draw.conduct_draw()
+                    # Conduct the draw under its execution lease
+                    conducted = conduct_draw_exclusively(draw.id)
+                    if conducted is None:
+                        self.stdout.write(f"Draw #{draw.draw_number} is already handled by another worker")
+                        continue
+                    draw = conducted
                     self.stdout.write(self.style.SUCCESS(
                         f"Successfully conducted draw #{draw.draw_number} for {draw.lottery_game.name}"
                     ))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from lottery.models import LotteryGame
+from lottery.utils.wheeling import MAX_DESIGN_POINTS, store_covering_design
+
+
+class Command(BaseCommand):
+    help = 'Precomputes the covering designs used by abbreviated wheels of active games'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lottery-id', type=int, help='ID of a specific lottery game')
+        parser.add_argument(
+            '--max-numbers', type=int, default=MAX_DESIGN_POINTS,
+            help=f'Largest pool of main numbers to precompute (at most {MAX_DESIGN_POINTS})'
+        )
+
+    def handle(self, *args, **options):
+        lottery_id = options.get('lottery_id')
+        max_numbers = options['max_numbers']
+        if max_numbers > MAX_DESIGN_POINTS:
+            raise CommandError(f"--max-numbers must be at most {MAX_DESIGN_POINTS}")
+
+        games = LotteryGame.objects.filter(is_active=True)
+        if lottery_id:
+            games = LotteryGame.objects.filter(id=lottery_id)
+            if not games.exists():
+                raise CommandError(f"Lottery game with ID {lottery_id} does not exist")
+
+        block_sizes = set(games.values_list('main_numbers_count', flat=True))
+        for k in sorted(block_sizes):
+            for v in range(k + 1, max_numbers + 1):
+                # A guarantee of k is the full wheel and needs no design
+                for t in range(1, k):
+                    blocks, built = store_covering_design(v, k, t)
+                    if built:
+                        self.stdout.write(f"C({v}, {k}, {t}): {len(blocks)} lines")
+
+        self.stdout.write(self.style.SUCCESS('Wheel designs precomputed successfully'))
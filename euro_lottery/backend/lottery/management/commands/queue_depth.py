@@ -0,0 +1,68 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from lottery_core.celery import app
+
+
+def get_queue_depths(queues):
+    """Число сообщений в каждой очереди брокера"""
+    depths = {}
+    with app.connection_for_read() as conn:
+        for name in queues:
+            channel = conn.channel()
+            try:
+                _, messages, _ = channel.queue_declare(queue=name, passive=True)
+            except conn.channel_errors:
+                # Очередь еще не объявлена: в нее ничего не отправляли
+                messages = 0
+            finally:
+                channel.close()
+            depths[name] = messages
+    return depths
+
+
+def get_queue_consumers(queues, timeout=1.0):
+    """
+    Число воркеров, слушающих каждую очередь.
+
+    Redis-брокер не ведет учет потребителей (queue_declare всегда отдает 0),
+    поэтому воркеров опрашиваем через active_queues().
+    """
+    consumers = dict.fromkeys(queues, 0)
+    replies = app.control.inspect(timeout=timeout).active_queues() or {}
+    for worker_queues in replies.values():
+        for queue in worker_queues:
+            if queue['name'] in consumers:
+                consumers[queue['name']] += 1
+    return consumers
+
+
+class Command(BaseCommand):
+    help = 'Reports the number of waiting messages in each Celery queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queue', action='append', dest='queues',
+                            help='Queue to report (repeatable, default: all configured queues)')
+        parser.add_argument('--fail-above', type=int,
+                            help='Exit with an error if any queue holds more messages than this')
+        parser.add_argument('--inspect-timeout', type=float, default=1.0,
+                            help='Seconds to wait for workers to report the queues they consume')
+
+    def handle(self, *args, **options):
+        concurrency = getattr(settings, 'CELERY_QUEUE_CONCURRENCY', {})
+        queues = options.get('queues') or list(concurrency)
+        unknown = [name for name in queues if name not in concurrency]
+        if unknown:
+            raise CommandError(f"Unknown queue(s): {', '.join(unknown)}")
+
+        depths = get_queue_depths(queues)
+        consumers = get_queue_consumers(queues, timeout=options.get('inspect_timeout', 1.0))
+
+        self.stdout.write(f"{'queue':<15}{'messages':>10}{'consumers':>11}{'concurrency':>13}")
+        for name in queues:
+            self.stdout.write(f"{name:<15}{depths[name]:>10}{consumers[name]:>11}{concurrency[name]:>13}")
+
+        limit = options.get('fail_above')
+        if limit is not None:
+            backlogged = [name for name in queues if depths[name] > limit]
+            if backlogged:
+                raise CommandError(f"Queue(s) above {limit} messages: {', '.join(backlogged)}")
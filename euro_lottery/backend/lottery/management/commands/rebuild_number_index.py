@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from lottery.models import LotteryGame
+from lottery.utils.number_index import rebuild_number_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the inverted number index used by historical combination search'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lottery-id', type=int, help='ID of a specific lottery game to rebuild')
+
+    def handle(self, *args, **options):
+        lottery_id = options.get('lottery_id')
+
+        games = LotteryGame.objects.all()
+        if lottery_id:
+            games = games.filter(id=lottery_id)
+            if not games.exists():
+                raise CommandError(f"Lottery game with ID {lottery_id} does not exist")
+
+        for game in games:
+            index = rebuild_number_index(game)
+            self.stdout.write(f"{game.name}: {index.size} draws indexed")
+
+        self.stdout.write(self.style.SUCCESS('Number index rebuilt successfully'))
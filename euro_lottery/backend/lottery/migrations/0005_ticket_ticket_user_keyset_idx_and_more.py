@@ -0,0 +1,24 @@
+# Generated by Django 4.2.9 on 2026-10-19 05:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("lottery", "0004_winningticket_extra_numbers_matched_and_more"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="ticket",
+            index=models.Index(
+                fields=["user", "-purchase_date", "-id"], name="ticket_user_keyset_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="winningticket",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="winning_keyset_idx"
+            ),
+        ),
+    ]
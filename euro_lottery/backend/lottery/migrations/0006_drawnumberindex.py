@@ -0,0 +1,60 @@
+# Generated by Django 4.2.9 on 2026-10-19 05:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("lottery", "0005_ticket_ticket_user_keyset_idx_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DrawNumberIndex",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "draw_ids",
+                    models.JSONField(
+                        default=list, help_text="Draw IDs in ordinal order"
+                    ),
+                ),
+                (
+                    "main_bitmaps",
+                    models.JSONField(
+                        default=dict,
+                        help_text="Number -> compressed bitmap of draw ordinals",
+                    ),
+                ),
+                (
+                    "extra_bitmaps",
+                    models.JSONField(
+                        default=dict,
+                        help_text="Number -> compressed bitmap of draw ordinals",
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "lottery_game",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="number_index",
+                        to="lottery.lotterygame",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Draw Number Index",
+                "verbose_name_plural": "Draw Number Indexes",
+            },
+        ),
+    ]
@@ -0,0 +1,102 @@
+# Generated by Django 4.2.9 on 2026-10-19 05:27
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("lottery", "0006_drawnumberindex"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PurchaseOrder",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "order_id",
+                    models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+                ),
+                (
+                    "tickets",
+                    models.JSONField(
+                        help_text="Ticket combinations: [{main_numbers, extra_numbers, is_quick_pick}]"
+                    ),
+                ),
+                ("ticket_count", models.IntegerField()),
+                ("ticket_price", models.DecimalField(decimal_places=2, max_digits=6)),
+                ("total_amount", models.DecimalField(decimal_places=2, max_digits=12)),
+                (
+                    "balance_before",
+                    models.DecimalField(decimal_places=2, max_digits=12),
+                ),
+                ("balance_after", models.DecimalField(decimal_places=2, max_digits=12)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("queued", "Queued"),
+                            ("processing", "Processing"),
+                            ("completed", "Completed"),
+                            ("failed", "Failed"),
+                        ],
+                        default="queued",
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "ticket_ids",
+                    models.JSONField(
+                        blank=True,
+                        default=list,
+                        help_text="UUIDs of the issued tickets",
+                    ),
+                ),
+                ("error_message", models.TextField(blank=True, null=True)),
+                ("ip_address", models.GenericIPAddressField(blank=True, null=True)),
+                ("user_agent", models.TextField(blank=True, null=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("processed_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "draw",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="purchase_orders",
+                        to="lottery.draw",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="purchase_orders",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Purchase Order",
+                "verbose_name_plural": "Purchase Orders",
+                "indexes": [
+                    models.Index(
+                        fields=["status", "draw"], name="lottery_pur_status_867b25_idx"
+                    ),
+                    models.Index(
+                        fields=["user", "draw"], name="lottery_pur_user_id_5151db_idx"
+                    ),
+                ],
+            },
+        ),
+    ]
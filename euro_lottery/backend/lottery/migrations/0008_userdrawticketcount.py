@@ -0,0 +1,80 @@
+# Generated by Django 4.2.9 on 2026-10-19 05:42
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_counts(apps, schema_editor):
+    """Seed the counters from issued tickets and still queued orders"""
+    Ticket = apps.get_model("lottery", "Ticket")
+    PurchaseOrder = apps.get_model("lottery", "PurchaseOrder")
+    UserDrawTicketCount = apps.get_model("lottery", "UserDrawTicketCount")
+
+    counts = {}
+    issued = Ticket.objects.values("user_id", "draw_id").annotate(total=models.Count("id"))
+    for row in issued:
+        counts[(row["user_id"], row["draw_id"])] = row["total"]
+    queued = (
+        PurchaseOrder.objects.filter(status__in=("queued", "processing"))
+        .values("user_id", "draw_id")
+        .annotate(total=models.Sum("ticket_count"))
+    )
+    for row in queued:
+        key = (row["user_id"], row["draw_id"])
+        counts[key] = counts.get(key, 0) + row["total"]
+
+    UserDrawTicketCount.objects.bulk_create(
+        [
+            UserDrawTicketCount(user_id=user_id, draw_id=draw_id, count=total)
+            for (user_id, draw_id), total in counts.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("lottery", "0007_purchaseorder"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserDrawTicketCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("count", models.PositiveIntegerField(default=0)),
+                (
+                    "draw",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="user_ticket_counts",
+                        to="lottery.draw",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="draw_ticket_counts",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "User Draw Ticket Count",
+                "verbose_name_plural": "User Draw Ticket Counts",
+                "unique_together": {("user", "draw")},
+            },
+        ),
+        migrations.RunPython(backfill_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.9 on 2026-10-19 05:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("lottery", "0008_userdrawticketcount"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WheelDesign",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("points", models.PositiveSmallIntegerField()),
+                ("block_size", models.PositiveSmallIntegerField()),
+                ("guarantee", models.PositiveSmallIntegerField()),
+                (
+                    "blocks",
+                    models.JSONField(
+                        help_text="List of blocks, each a sorted list of point indexes"
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "verbose_name": "Wheel Design",
+                "verbose_name_plural": "Wheel Designs",
+                "unique_together": {("points", "block_size", "guarantee")},
+            },
+        ),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 4.2.9 on 2026-10-19 05:49
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("lottery", "0009_wheeldesign"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Subscription",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "subscription_id",
+                    models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+                ),
+                (
+                    "lines",
+                    models.JSONField(
+                        help_text="Ticket combinations: [{main_numbers, extra_numbers}]"
+                    ),
+                ),
+                (
+                    "draws_total",
+                    models.PositiveIntegerField(
+                        blank=True, help_text="Empty means every draw", null=True
+                    ),
+                ),
+                ("draws_played", models.PositiveIntegerField(default=0)),
+                ("last_draw_number", models.IntegerField(default=0)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("active", "Active"),
+                            ("suspended", "Suspended"),
+                            ("completed", "Completed"),
+                            ("cancelled", "Cancelled"),
+                        ],
+                        default="active",
+                        max_length=20,
+                    ),
+                ),
+                ("consecutive_failures", models.PositiveSmallIntegerField(default=0)),
+                ("last_failure_reason", models.CharField(blank=True, max_length=255)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "lottery_game",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="subscriptions",
+                        to="lottery.lotterygame",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="subscriptions",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Subscription",
+                "verbose_name_plural": "Subscriptions",
+                "ordering": ["-created_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["lottery_game", "status", "last_draw_number"],
+                        name="lottery_sub_lottery_59d4f8_idx",
+                    ),
+                    models.Index(
+                        fields=["user", "status"], name="lottery_sub_user_id_52dc06_idx"
+                    ),
+                ],
+            },
+        ),
+    ]
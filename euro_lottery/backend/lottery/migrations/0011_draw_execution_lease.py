@@ -0,0 +1,31 @@
+# Generated by Django 4.2.9 on 2026-10-19 05:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("lottery", "0010_subscription"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="draw",
+            name="execution_lease_expires_at",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="When the execution lease can be taken over",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="draw",
+            name="execution_lease_owner",
+            field=models.CharField(
+                blank=True,
+                default="",
+                help_text="Worker currently conducting the draw",
+                max_length=100,
+            ),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.9 on 2026-10-19 07:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("lottery", "0011_draw_execution_lease"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="purchaseorder",
+            name="lease_expires_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="purchaseorder",
+            name="lease_owner",
+            field=models.CharField(blank=True, default="", max_length=100),
+        ),
+    ]
@@ -109,49 +109,14 @@ class LotteryGame(models.Model):
     
     def get_next_draw_date(self):
         """
-        Calculate the next draw date based on the current time and draw_days
+        Calculate the next draw date from the game's draw calendar
         """
-        from datetime import datetime, timedelta
-        import calendar
+        from lottery.utils.draw_calendar import get_draw_calendar
         
-        # Parse draw days from string
-        days_str_to_int = {
-            'monday': 0, 'tuesday': 1, 'wednesday': 2, 'thursday': 3,
-            'friday': 4, 'saturday': 5, 'sunday': 6
-        }
-        
-        draw_days_list = [days_str_to_int.get(day.strip().lower(), 0) 
-                          for day in self.draw_days.split(',')]
-        
-        # Get current date and time
-        now = timezone.now()
-        
-        # Convert string time to time object if needed
-        if isinstance(self.draw_time, str):
-            draw_time_obj = datetime.strptime(self.draw_time, '%H:%M:%S').time()
-        else:
-            draw_time_obj = self.draw_time or datetime.strptime('20:00', '%H:%M').time()
-        
-        draw_time = timezone.datetime.combine(now.date(), draw_time_obj)
-        draw_time = timezone.make_aware(draw_time)
-        
-        # If today is a draw day but the draw time has passed, start from tomorrow
-        if now.weekday() in draw_days_list and now > draw_time:
-            start_date = now.date() + timedelta(days=1)
-        else:
-            start_date = now.date()
-        
-        # Find the next draw day
-        for i in range(7):  # Check next 7 days
-            check_date = start_date + timedelta(days=i)
-            if check_date.weekday() in draw_days_list:
-                next_draw = timezone.datetime.combine(check_date, draw_time_obj)
-                next_draw = timezone.make_aware(next_draw)
-                return next_draw
-        
-        # If no draw day found (shouldn't happen if draw_days is valid)
-        logger.error(f"No valid draw day found for lottery {self.name}")
-        return None
+        next_draw = get_draw_calendar(self).next_after(timezone.now())
+        if next_draw is None:
+            logger.error(f"No valid draw day found for lottery {self.name}")
+        return next_draw
         
     def create_next_draw(self) -> Optional['Draw']:
         """
@@ -244,6 +209,8 @@ class Draw(models.Model):
     public_verification_url = models.URLField(blank=True, null=True, help_text="URL for public verification of results")
     is_test = models.BooleanField(default=False, help_text="Indicates if this is a test draw")
     winning_tickets_processed = models.BooleanField(default=False, help_text="Indicates if winning tickets have been processed")
+    execution_lease_owner = models.CharField(max_length=100, blank=True, default='', help_text="Worker currently conducting the draw")
+    execution_lease_expires_at = models.DateTimeField(blank=True, null=True, help_text="When the execution lease can be taken over")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -272,9 +239,16 @@ class Draw(models.Model):
     def is_completed(self):
         return self.status == 'completed'
     
+    @property
+    def sales_close_at(self):
+        """Moment ticket sales stop: DRAW_BUFFER_TIME minutes before the draw"""
+        from datetime import timedelta
+        buffer_minutes = settings.LOTTERY_SETTINGS.get('DRAW_BUFFER_TIME', 0)
+        return self.draw_date - timedelta(minutes=buffer_minutes)
+    
     @property
     def is_open_for_tickets(self):
-        return self.status == 'scheduled' and self.draw_date > timezone.now()
+        return self.status == 'scheduled' and self.sales_close_at > timezone.now()
     
     def __str__(self):
         return f"{self.lottery_game.name} - Draw #{self.draw_number}"
@@ -651,6 +625,8 @@ class Ticket(models.Model):
             models.Index(fields=['result_status']),
             models.Index(fields=['purchase_date']),
             models.Index(fields=['user', 'draw']),
+            # Backs keyset pagination of a user's ticket history
+            models.Index(fields=['user', '-purchase_date', '-id'], name='ticket_user_keyset_idx'),
         ]
     
     def __str__(self):
@@ -659,11 +635,12 @@ class Ticket(models.Model):
     def save(self, *args, **kwargs):
         # No need to generate ticket_id manually as it's now a UUIDField with default value
         
+        adding = self._state.adding
         super().save(*args, **kwargs)
         
-        # Update ticket count on the draw
-        self.draw.ticket_count = Ticket.objects.filter(draw=self.draw).count()
-        self.draw.save()
+        # Update ticket count on the draw without rewriting (and re-signalling) the whole row
+        if adding:
+            Draw.objects.filter(pk=self.draw_id).update(ticket_count=F('ticket_count') + 1)
 
 
 class DrawResult(models.Model):
@@ -706,6 +683,9 @@ class WinningTicket(models.Model):
         ('cancelled', 'Cancelled'),
         ('on_hold', 'On Hold'),  # For manual verification of large prizes
     )
+
+    # Large prizes often require manual verification; configure based on your business rules
+    MANUAL_VERIFICATION_THRESHOLD = Decimal('1000.00')
     
     ticket = models.OneToOneField(Ticket, on_delete=models.CASCADE, related_name='winning_info')
     prize_category = models.ForeignKey(PrizeCategory, on_delete=models.CASCADE)
@@ -736,6 +716,7 @@ class WinningTicket(models.Model):
             models.Index(fields=['payment_status']),
             models.Index(fields=['created_at']),
             models.Index(fields=['payment_date']),
+            models.Index(fields=['-created_at', '-id'], name='winning_keyset_idx'),
         ]
     
     def __str__(self):
@@ -744,9 +725,7 @@ class WinningTicket(models.Model):
     @property
     def requires_manual_verification(self) -> bool:
         """Check if this winning requires manual verification"""
-        # Large prizes often require manual verification
-        threshold = Decimal('1000.00')  # Configure based on your business rules
-        return self.amount >= threshold
+        return self.amount >= self.MANUAL_VERIFICATION_THRESHOLD
     
     def pay_prize(self):
         """Mark the winning ticket as paid and update related records"""
@@ -804,4 +783,164 @@ class WinningTicket(models.Model):
             'status': 'completed',
             'amount': float(self.amount),
             'user_id': self.ticket.user.id,
-        }
\ No newline at end of file
+        }
+
+class DrawNumberIndex(models.Model):
+    """
+    Inverted index from drawn numbers to the completed draws of a game.
+
+    Every completed draw gets an ordinal (its position in ``draw_ids``); for
+    each number the index stores a bitmap with the ordinals of the draws it
+    came up in. Historical combination searches become bitmap intersections
+    instead of a scan over every draw's JSON. See lottery.utils.number_index.
+    """
+    lottery_game = models.OneToOneField(LotteryGame, on_delete=models.CASCADE, related_name='number_index')
+    draw_ids = models.JSONField(default=list, help_text="Draw IDs in ordinal order")
+    main_bitmaps = models.JSONField(default=dict, help_text="Number -> compressed bitmap of draw ordinals")
+    extra_bitmaps = models.JSONField(default=dict, help_text="Number -> compressed bitmap of draw ordinals")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = "Draw Number Index"
+        verbose_name_plural = "Draw Number Indexes"
+    
+    def __str__(self):
+        return f"{self.lottery_game.name} - {len(self.draw_ids)} draws indexed"
+
+
+class PurchaseOrder(models.Model):
+    """
+    Queued ticket purchase for the asynchronous (write-behind) purchase mode.
+
+    Funds are reserved when the order is accepted; the purchase queue worker
+    later issues the tickets and the purchase transaction in per-draw batches.
+    The table doubles as the durable queue: the broker message only signals
+    that a draw has work waiting.
+    """
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('processing', 'Processing'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    )
+    
+    order_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='purchase_orders')
+    draw = models.ForeignKey(Draw, on_delete=models.CASCADE, related_name='purchase_orders')
+    tickets = models.JSONField(help_text="Ticket combinations: [{main_numbers, extra_numbers, is_quick_pick}]")
+    ticket_count = models.IntegerField()
+    ticket_price = models.DecimalField(max_digits=6, decimal_places=2)
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    balance_before = models.DecimalField(max_digits=12, decimal_places=2)
+    balance_after = models.DecimalField(max_digits=12, decimal_places=2)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    ticket_ids = models.JSONField(default=list, blank=True, help_text="UUIDs of the issued tickets")
+    error_message = models.TextField(blank=True, null=True)
+    ip_address = models.GenericIPAddressField(null=True, blank=True)
+    user_agent = models.TextField(null=True, blank=True)
+    # Аренда заказа воркером очереди: заказ умершего воркера перехватывается (lottery_core.leases)
+    lease_owner = models.CharField(max_length=100, blank=True, default='')
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = "Purchase Order"
+        verbose_name_plural = "Purchase Orders"
+        indexes = [
+            models.Index(fields=['status', 'draw']),
+            models.Index(fields=['user', 'draw']),
+        ]
+    
+    def __str__(self):
+        return f"Order {self.order_id} - {self.ticket_count} ticket(s) - {self.status}"
+
+
+class UserDrawTicketCount(models.Model):
+    """
+    Number of tickets a user has bought (or has queued) for a draw.
+
+    Maintained by the purchase path with a conditional UPDATE so that
+    MAX_TICKETS_PER_USER is enforced on a single row instead of counting
+    the user's tickets on every purchase.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='draw_ticket_counts')
+    draw = models.ForeignKey(Draw, on_delete=models.CASCADE, related_name='user_ticket_counts')
+    count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        verbose_name = "User Draw Ticket Count"
+        verbose_name_plural = "User Draw Ticket Counts"
+        unique_together = ('user', 'draw')
+    
+    def __str__(self):
+        return f"{self.user} - Draw #{self.draw_id}: {self.count}"
+
+
+class WheelDesign(models.Model):
+    """
+    Precomputed covering design C(points, block_size, guarantee) for
+    abbreviated wheels: blocks of point indexes 0..points-1 such that every
+    ``guarantee``-subset of the points lies in at least one block.
+    """
+    points = models.PositiveSmallIntegerField()
+    block_size = models.PositiveSmallIntegerField()
+    guarantee = models.PositiveSmallIntegerField()
+    blocks = models.JSONField(help_text="List of blocks, each a sorted list of point indexes")
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = "Wheel Design"
+        verbose_name_plural = "Wheel Designs"
+        unique_together = ('points', 'block_size', 'guarantee')
+    
+    def __str__(self):
+        return f"C({self.points}, {self.block_size}, {self.guarantee}) - {len(self.blocks)} blocks"
+
+
+class Subscription(models.Model):
+    """
+    Standing order to play the same lines in the next ``draws_total`` draws
+    of a game, or in every draw when ``draws_total`` is empty.
+
+    Subscriptions are turned into tickets when schedule_next_draws creates a
+    draw; ``last_draw_number`` records the last draw they were considered for
+    so a draw is never materialized twice.
+    """
+    STATUS_CHOICES = (
+        ('active', 'Active'),
+        ('suspended', 'Suspended'),
+        ('completed', 'Completed'),
+        ('cancelled', 'Cancelled'),
+    )
+    
+    subscription_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='subscriptions')
+    lottery_game = models.ForeignKey(LotteryGame, on_delete=models.CASCADE, related_name='subscriptions')
+    lines = models.JSONField(help_text="Ticket combinations: [{main_numbers, extra_numbers}]")
+    draws_total = models.PositiveIntegerField(null=True, blank=True, help_text="Empty means every draw")
+    draws_played = models.PositiveIntegerField(default=0)
+    last_draw_number = models.IntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
+    consecutive_failures = models.PositiveSmallIntegerField(default=0)
+    last_failure_reason = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = "Subscription"
+        verbose_name_plural = "Subscriptions"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['lottery_game', 'status', 'last_draw_number']),
+            models.Index(fields=['user', 'status']),
+        ]
+    
+    @property
+    def draws_remaining(self):
+        if self.draws_total is None:
+            return None
+        return max(self.draws_total - self.draws_played, 0)
+    
+    def __str__(self):
+        return f"Subscription {self.subscription_id} - {self.lottery_game.name} - {self.status}"
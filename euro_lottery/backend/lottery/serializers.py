@@ -1,8 +1,11 @@
+from django.conf import settings
 from rest_framework import serializers
 from .models import (
     LotteryGame, Draw, Ticket, PrizeCategory, 
-    DrawResult, WinningTicket, SavedNumberCombination
+    DrawResult, WinningTicket, SavedNumberCombination, PurchaseOrder, Subscription
 )
+from .utils.sales_state import get_draw_sales_state, combination_error
+from .utils.wheeling import Wheel, WheelError
 
 
 class LotteryGameSerializer(serializers.ModelSerializer):
@@ -56,6 +59,15 @@ class TicketSerializer(serializers.ModelSerializer):
                            'winning_amount')
     
     def get_draw_info(self, obj):
+        # При покупке данные розыгрыша берутся из кэша состояния продаж
+        sales_state = self.context.get('sales_state')
+        if sales_state is not None and sales_state.draw_id == obj.draw_id:
+            return {
+                'draw_number': sales_state.draw_number,
+                'draw_date': sales_state.draw_date,
+                'lottery_game': sales_state.lottery_game_name,
+                'status': sales_state.status
+            }
         return {
             'draw_number': obj.draw.draw_number,
             'draw_date': obj.draw.draw_date,
@@ -64,6 +76,60 @@ class TicketSerializer(serializers.ModelSerializer):
         }
 
 
+class CompactTicketSerializer:
+    """
+    Лёгкий сериализатор для ?view=compact списка билетов.
+
+    Работает со строками queryset.values() и не создаёт экземпляры моделей
+    и полей DRF на каждый билет.
+    """
+    values_fields = (
+        'id', 'ticket_id', 'draw_id', 'draw__draw_number', 'draw__draw_date',
+        'draw__status', 'draw__lottery_game__name', 'main_numbers', 'extra_numbers',
+        'purchase_date', 'result_status', 'winning_amount',
+    )
+    
+    _datetime_field = serializers.DateTimeField()
+    _amount_field = serializers.DecimalField(max_digits=14, decimal_places=2)
+    
+    def __init__(self, rows):
+        self.rows = rows
+    
+    @classmethod
+    def project(cls, queryset):
+        return queryset.values(*cls.values_fields)
+    
+    def to_representation(self, row):
+        return {
+            'id': row['id'],
+            'ticket_id': str(row['ticket_id']),
+            'draw': row['draw_id'],
+            'draw_number': row['draw__draw_number'],
+            'draw_date': self._datetime_field.to_representation(row['draw__draw_date']),
+            'draw_status': row['draw__status'],
+            'lottery_game': row['draw__lottery_game__name'],
+            'main_numbers': row['main_numbers'],
+            'extra_numbers': row['extra_numbers'],
+            'purchase_date': self._datetime_field.to_representation(row['purchase_date']),
+            'result_status': row['result_status'],
+            'winning_amount': self._amount_field.to_representation(row['winning_amount']),
+        }
+    
+    @property
+    def data(self):
+        return [self.to_representation(row) for row in self.rows]
+
+
+class BatchCheckTicketsSerializer(serializers.Serializer):
+    """Сериализатор для пакетной проверки билетов"""
+    ticket_ids = serializers.ListField(
+        child=serializers.UUIDField(),
+        required=False,
+        allow_empty=False,
+        max_length=500
+    )
+
+
 class PurchaseTicketSerializer(serializers.Serializer):
     """Сериализатор для покупки билетов"""
     draw_id = serializers.IntegerField(required=True)
@@ -76,58 +142,81 @@ class PurchaseTicketSerializer(serializers.Serializer):
     )
     use_quick_pick = serializers.BooleanField(default=False)
     saved_combination_id = serializers.IntegerField(required=False)
+    async_purchase = serializers.BooleanField(default=False)
     
     def validate_draw_id(self, value):
-        try:
-            draw = Draw.objects.get(pk=value)
-            if not draw.is_open_for_tickets:
-                raise serializers.ValidationError("This draw is no longer open for ticket purchases")
-            return value
-        except Draw.DoesNotExist:
+        # Состояние продаж берется из кэша: Draw и LotteryGame не читаются из БД
+        self.sales_state = get_draw_sales_state(value)
+        if self.sales_state is None:
             raise serializers.ValidationError("Invalid draw ID")
+        if not self.sales_state.is_open():
+            raise serializers.ValidationError("This draw is no longer open for ticket purchases")
+        return value
     
     def validate(self, data):
+        data['sales_state'] = self.sales_state
+        
         # Если используется quick pick или сохраненная комбинация, то tickets можно не передавать
         if data.get('use_quick_pick') or data.get('saved_combination_id'):
             return data
         
-        # Иначе проверяем корректность формата билетов
-        draw = Draw.objects.get(pk=data['draw_id'])
-        lottery_game = draw.lottery_game
-        
+        # Иначе проверяем корректность формата билетов по правилам игры
         for ticket in data['tickets']:
             if 'main_numbers' not in ticket or 'extra_numbers' not in ticket:
                 raise serializers.ValidationError("Each ticket must have main_numbers and extra_numbers")
             
-            main_numbers = ticket['main_numbers']
-            extra_numbers = ticket['extra_numbers']
-            
-            # Проверка количества выбранных чисел
-            if len(main_numbers) != lottery_game.main_numbers_count:
-                raise serializers.ValidationError(f"You must select exactly {lottery_game.main_numbers_count} main numbers")
-            
-            if len(extra_numbers) != lottery_game.extra_numbers_count:
-                raise serializers.ValidationError(f"You must select exactly {lottery_game.extra_numbers_count} extra numbers")
-            
-            # Проверка диапазона чисел
-            for num in main_numbers:
-                if not (1 <= num <= lottery_game.main_numbers_range):
-                    raise serializers.ValidationError(f"Main numbers must be between 1 and {lottery_game.main_numbers_range}")
-            
-            for num in extra_numbers:
-                if not (1 <= num <= lottery_game.extra_numbers_range):
-                    raise serializers.ValidationError(f"Extra numbers must be between 1 and {lottery_game.extra_numbers_range}")
-            
-            # Проверка на дубликаты
-            if len(set(main_numbers)) != len(main_numbers):
-                raise serializers.ValidationError("Main numbers must be unique")
-            
-            if len(set(extra_numbers)) != len(extra_numbers):
-                raise serializers.ValidationError("Extra numbers must be unique")
+            error = self.sales_state.numbers_error(ticket['main_numbers'], ticket['extra_numbers'])
+            if error:
+                raise serializers.ValidationError(error)
         
         return data
 
 
+class WheelPurchaseSerializer(serializers.Serializer):
+    """Сериализатор для покупки системной ставки (полной или сокращенной)"""
+    draw_id = serializers.IntegerField(required=True)
+    main_numbers = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    extra_numbers = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    guarantee = serializers.IntegerField(required=False, allow_null=True, default=None)
+    dry_run = serializers.BooleanField(default=False)
+    
+    def validate_draw_id(self, value):
+        self.sales_state = get_draw_sales_state(value)
+        if self.sales_state is None:
+            raise serializers.ValidationError("Invalid draw ID")
+        if not self.sales_state.is_open():
+            raise serializers.ValidationError("This draw is no longer open for ticket purchases")
+        return value
+    
+    def validate(self, data):
+        try:
+            wheel = Wheel.for_sales_state(
+                self.sales_state, data['main_numbers'], data['extra_numbers'], data.get('guarantee')
+            )
+            line_count = len(wheel)
+        except WheelError as e:
+            raise serializers.ValidationError(str(e))
+        
+        max_lines = settings.LOTTERY_SETTINGS.get('MAX_WHEEL_LINES', 10000)
+        if line_count > max_lines:
+            raise serializers.ValidationError(
+                f"This wheel has {line_count} lines, the maximum is {max_lines}"
+            )
+        
+        data['sales_state'] = self.sales_state
+        data['wheel'] = wheel
+        return data
+
+
+class PurchaseOrderSerializer(serializers.ModelSerializer):
+    """Сериализатор для статуса заказа в асинхронном режиме покупки"""
+    class Meta:
+        model = PurchaseOrder
+        fields = ('order_id', 'draw', 'status', 'ticket_count', 'total_amount',
+                  'ticket_ids', 'error_message', 'created_at', 'processed_at')
+        read_only_fields = fields
+
+
 class DrawResultSerializer(serializers.ModelSerializer):
     """Сериализатор для результатов розыгрыша"""
     prize_category = PrizeCategorySerializer(read_only=True)
@@ -187,6 +276,55 @@ class SavedNumberCombinationSerializer(serializers.ModelSerializer):
         return data
 
 
+class SubscriptionSerializer(serializers.ModelSerializer):
+    """Сериализатор для подписок на несколько розыгрышей"""
+    lines = serializers.ListField(
+        child=serializers.DictField(child=serializers.ListField(child=serializers.IntegerField())),
+        allow_empty=False
+    )
+    draws_remaining = serializers.IntegerField(read_only=True, allow_null=True)
+    
+    class Meta:
+        model = Subscription
+        fields = ('subscription_id', 'lottery_game', 'lines', 'draws_total', 'draws_played',
+                  'draws_remaining', 'status', 'consecutive_failures', 'last_failure_reason',
+                  'created_at', 'updated_at')
+        read_only_fields = ('subscription_id', 'draws_played', 'status', 'consecutive_failures',
+                            'last_failure_reason', 'created_at', 'updated_at')
+    
+    def validate_lottery_game(self, value):
+        if not value.is_active:
+            raise serializers.ValidationError("This lottery game is not active")
+        return value
+    
+    def validate_draws_total(self, value):
+        if value is not None and value < 1:
+            raise serializers.ValidationError("A subscription must cover at least one draw")
+        return value
+    
+    def validate(self, data):
+        lottery_game = data['lottery_game']
+        lines = []
+        
+        for line in data['lines']:
+            if 'main_numbers' not in line or 'extra_numbers' not in line:
+                raise serializers.ValidationError("Each line must have main_numbers and extra_numbers")
+            error = combination_error(lottery_game, line['main_numbers'], line['extra_numbers'])
+            if error:
+                raise serializers.ValidationError(error)
+            lines.append({
+                'main_numbers': sorted(line['main_numbers']),
+                'extra_numbers': sorted(line['extra_numbers'])
+            })
+        
+        max_tickets = settings.LOTTERY_SETTINGS.get('MAX_TICKETS_PER_USER', 10)
+        if len(lines) > max_tickets:
+            raise serializers.ValidationError(f"You can buy a maximum of {max_tickets} tickets per draw")
+        
+        data['lines'] = lines
+        return data
+
+
 class LotteryStatisticsSerializer(serializers.Serializer):
     """Сериализатор для статистики лотереи"""
     most_frequent_main_numbers = serializers.ListField(child=serializers.DictField())
@@ -0,0 +1,90 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import LotteryGame, Draw, DrawResult, PrizeCategory
+from .utils.versioning import (
+    SCOPE_GAMES, SCOPE_DRAWS, game_draws_scope, draw_scope,
+    bump_version, updated_at_or_now
+)
+from .utils.number_index import INDEXED_DRAW_STATUSES, get_number_index, add_draw_to_index
+from .utils.ticket_check import invalidate_draw_outcome
+from .utils.sales_state import invalidate_sales_state, invalidate_game_sales_state
+from .utils.draw_execution import schedule_draw_execution
+from .utils.draw_calendar import invalidate_next_draw
+
+
+@receiver([post_save, post_delete], sender=LotteryGame)
+def bump_game_version(sender, instance, **kwargs):
+    """
+    Инвалидирует ETag списка игр и розыгрышей, в которые вложена игра
+    """
+    bump_version(
+        SCOPE_GAMES, SCOPE_DRAWS, game_draws_scope(instance.pk),
+        modified=updated_at_or_now(instance)
+    )
+    # Правила и цена игры входят в кэш состояния продаж ее розыгрышей
+    invalidate_game_sales_state(instance.pk)
+    transaction.on_commit(lambda: invalidate_game_sales_state(instance.pk))
+    # Расписание игры определяет ее следующий розыгрыш
+    invalidate_next_draw(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Draw)
+def bump_draw_version(sender, instance, **kwargs):
+    """
+    Инвалидирует ETag розыгрыша и списков розыгрышей его игры
+    """
+    bump_version(
+        SCOPE_DRAWS, game_draws_scope(instance.lottery_game_id), draw_scope(instance.pk),
+        modified=updated_at_or_now(instance)
+    )
+    invalidate_draw_outcome(instance.pk)
+    # Повторно после коммита: читатель мог закэшировать состояние до фиксации транзакции
+    invalidate_sales_state(instance.pk)
+    transaction.on_commit(lambda: invalidate_sales_state(instance.pk))
+    invalidate_next_draw(instance.lottery_game_id)
+    transaction.on_commit(lambda: invalidate_next_draw(instance.lottery_game_id))
+
+
+@receiver(post_save, sender=Draw)
+def index_completed_draw(sender, instance, **kwargs):
+    """
+    Добавляет завершенный розыгрыш в инвертированный индекс номеров
+    """
+    if instance.status not in INDEXED_DRAW_STATUSES or not instance.main_numbers:
+        return
+    if instance.pk in get_number_index(instance.lottery_game_id):
+        return
+    add_draw_to_index(instance)
+
+
+@receiver(post_save, sender=Draw)
+def arm_draw_execution(sender, instance, **kwargs):
+    """
+    Ставит ETA-задачу проведения розыгрыша на draw_date при создании и переносе
+    """
+    if instance.status != 'scheduled':
+        return
+    transaction.on_commit(lambda: schedule_draw_execution(instance))
+
+
+@receiver([post_save, post_delete], sender=DrawResult)
+def bump_draw_result_version(sender, instance, **kwargs):
+    """
+    Результаты входят в ответы DrawDetailView и DrawResultsView
+    """
+    draw = instance.draw
+    bump_version(
+        SCOPE_DRAWS, game_draws_scope(draw.lottery_game_id), draw_scope(draw.pk),
+        modified=updated_at_or_now(instance)
+    )
+    invalidate_draw_outcome(draw.pk)
+
+
+@receiver([post_save, post_delete], sender=PrizeCategory)
+def bump_prize_category_version(sender, instance, **kwargs):
+    """
+    Категории призов вложены в результаты розыгрышей
+    """
+    bump_version(SCOPE_DRAWS, game_draws_scope(instance.lottery_game_id))
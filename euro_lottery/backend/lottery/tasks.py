@@ -1,15 +1,23 @@
 from celery import shared_task
 from django.utils import timezone
 from django.core.management import call_command
+import datetime
 import logging
 import traceback
+from lottery_core.task_metrics import rows_processed
 
 logger = logging.getLogger(__name__)
 
+# Minimum time between scheduling a draw and conducting it
+MIN_SALES_WINDOW = datetime.timedelta(hours=24)
+
 @shared_task
 def conduct_pending_draws():
     """
     Celery task to run all pending lottery draws
+    
+    Draws are normally conducted by conduct_draw_at_eta; this periodic run
+    is the safety net for draws whose ETA task never ran.
     """
     try:
         logger.info("Starting scheduled draw task")
@@ -21,12 +29,52 @@ def conduct_pending_draws():
         logger.error(traceback.format_exc())
         return False
 
+@shared_task
+def conduct_draw_at_eta(draw_id, armed_for):
+    """
+    Celery task sent with eta=draw_date to conduct one draw on time
+    
+    armed_for is the draw_date the task was sent for; see
+    utils.draw_execution for the lease that keeps duplicates harmless.
+    """
+    from .utils.draw_execution import run_draw_at_eta
+    
+    try:
+        result = run_draw_at_eta(draw_id, armed_for)
+        return {'draw_id': draw_id, 'result': result}
+    except Exception as e:
+        logger.error(f"Error in conduct_draw_at_eta task for draw {draw_id}: {str(e)}")
+        logger.error(traceback.format_exc())
+        return False
+
+@shared_task
+@rows_processed('draws_armed')
+def arm_draw_executions():
+    """
+    Celery task to re-send the ETA tasks of draws that are due soon
+    """
+    from .utils.draw_execution import arm_due_draws
+    
+    try:
+        armed = arm_due_draws()
+        return {'draws_armed': armed}
+    except Exception as e:
+        logger.error(f"Error in arm_draw_executions task: {str(e)}")
+        logger.error(traceback.format_exc())
+        return False
+
 @shared_task
 def schedule_next_draws():
     """
     Celery task to create the next set of scheduled draws for active lotteries
+    
+    Each game is kept SCHEDULED_DRAWS_AHEAD future draws ahead, with dates
+    from its draw calendar at least MIN_SALES_WINDOW from now.
     """
+    from django.conf import settings
     from .models import LotteryGame, Draw
+    from .utils.draw_calendar import get_draw_calendar
+    from .utils.subscriptions import materialize_subscriptions
     
     try:
         logger.info("Scheduling next draws")
@@ -34,23 +82,26 @@ def schedule_next_draws():
         # Get all active lottery games
         active_games = LotteryGame.objects.filter(is_active=True)
         now = timezone.now()
+        draws_ahead = settings.LOTTERY_SETTINGS.get('SCHEDULED_DRAWS_AHEAD', 1)
         
         for game in active_games:
+            missing = draws_ahead - Draw.objects.filter(
+                lottery_game=game, status='scheduled', draw_date__gt=now
+            ).count()
+            if missing <= 0:
+                continue
+            
             # Find the latest draw for this game
             latest_draw = Draw.objects.filter(lottery_game=game).order_by('-draw_number').first()
+            next_draw_number = latest_draw.draw_number + 1 if latest_draw else 1
             
-            if not latest_draw:
-                # If no draws exist, create the first one
-                next_draw_number = 1
-                next_draw_date = _calculate_next_draw_date(game, now)
-            else:
-                # Schedule next draw after the latest one
-                next_draw_number = latest_draw.draw_number + 1
-                next_draw_date = _calculate_next_draw_date(game, latest_draw.draw_date)
+            # Leave time for ticket sales before the first new draw
+            after = now + MIN_SALES_WINDOW
+            if latest_draw and latest_draw.draw_date > after:
+                after = latest_draw.draw_date
             
-            # Create new draw if it doesn't already exist and if it's in the future
-            if not Draw.objects.filter(lottery_game=game, draw_number=next_draw_number).exists() and next_draw_date > now:
-                Draw.objects.create(
+            for next_draw_date in get_draw_calendar(game).occurrences(after, missing):
+                draw = Draw.objects.create(
                     lottery_game=game,
                     draw_number=next_draw_number,
                     draw_date=next_draw_date,
@@ -59,6 +110,14 @@ def schedule_next_draws():
                     ticket_count=0
                 )
                 logger.info(f"Scheduled draw #{next_draw_number} for {game.name} on {next_draw_date}")
+                next_draw_number += 1
+                
+                # Выпуск билетов по подпискам на новый розыгрыш
+                try:
+                    materialize_subscriptions(draw)
+                except Exception as e:
+                    logger.error(f"Error materializing subscriptions for draw {draw.pk}: {str(e)}")
+                    logger.error(traceback.format_exc())
         
         logger.info("Completed scheduling next draws")
         return True
@@ -67,47 +126,6 @@ def schedule_next_draws():
         logger.error(traceback.format_exc())
         return False
 
-def _calculate_next_draw_date(game, reference_date):
-    """
-    Calculate the next draw date based on game rules and a reference date
-    """
-    import datetime
-    from dateutil.relativedelta import relativedelta, MO, TU, WE, TH, FR, SA, SU
-    
-    # Parse draw days from the game settings
-    day_mapping = {
-        'monday': MO, 'tuesday': TU, 'wednesday': WE, 
-        'thursday': TH, 'friday': FR, 'saturday': SA, 'sunday': SU
-    }
-    
-    draw_days = [day.strip().lower() for day in game.draw_days.split(',')]
-    weekdays = [day_mapping[day] for day in draw_days if day in day_mapping]
-    
-    if not weekdays:
-        # If no valid days, default to next week
-        return reference_date + datetime.timedelta(days=7)
-    
-    # Find the next occurrence of any draw day after the reference date
-    next_dates = []
-    for weekday in weekdays:
-        # Get next occurrence of this weekday
-        next_date = reference_date + relativedelta(weekday=weekday(+1))
-        next_dates.append(next_date)
-    
-    # Return the earliest date
-    next_draw_date = min(next_dates)
-    
-    # If less than 24 hours away, move to the following week to give time for ticket sales
-    if (next_draw_date - reference_date).total_seconds() < 86400:  # 24 hours in seconds
-        next_dates = []
-        for weekday in weekdays:
-            next_date = reference_date + relativedelta(weekday=weekday(+2))
-            next_dates.append(next_date)
-        next_draw_date = min(next_dates)
-    
-    # Set the time component (default to 8:00 PM local time)
-    return next_draw_date.replace(hour=20, minute=0, second=0, microsecond=0)
-
 def _calculate_jackpot(game, previous_draw=None):
     """
     Calculate the jackpot amount for the next draw based on rules and previous draw
@@ -146,6 +164,7 @@ def _calculate_jackpot(game, previous_draw=None):
 
 
 @shared_task
+@rows_processed('verified')
 def verify_completed_draws():
     """
     Celery task to verify completed draws that haven't been verified yet
@@ -184,6 +203,7 @@ def verify_completed_draws():
 
 
 @shared_task
+@rows_processed('draws_processed')
 def check_ticket_winnings():
     """
     Celery task to check for winning tickets and process payouts
@@ -307,4 +327,23 @@ def check_ticket_winnings():
     except Exception as e:
         logger.error(f"Error in check_ticket_winnings task: {str(e)}")
         logger.error(traceback.format_exc())
-        return False
\ No newline at end of file
+        return False
+
+@shared_task
+@rows_processed('orders_processed')
+def process_purchase_queue(draw_id=None):
+    """
+    Celery task to issue queued ticket orders (asynchronous purchase mode)
+    
+    Enqueued purchases trigger it per draw; the periodic run without draw_id
+    drains anything left behind by a lost message.
+    """
+    from .utils.purchase_queue import drain_purchase_queue
+    
+    try:
+        processed = drain_purchase_queue(draw_id=draw_id)
+        return {'orders_processed': processed}
+    except Exception as e:
+        logger.error(f"Error in process_purchase_queue task: {str(e)}")
+        logger.error(traceback.format_exc())
+        return False
@@ -0,0 +1,136 @@
+import uuid
+from django.core.cache import cache
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+from decimal import Decimal
+import datetime
+
+from .models import LotteryGame, Draw, Ticket, PrizeCategory, DrawResult, WinningTicket
+
+User = get_user_model()
+
+
+class BatchCheckTicketsTestCase(APITestCase):
+    """Тестирование пакетной проверки билетов"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='user@example.com',
+            username='testuser',
+            password='testpassword'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.lottery_game = LotteryGame.objects.create(
+            name="Test Lottery",
+            main_numbers_count=5,
+            main_numbers_range=50,
+            extra_numbers_count=2,
+            extra_numbers_range=12,
+            ticket_price=Decimal('2.50'),
+            draw_days="Tuesday,Friday",
+            draw_time="20:00:00",
+        )
+        self.draw = Draw.objects.create(
+            lottery_game=self.lottery_game,
+            draw_number=1,
+            draw_date=timezone.now() - datetime.timedelta(hours=1),
+            jackpot_amount=Decimal('1000000.00'),
+            main_numbers=[1, 2, 3, 4, 5],
+            extra_numbers=[1, 2],
+            status='completed'
+        )
+        self.future_draw = Draw.objects.create(
+            lottery_game=self.lottery_game,
+            draw_number=2,
+            draw_date=timezone.now() + datetime.timedelta(days=2),
+            jackpot_amount=Decimal('1000000.00')
+        )
+        self.second_prize = PrizeCategory.objects.create(
+            lottery_game=self.lottery_game,
+            name="5+1",
+            main_numbers_matched=5,
+            extra_numbers_matched=1,
+            prize_type='fixed',
+            fixed_amount=Decimal('500.00')
+        )
+        DrawResult.objects.create(
+            draw=self.draw,
+            prize_category=self.second_prize,
+            winners_count=1,
+            prize_amount=Decimal('500.00')
+        )
+
+        def ticket(draw, main_numbers, extra_numbers):
+            return Ticket.objects.create(
+                user=self.user,
+                draw=draw,
+                main_numbers=main_numbers,
+                extra_numbers=extra_numbers,
+                price=Decimal('2.50')
+            )
+
+        self.winning_ticket = ticket(self.draw, [1, 2, 3, 4, 5], [1, 9])
+        self.losing_tickets = [ticket(self.draw, [10, 11, 12, 13, 14], [3, 4]) for _ in range(5)]
+        self.future_ticket = ticket(self.future_draw, [1, 2, 3, 4, 5], [1, 2])
+        self.url = reverse('check-tickets-batch')
+
+    def test_checks_all_pending_tickets(self):
+        # Блокировка билетов, исход розыгрыша (розыгрыш + результаты), bulk_update, bulk_create
+        # плюс SAVEPOINT/RELEASE транзакции
+        with self.assertNumQueries(7):
+            response = self.client.post(self.url, {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['checked'], 6)
+        self.assertEqual(response.data['winning_count'], 1)
+        self.assertEqual(response.data['total_winnings'], Decimal('500.00'))
+
+        self.winning_ticket.refresh_from_db()
+        self.assertEqual(self.winning_ticket.result_status, 'winning')
+        self.assertEqual(self.winning_ticket.matched_extra_numbers, 1)
+        winning = WinningTicket.objects.get(ticket=self.winning_ticket)
+        self.assertEqual(winning.prize_category, self.second_prize)
+        self.assertEqual(winning.amount, Decimal('500.00'))
+        self.assertEqual(
+            Ticket.objects.filter(id__in=[t.id for t in self.losing_tickets], result_status='non_winning').count(),
+            5
+        )
+        self.future_ticket.refresh_from_db()
+        self.assertEqual(self.future_ticket.result_status, 'pending')
+
+        # Повторная проверка ничего не меняет
+        response = self.client.post(self.url, {}, format='json')
+        self.assertEqual(response.data['checked'], 0)
+        self.assertEqual(WinningTicket.objects.count(), 1)
+
+    def test_checks_selected_tickets(self):
+        missing = uuid.uuid4()
+        response = self.client.post(self.url, {
+            'ticket_ids': [
+                str(self.winning_ticket.ticket_id),
+                str(self.future_ticket.ticket_id),
+                str(missing)
+            ]
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['checked'], 1)
+        self.assertEqual(response.data['results'][0]['prize_category'], '5+1')
+        self.assertEqual(response.data['not_ready'], [str(self.future_ticket.ticket_id)])
+        self.assertEqual(response.data['not_found'], [str(missing)])
+
+    def test_other_users_tickets_are_not_checked(self):
+        other = User.objects.create_user(email='other@example.com', username='other', password='password')
+        client = APIClient()
+        client.force_authenticate(user=other)
+        response = client.post(self.url, {'ticket_ids': [str(self.winning_ticket.ticket_id)]}, format='json')
+        self.assertEqual(response.data['checked'], 0)
+        self.assertEqual(response.data['not_found'], [str(self.winning_ticket.ticket_id)])
+
+    def test_invalid_ticket_ids(self):
+        response = self.client.post(self.url, {'ticket_ids': ['not-a-uuid']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
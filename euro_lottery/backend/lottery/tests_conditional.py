@@ -0,0 +1,117 @@
+from django.core.cache import cache
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+from decimal import Decimal
+import datetime
+
+from .models import LotteryGame, Draw
+from .utils.versioning import etag_matches
+
+User = get_user_model()
+
+
+class ConditionalRequestsTestCase(APITestCase):
+    """Тестирование ETag / Last-Modified для эндпоинтов розыгрышей и игр"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='user@example.com',
+            username='testuser',
+            password='testpassword'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.lottery_game = LotteryGame.objects.create(
+            name="Test Lottery",
+            main_numbers_count=5,
+            main_numbers_range=50,
+            extra_numbers_count=2,
+            extra_numbers_range=12,
+            ticket_price=Decimal('2.50'),
+            draw_days="Tuesday,Friday",
+            draw_time="20:00:00",
+            is_active=True
+        )
+        self.draw = Draw.objects.create(
+            lottery_game=self.lottery_game,
+            draw_number=1,
+            draw_date=timezone.now() + datetime.timedelta(days=2),
+            jackpot_amount=Decimal('1000000.00')
+        )
+
+    def test_matching_etag_returns_304_without_queries(self):
+        for url in (
+            reverse('lottery-games'),
+            reverse('upcoming-draws'),
+            reverse('draw-results'),
+            reverse('draw-detail', args=[self.draw.pk]),
+        ):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            etag = response['ETag']
+            self.assertTrue(response.has_header('Last-Modified'))
+
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response['ETag'], etag)
+
+    def test_draw_change_invalidates_etag(self):
+        url = reverse('draw-detail', args=[self.draw.pk])
+        etag = self.client.get(url)['ETag']
+
+        self.draw.jackpot_amount = Decimal('2000000.00')
+        self.draw.save()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['jackpot_amount'], '2000000.00')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_game_scoped_etag_ignores_other_games(self):
+        url = reverse('upcoming-draws')
+        etag = self.client.get(url, {'lottery_id': self.lottery_game.pk})['ETag']
+
+        other_game = LotteryGame.objects.create(
+            name="Other Lottery",
+            main_numbers_count=6,
+            main_numbers_range=49,
+            extra_numbers_count=1,
+            extra_numbers_range=10,
+            ticket_price=Decimal('1.00'),
+            draw_days="Saturday",
+            draw_time="20:00:00",
+        )
+        Draw.objects.create(
+            lottery_game=other_game,
+            draw_number=1,
+            draw_date=timezone.now() + datetime.timedelta(days=3),
+            jackpot_amount=Decimal('500000.00')
+        )
+
+        response = self.client.get(url, {'lottery_id': self.lottery_game.pk}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_if_modified_since(self):
+        url = reverse('lottery-games')
+        last_modified = self.client.get(url)['Last-Modified']
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_weak_etag_comparison(self):
+        url = reverse('lottery-games')
+        etag = self.client.get(url)['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=f'"stale", W/{etag}')
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Снимается только префикс W/, а не любые символы W и /
+        self.assertFalse(etag_matches(f'WW/{etag}', etag))
+        self.assertFalse(etag_matches(f'/{etag}', etag))
+        self.assertTrue(etag_matches('*', etag))
@@ -0,0 +1,157 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from decimal import Decimal
+from zoneinfo import ZoneInfo
+import datetime
+
+from .models import LotteryGame, Draw
+from .tasks import schedule_next_draws, MIN_SALES_WINDOW
+from .utils.draw_calendar import get_draw_calendar, get_next_draw_info
+
+User = get_user_model()
+
+UTC = datetime.timezone.utc
+
+
+def _game(**kwargs):
+    fields = dict(
+        name="Test Lottery",
+        main_numbers_count=5,
+        main_numbers_range=50,
+        extra_numbers_count=2,
+        extra_numbers_range=12,
+        ticket_price=Decimal('2.50'),
+        draw_days="Tuesday,Friday",
+        draw_time="20:00:00",
+    )
+    fields.update(kwargs)
+    return LotteryGame.objects.create(**fields)
+
+
+class DrawCalendarTestCase(TestCase):
+    """Тестирование календаря розыгрышей"""
+
+    def setUp(self):
+        cache.clear()
+        self.game = _game()
+
+    def test_next_occurrences(self):
+        """Следующие K розыгрышей по дням и времени игры"""
+        # Вторник 2026-10-20 19:00 UTC
+        after = datetime.datetime(2026, 10, 20, 19, 0, tzinfo=UTC)
+        dates = list(get_draw_calendar(self.game).occurrences(after, 3))
+        self.assertEqual(dates, [
+            datetime.datetime(2026, 10, 20, 20, 0, tzinfo=UTC),
+            datetime.datetime(2026, 10, 23, 20, 0, tzinfo=UTC),
+            datetime.datetime(2026, 10, 27, 20, 0, tzinfo=UTC),
+        ])
+        # Розыгрыш в момент after не считается следующим
+        self.assertEqual(
+            get_draw_calendar(self.game).next_after(dates[0]),
+            dates[1]
+        )
+
+    def test_holidays_and_timezone(self):
+        """Праздники пропускаются, время розыгрыша держится в часовом поясе игры"""
+        self.game.rules = {'timezone': 'Europe/Paris', 'holidays': ['2026-10-23']}
+        calendar = get_draw_calendar(self.game)
+        after = datetime.datetime(2026, 10, 20, 21, 0, tzinfo=UTC)
+        first, second = calendar.occurrences(after, 2)
+
+        paris = ZoneInfo('Europe/Paris')
+        # 23 октября - праздник, 25 октября Франция переходит на зимнее время
+        self.assertEqual(first.astimezone(paris).date(), datetime.date(2026, 10, 27))
+        self.assertEqual(first.astimezone(paris).hour, 20)
+        self.assertEqual(first.astimezone(UTC).hour, 19)
+        self.assertEqual(second.astimezone(paris).date(), datetime.date(2026, 10, 30))
+
+    def test_schedule_compiled_once(self):
+        """Одинаковое расписание компилируется один раз"""
+        other = _game(name="Other Lottery")
+        self.assertIs(get_draw_calendar(self.game), get_draw_calendar(other))
+
+        other.draw_days = "Saturday"
+        self.assertIsNot(get_draw_calendar(self.game), get_draw_calendar(other))
+        self.assertEqual(get_draw_calendar(other).weekdays, frozenset({5}))
+
+    def test_invalid_schedule(self):
+        """Игра без корректных дней розыгрыша не имеет дат"""
+        self.game.draw_days = "Someday"
+        self.assertIsNone(self.game.get_next_draw_date())
+
+    def test_model_uses_calendar(self):
+        """LotteryGame.get_next_draw_date берет дату из календаря"""
+        self.assertEqual(
+            self.game.get_next_draw_date(),
+            get_draw_calendar(self.game).next_after(timezone.now())
+        )
+
+    def test_schedule_next_draws_keeps_draws_ahead(self):
+        """Задача создает розыгрыш по календарю и не плодит новые при каждом запуске"""
+        self.assertTrue(schedule_next_draws())
+        draw = Draw.objects.get(lottery_game=self.game)
+        self.assertEqual(draw.draw_date.astimezone(UTC).hour, 20)
+        self.assertIn(draw.draw_date.weekday(), [1, 4])
+        self.assertGreater(draw.draw_date, timezone.now() + MIN_SALES_WINDOW)
+
+        self.assertTrue(schedule_next_draws())
+        self.assertEqual(Draw.objects.filter(lottery_game=self.game).count(), 1)
+
+        with self.settings(LOTTERY_SETTINGS={'SCHEDULED_DRAWS_AHEAD': 3}):
+            self.assertTrue(schedule_next_draws())
+        draws = list(Draw.objects.filter(lottery_game=self.game).order_by('draw_number'))
+        self.assertEqual([d.draw_number for d in draws], [1, 2, 3])
+        self.assertEqual(
+            [d.draw_date for d in draws[1:]],
+            list(get_draw_calendar(self.game).occurrences(draws[0].draw_date, 2))
+        )
+
+
+class NextDrawCountdownTestCase(APITestCase):
+    """Тестирование кэшированного обратного отсчета до розыгрыша"""
+
+    def setUp(self):
+        cache.clear()
+        self.game = _game()
+        self.user = User.objects.create_user(
+            username='testuser', email='test@example.com', password='testpassword123'
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def test_countdown_falls_back_to_calendar(self):
+        """Без созданного розыгрыша отсчет идет до даты из календаря"""
+        info = get_next_draw_info(self.game)
+        self.assertIsNone(info['draw_id'])
+        self.assertEqual(info['draw_date'], get_draw_calendar(self.game).next_after(timezone.now()))
+
+    def test_countdown_cached_and_invalidated(self):
+        """Следующий розыгрыш кэшируется и сбрасывается при изменении розыгрышей"""
+        draw = Draw.objects.create(
+            lottery_game=self.game, draw_number=1,
+            draw_date=timezone.now() + datetime.timedelta(hours=5),
+            jackpot_amount=Decimal('1000000.00'),
+        )
+        self.assertEqual(get_next_draw_info(self.game)['draw_id'], draw.pk)
+        with self.assertNumQueries(0):
+            info = get_next_draw_info(self.game)
+        self.assertAlmostEqual(info['seconds_until_draw'], 5 * 3600, delta=5)
+
+        earlier = Draw.objects.create(
+            lottery_game=self.game, draw_number=2,
+            draw_date=timezone.now() + datetime.timedelta(hours=2),
+            jackpot_amount=Decimal('1000000.00'),
+        )
+        self.assertEqual(get_next_draw_info(self.game)['draw_id'], earlier.pk)
+
+    def test_next_draw_endpoint(self):
+        """Эндпоинт обратного отсчета игры"""
+        response = self.client.get(reverse('lottery-game-next-draw', args=[self.game.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['lottery_game_id'], self.game.pk)
+        self.assertGreater(response.data['seconds_until_draw'], 0)
+        self.assertEqual(len(response.data['upcoming_draw_dates']), 5)
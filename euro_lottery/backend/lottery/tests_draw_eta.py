@@ -0,0 +1,172 @@
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from unittest.mock import patch
+from decimal import Decimal
+from io import StringIO
+import datetime
+
+from .models import LotteryGame, Draw
+from .tasks import conduct_draw_at_eta
+from .utils.draw_execution import (
+    acquire_draw_lease, release_draw_lease, conduct_draw_exclusively,
+    schedule_draw_execution, arm_due_draws, run_draw_at_eta
+)
+
+
+class DrawEtaExecutionTestCase(TestCase):
+    """Тестирование проведения розыгрышей по ETA с арендой в БД"""
+
+    def setUp(self):
+        cache.clear()
+        self.lottery_game = LotteryGame.objects.create(
+            name="Test Lottery",
+            main_numbers_count=5,
+            main_numbers_range=50,
+            extra_numbers_count=2,
+            extra_numbers_range=12,
+            ticket_price=Decimal('2.50'),
+            draw_days="Tuesday,Friday",
+            draw_time="20:00:00",
+        )
+        self.draw = self._draw(1, timezone.now() - datetime.timedelta(minutes=1))
+
+    def _draw(self, number, draw_date):
+        return Draw.objects.create(
+            lottery_game=self.lottery_game,
+            draw_number=number,
+            draw_date=draw_date,
+            jackpot_amount=Decimal('1000000.00'),
+        )
+
+    def test_lease_is_exclusive_until_it_expires(self):
+        """Аренду получает только один воркер, пока она не истекла"""
+        self.assertTrue(acquire_draw_lease(self.draw.pk, 'worker-a'))
+        self.assertFalse(acquire_draw_lease(self.draw.pk, 'worker-b'))
+
+        later = timezone.now() + datetime.timedelta(hours=1)
+        self.assertTrue(acquire_draw_lease(self.draw.pk, 'worker-b', now=later))
+        self.draw.refresh_from_db()
+        self.assertEqual(self.draw.execution_lease_owner, 'worker-b')
+
+    def test_release_only_by_owner(self):
+        """Освободить аренду может только ее владелец"""
+        acquire_draw_lease(self.draw.pk, 'worker-a')
+        release_draw_lease(self.draw.pk, 'worker-b')
+        self.assertFalse(acquire_draw_lease(self.draw.pk, 'worker-c'))
+
+        release_draw_lease(self.draw.pk, 'worker-a')
+        self.assertTrue(acquire_draw_lease(self.draw.pk, 'worker-c'))
+
+    def test_conduct_exclusively(self):
+        """Розыгрыш проводится один раз, аренда снимается после проведения"""
+        conducted = conduct_draw_exclusively(self.draw.pk)
+        self.assertIsNotNone(conducted)
+        self.assertEqual(conducted.status, 'completed')
+        self.assertEqual(conducted.execution_lease_owner, '')
+
+        self.draw.refresh_from_db()
+        self.assertEqual(self.draw.status, 'completed')
+        self.assertIsNone(self.draw.execution_lease_expires_at)
+        # Повторная доставка ETA-задачи ничего не делает
+        self.assertIsNone(conduct_draw_exclusively(self.draw.pk))
+
+    def test_leased_draw_is_skipped(self):
+        """Розыгрыш в аренде другого воркера не проводится"""
+        acquire_draw_lease(self.draw.pk, 'other-worker')
+        self.assertEqual(run_draw_at_eta(self.draw.pk, self.draw.draw_date.isoformat()), 'locked')
+
+        call_command('conduct_draw', stdout=StringIO())
+        self.draw.refresh_from_db()
+        self.assertEqual(self.draw.status, 'scheduled')
+
+    def test_eta_task_outcomes(self):
+        """ETA-задача проводит розыгрыш и игнорирует устаревшие и ранние вызовы"""
+        stale_for = (self.draw.draw_date - datetime.timedelta(days=1)).isoformat()
+        self.assertEqual(run_draw_at_eta(self.draw.pk, stale_for), 'stale')
+
+        future = self._draw(2, timezone.now() + datetime.timedelta(hours=2))
+        self.assertEqual(run_draw_at_eta(future.pk, future.draw_date.isoformat()), 'early')
+
+        result = conduct_draw_at_eta(self.draw.pk, self.draw.draw_date.isoformat())
+        self.assertEqual(result, {'draw_id': self.draw.pk, 'result': 'conducted'})
+        self.assertEqual(run_draw_at_eta(self.draw.pk, self.draw.draw_date.isoformat()), 'skipped')
+
+    def test_polling_command_uses_lease(self):
+        """Страховочный опрос проводит просроченные розыгрыши через аренду"""
+        call_command('conduct_draw', stdout=StringIO())
+        self.draw.refresh_from_db()
+        self.assertEqual(self.draw.status, 'completed')
+        self.assertEqual(self.draw.execution_lease_owner, '')
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=False)
+class DrawEtaArmingTestCase(TestCase):
+    """Тестирование постановки ETA-задач розыгрышей"""
+
+    def setUp(self):
+        cache.clear()
+        self.lottery_game = LotteryGame.objects.create(
+            name="Test Lottery",
+            main_numbers_count=5,
+            main_numbers_range=50,
+            extra_numbers_count=2,
+            extra_numbers_range=12,
+            ticket_price=Decimal('2.50'),
+            draw_days="Tuesday,Friday",
+            draw_time="20:00:00",
+        )
+
+    def _draw(self, number, draw_date):
+        return Draw.objects.create(
+            lottery_game=self.lottery_game,
+            draw_number=number,
+            draw_date=draw_date,
+            jackpot_amount=Decimal('1000000.00'),
+        )
+
+    def test_armed_on_create_and_reschedule(self):
+        """Задача ставится при создании и переносе, но не при прочих сохранениях"""
+        draw_date = timezone.now() + datetime.timedelta(minutes=30)
+        with patch.object(conduct_draw_at_eta, 'apply_async') as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                draw = self._draw(1, draw_date)
+            apply_async.assert_called_once_with(args=[draw.pk, draw_date.isoformat()], eta=draw_date)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                draw.jackpot_amount = Decimal('2000000.00')
+                draw.save()
+            self.assertEqual(apply_async.call_count, 1)
+
+            new_date = draw_date + datetime.timedelta(minutes=10)
+            with self.captureOnCommitCallbacks(execute=True):
+                draw.draw_date = new_date
+                draw.save()
+            self.assertEqual(apply_async.call_count, 2)
+            self.assertEqual(apply_async.call_args.kwargs['eta'], new_date)
+
+    def test_far_draw_armed_once_near(self):
+        """Далекий розыгрыш ставится в очередь только когда подходит его время"""
+        now = timezone.now()
+        draw_date = now + datetime.timedelta(days=2)
+        with patch.object(conduct_draw_at_eta, 'apply_async') as apply_async:
+            # ETA-сообщение на дни вперед брокер возвращал бы в очередь каждый visibility_timeout
+            with self.captureOnCommitCallbacks(execute=True):
+                self._draw(1, draw_date)
+            apply_async.assert_not_called()
+            self.assertEqual(arm_due_draws(now=now), 0)
+
+            near = draw_date - datetime.timedelta(minutes=20)
+            self.assertEqual(arm_due_draws(now=near), 1)
+            self.assertEqual(arm_due_draws(now=near), 0)
+            self.assertEqual(apply_async.call_count, 1)
+            self.assertEqual(apply_async.call_args.kwargs['eta'], draw_date)
+
+    def test_not_armed_when_not_scheduled(self):
+        """Проведенные и отмененные розыгрыши не ставятся"""
+        draw = self._draw(1, timezone.now() + datetime.timedelta(minutes=5))
+        draw.status = 'cancelled'
+        with patch.object(conduct_draw_at_eta, 'apply_async') as apply_async:
+            self.assertFalse(schedule_draw_execution(draw))
+            apply_async.assert_not_called()
@@ -0,0 +1,191 @@
+import random
+import time
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+from decimal import Decimal
+import datetime
+
+from .models import LotteryGame, Draw, DrawNumberIndex
+from .utils.number_index import (
+    INDEX_CACHE_KEY, NumberIndex, encode_bitmap, decode_bitmap, get_number_index
+)
+
+User = get_user_model()
+
+
+class NumberIndexTestCase(TestCase):
+    """Тестирование битмап-операций инвертированного индекса"""
+
+    def setUp(self):
+        self.index = NumberIndex()
+        self.index.add_draw(101, [1, 2, 3, 4, 5], [1, 2])
+        self.index.add_draw(102, [1, 2, 3, 4, 6], [3, 4])
+        self.index.add_draw(103, [10, 20, 30, 40, 50], [1, 5])
+
+    def test_bitmap_roundtrip(self):
+        for bitmap in (0, 1, (1 << 5000) | 7, random.getrandbits(3000)):
+            self.assertEqual(decode_bitmap(encode_bitmap(bitmap)), bitmap)
+
+    def test_add_draw_is_idempotent(self):
+        self.assertFalse(self.index.add_draw(101, [1, 2, 3, 4, 5], [1, 2]))
+        self.assertEqual(self.index.size, 3)
+        self.assertIn(101, self.index)
+
+    def test_contains(self):
+        matched = self.index.contains([1, 2, 3, 4])
+        self.assertEqual(list(self.index.draw_ids_for(matched)), [102, 101])
+        matched = self.index.contains([1, 2], [1])
+        self.assertEqual(list(self.index.draw_ids_for(matched)), [101])
+        self.assertEqual(self.index.contains([1, 99]), 0)
+
+    def test_at_least_and_histogram(self):
+        counters = self.index.at_least([1, 2, 3, 4, 5])
+        self.assertEqual(list(self.index.draw_ids_for(counters[5])), [101])
+        self.assertEqual(list(self.index.draw_ids_for(counters[4])), [102, 101])
+        self.assertEqual(self.index.histogram(counters), {0: 1, 1: 0, 2: 0, 3: 0, 4: 1, 5: 1})
+
+
+class NumberSearchAPITestCase(APITestCase):
+    """Тестирование поиска комбинаций по истории розыгрышей"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='user@example.com',
+            username='testuser',
+            password='testpassword'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.lottery_game = LotteryGame.objects.create(
+            name="Test Lottery",
+            main_numbers_count=5,
+            main_numbers_range=50,
+            extra_numbers_count=2,
+            extra_numbers_range=12,
+            ticket_price=Decimal('2.50'),
+            draw_days="Tuesday,Friday",
+            draw_time="20:00:00",
+        )
+        results = [
+            ([1, 2, 3, 4, 5], [1, 2]),
+            ([1, 2, 3, 4, 6], [3, 4]),
+            ([7, 8, 9, 10, 11], [1, 2]),
+        ]
+        self.draws = []
+        for number, (main_numbers, extra_numbers) in enumerate(results, start=1):
+            draw = Draw.objects.create(
+                lottery_game=self.lottery_game,
+                draw_number=number,
+                draw_date=timezone.now() - datetime.timedelta(days=10 - number),
+                jackpot_amount=Decimal('1000000.00')
+            )
+            # Завершение розыгрыша добавляет его в индекс через сигнал
+            draw.main_numbers = main_numbers
+            draw.extra_numbers = extra_numbers
+            draw.status = 'completed'
+            draw.save()
+            self.draws.append(draw)
+
+        # Незавершенный розыгрыш не индексируется
+        Draw.objects.create(
+            lottery_game=self.lottery_game,
+            draw_number=4,
+            draw_date=timezone.now() + datetime.timedelta(days=2),
+            jackpot_amount=Decimal('1000000.00')
+        )
+        self.url = reverse('number-search')
+
+    def _search(self, **params):
+        params.setdefault('lottery_id', self.lottery_game.pk)
+        return self.client.get(self.url, params)
+
+    def test_draw_completion_updates_index(self):
+        stored = DrawNumberIndex.objects.get(lottery_game=self.lottery_game)
+        self.assertEqual(stored.draw_ids, [draw.pk for draw in self.draws])
+
+    def test_contains(self):
+        response = self._search(main_numbers='1,2,3,4,5', extra_numbers='1,2')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['matched_draws_count'], 1)
+        self.assertEqual(response.data['draws'][0]['draw_id'], self.draws[0].pk)
+        self.assertEqual(response.data['indexed_draws'], 3)
+
+    def test_at_least(self):
+        response = self._search(main_numbers='1,2,3,4,5', mode='at_least', min_matches=4)
+        self.assertEqual(response.data['matched_draws_count'], 2)
+        self.assertEqual(
+            [row['draw_id'] for row in response.data['draws']],
+            [self.draws[1].pk, self.draws[0].pk]
+        )
+        self.assertEqual(response.data['draws'][0]['matched_main_numbers'], 4)
+
+    def test_best_match(self):
+        response = self._search(main_numbers='1,2,3,6,49', mode='best')
+        self.assertEqual(response.data['best_match'], 4)
+        self.assertEqual([row['draw_id'] for row in response.data['draws']], [self.draws[1].pk])
+        self.assertEqual(response.data['match_histogram'][0], 1)
+
+    def test_validation(self):
+        self.assertEqual(self._search(lottery_id='', main_numbers='1').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self._search(main_numbers='a,b').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self._search(main_numbers='1', mode='any').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            self._search(main_numbers='1,2', mode='at_least', min_matches=3).status_code,
+            status.HTTP_400_BAD_REQUEST
+        )
+        for lottery_id in ('abc', '0', '-1'):
+            self.assertEqual(self._search(lottery_id=lottery_id, main_numbers='1').status_code,
+                             status.HTTP_400_BAD_REQUEST)
+        for limit in ('abc', '0', '-5'):
+            self.assertEqual(self._search(main_numbers='1', limit=limit).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_unknown_lottery(self):
+        unknown_id = self.lottery_game.pk + 1000
+        response = self._search(lottery_id=unknown_id, main_numbers='1')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertIsNone(cache.get(INDEX_CACHE_KEY.format(game_id=unknown_id)))
+
+    def test_limit(self):
+        response = self._search(main_numbers='1,2,3,4,5', mode='at_least', min_matches=4, limit=1)
+        self.assertEqual([row['draw_id'] for row in response.data['draws']], [self.draws[1].pk])
+        response = self._search(main_numbers='1,2,3,4,5', mode='at_least', min_matches=4, limit=10 ** 6)
+        self.assertEqual(len(response.data['draws']), 2)
+
+    def test_rebuild_command(self):
+        DrawNumberIndex.objects.all().delete()
+        cache.clear()
+        call_command('rebuild_number_index', lottery_id=self.lottery_game.pk, stdout=open('/dev/null', 'w'))
+        self.assertEqual(get_number_index(self.lottery_game.pk).size, 3)
+
+
+@pytest.mark.slow
+class NumberIndexBenchmark(TestCase):
+    """Поиск по ~40 годам истории (два розыгрыша в неделю) укладывается в 10 мс"""
+
+    DRAW_COUNT = 4200
+
+    def test_search_latency(self):
+        rng = random.Random(42)
+        index = NumberIndex()
+        for draw_id in range(self.DRAW_COUNT):
+            index.add_draw(draw_id, rng.sample(range(1, 51), 5), rng.sample(range(1, 13), 2))
+
+        numbers = [3, 14, 15, 27, 42]
+        started = time.perf_counter()
+        for _ in range(100):
+            counters = index.at_least(numbers)
+            index.histogram(counters)
+            list(index.draw_ids_for(counters[3], limit=20))
+            index.contains(numbers[:3])
+        elapsed_ms = (time.perf_counter() - started) * 1000 / 100
+
+        self.assertLess(elapsed_ms, 10)
@@ -0,0 +1,254 @@
+import time
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+from decimal import Decimal
+import datetime
+
+from .models import LotteryGame, Draw, Ticket
+from payments.models import Transaction
+from users.models import Notification
+
+User = get_user_model()
+
+
+def _create_tickets(user, draw, count):
+    """Массовое создание билетов без пересчёта ticket_count в Ticket.save()"""
+    Ticket.objects.bulk_create([
+        Ticket(
+            user=user,
+            draw=draw,
+            main_numbers=[1, 2, 3, 4, 5],
+            extra_numbers=[1, 2],
+            price=draw.lottery_game.ticket_price,
+        )
+        for _ in range(count)
+    ], batch_size=500)
+
+
+class KeysetPaginationTestCase(APITestCase):
+    """Тестирование keyset-пагинации истории пользователя"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='user@example.com',
+            username='testuser',
+            password='testpassword'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.lottery_game = LotteryGame.objects.create(
+            name="Test Lottery",
+            description="A test lottery game",
+            main_numbers_count=5,
+            main_numbers_range=50,
+            extra_numbers_count=2,
+            extra_numbers_range=12,
+            ticket_price=Decimal('2.50'),
+            draw_days="Tuesday,Friday",
+            draw_time="20:00:00",
+            is_active=True
+        )
+        self.draw = Draw.objects.create(
+            lottery_game=self.lottery_game,
+            draw_number=1,
+            draw_date=timezone.now() + datetime.timedelta(days=2),
+            jackpot_amount=Decimal('1000000.00')
+        )
+        # Билеты с одинаковой датой покупки проверяют разрешение коллизий по id
+        _create_tickets(self.user, self.draw, 25)
+        self.url = reverse('tickets-list')
+
+    def _collect(self, url):
+        ids = []
+        pages = 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+            pages += 1
+        return ids, pages
+
+    def test_legacy_mode_keeps_page_number_response(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 25)
+        self.assertEqual(len(response.data['results']), 10)
+
+    def test_keyset_mode_walks_all_rows_once(self):
+        response = self.client.get(self.url, {'pagination': 'cursor'})
+        self.assertNotIn('count', response.data)
+
+        ids, pages = self._collect(f'{self.url}?cursor=')
+        self.assertEqual(pages, 3)
+        self.assertEqual(len(ids), 25)
+        self.assertEqual(len(set(ids)), 25)
+        expected = list(Ticket.objects.filter(user=self.user).order_by('-purchase_date', '-id')
+                        .values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_previous_link_returns_preceding_page(self):
+        first = self.client.get(self.url, {'cursor': '', 'page_size': 5})
+        self.assertIsNone(first.data['previous'])
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(
+            [item['id'] for item in back.data['results']],
+            [item['id'] for item in first.data['results']]
+        )
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_transactions_and_notifications_support_keyset(self):
+        for i in range(3):
+            Transaction.objects.create(
+                user=self.user,
+                transaction_type='deposit',
+                amount=Decimal('10.00'),
+                status='completed',
+                balance_before=Decimal('0.00'),
+                balance_after=Decimal('10.00'),
+            )
+            Notification.objects.create(
+                user=self.user,
+                notification_type='system',
+                title=f'Notification {i}',
+                message='Test',
+            )
+
+        for name in ('transactions-list', 'notifications-list'):
+            response = self.client.get(reverse(name), {'cursor': '', 'page_size': 2})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(response.data['results']), 2)
+            self.assertIsNotNone(response.data['next'])
+
+
+class TicketListQueryCountTestCase(APITestCase):
+    """Количество запросов списка билетов не зависит от числа билетов"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='user@example.com',
+            username='testuser',
+            password='testpassword'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        for index in range(3):
+            game = LotteryGame.objects.create(
+                name=f"Lottery {index}",
+                main_numbers_count=5,
+                main_numbers_range=50,
+                extra_numbers_count=2,
+                extra_numbers_range=12,
+                ticket_price=Decimal('2.50'),
+                draw_days="Tuesday,Friday",
+                draw_time="20:00:00",
+            )
+            draw = Draw.objects.create(
+                lottery_game=game,
+                draw_number=index + 1,
+                draw_date=timezone.now() + datetime.timedelta(days=2),
+                jackpot_amount=Decimal('1000000.00')
+            )
+            _create_tickets(self.user, draw, 5)
+        self.url = reverse('tickets-list')
+
+    def test_full_list_has_no_per_ticket_queries(self):
+        # COUNT(*) для PageNumberPagination + один запрос с JOIN
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, {'page_size': 15})
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertIn('lottery_game', response.data['results'][0]['draw_info'])
+
+    def test_compact_view(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'view': 'compact', 'cursor': ''})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        row = response.data['results'][0]
+        ticket = Ticket.objects.select_related('draw__lottery_game').get(pk=row['id'])
+        self.assertEqual(row['ticket_id'], str(ticket.ticket_id))
+        self.assertEqual(row['lottery_game'], ticket.draw.lottery_game.name)
+        self.assertEqual(row['draw_number'], ticket.draw.draw_number)
+        self.assertEqual(row['main_numbers'], [1, 2, 3, 4, 5])
+        self.assertEqual(row['winning_amount'], '0.00')
+        self.assertNotIn('draw_info', row)
+
+    def test_compact_view_legacy_pagination(self):
+        response = self.client.get(self.url, {'view': 'compact', 'page': 2})
+        self.assertEqual(response.data['count'], 15)
+        self.assertEqual(len(response.data['results']), 5)
+
+
+@pytest.mark.slow
+class KeysetPaginationBenchmark(APITestCase):
+    """Сравнение стоимости глубоких страниц с первой страницей"""
+
+    TICKET_COUNT = 20000
+    PAGE_SIZE = 50
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='heavy@example.com',
+            username='heavyplayer',
+            password='testpassword'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        game = LotteryGame.objects.create(
+            name="Bench Lottery",
+            main_numbers_count=5,
+            main_numbers_range=50,
+            extra_numbers_count=2,
+            extra_numbers_range=12,
+            ticket_price=Decimal('2.50'),
+            draw_days="Tuesday,Friday",
+            draw_time="20:00:00",
+        )
+        draw = Draw.objects.create(
+            lottery_game=game,
+            draw_number=1,
+            draw_date=timezone.now() + datetime.timedelta(days=2),
+            jackpot_amount=Decimal('1000000.00')
+        )
+        _create_tickets(self.user, draw, self.TICKET_COUNT)
+        self.url = reverse('tickets-list')
+
+    def _timed_get(self, params):
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            response = self.client.get(self.url, params)
+            elapsed = time.perf_counter() - started
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, ctx.captured_queries, elapsed
+
+    def test_deep_page_costs_same_as_first_page(self):
+        # Курсор на позицию примерно в конце истории
+        deep_ticket = Ticket.objects.filter(user=self.user).order_by('-purchase_date', '-id')[
+            self.TICKET_COUNT - 2 * self.PAGE_SIZE
+        ]
+        from lottery_core.pagination import KeysetPagination
+        deep_cursor = KeysetPagination().encode_cursor((deep_ticket.purchase_date, deep_ticket.pk))
+
+        _, first_queries, first_time = self._timed_get({'cursor': '', 'page_size': self.PAGE_SIZE})
+        _, deep_queries, deep_time = self._timed_get({'cursor': deep_cursor, 'page_size': self.PAGE_SIZE})
+
+        self.assertEqual(len(first_queries), len(deep_queries))
+        for query in first_queries + deep_queries:
+            sql = query['sql'].upper()
+            self.assertNotIn('OFFSET', sql)
+            self.assertNotIn('COUNT(', sql)
+
+        # Глубокая страница не должна быть заметно дороже первой
+        self.assertLess(deep_time, max(first_time * 5, 0.5))
@@ -0,0 +1,187 @@
+from unittest.mock import patch
+from django.test import override_settings
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+from decimal import Decimal
+import datetime
+
+from .models import LotteryGame, Draw, Ticket, PurchaseOrder
+from .utils.purchase_queue import drain_purchase_queue
+from payments.models import Transaction
+
+User = get_user_model()
+
+
+class PurchaseQueueTestCase(APITestCase):
+    """Тестирование асинхронного режима покупки билетов"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='user@example.com',
+            username='testuser',
+            password='testpassword'
+        )
+        User.objects.filter(pk=self.user.pk).update(balance=Decimal('100.00'))
+        self.user.refresh_from_db()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.lottery_game = LotteryGame.objects.create(
+            name="Test Lottery",
+            main_numbers_count=5,
+            main_numbers_range=50,
+            extra_numbers_count=2,
+            extra_numbers_range=12,
+            ticket_price=Decimal('2.50'),
+            draw_days="Tuesday,Friday",
+            draw_time="20:00:00",
+        )
+        self.draw = Draw.objects.create(
+            lottery_game=self.lottery_game,
+            draw_number=1,
+            draw_date=timezone.now() + datetime.timedelta(days=2),
+            jackpot_amount=Decimal('1000000.00')
+        )
+        self.url = reverse('purchase-ticket')
+        self.payload = {
+            'draw_id': self.draw.id,
+            'tickets': [
+                {'main_numbers': [1, 2, 3, 4, 5], 'extra_numbers': [1, 2]},
+                {'main_numbers': [6, 7, 8, 9, 10], 'extra_numbers': [3, 4]},
+            ],
+            'async_purchase': True
+        }
+
+    @override_settings(CELERY_TASK_ALWAYS_EAGER=False)
+    def test_enqueue_reserves_funds_and_worker_issues_tickets(self):
+        with patch('lottery.tasks.process_purchase_queue.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(self.url, self.payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        delay.assert_called_once_with(self.draw.id)
+        self.assertEqual(response.data['status'], 'queued')
+        self.assertEqual(response.data['current_balance'], Decimal('95.00'))
+
+        # Средства зарезервированы, билеты еще не выпущены
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, Decimal('95.00'))
+        self.assertEqual(Ticket.objects.count(), 0)
+
+        status_url = response.data['status_url']
+        self.assertEqual(self.client.get(status_url).data['status'], 'queued')
+
+        self.assertEqual(drain_purchase_queue(), 1)
+
+        order = PurchaseOrder.objects.get(order_id=response.data['order_id'])
+        self.assertEqual(order.status, 'completed')
+        self.assertEqual(len(order.ticket_ids), 2)
+        self.assertEqual(Ticket.objects.filter(user=self.user, draw=self.draw).count(), 2)
+        purchase = Transaction.objects.get(user=self.user, transaction_type='ticket_purchase')
+        self.assertEqual(purchase.amount, Decimal('5.00'))
+        self.assertEqual(purchase.balance_after, Decimal('95.00'))
+        self.draw.refresh_from_db()
+        self.assertEqual(self.draw.ticket_count, 2)
+
+        response = self.client.get(status_url)
+        self.assertEqual(response.data['status'], 'completed')
+        self.assertEqual(sorted(response.data['ticket_ids']), sorted(order.ticket_ids))
+
+    @override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+    def test_in_process_drain_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, self.payload, format='json')
+        order = PurchaseOrder.objects.get(order_id=response.data['order_id'])
+        self.assertEqual(order.status, 'completed')
+
+    def test_batches_orders_per_draw(self):
+        with patch('lottery.tasks.process_purchase_queue.delay'):
+            for _ in range(6):
+                payload = dict(self.payload, tickets=self.payload['tickets'][:1])
+                self.client.post(self.url, payload, format='json')
+
+        # Число запросов не зависит от числа заказов в пачке: аренда заказов, блокировка
+        # розыгрыша и заказов, билеты, транзакции, заказы и счетчик розыгрыша, плюс пустой захват
+        with self.assertNumQueries(14):
+            self.assertEqual(drain_purchase_queue(batch_size=10), 6)
+        self.assertEqual(Ticket.objects.count(), 6)
+
+    def test_queued_tickets_count_towards_limit(self):
+        with patch('lottery.tasks.process_purchase_queue.delay'):
+            with override_settings(LOTTERY_SETTINGS={'MAX_TICKETS_PER_USER': 3, 'DRAW_BUFFER_TIME': 60}):
+                first = self.client.post(self.url, self.payload, format='json')
+                second = self.client.post(self.url, self.payload, format='json')
+        self.assertEqual(first.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(second.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_insufficient_funds(self):
+        User.objects.filter(pk=self.user.pk).update(balance=Decimal('1.00'))
+        response = self.client.post(self.url, self.payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(PurchaseOrder.objects.exists())
+
+    def test_failed_order_is_refunded(self):
+        with patch('lottery.tasks.process_purchase_queue.delay'):
+            response = self.client.post(self.url, self.payload, format='json')
+
+        with patch('lottery.utils.purchase_queue._issue_draw_orders', side_effect=RuntimeError('boom')):
+            drain_purchase_queue()
+
+        order = PurchaseOrder.objects.get(order_id=response.data['order_id'])
+        self.assertEqual(order.status, 'failed')
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, Decimal('100.00'))
+        self.assertTrue(Transaction.objects.filter(user=self.user, transaction_type='refund').exists())
+
+    def test_orders_for_started_draw_are_refunded(self):
+        with patch('lottery.tasks.process_purchase_queue.delay'):
+            response = self.client.post(self.url, self.payload, format='json')
+
+        # Розыгрыш начался раньше, чем очередь дошла до заказа
+        Draw.objects.filter(pk=self.draw.pk).update(status='in_progress')
+        self.assertEqual(drain_purchase_queue(), 1)
+
+        order = PurchaseOrder.objects.get(order_id=response.data['order_id'])
+        self.assertEqual(order.status, 'failed')
+        self.assertEqual(Ticket.objects.count(), 0)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, Decimal('100.00'))
+
+    def test_order_after_rescheduled_cutoff_is_refunded(self):
+        with patch('lottery.tasks.process_purchase_queue.delay'):
+            response = self.client.post(self.url, self.payload, format='json')
+
+        # Розыгрыш перенесен: заказ оказался принят после закрытия продаж
+        Draw.objects.filter(pk=self.draw.pk).update(draw_date=timezone.now() + datetime.timedelta(minutes=5))
+        drain_purchase_queue()
+
+        order = PurchaseOrder.objects.get(order_id=response.data['order_id'])
+        self.assertEqual(order.status, 'failed')
+        self.assertEqual(Ticket.objects.count(), 0)
+
+    def test_orders_of_dead_worker_are_reclaimed(self):
+        with patch('lottery.tasks.process_purchase_queue.delay'):
+            response = self.client.post(self.url, self.payload, format='json')
+
+        # Воркер захватил заказ и умер, не выпустив билеты
+        PurchaseOrder.objects.update(
+            status='processing', lease_owner='dead-worker',
+            lease_expires_at=timezone.now() + datetime.timedelta(minutes=5)
+        )
+        self.assertEqual(drain_purchase_queue(), 0)
+
+        PurchaseOrder.objects.update(lease_expires_at=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertEqual(drain_purchase_queue(), 1)
+        order = PurchaseOrder.objects.get(order_id=response.data['order_id'])
+        self.assertEqual(order.status, 'completed')
+        self.assertEqual(Ticket.objects.count(), 2)
+
+    def test_status_of_other_users_order_is_hidden(self):
+        with patch('lottery.tasks.process_purchase_queue.delay'):
+            response = self.client.post(self.url, self.payload, format='json')
+        other = User.objects.create_user(email='other@example.com', username='other', password='password')
+        client = APIClient()
+        client.force_authenticate(user=other)
+        self.assertEqual(client.get(response.data['status_url']).status_code, status.HTTP_404_NOT_FOUND)
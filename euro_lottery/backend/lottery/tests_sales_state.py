@@ -0,0 +1,126 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+from decimal import Decimal
+import datetime
+
+from .models import LotteryGame, Draw, Ticket
+from .utils.sales_state import get_draw_sales_state
+
+User = get_user_model()
+
+
+class DrawSalesStateTestCase(APITestCase):
+    """Тестирование кэша состояния продаж розыгрыша"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='user@example.com',
+            username='testuser',
+            password='testpassword'
+        )
+        User.objects.filter(pk=self.user.pk).update(balance=Decimal('100.00'))
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.lottery_game = LotteryGame.objects.create(
+            name="Test Lottery",
+            main_numbers_count=5,
+            main_numbers_range=50,
+            extra_numbers_count=2,
+            extra_numbers_range=12,
+            ticket_price=Decimal('2.50'),
+            draw_days="Tuesday,Friday",
+            draw_time="20:00:00",
+        )
+        self.draw = Draw.objects.create(
+            lottery_game=self.lottery_game,
+            draw_number=1,
+            draw_date=timezone.now() + datetime.timedelta(days=2),
+            jackpot_amount=Decimal('1000000.00')
+        )
+        self.url = reverse('purchase-ticket')
+        self.payload = {
+            'draw_id': self.draw.id,
+            'tickets': [{'main_numbers': [1, 2, 3, 4, 5], 'extra_numbers': [1, 2]}]
+        }
+
+    def test_state_is_built_once_and_cached(self):
+        with self.assertNumQueries(1):
+            state = get_draw_sales_state(self.draw.id)
+        with self.assertNumQueries(0):
+            self.assertIs(get_draw_sales_state(self.draw.id).is_open(), True)
+
+        self.assertEqual(state.ticket_price, Decimal('2.50'))
+        self.assertEqual(state.main_numbers_range, 50)
+        self.assertIsNone(get_draw_sales_state(self.draw.id + 1000))
+
+    def test_purchase_does_not_read_draw_or_game(self):
+        get_draw_sales_state(self.draw.id)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, self.payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        selects = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT') and (
+                'FROM "lottery_draw"' in query['sql'] or 'FROM "lottery_lotterygame"' in query['sql']
+            )
+        ]
+        self.assertEqual(selects, [])
+        self.assertEqual(response.data['tickets'][0]['draw_info']['lottery_game'], "Test Lottery")
+
+        self.draw.refresh_from_db()
+        self.assertEqual(self.draw.ticket_count, 1)
+
+    def test_status_change_invalidates_state(self):
+        self.assertTrue(get_draw_sales_state(self.draw.id).is_open())
+
+        self.draw.status = 'in_progress'
+        self.draw.save()
+
+        self.assertFalse(get_draw_sales_state(self.draw.id).is_open())
+        response = self.client.post(self.url, self.payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('draw_id', response.data)
+
+    def test_game_change_invalidates_state(self):
+        get_draw_sales_state(self.draw.id)
+
+        self.lottery_game.ticket_price = Decimal('3.00')
+        self.lottery_game.save()
+
+        response = self.client.post(self.url, self.payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Decimal(str(response.data['total_price'])), Decimal('3.00'))
+
+    @override_settings(LOTTERY_SETTINGS={'DRAW_BUFFER_TIME': 60, 'MAX_TICKETS_PER_USER': 10})
+    def test_sales_close_draw_buffer_time_before_draw(self):
+        closing_draw = Draw.objects.create(
+            lottery_game=self.lottery_game,
+            draw_number=2,
+            draw_date=timezone.now() + datetime.timedelta(minutes=30),
+            jackpot_amount=Decimal('1000000.00')
+        )
+        state = get_draw_sales_state(closing_draw.id)
+        self.assertFalse(state.is_open())
+        self.assertFalse(closing_draw.is_open_for_tickets)
+        self.assertTrue(state.is_open(now=closing_draw.draw_date - datetime.timedelta(minutes=61)))
+
+        response = self.client.post(self.url, dict(self.payload, draw_id=closing_draw.id), format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Ticket.objects.count(), 0)
+
+    def test_numbers_validated_against_cached_rules(self):
+        payload = dict(self.payload, tickets=[{'main_numbers': [1, 2, 3, 4, 51], 'extra_numbers': [1, 2]}])
+        response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("Main numbers must be between 1 and 50", str(response.data))
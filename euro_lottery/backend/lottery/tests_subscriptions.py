@@ -0,0 +1,177 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+from decimal import Decimal
+import datetime
+
+from payments.models import Transaction
+from users.models import Notification
+from .models import LotteryGame, Draw, Ticket, Subscription
+from .tasks import schedule_next_draws
+from .utils.subscriptions import materialize_subscriptions
+
+User = get_user_model()
+
+LINE_A = {'main_numbers': [1, 2, 3, 4, 5], 'extra_numbers': [1, 2]}
+LINE_B = {'main_numbers': [6, 7, 8, 9, 10], 'extra_numbers': [3, 4]}
+
+
+class SubscriptionTestCase(APITestCase):
+    """Тестирование подписок на несколько розыгрышей"""
+
+    def setUp(self):
+        cache.clear()
+        self.lottery_game = LotteryGame.objects.create(
+            name="Test Lottery",
+            main_numbers_count=5,
+            main_numbers_range=50,
+            extra_numbers_count=2,
+            extra_numbers_range=12,
+            ticket_price=Decimal('2.50'),
+            draw_days="Tuesday,Friday",
+            draw_time="20:00:00",
+        )
+        self.alice = self._user('alice', Decimal('100.00'))
+        self.bob = self._user('bob', Decimal('100.00'))
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.alice)
+        self.draw_number = 0
+
+    def _user(self, name, balance):
+        user = User.objects.create_user(email=f'{name}@example.com', username=name, password='password')
+        User.objects.filter(pk=user.pk).update(balance=balance)
+        user.refresh_from_db()
+        return user
+
+    def _subscribe(self, user, lines, draws_total=None):
+        return Subscription.objects.create(
+            user=user, lottery_game=self.lottery_game, lines=lines, draws_total=draws_total
+        )
+
+    def _next_draw(self):
+        self.draw_number += 1
+        return Draw.objects.create(
+            lottery_game=self.lottery_game,
+            draw_number=self.draw_number,
+            draw_date=timezone.now() + datetime.timedelta(days=2 + self.draw_number),
+            jackpot_amount=Decimal('1000000.00')
+        )
+
+    def _balance(self, user):
+        user.refresh_from_db()
+        return user.balance
+
+    def test_subscriptions_materialized_with_one_bulk_insert(self):
+        self._subscribe(self.alice, [LINE_A, LINE_B])
+        self._subscribe(self.alice, [LINE_A])
+        self._subscribe(self.bob, [LINE_B])
+        draw = self._next_draw()
+
+        with CaptureQueriesContext(connection) as queries:
+            stats = materialize_subscriptions(draw)
+
+        ticket_inserts = [q for q in queries.captured_queries if q['sql'].startswith('INSERT INTO "lottery_ticket"')]
+        self.assertEqual(len(ticket_inserts), 1)
+        self.assertEqual(stats, {'played': 3, 'refused': 0, 'users': 2, 'tickets': 4})
+
+        self.assertEqual(Ticket.objects.filter(user=self.alice, draw=draw).count(), 3)
+        self.assertEqual(Ticket.objects.filter(user=self.bob, draw=draw).count(), 1)
+        # Одно списание на пользователя за все его подписки
+        self.assertEqual(Transaction.objects.filter(user=self.alice, transaction_type='ticket_purchase').count(), 1)
+        self.assertEqual(self._balance(self.alice), Decimal('92.50'))
+        self.assertEqual(self._balance(self.bob), Decimal('97.50'))
+
+        draw.refresh_from_db()
+        self.assertEqual(draw.ticket_count, 4)
+
+    def test_materialization_is_idempotent_per_draw(self):
+        self._subscribe(self.alice, [LINE_A])
+        draw = self._next_draw()
+        materialize_subscriptions(draw)
+        self.assertEqual(materialize_subscriptions(draw)['tickets'], 0)
+        self.assertEqual(Ticket.objects.count(), 1)
+
+    def test_limited_subscription_completes(self):
+        subscription = self._subscribe(self.alice, [LINE_A], draws_total=2)
+        for _ in range(3):
+            materialize_subscriptions(self._next_draw())
+
+        subscription.refresh_from_db()
+        self.assertEqual(subscription.status, 'completed')
+        self.assertEqual(subscription.draws_played, 2)
+        self.assertEqual(Ticket.objects.filter(user=self.alice).count(), 2)
+
+    def test_insufficient_funds_skips_user_and_suspends(self):
+        poor = self._user('poor', Decimal('1.00'))
+        subscription = self._subscribe(poor, [LINE_A])
+        self._subscribe(self.bob, [LINE_B])
+
+        stats = materialize_subscriptions(self._next_draw())
+        self.assertEqual(stats['refused'], 1)
+        self.assertEqual(stats['tickets'], 1)
+        self.assertFalse(Ticket.objects.filter(user=poor).exists())
+        self.assertEqual(self._balance(poor), Decimal('1.00'))
+
+        subscription.refresh_from_db()
+        self.assertEqual(subscription.consecutive_failures, 1)
+        self.assertEqual(subscription.last_failure_reason, "Insufficient funds")
+        self.assertEqual(subscription.status, 'active')
+        self.assertTrue(Notification.objects.filter(user=poor, notification_type='system').exists())
+
+        materialize_subscriptions(self._next_draw())
+        materialize_subscriptions(self._next_draw())
+        subscription.refresh_from_db()
+        self.assertEqual(subscription.status, 'suspended')
+
+        # После пополнения и возобновления подписка снова играет
+        User.objects.filter(pk=poor.pk).update(balance=Decimal('50.00'))
+        self.client.force_authenticate(user=poor)
+        response = self.client.post(reverse('resume-subscription', args=[subscription.subscription_id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        materialize_subscriptions(self._next_draw())
+        self.assertEqual(Ticket.objects.filter(user=poor).count(), 1)
+
+    def test_schedule_next_draws_materializes_new_draw(self):
+        self._subscribe(self.alice, [LINE_A])
+        self.assertTrue(schedule_next_draws())
+
+        draw = Draw.objects.get(lottery_game=self.lottery_game)
+        self.assertEqual(Ticket.objects.filter(user=self.alice, draw=draw).count(), 1)
+
+    def test_create_subscription_via_api(self):
+        self._next_draw()
+        response = self.client.post(reverse('subscriptions'), {
+            'lottery_game': self.lottery_game.id,
+            'lines': [{'main_numbers': [5, 4, 3, 2, 1], 'extra_numbers': [2, 1]}],
+            'draws_total': 4,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['draws_remaining'], 4)
+
+        subscription = Subscription.objects.get(user=self.alice)
+        self.assertEqual(subscription.lines, [LINE_A])
+        # Уже открытый розыгрыш не затрагивается, подписка начинается со следующего
+        self.assertEqual(subscription.last_draw_number, 1)
+
+    def test_invalid_lines_rejected(self):
+        response = self.client.post(reverse('subscriptions'), {
+            'lottery_game': self.lottery_game.id,
+            'lines': [{'main_numbers': [1, 2, 3, 4, 51], 'extra_numbers': [1, 2]}],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_cancel_subscription(self):
+        subscription = self._subscribe(self.alice, [LINE_A])
+        url = reverse('cancel-subscription', args=[subscription.subscription_id])
+        self.assertEqual(self.client.post(url).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.post(url).status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.assertEqual(materialize_subscriptions(self._next_draw())['played'], 0)
+
+        self.client.force_authenticate(user=self.bob)
+        self.assertEqual(self.client.post(url).status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,123 @@
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from unittest.mock import patch
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+from celery.backends.base import DisabledBackend
+import json
+import os
+import tempfile
+import time
+
+from lottery_core import task_metrics
+from .tasks import process_purchase_queue, arm_draw_executions
+
+NO_DIR = {'ENABLED': True, 'DIR': '', 'WORKER_PORT': 0, 'AUTH_TOKEN': ''}
+
+
+@override_settings(TASK_METRICS=NO_DIR)
+class TaskMetricsTestCase(TestCase):
+    """Тестирование инструментирования Celery-задач"""
+
+    def setUp(self):
+        task_metrics.registry.reset()
+        # apply() не хранит результат, бэкенд результатов тестам не нужен
+        for task in (process_purchase_queue, arm_draw_executions):
+            patcher = patch.object(task, '_backend', DisabledBackend(task.app))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _snapshot(self):
+        return task_metrics.registry.snapshot()
+
+    def test_task_run_recorded(self):
+        """Время, запросы к БД и обработанные строки записываются по задаче"""
+        process_purchase_queue.apply()
+        snapshot = self._snapshot()
+        name = process_purchase_queue.name
+
+        self.assertEqual(snapshot['counters']['celery_task_runs_total'][name], 1)
+        self.assertEqual(snapshot['histograms']['celery_task_duration_seconds'][name]['count'], 1)
+        self.assertGreater(snapshot['histograms']['celery_task_db_queries'][name]['sum'], 0)
+        # Пустая очередь: 0 заказов в первой корзине
+        self.assertEqual(snapshot['histograms']['celery_task_rows_processed'][name]['buckets'][0], 1)
+        self.assertIn(name, snapshot['gauges']['celery_task_last_success_timestamp_seconds'])
+        self.assertNotIn(name, snapshot['counters']['celery_task_failures_total'])
+
+    def test_returned_false_counts_as_failure(self):
+        """Задача, вернувшая False после ошибки, считается неуспешной"""
+        with patch('lottery.utils.purchase_queue.drain_purchase_queue', side_effect=RuntimeError('boom')):
+            process_purchase_queue.apply()
+        name = process_purchase_queue.name
+        snapshot = self._snapshot()
+        self.assertEqual(snapshot['counters']['celery_task_failures_total'][name], 1)
+        self.assertNotIn(name, snapshot['gauges']['celery_task_last_success_timestamp_seconds'])
+
+    def test_queue_lag_from_enqueue_header(self):
+        """Задержка очереди считается от заголовка enqueued_at"""
+        arm_draw_executions.apply(headers={task_metrics.ENQUEUED_HEADER: time.time() - 3})
+        lag = self._snapshot()['histograms']['celery_task_queue_lag_seconds'][arm_draw_executions.name]
+        self.assertEqual(lag['count'], 1)
+        self.assertGreaterEqual(lag['sum'], 3)
+
+    def test_prometheus_text_labels(self):
+        """Текстовый формат Prometheus с метками задачи и записи расписания"""
+        process_purchase_queue.apply()
+        text = task_metrics.render()
+
+        labels = 'task="lottery.tasks.process_purchase_queue",schedule="process-purchase-queue"'
+        self.assertIn('# TYPE celery_task_duration_seconds histogram', text)
+        self.assertIn(f'celery_task_duration_seconds_bucket{{{labels},le="+Inf"}} 1', text)
+        self.assertIn(f'celery_task_runs_total{{{labels}}} 1', text)
+        # Задачи расписания, которые еще не запускались, видны с нулем
+        self.assertIn(
+            'celery_task_runs_total{task="lottery.tasks.schedule_next_draws",schedule="schedule-next-draws"} 0',
+            text
+        )
+
+    def test_metrics_endpoint(self):
+        """Эндпоинт /metrics отдает метрики только по токену, без токена он закрыт"""
+        self.assertEqual(self.client.get(reverse('task-metrics')).status_code, 401)
+        response = self.client.get(reverse('task-metrics'), HTTP_AUTHORIZATION='Bearer ')
+        self.assertEqual(response.status_code, 401)
+
+        with self.settings(TASK_METRICS=dict(NO_DIR, AUTH_TOKEN='secret')):
+            self.assertEqual(self.client.get(reverse('task-metrics')).status_code, 401)
+            response = self.client.get(reverse('task-metrics'), HTTP_AUTHORIZATION='Bearer wrong')
+            self.assertEqual(response.status_code, 401)
+            response = self.client.get(reverse('task-metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertIn(b'celery_task_runs_total', response.content)
+
+    def test_worker_metrics_server(self):
+        """Сервер воркера проверяет токен, а без токена слушает только loopback"""
+        with self.assertRaises(ValueError):
+            task_metrics.start_metrics_server(0, bind='0.0.0.0')
+
+        with self.settings(TASK_METRICS=dict(NO_DIR, AUTH_TOKEN='secret')):
+            server = task_metrics.start_metrics_server(0, bind='127.0.0.1')
+            self.addCleanup(server.server_close)
+            self.addCleanup(server.shutdown)
+            url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+
+            with self.assertRaises(HTTPError) as denied:
+                urlopen(url, timeout=5)
+            self.assertEqual(denied.exception.code, 401)
+            with urlopen(Request(url, headers={'Authorization': 'Bearer secret'}), timeout=5) as response:
+                self.assertEqual(response.status, 200)
+                self.assertIn(b'celery_task_runs_total', response.read())
+
+    def test_snapshots_of_processes_are_merged(self):
+        """Снимки нескольких процессов суммируются"""
+        name = process_purchase_queue.name
+        with tempfile.TemporaryDirectory() as directory:
+            with self.settings(TASK_METRICS=dict(NO_DIR, DIR=directory)):
+                process_purchase_queue.apply()
+                other = task_metrics.registry.snapshot()
+                with open(os.path.join(directory, 'other-worker-1.json'), 'w') as f:
+                    json.dump(other, f)
+
+                merged = task_metrics.collect()
+        self.assertEqual(merged['counters']['celery_task_runs_total'][name], 2)
+        self.assertEqual(merged['histograms']['celery_task_duration_seconds'][name]['count'], 2)
@@ -0,0 +1,98 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase
+from io import StringIO
+from unittest.mock import patch
+
+from lottery_core.celery import app
+
+
+class TaskRoutingTestCase(SimpleTestCase):
+    """Тестирование распределения задач по очередям"""
+
+    def _route(self, task_name):
+        return app.amqp.router.route({}, task_name)
+
+    def test_draw_execution_has_own_queue_and_top_priority(self):
+        """Проведение розыгрыша идет в очередь draws с наивысшим приоритетом"""
+        route = self._route('lottery.tasks.conduct_draw_at_eta')
+        self.assertEqual(route['queue'].name, 'draws')
+        self.assertEqual(route['priority'], 0)
+
+        self.assertEqual(self._route('lottery.tasks.check_ticket_winnings')['queue'].name, 'settlement')
+        self.assertEqual(self._route('payments.tasks.check_pending_deposits')['queue'].name, 'payments')
+        self.assertEqual(self._route('users.tasks.send_pending_notifications')['queue'].name, 'notifications')
+
+    def test_every_periodic_task_routed_to_configured_queue(self):
+        """Каждая периодическая задача направлена в объявленную очередь"""
+        for entry in settings.CELERY_BEAT_SCHEDULE.values():
+            route = settings.CELERY_TASK_ROUTES.get(entry['task'])
+            self.assertIsNotNone(route, entry['task'])
+            self.assertIn(route['queue'], settings.CELERY_QUEUE_CONCURRENCY)
+
+    def test_unrouted_task_goes_to_maintenance(self):
+        """Задачи без маршрута попадают в очередь обслуживания"""
+        self.assertEqual(self._route('lottery_core.celery.debug_task')['queue'].name, 'maintenance')
+
+
+class QueueDepthCommandTestCase(SimpleTestCase):
+    """Тестирование команды queue_depth"""
+
+    def setUp(self):
+        self.addCleanup(self._purge)
+        # Воркеров в тестах нет: ответ active_queues() подставляем
+        self.active_queues = {}
+        patcher = patch.object(app.control, 'inspect')
+        patcher.start().return_value.active_queues.side_effect = lambda: self.active_queues
+        self.addCleanup(patcher.stop)
+
+    def _purge(self):
+        with app.connection_for_write() as conn:
+            for queue in settings.CELERY_TASK_QUEUES:
+                queue(conn.default_channel).declare()
+                queue(conn.default_channel).purge()
+
+    def _publish(self, task_name, count):
+        queue = app.amqp.router.route({}, task_name)['queue']
+        with app.producer_or_acquire() as producer:
+            for _ in range(count):
+                producer.publish({'task': task_name}, exchange=queue.exchange,
+                                 routing_key=queue.routing_key, declare=[queue])
+
+    def test_reports_depth_per_queue(self):
+        """Команда показывает число сообщений в каждой очереди"""
+        self._purge()
+        self._publish('payments.tasks.check_pending_deposits', 3)
+
+        out = StringIO()
+        call_command('queue_depth', stdout=out)
+        lines = {line.split()[0]: line.split()[1:] for line in out.getvalue().splitlines()[1:]}
+        self.assertEqual(lines['payments'][0], '3')
+        self.assertEqual(lines['draws'][0], '0')
+        self.assertEqual(set(lines), set(settings.CELERY_QUEUE_CONCURRENCY))
+
+    def test_reports_consumers_per_queue(self):
+        """Число потребителей берется из ответов воркеров, а не от брокера"""
+        self.active_queues = {
+            'draws@host1': [{'name': 'draws'}],
+            'draws@host2': [{'name': 'draws'}, {'name': 'payments'}],
+        }
+
+        out = StringIO()
+        call_command('queue_depth', stdout=out)
+        lines = {line.split()[0]: line.split()[1:] for line in out.getvalue().splitlines()[1:]}
+        self.assertEqual(lines['draws'][1], '2')
+        self.assertEqual(lines['payments'][1], '1')
+        self.assertEqual(lines['notifications'][1], '0')
+
+    def test_fail_above_threshold(self):
+        """С --fail-above команда завершается ошибкой при переполненной очереди"""
+        self._purge()
+        self._publish('users.tasks.send_pending_notifications', 2)
+
+        call_command('queue_depth', queues=['notifications'], fail_above=2, stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command('queue_depth', queues=['notifications'], fail_above=1, stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command('queue_depth', queues=['unknown'], stdout=StringIO())
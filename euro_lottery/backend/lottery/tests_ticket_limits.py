@@ -0,0 +1,95 @@
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+from decimal import Decimal
+import datetime
+
+from .models import LotteryGame, Draw, Ticket, UserDrawTicketCount
+from .utils.ticket_limits import reserve_tickets, release_tickets, TicketLimitExceededError
+
+User = get_user_model()
+
+
+@override_settings(LOTTERY_SETTINGS={'MAX_TICKETS_PER_USER': 3, 'DRAW_BUFFER_TIME': 60})
+class TicketLimitTestCase(APITestCase):
+    """Тестирование счетчика билетов пользователя на розыгрыш"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='user@example.com',
+            username='testuser',
+            password='testpassword'
+        )
+        User.objects.filter(pk=self.user.pk).update(balance=Decimal('100.00'))
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        lottery_game = LotteryGame.objects.create(
+            name="Test Lottery",
+            main_numbers_count=5,
+            main_numbers_range=50,
+            extra_numbers_count=2,
+            extra_numbers_range=12,
+            ticket_price=Decimal('2.50'),
+            draw_days="Tuesday,Friday",
+            draw_time="20:00:00",
+        )
+        self.draw = Draw.objects.create(
+            lottery_game=lottery_game,
+            draw_number=1,
+            draw_date=timezone.now() + datetime.timedelta(days=2),
+            jackpot_amount=Decimal('1000000.00')
+        )
+        self.url = reverse('purchase-ticket')
+
+    def _purchase(self, count):
+        tickets = [
+            {'main_numbers': [i + 1, i + 2, i + 3, i + 4, i + 5], 'extra_numbers': [1, 2]}
+            for i in range(count)
+        ]
+        return self.client.post(self.url, {'draw_id': self.draw.id, 'tickets': tickets}, format='json')
+
+    def _counter(self):
+        return UserDrawTicketCount.objects.get(user=self.user, draw=self.draw).count
+
+    def test_purchases_are_counted_up_to_the_cap(self):
+        self.assertEqual(self._purchase(2).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self._counter(), 2)
+
+        response = self._purchase(2)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], "You can buy a maximum of 3 tickets per draw")
+
+        self.assertEqual(self._purchase(1).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self._counter(), 3)
+        self.assertEqual(Ticket.objects.filter(user=self.user, draw=self.draw).count(), 3)
+
+    def test_reservation_is_a_single_statement(self):
+        reserve_tickets(self.user.pk, self.draw.pk, 1)
+        with self.assertNumQueries(1):
+            reserve_tickets(self.user.pk, self.draw.pk, 1)
+        with self.assertNumQueries(2):
+            # Полный счетчик: условный UPDATE не срабатывает, строка уже существует
+            with self.assertRaises(TicketLimitExceededError):
+                reserve_tickets(self.user.pk, self.draw.pk, 2)
+        self.assertEqual(self._counter(), 2)
+
+    def test_refused_purchase_does_not_consume_quota(self):
+        User.objects.filter(pk=self.user.pk).update(balance=Decimal('1.00'))
+
+        response = self._purchase(2)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], "Insufficient funds")
+        self.assertFalse(UserDrawTicketCount.objects.filter(user=self.user, draw=self.draw).exists())
+
+    def test_release_returns_tickets_to_quota(self):
+        reserve_tickets(self.user.pk, self.draw.pk, 3)
+        release_tickets(self.user.pk, self.draw.pk, 2)
+        self.assertEqual(self._counter(), 1)
+        reserve_tickets(self.user.pk, self.draw.pk, 2)
+        self.assertEqual(self._counter(), 3)
@@ -0,0 +1,257 @@
+import time
+from itertools import combinations
+from math import comb
+
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+from decimal import Decimal
+import datetime
+from io import StringIO
+
+from payments.models import Transaction
+from .models import LotteryGame, Draw, Ticket, WheelDesign
+from .utils.wheeling import Wheel, WheelError, build_covering_design, store_covering_design
+
+User = get_user_model()
+
+LOTTERY_SETTINGS = {'MAX_TICKETS_PER_USER': 20000, 'DRAW_BUFFER_TIME': 60, 'MAX_WHEEL_LINES': 20000}
+
+
+def _wheel(main_numbers, extra_numbers=(1, 2), guarantee=None):
+    return Wheel(5, 50, 2, 12, main_numbers, extra_numbers, guarantee)
+
+
+class WheelEngineTestCase(TestCase):
+    """Тестирование генератора системных ставок"""
+
+    def setUp(self):
+        cache.clear()
+        store_covering_design(10, 5, 3)
+
+    def test_full_wheel_plays_every_combination(self):
+        wheel = _wheel(range(1, 8), extra_numbers=[1, 2, 3])
+        lines = list(wheel)
+        self.assertEqual(len(wheel), comb(7, 5) * comb(3, 2))
+        self.assertEqual(len(lines), len(wheel))
+        self.assertEqual(len({(tuple(main), tuple(extra)) for main, extra in lines}), len(lines))
+        self.assertTrue(wheel.is_full)
+
+    def test_guarantee_equal_to_line_size_is_full_wheel(self):
+        self.assertTrue(_wheel(range(1, 8), guarantee=5).is_full)
+
+    def test_covering_design_covers_every_subset(self):
+        for v, t in ((10, 3), (12, 2), (12, 4)):
+            blocks = build_covering_design(v, 5, t)
+            covered = {subset for block in blocks for subset in combinations(block, t)}
+            self.assertEqual(len(covered), comb(v, t))
+            self.assertLess(len(blocks), comb(v, 5))
+
+    def test_abbreviated_wheel_guarantee(self):
+        pool = [3, 7, 11, 19, 23, 28, 31, 40, 44, 49]
+        wheel = _wheel(pool, guarantee=3)
+        lines = [set(main) for main, _ in wheel]
+        self.assertLess(len(lines), comb(10, 5))
+        # Любые 3 выпавших числа из пула встречаются хотя бы в одной линии
+        for drawn in combinations(pool, 3):
+            self.assertTrue(any(set(drawn) <= line for line in lines))
+
+    def test_design_is_stored_and_reused(self):
+        self.assertTrue(WheelDesign.objects.filter(points=10, block_size=5, guarantee=3).exists())
+        _, built = store_covering_design(10, 5, 3)
+        self.assertFalse(built)
+
+        with self.assertNumQueries(1):
+            _wheel(range(1, 11), guarantee=3).main_line_count()
+        with self.assertNumQueries(0):
+            _wheel(range(11, 21), guarantee=3).main_line_count()
+
+    def test_missing_design_is_not_built_on_request(self):
+        with self.assertRaises(WheelError):
+            _wheel(range(1, 12), guarantee=3).main_line_count()
+        self.assertFalse(WheelDesign.objects.filter(points=11).exists())
+
+    def test_precompute_command_covers_every_guarantee(self):
+        LotteryGame.objects.create(
+            name="Small Lottery", main_numbers_count=3, main_numbers_range=20,
+            extra_numbers_count=1, extra_numbers_range=5, ticket_price=Decimal('1.00'),
+            draw_days="Tuesday", draw_time="20:00:00",
+        )
+        call_command('precompute_wheel_designs', max_numbers=6, stdout=StringIO())
+        self.assertEqual(
+            set(WheelDesign.objects.filter(block_size=3).values_list('points', 'guarantee')),
+            {(v, t) for v in range(4, 7) for t in (1, 2)}
+        )
+
+    def test_lines_are_generated_lazily(self):
+        wheel = _wheel(range(1, 31), extra_numbers=range(1, 13))
+        first = next(iter(wheel))
+        self.assertEqual(first, ([1, 2, 3, 4, 5], [1, 2]))
+        self.assertEqual(len(wheel), comb(30, 5) * comb(12, 2))
+
+    def test_invalid_pools(self):
+        with self.assertRaises(WheelError):
+            _wheel([1, 2, 3, 4])
+        with self.assertRaises(WheelError):
+            _wheel([1, 2, 3, 4, 5, 5])
+        with self.assertRaises(WheelError):
+            _wheel([1, 2, 3, 4, 5, 51])
+        with self.assertRaises(WheelError):
+            _wheel(range(1, 8), guarantee=6)
+
+
+@override_settings(LOTTERY_SETTINGS=LOTTERY_SETTINGS)
+class WheelPurchaseTestCase(APITestCase):
+    """Тестирование покупки системной ставки"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='user@example.com',
+            username='testuser',
+            password='testpassword',
+            daily_limit=Decimal('100000.00'),
+            weekly_limit=Decimal('100000.00'),
+            monthly_limit=Decimal('100000.00'),
+        )
+        User.objects.filter(pk=self.user.pk).update(balance=Decimal('1000.00'))
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        lottery_game = LotteryGame.objects.create(
+            name="Test Lottery",
+            main_numbers_count=5,
+            main_numbers_range=50,
+            extra_numbers_count=2,
+            extra_numbers_range=12,
+            ticket_price=Decimal('2.50'),
+            draw_days="Tuesday,Friday",
+            draw_time="20:00:00",
+        )
+        self.draw = Draw.objects.create(
+            lottery_game=lottery_game,
+            draw_number=1,
+            draw_date=timezone.now() + datetime.timedelta(days=2),
+            jackpot_amount=Decimal('1000000.00')
+        )
+        self.url = reverse('purchase-wheel')
+        store_covering_design(10, 5, 3)
+
+    def _post(self, **data):
+        payload = {'draw_id': self.draw.id, 'main_numbers': [1, 2, 3, 4, 5, 6, 7], 'extra_numbers': [1, 2]}
+        payload.update(data)
+        return self.client.post(self.url, payload, format='json')
+
+    def test_dry_run_prices_without_buying(self):
+        response = self._post(dry_run=True)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['line_count'], 21)
+        self.assertEqual(response.data['total_price'], Decimal('52.50'))
+        self.assertEqual(Ticket.objects.count(), 0)
+
+    def test_full_wheel_purchase_in_one_transaction(self):
+        response = self._post()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['line_count'], 21)
+        self.assertEqual(response.data['current_balance'], Decimal('947.50'))
+
+        purchase = Transaction.objects.get(transaction_type='ticket_purchase')
+        tickets = Ticket.objects.filter(user=self.user, draw=self.draw)
+        self.assertEqual(tickets.count(), 21)
+        self.assertEqual(set(tickets.values_list('transaction_id', flat=True)), {str(purchase.transaction_id)})
+        self.assertEqual(purchase.amount, Decimal('52.50'))
+
+        self.draw.refresh_from_db()
+        self.assertEqual(self.draw.ticket_count, 21)
+
+    def test_abbreviated_wheel_purchase(self):
+        response = self._post(main_numbers=list(range(1, 11)), guarantee=3)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(response.data['is_full_wheel'])
+        self.assertEqual(Ticket.objects.count(), response.data['line_count'])
+        self.assertLess(response.data['line_count'], comb(10, 5))
+
+    def test_wheel_without_precomputed_design_rejected(self):
+        response = self._post(main_numbers=list(range(1, 12)), guarantee=3, dry_run=True)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("not available", str(response.data))
+
+    def test_ticket_cap_rejects_whole_wheel(self):
+        with override_settings(LOTTERY_SETTINGS=dict(LOTTERY_SETTINGS, MAX_TICKETS_PER_USER=10)):
+            response = self._post()
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Ticket.objects.count(), 0)
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_insufficient_funds_rejects_whole_wheel(self):
+        User.objects.filter(pk=self.user.pk).update(balance=Decimal('10.00'))
+        response = self._post()
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Ticket.objects.count(), 0)
+
+    def test_wheel_size_limit(self):
+        with override_settings(LOTTERY_SETTINGS=dict(LOTTERY_SETTINGS, MAX_WHEEL_LINES=20)):
+            response = self._post()
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("maximum is 20", str(response.data))
+
+
+@pytest.mark.slow
+@override_settings(LOTTERY_SETTINGS=LOTTERY_SETTINGS)
+class WheelBenchmark(TestCase):
+    """Генерация и покупка системной ставки на ~12 тыс. линий"""
+
+    MAIN_POOL = list(range(1, 15))  # C(14, 5) = 2002
+    EXTRA_POOL = [1, 2, 3, 4]       # C(4, 2) = 6 -> 12012 линий
+
+    def test_generation_speed(self):
+        wheel = _wheel(self.MAIN_POOL, self.EXTRA_POOL)
+        started = time.perf_counter()
+        generated = sum(1 for _ in wheel)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        self.assertEqual(generated, 12012)
+        self.assertLess(elapsed_ms, 200)
+
+    def test_abbreviated_design_speed(self):
+        started = time.perf_counter()
+        blocks = build_covering_design(30, 5, 4)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        self.assertLess(len(blocks), comb(30, 5))
+        self.assertLess(elapsed_ms, 3000)
+
+    def test_bulk_purchase_speed(self):
+        from .utils.bulk_purchase import purchase_lines
+        from .utils.sales_state import get_draw_sales_state
+
+        user = User.objects.create_user(
+            email='bench@example.com', username='bench', password='password',
+            daily_limit=Decimal('100000.00'), weekly_limit=Decimal('100000.00'),
+            monthly_limit=Decimal('100000.00'),
+        )
+        User.objects.filter(pk=user.pk).update(balance=Decimal('100000.00'))
+        game = LotteryGame.objects.create(
+            name="Bench Lottery", main_numbers_count=5, main_numbers_range=50,
+            extra_numbers_count=2, extra_numbers_range=12, ticket_price=Decimal('2.50'),
+            draw_days="Tuesday", draw_time="20:00:00",
+        )
+        draw = Draw.objects.create(
+            lottery_game=game, draw_number=1, jackpot_amount=Decimal('1000000.00'),
+            draw_date=timezone.now() + datetime.timedelta(days=2),
+        )
+        wheel = _wheel(self.MAIN_POOL, self.EXTRA_POOL)
+
+        started = time.perf_counter()
+        purchase = purchase_lines(user, get_draw_sales_state(draw.id), wheel, len(wheel), description="Benchmark wheel")
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(purchase.ticket_count, 12012)
+        self.assertEqual(Ticket.objects.filter(draw=draw).count(), 12012)
+        self.assertLess(elapsed, 30)
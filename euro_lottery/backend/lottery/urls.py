@@ -5,6 +5,7 @@ urlpatterns = [
     # Информация о лотереях
     path('games/', views.LotteryGameListView.as_view(), name='lottery-games'),
     path('games/<int:pk>/', views.LotteryGameDetailView.as_view(), name='lottery-game-detail'),
+    path('games/<int:pk>/next-draw/', views.NextDrawView.as_view(), name='lottery-game-next-draw'),
     
     # Розыгрыши
     path('draws/', views.DrawListView.as_view(), name='draws-list'),
@@ -15,7 +16,10 @@ urlpatterns = [
     # Билеты
     path('tickets/', views.TicketListView.as_view(), name='tickets-list'),
     path('tickets/purchase/', views.PurchaseTicketView.as_view(), name='purchase-ticket'),
+    path('tickets/wheel/', views.WheelPurchaseView.as_view(), name='purchase-wheel'),
+    path('tickets/orders/<uuid:order_id>/', views.PurchaseOrderStatusView.as_view(), name='purchase-order-status'),
     path('tickets/<uuid:ticket_id>/', views.TicketDetailView.as_view(), name='ticket-detail'),
+    path('tickets/check/', views.BatchCheckTicketsView.as_view(), name='check-tickets-batch'),
     path('tickets/check/<uuid:ticket_id>/', views.CheckTicketView.as_view(), name='check-ticket'),
     
     # Сохраненные комбинации
@@ -24,6 +28,13 @@ urlpatterns = [
     path('saved-combinations/<int:pk>/', views.SavedCombinationDetailView.as_view(), name='saved-combination-detail'),
     path('saved-combinations/<int:pk>/delete/', views.DeleteSavedCombinationView.as_view(), name='delete-saved-combination'),
     
+    # Подписки на несколько розыгрышей
+    path('subscriptions/', views.SubscriptionListView.as_view(), name='subscriptions'),
+    path('subscriptions/<uuid:subscription_id>/cancel/', views.SubscriptionStatusView.as_view(),
+         {'action': 'cancel'}, name='cancel-subscription'),
+    path('subscriptions/<uuid:subscription_id>/resume/', views.SubscriptionStatusView.as_view(),
+         {'action': 'resume'}, name='resume-subscription'),
+    
     # Выигрыши
     path('winnings/', views.WinningsListView.as_view(), name='winnings-list'),
     path('winnings/<int:pk>/', views.WinningDetailView.as_view(), name='winning-detail'),
@@ -31,6 +42,7 @@ urlpatterns = [
     # Статистика и информация
     path('statistics/', views.LotteryStatisticsView.as_view(), name='lottery-statistics'),
     path('hot-numbers/', views.HotNumbersView.as_view(), name='hot-numbers'),
+    path('number-search/', views.NumberSearchView.as_view(), name='number-search'),
     
     # Admin controls
     path('admin/draws/conduct/', views.AdminDrawControlView.as_view(), name='admin-conduct-draw'),
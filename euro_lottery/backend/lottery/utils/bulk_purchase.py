@@ -0,0 +1,92 @@
+"""
+Bulk ticket purchase for large line sets such as wheels.
+
+The regular purchase view saves tickets one by one, each save recounting
+the draw. For thousands of lines the whole purchase is one transaction:
+the ticket cap, spend limits and the debit are reserved for the total line
+count up front, a single purchase Transaction is recorded, and the tickets
+are inserted with bulk_create in slices taken lazily from the line source.
+"""
+
+import logging
+from collections import namedtuple
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import F
+
+from payments import wallet
+from users import spending
+
+from . import ticket_limits
+
+logger = logging.getLogger(__name__)
+
+INSERT_BATCH_SIZE = 1000
+
+BulkPurchase = namedtuple('BulkPurchase', ['transaction', 'ticket_count', 'total_price', 'balance_change'])
+
+
+def purchase_lines(user, sales_state, lines: Iterable[Tuple[List[int], List[int]]], line_count: int,
+                   description: str, metadata: Optional[Dict[str, Any]] = None,
+                   ip_address: Optional[str] = None, user_agent: Optional[str] = None) -> BulkPurchase:
+    """
+    Buy ``line_count`` tickets for the draw of ``sales_state`` in one transaction.
+
+    ``lines`` yields (main_numbers, extra_numbers) pairs and must produce
+    exactly ``line_count`` of them. Raises the errors of
+    ticket_limits.reserve_tickets, spending.reserve_spend and wallet.debit;
+    nothing is written in that case.
+    """
+    from lottery.models import Draw, Ticket
+    from payments.models import Transaction
+
+    total_price = sales_state.price_for(line_count)
+    lines = iter(lines)
+
+    with transaction.atomic():
+        ticket_limits.reserve_tickets(user.pk, sales_state.draw_id, line_count)
+        spending.reserve_spend(user, total_price)
+        balance_change = wallet.debit(user, total_price)
+
+        purchase = Transaction.objects.create(
+            user=user,
+            transaction_type='ticket_purchase',
+            amount=total_price,
+            balance_before=balance_change.balance_before,
+            balance_after=balance_change.balance_after,
+            status='completed',
+            description=description,
+            metadata=dict(metadata or {}, ticket_count=line_count),
+        )
+
+        inserted = 0
+        while True:
+            batch = list(islice(lines, INSERT_BATCH_SIZE))
+            if not batch:
+                break
+            Ticket.objects.bulk_create([
+                Ticket(
+                    user=user,
+                    draw_id=sales_state.draw_id,
+                    main_numbers=main_numbers,
+                    extra_numbers=extra_numbers,
+                    price=sales_state.ticket_price,
+                    transaction_id=str(purchase.transaction_id),
+                    ip_address=ip_address,
+                    user_agent=user_agent,
+                )
+                for main_numbers, extra_numbers in batch
+            ])
+            inserted += len(batch)
+
+        if inserted != line_count:
+            # Rolls back the debit and the reservations with the tickets
+            raise ValueError(f"Expected {line_count} lines, got {inserted}")
+
+        # bulk_create bypasses Ticket.save(), so the draw counter is advanced once here
+        Draw.objects.filter(pk=sales_state.draw_id).update(ticket_count=F('ticket_count') + inserted)
+
+    logger.info(f"Bulk purchase of {inserted} ticket(s) for draw {sales_state.draw_id} by user {user.pk}")
+    return BulkPurchase(purchase, inserted, total_price, balance_change)
@@ -0,0 +1,13 @@
+"""
+Client address of a request, as recorded on transactions and sessions.
+"""
+
+
+def get_client_ip(request):
+    """First address of X-Forwarded-For (set by the proxy), else REMOTE_ADDR"""
+    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    if x_forwarded_for:
+        ip = x_forwarded_for.split(',')[0]
+    else:
+        ip = request.META.get('REMOTE_ADDR')
+    return ip
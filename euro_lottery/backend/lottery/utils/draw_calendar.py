@@ -0,0 +1,159 @@
+"""
+Draw calendar: when a game's draws take place.
+
+There used to be two diverging answers - LotteryGame.get_next_draw_date
+(draw_time combined with the current timezone, 7-day scan) and
+tasks._calculate_next_draw_date (relativedelta, hard-coded 20:00) - and
+both re-parsed ``draw_days`` on every call. A game's schedule is now
+compiled once into a DrawCalendar:
+
+- ``draw_days``: comma-separated weekday names, e.g. "Tuesday,Friday";
+- ``draw_time``: the wall-clock time of the draw;
+- ``rules['timezone']``: the zone ``draw_time`` is in (TIME_ZONE if unset),
+  so draws keep their local time across DST changes;
+- ``rules['holidays']``: ISO dates on which no draw takes place.
+
+Compiled calendars are memoized per distinct schedule in the process, so
+editing a game's schedule simply compiles a new one.
+
+The next draw of each game is cached for countdowns
+(get_next_draw_info); the Draw and LotteryGame signals drop the entry.
+"""
+
+import logging
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Iterator, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+WEEKDAYS = {
+    'monday': 0, 'tuesday': 1, 'wednesday': 2, 'thursday': 3,
+    'friday': 4, 'saturday': 5, 'sunday': 6,
+}
+DEFAULT_DRAW_TIME = time(20, 0)
+
+# Bounds the scan of a calendar whose draw days are all holidays
+MAX_SCAN_DAYS = 366 * 2
+
+NEXT_DRAW_CACHE_KEY = 'lottery:next_draw:{lottery_game_id}'
+NEXT_DRAW_CACHE_TIMEOUT = 60 * 60
+
+
+class DrawCalendar:
+    """
+    Compiled schedule of a game
+    """
+
+    __slots__ = ('weekdays', 'draw_time', 'tz', 'holidays')
+
+    def __init__(self, weekdays: FrozenSet[int], draw_time: time, tz, holidays: FrozenSet[date]):
+        self.weekdays = weekdays
+        self.draw_time = draw_time
+        self.tz = tz
+        self.holidays = holidays
+
+    def occurrences(self, after: datetime, count: int) -> Iterator[datetime]:
+        """The next ``count`` draw datetimes strictly after ``after``"""
+        if not self.weekdays or count <= 0:
+            return
+        day = after.astimezone(self.tz).date()
+        for _ in range(MAX_SCAN_DAYS):
+            if day.weekday() in self.weekdays and day not in self.holidays:
+                moment = datetime.combine(day, self.draw_time, tzinfo=self.tz)
+                if moment > after:
+                    yield moment
+                    count -= 1
+                    if not count:
+                        return
+            day += timedelta(days=1)
+
+    def next_after(self, after: datetime) -> Optional[datetime]:
+        return next(self.occurrences(after, 1), None)
+
+    def upcoming(self, count: int, now: Optional[datetime] = None) -> List[datetime]:
+        return list(self.occurrences(now or timezone.now(), count))
+
+
+def _parse_draw_time(value) -> time:
+    if isinstance(value, str):
+        return datetime.strptime(value, '%H:%M:%S').time()
+    return value or DEFAULT_DRAW_TIME
+
+
+def _parse_timezone(name: Optional[str]):
+    try:
+        return ZoneInfo(name or settings.TIME_ZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.error(f"Unknown draw timezone '{name}', falling back to {settings.TIME_ZONE}")
+        return ZoneInfo(settings.TIME_ZONE)
+
+
+@lru_cache(maxsize=256)
+def _compile(draw_days: str, draw_time: time, timezone_name: Optional[str],
+             holidays: Tuple[str, ...]) -> DrawCalendar:
+    weekdays = frozenset(
+        WEEKDAYS[day.strip().lower()] for day in draw_days.split(',')
+        if day.strip().lower() in WEEKDAYS
+    )
+    holiday_dates = set()
+    for value in holidays:
+        try:
+            holiday_dates.add(date.fromisoformat(value))
+        except (TypeError, ValueError):
+            logger.error(f"Ignoring invalid holiday date '{value}'")
+    return DrawCalendar(weekdays, draw_time, _parse_timezone(timezone_name), frozenset(holiday_dates))
+
+
+def get_draw_calendar(game) -> DrawCalendar:
+    """Compiled calendar of a LotteryGame"""
+    rules = game.rules or {}
+    return _compile(
+        game.draw_days or '',
+        _parse_draw_time(game.draw_time),
+        rules.get('timezone'),
+        tuple(str(day) for day in rules.get('holidays', ())),
+    )
+
+
+def _cache_key(lottery_game_id) -> str:
+    return NEXT_DRAW_CACHE_KEY.format(lottery_game_id=lottery_game_id)
+
+
+def invalidate_next_draw(lottery_game_id) -> None:
+    cache.delete(_cache_key(lottery_game_id))
+
+
+def get_next_draw_info(game, now=None) -> Dict[str, Any]:
+    """
+    Next draw of a game with its countdown.
+
+    The next scheduled Draw is used if there is one, the calendar
+    otherwise (``draw_id`` is then None). Only the draw is cached; the
+    countdown is computed against it on every call.
+    """
+    from lottery.models import Draw
+
+    now = now or timezone.now()
+    key = _cache_key(game.pk)
+    info = cache.get(key)
+    if info is None or info['draw_date'] <= now:
+        draw = Draw.objects.filter(
+            lottery_game_id=game.pk, status='scheduled', draw_date__gt=now
+        ).order_by('draw_date').values('id', 'draw_number', 'draw_date').first()
+        if draw is not None:
+            info = {'draw_id': draw['id'], 'draw_number': draw['draw_number'], 'draw_date': draw['draw_date']}
+        else:
+            draw_date = get_draw_calendar(game).next_after(now)
+            info = {'draw_id': None, 'draw_number': None, 'draw_date': draw_date}
+        if info['draw_date'] is None:
+            return dict(info, seconds_until_draw=None)
+        timeout = min(NEXT_DRAW_CACHE_TIMEOUT, int((info['draw_date'] - now).total_seconds()) + 1)
+        cache.set(key, info, timeout)
+
+    return dict(info, seconds_until_draw=max(int((info['draw_date'] - now).total_seconds()), 0))
@@ -0,0 +1,162 @@
+"""
+Conducting draws at their draw time.
+
+conduct_pending_draws used to poll every five minutes, so a draw ran up to
+five minutes late, and overlapping runs on several workers could all pick
+up the same draw. Now:
+
+- when a draw due within ARM_HORIZON is created or its draw_date changes, a
+  ``conduct_draw_at_eta`` task is sent with ``eta=draw_date`` once the
+  transaction commits; ``arm_draw_executions`` sends it for draws that come
+  within ARM_HORIZON later on. A marker per (draw, draw_date) in the shared
+  cache keeps web and worker processes from sending duplicates. Far-off
+  draws get no message yet: with late acks an ETA message stays unacked
+  in the Redis broker until it runs and is redelivered after the broker's
+  ``visibility_timeout``, which therefore has to exceed ARM_HORIZON;
+- whoever conducts a draw - the ETA task, the polling safety net or the
+  conduct_draw command - first takes the draw's execution lease
+  (lottery_core.leases), so exactly one worker conducts it. A lease whose
+  holder died expires after DRAW_LEASE_SECONDS and can be taken over.
+
+The ETA task carries the draw_date it was armed for. A task of a draw that
+was rescheduled since does nothing; the task armed for the new date does
+the work.
+"""
+
+import logging
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from lottery_core import leases
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEASE_SECONDS = 600
+LEASE_OWNER_FIELD = 'execution_lease_owner'
+LEASE_EXPIRES_FIELD = 'execution_lease_expires_at'
+
+# Must be longer than the arm_draw_executions beat interval and shorter than
+# the broker visibility_timeout (CELERY_BROKER_TRANSPORT_OPTIONS)
+ARM_HORIZON = timedelta(hours=1)
+ARMED_CACHE_KEY = 'lottery:draw_eta:{draw_id}:{timestamp}'
+ARMED_MARKER_GRACE = 60 * 60
+
+
+def lease_seconds() -> int:
+    return settings.LOTTERY_SETTINGS.get('DRAW_LEASE_SECONDS', DEFAULT_LEASE_SECONDS)
+
+
+def acquire_draw_lease(draw_id, owner: str, now=None) -> bool:
+    """
+    Take the execution lease of a scheduled draw.
+
+    Succeeds for one caller only, unless the lease expires first.
+    """
+    from lottery.models import Draw
+
+    return bool(leases.claim(
+        Draw.objects.filter(pk=draw_id, status='scheduled'), 1, owner, lease_seconds(),
+        owner_field=LEASE_OWNER_FIELD, expires_field=LEASE_EXPIRES_FIELD, now=now,
+    ))
+
+
+def release_draw_lease(draw_id, owner: str) -> None:
+    from lottery.models import Draw
+
+    leases.release(Draw, [draw_id], owner, owner_field=LEASE_OWNER_FIELD, expires_field=LEASE_EXPIRES_FIELD)
+
+
+def conduct_draw_exclusively(draw_id, owner: Optional[str] = None):
+    """
+    Conduct the draw if the caller wins its execution lease.
+
+    Returns the conducted Draw, or None if the draw is not scheduled or
+    another worker holds the lease. Errors of Draw.conduct_draw propagate;
+    the lease is released either way.
+    """
+    from lottery.models import Draw
+
+    owner = owner or leases.new_owner()
+    if not acquire_draw_lease(draw_id, owner):
+        return None
+    try:
+        # Loaded after the lease is taken: conduct_draw saves the whole row
+        draw = Draw.objects.select_related('lottery_game').get(pk=draw_id)
+        draw.conduct_draw()
+    finally:
+        release_draw_lease(draw_id, owner)
+    draw.execution_lease_owner = ''
+    draw.execution_lease_expires_at = None
+    return draw
+
+
+def _armed_key(draw) -> str:
+    return ARMED_CACHE_KEY.format(draw_id=draw.pk, timestamp=int(draw.draw_date.timestamp()))
+
+
+def schedule_draw_execution(draw, now=None) -> bool:
+    """
+    Send the ETA task of a scheduled draw due within ARM_HORIZON, unless
+    one was already sent for its current draw_date. Returns whether a task
+    was sent; draws further away are left to arm_due_draws.
+    """
+    from lottery.tasks import conduct_draw_at_eta
+
+    if draw.status != 'scheduled':
+        return False
+    if getattr(settings, 'CELERY_TASK_ALWAYS_EAGER', False):
+        # An eager task would run right away instead of at the ETA; local runs rely on the polling task
+        return False
+
+    now = now or timezone.now()
+    seconds_left = max(int((draw.draw_date - now).total_seconds()), 0)
+    if seconds_left > ARM_HORIZON.total_seconds():
+        return False
+    if not cache.add(_armed_key(draw), True, seconds_left + ARMED_MARKER_GRACE):
+        return False
+
+    conduct_draw_at_eta.apply_async(args=[draw.pk, draw.draw_date.isoformat()], eta=draw.draw_date)
+    logger.info(f"Draw {draw.pk} armed for {draw.draw_date.isoformat()}")
+    return True
+
+
+def arm_due_draws(now=None) -> int:
+    """Send the ETA tasks of scheduled draws due within ARM_HORIZON"""
+    from lottery.models import Draw
+
+    now = now or timezone.now()
+    due_draws = Draw.objects.filter(
+        status='scheduled', draw_date__lte=now + ARM_HORIZON
+    ).only('id', 'status', 'draw_date')
+    return sum(1 for draw in due_draws if schedule_draw_execution(draw, now=now))
+
+
+def run_draw_at_eta(draw_id, armed_for: str) -> str:
+    """
+    Body of the ETA task. Returns what happened: 'conducted', 'locked'
+    (another worker has it), 'early' (re-armed), 'stale' (rescheduled)
+    or 'skipped' (not scheduled any more).
+    """
+    from lottery.models import Draw
+    from lottery.tasks import conduct_draw_at_eta
+
+    draw = Draw.objects.filter(pk=draw_id).values('status', 'draw_date').first()
+    if draw is None or draw['status'] != 'scheduled':
+        return 'skipped'
+    if parse_datetime(armed_for) != draw['draw_date']:
+        return 'stale'
+    if draw['draw_date'] > timezone.now():
+        # Worker clock ahead of the scheduler: try again at the ETA
+        if not getattr(settings, 'CELERY_TASK_ALWAYS_EAGER', False):
+            conduct_draw_at_eta.apply_async(args=[draw_id, armed_for], eta=draw['draw_date'])
+        return 'early'
+
+    if conduct_draw_exclusively(draw_id) is None:
+        return 'locked'
+    logger.info(f"Draw {draw_id} conducted at its ETA")
+    return 'conducted'
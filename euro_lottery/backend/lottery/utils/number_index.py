@@ -0,0 +1,216 @@
+"""
+Inverted index from drawn numbers to completed draws.
+
+Each completed draw of a game is assigned an ordinal. For every number the
+index keeps a bitmap (a Python int, bit ``i`` set when draw ``i`` contained
+the number), stored zlib-compressed in DrawNumberIndex. Searches are then a
+handful of AND/OR operations and popcounts over these bitmaps:
+
+- containment: AND of the bitmaps of all requested numbers;
+- "at least N of my numbers": a bit-sliced counter where ``at_least[k]``
+  marks the draws matching ``k`` or more numbers;
+- best match: the highest ``k`` whose ``at_least[k]`` bitmap is non-empty.
+
+Decoded indexes are cached in the Django cache, so a search does not touch
+the database until the matched draws themselves are loaded.
+"""
+
+import base64
+import logging
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+INDEX_CACHE_KEY = 'lottery:number_index:{game_id}'
+INDEX_CACHE_TIMEOUT = 60 * 60 * 24
+
+INDEXED_DRAW_STATUSES = ('completed', 'verified')
+
+
+def encode_bitmap(bitmap: int) -> str:
+    """Serialize a bitmap as base64 of its zlib-compressed little-endian bytes"""
+    raw = bitmap.to_bytes(max((bitmap.bit_length() + 7) // 8, 1), 'little')
+    return base64.b64encode(zlib.compress(raw)).decode('ascii')
+
+
+def decode_bitmap(value: str) -> int:
+    return int.from_bytes(zlib.decompress(base64.b64decode(value)), 'little')
+
+
+class NumberIndex:
+    """
+    Decoded, in-memory form of a game's DrawNumberIndex
+    """
+
+    def __init__(self, draw_ids: Optional[List[int]] = None,
+                 main: Optional[Dict[int, int]] = None,
+                 extra: Optional[Dict[int, int]] = None):
+        self.draw_ids = list(draw_ids or [])
+        self.main = dict(main or {})
+        self.extra = dict(extra or {})
+        self._indexed = set(self.draw_ids)
+
+    @classmethod
+    def from_model(cls, index) -> 'NumberIndex':
+        return cls(
+            draw_ids=index.draw_ids,
+            main={int(number): decode_bitmap(value) for number, value in index.main_bitmaps.items()},
+            extra={int(number): decode_bitmap(value) for number, value in index.extra_bitmaps.items()},
+        )
+
+    def apply_to(self, index) -> None:
+        index.draw_ids = self.draw_ids
+        index.main_bitmaps = {str(number): encode_bitmap(bitmap) for number, bitmap in self.main.items()}
+        index.extra_bitmaps = {str(number): encode_bitmap(bitmap) for number, bitmap in self.extra.items()}
+
+    def __contains__(self, draw_id) -> bool:
+        return draw_id in self._indexed
+
+    @property
+    def size(self) -> int:
+        return len(self.draw_ids)
+
+    @property
+    def universe(self) -> int:
+        """Bitmap with every indexed draw set"""
+        return (1 << self.size) - 1
+
+    def add_draw(self, draw_id: int, main_numbers: Iterable[int], extra_numbers: Iterable[int]) -> bool:
+        """Append a draw; returns False if it was already indexed"""
+        if draw_id in self._indexed:
+            return False
+
+        bit = 1 << self.size
+        self.draw_ids.append(draw_id)
+        self._indexed.add(draw_id)
+        for number in main_numbers or []:
+            self.main[number] = self.main.get(number, 0) | bit
+        for number in extra_numbers or []:
+            self.extra[number] = self.extra.get(number, 0) | bit
+        return True
+
+    # Queries
+
+    def contains(self, main_numbers: Sequence[int], extra_numbers: Sequence[int] = ()) -> int:
+        """Draws whose results contain every requested number"""
+        result = self.universe
+        for number in main_numbers:
+            result &= self.main.get(number, 0)
+        for number in extra_numbers:
+            result &= self.extra.get(number, 0)
+        return result
+
+    def at_least(self, numbers: Sequence[int], extra: bool = False) -> List[int]:
+        """
+        Bit-sliced match counter: element ``k`` is the bitmap of draws that
+        matched at least ``k`` of ``numbers`` (element 0 is every draw)
+        """
+        bitmaps = self.extra if extra else self.main
+        counters = [self.universe] + [0] * len(numbers)
+        for number in numbers:
+            bitmap = bitmaps.get(number, 0)
+            if not bitmap:
+                continue
+            for k in range(len(numbers), 0, -1):
+                counters[k] |= counters[k - 1] & bitmap
+        return counters
+
+    def histogram(self, counters: List[int]) -> Dict[int, int]:
+        """Number of draws matching exactly ``k`` numbers, from at_least() counters"""
+        result = {}
+        for k, bitmap in enumerate(counters):
+            upper = counters[k + 1] if k + 1 < len(counters) else 0
+            result[k] = (bitmap & ~upper).bit_count()
+        return result
+
+    def draw_ids_for(self, bitmap: int, limit: Optional[int] = None) -> Iterator[int]:
+        """Draw IDs for the set bits of ``bitmap``, most recently indexed first"""
+        produced = 0
+        while bitmap and (limit is None or produced < limit):
+            ordinal = bitmap.bit_length() - 1
+            bitmap ^= 1 << ordinal
+            produced += 1
+            yield self.draw_ids[ordinal]
+
+
+def _cache_key(game_id) -> str:
+    return INDEX_CACHE_KEY.format(game_id=game_id)
+
+
+def invalidate_number_index(game_id) -> None:
+    cache.delete(_cache_key(game_id))
+
+
+def get_number_index(game_id) -> NumberIndex:
+    """
+    Return the decoded index of a game, loading it into the cache on a miss.
+
+    Raises LotteryGame.DoesNotExist for an unknown game, so arbitrary IDs do
+    not fill the cache with empty indexes.
+    """
+    from lottery.models import DrawNumberIndex, LotteryGame
+
+    key = _cache_key(game_id)
+    index = cache.get(key)
+    if index is None:
+        stored = DrawNumberIndex.objects.filter(lottery_game_id=game_id).first()
+        if stored is None and not LotteryGame.objects.filter(pk=game_id).exists():
+            raise LotteryGame.DoesNotExist(f"LotteryGame {game_id} does not exist")
+        index = NumberIndex.from_model(stored) if stored else NumberIndex()
+        cache.set(key, index, INDEX_CACHE_TIMEOUT)
+    return index
+
+
+def add_draw_to_index(draw) -> bool:
+    """
+    Index a completed draw. Safe to call repeatedly for the same draw.
+    """
+    from lottery.models import DrawNumberIndex
+
+    if draw.status not in INDEXED_DRAW_STATUSES or not draw.main_numbers:
+        return False
+
+    with transaction.atomic():
+        stored, _ = DrawNumberIndex.objects.select_for_update().get_or_create(
+            lottery_game_id=draw.lottery_game_id
+        )
+        index = NumberIndex.from_model(stored)
+        if not index.add_draw(draw.pk, draw.main_numbers, draw.extra_numbers):
+            return False
+        index.apply_to(stored)
+        stored.save()
+
+        invalidate_number_index(draw.lottery_game_id)
+        # Drop whatever a concurrent reader cached before this transaction committed
+        transaction.on_commit(lambda: invalidate_number_index(draw.lottery_game_id))
+
+    logger.debug(f"Draw {draw.pk} added to number index of game {draw.lottery_game_id}")
+    return True
+
+
+def rebuild_number_index(lottery_game) -> NumberIndex:
+    """Rebuild a game's index from scratch in draw date order"""
+    from lottery.models import Draw, DrawNumberIndex
+
+    index = NumberIndex()
+    draws = Draw.objects.filter(
+        lottery_game=lottery_game,
+        status__in=INDEXED_DRAW_STATUSES,
+        main_numbers__isnull=False,
+    ).order_by('draw_date', 'id').values_list('id', 'main_numbers', 'extra_numbers')
+
+    for draw_id, main_numbers, extra_numbers in draws.iterator():
+        index.add_draw(draw_id, main_numbers, extra_numbers)
+
+    with transaction.atomic():
+        stored, _ = DrawNumberIndex.objects.select_for_update().get_or_create(lottery_game=lottery_game)
+        index.apply_to(stored)
+        stored.save()
+        transaction.on_commit(lambda: invalidate_number_index(lottery_game.pk))
+
+    invalidate_number_index(lottery_game.pk)
+    return index
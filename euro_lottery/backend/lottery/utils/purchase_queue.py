@@ -0,0 +1,258 @@
+"""
+Write-behind purchase queue.
+
+In the last minutes before a big draw, synchronous purchases pile up on the
+same Draw and User rows. In the asynchronous mode the request path only
+validates, reserves funds with a single conditional UPDATE and records a
+PurchaseOrder; the Celery task ``process_purchase_queue`` then issues the
+tickets and purchase transactions of many orders at once, one bulk insert
+per draw.
+
+PurchaseOrder rows are the durable queue and the Celery message is only a
+wake-up signal, so a lost message delays orders until the periodic drain
+instead of losing them. With ``CELERY_TASK_ALWAYS_EAGER`` (local runs) the
+drain happens in-process right after the enqueueing transaction commits.
+
+Orders are leased to the draining worker, so a worker that dies mid-batch
+only delays its orders until the lease expires. Tickets are issued under a
+lock of the draw row: orders for a draw that has started, or placed after
+its sales closed (e.g. the draw was rescheduled earlier), are failed and
+refunded instead.
+"""
+
+import logging
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from lottery_core import leases
+from payments import wallet
+from users import spending
+
+from . import ticket_limits
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_CLAIM_SECONDS = 300
+
+
+def _batch_size() -> int:
+    return settings.LOTTERY_SETTINGS.get('PURCHASE_QUEUE_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+
+def _claim_seconds() -> int:
+    return settings.LOTTERY_SETTINGS.get('PURCHASE_QUEUE_CLAIM_SECONDS', DEFAULT_CLAIM_SECONDS)
+
+
+def enqueue_purchase(user, draw_id: int, tickets_data: List[Dict[str, Any]], ticket_price,
+                     ip_address: Optional[str] = None, user_agent: Optional[str] = None):
+    """
+    Reserve funds and queue a purchase order.
+
+    Raises ticket_limits.TicketLimitExceededError over the per-draw cap,
+    spending.SpendingBlockedError if responsible-gaming rules refuse it and
+    wallet.InsufficientFundsError if the balance does not cover it.
+    """
+    from lottery.models import PurchaseOrder
+    from lottery.tasks import process_purchase_queue
+
+    total_amount = ticket_price * len(tickets_data)
+
+    with transaction.atomic():
+        ticket_limits.reserve_tickets(user.pk, draw_id, len(tickets_data))
+        spending.reserve_spend(user, total_amount)
+        balance_change = wallet.debit(user, total_amount)
+        order = PurchaseOrder.objects.create(
+            user=user,
+            draw_id=draw_id,
+            tickets=tickets_data,
+            ticket_count=len(tickets_data),
+            ticket_price=ticket_price,
+            total_amount=total_amount,
+            balance_before=balance_change.balance_before,
+            balance_after=balance_change.balance_after,
+            ip_address=ip_address,
+            user_agent=user_agent,
+        )
+        if getattr(settings, 'CELERY_TASK_ALWAYS_EAGER', False):
+            # Local runs without a broker: drain in-process once the order is committed
+            transaction.on_commit(lambda: drain_purchase_queue(draw_id=draw_id))
+        else:
+            transaction.on_commit(lambda: process_purchase_queue.delay(draw_id))
+
+    return order
+
+
+def _claim_batch(draw_id: Optional[int], batch_size: int, owner: str) -> Dict[int, List[int]]:
+    """
+    Lease up to ``batch_size`` orders to ``owner`` and move them to 'processing'.
+
+    Workers claim disjoint batches (see lottery_core.leases). Orders left in
+    'processing' by a worker that died are claimed again once their lease
+    has expired: issuing is atomic, so they hold no tickets yet. Returns the
+    claimed order ids grouped by draw.
+    """
+    from lottery.models import PurchaseOrder
+
+    queryset = PurchaseOrder.objects.filter(status__in=('queued', 'processing'))
+    if draw_id is not None:
+        queryset = queryset.filter(draw_id=draw_id)
+
+    pks = leases.claim(queryset, batch_size, owner, _claim_seconds())
+    if not pks:
+        return {}
+    PurchaseOrder.objects.filter(pk__in=pks, lease_owner=owner).update(status='processing')
+
+    by_draw = defaultdict(list)
+    for pk, order_draw_id in (
+        PurchaseOrder.objects.filter(pk__in=pks, lease_owner=owner).order_by('id').values_list('id', 'draw_id')
+    ):
+        by_draw[order_draw_id].append(pk)
+    return by_draw
+
+
+def _lock_draw_orders(draw_id: int, order_ids: List[int], owner: str):
+    """
+    Lock the draw and the orders still leased to ``owner``.
+
+    Returns the draw and the orders split into those that can be issued and
+    those placed after sales closed or for a draw that no longer sells. The
+    draw row lock orders the issue against the draw being conducted.
+    """
+    from lottery.models import Draw, PurchaseOrder
+
+    draw = Draw.objects.select_for_update(of=('self',)).select_related('lottery_game').get(pk=draw_id)
+    orders = list(
+        PurchaseOrder.objects.select_for_update()
+        .filter(pk__in=order_ids, status='processing', lease_owner=owner)
+        .order_by('id')
+    )
+    # An order accepted before the cutoff is honoured while the draw has not started
+    if draw.status != 'scheduled':
+        return draw, [], orders
+    cutoff = draw.sales_close_at
+    return draw, [order for order in orders if order.created_at < cutoff], [
+        order for order in orders if order.created_at >= cutoff
+    ]
+
+
+def _issue_draw_orders(draw, orders) -> None:
+    """Bulk insert tickets and purchase transactions for one draw's orders"""
+    from lottery.models import Ticket, PurchaseOrder
+    from payments.models import Transaction
+
+    now = timezone.now()
+    tickets = []
+    transactions = []
+    for order in orders:
+        transaction_id = uuid.uuid4()
+        order_tickets = [
+            Ticket(
+                user_id=order.user_id,
+                draw=draw,
+                main_numbers=data['main_numbers'],
+                extra_numbers=data['extra_numbers'],
+                is_quick_pick=data.get('is_quick_pick', False),
+                price=order.ticket_price,
+                transaction_id=str(transaction_id),
+                ip_address=order.ip_address,
+                user_agent=order.user_agent,
+            )
+            for data in order.tickets
+        ]
+        tickets.extend(order_tickets)
+        transactions.append(Transaction(
+            transaction_id=transaction_id,
+            user_id=order.user_id,
+            transaction_type='ticket_purchase',
+            amount=order.total_amount,
+            balance_before=order.balance_before,
+            balance_after=order.balance_after,
+            status='completed',
+            description=(
+                f"Purchase of {order.ticket_count} ticket(s) for "
+                f"{draw.lottery_game.name} Draw #{draw.draw_number}"
+            ),
+            metadata={'purchase_order_id': str(order.order_id)},
+        ))
+        order.ticket_ids = [str(ticket.ticket_id) for ticket in order_tickets]
+        order.status = 'completed'
+        order.processed_at = now
+
+    Ticket.objects.bulk_create(tickets, batch_size=_batch_size())
+    Transaction.objects.bulk_create(transactions, batch_size=_batch_size())
+    PurchaseOrder.objects.bulk_update(orders, ['ticket_ids', 'status', 'processed_at'])
+    # bulk_create bypasses Ticket.save(), so the draw counter is advanced once here
+    type(draw).objects.filter(pk=draw.pk).update(ticket_count=F('ticket_count') + len(tickets))
+
+
+def _fail_orders(order_ids: List[int], error: str, owner: str) -> int:
+    """Release the reserved funds of orders that could not be issued; returns how many"""
+    from lottery.models import PurchaseOrder
+    from payments.models import Transaction
+
+    failed = 0
+    for order_id in order_ids:
+        with transaction.atomic():
+            # Only an order still leased to this worker and not issued is refunded
+            if not PurchaseOrder.objects.filter(pk=order_id, status='processing', lease_owner=owner).update(
+                status='failed', error_message=error, processed_at=timezone.now()
+            ):
+                continue
+            order = PurchaseOrder.objects.select_related('user').get(pk=order_id)
+            balance_change = wallet.credit(order.user, order.total_amount)
+            Transaction.objects.create(
+                user_id=order.user_id,
+                transaction_type='refund',
+                amount=order.total_amount,
+                balance_before=balance_change.balance_before,
+                balance_after=balance_change.balance_after,
+                status='completed',
+                description=f"Refund of failed ticket order {order.order_id}",
+                metadata={'purchase_order_id': str(order.order_id)},
+            )
+            spending.release_spend(order.user_id, order.total_amount, timezone.localdate(order.created_at))
+            ticket_limits.release_tickets(order.user_id, order.draw_id, order.ticket_count)
+            failed += 1
+    return failed
+
+
+def drain_purchase_queue(draw_id: Optional[int] = None, batch_size: Optional[int] = None) -> int:
+    """
+    Issue queued orders until the queue (optionally of one draw) is empty.
+
+    Returns the number of orders processed.
+    """
+    batch_size = batch_size or _batch_size()
+    owner = leases.new_owner()
+    processed = 0
+
+    while True:
+        by_draw = _claim_batch(draw_id, batch_size, owner)
+        if not by_draw:
+            break
+
+        for order_draw_id, order_ids in by_draw.items():
+            try:
+                with transaction.atomic():
+                    draw, orders, late = _lock_draw_orders(order_draw_id, order_ids, owner)
+                    if orders:
+                        _issue_draw_orders(draw, orders)
+            except Exception as e:
+                logger.error(f"Failed to issue {len(order_ids)} queued order(s) for draw {order_draw_id}: {str(e)}")
+                _fail_orders(order_ids, str(e), owner)
+            else:
+                if late:
+                    logger.warning(f"{len(late)} queued order(s) for draw {order_draw_id} missed the sales cutoff")
+                    _fail_orders([order.pk for order in late], "Draw is no longer open for ticket purchases", owner)
+            processed += len(order_ids)
+
+    if processed:
+        logger.info(f"Purchase queue drained: {processed} order(s) processed")
+    return processed
@@ -0,0 +1,146 @@
+"""
+Cached sales state of draws for the ticket purchase hot path.
+
+A purchase used to load the same Draw several times (serializer field
+validation, object validation, the view) plus its LotteryGame, and to
+recompute ``is_open_for_tickets`` from the row each time. Everything the
+purchase path needs - status, sales cutoff, number rules and price - is
+collected here once per draw into a DrawSalesState and kept in the cache.
+
+The state is dropped by the Draw and LotteryGame signals whenever either
+row is saved or deleted. That only reaches every web worker because the
+cache is shared by all processes (see ``CACHES``): a price change, close or
+reschedule saved by the admin or by the draw task in Celery is seen by the
+next purchase. ``SALES_STATE_CACHE_SECONDS`` is kept short so that even a
+lost invalidation (cache briefly unreachable during the delete) cannot sell
+at a stale price or schedule for long. The open/closed decision is made
+against the cached cutoff at call time, so the cutoff passing needs no
+invalidation.
+"""
+
+import logging
+from decimal import Decimal
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+SALES_STATE_CACHE_KEY = 'lottery:sales_state:{draw_id}'
+DEFAULT_CACHE_SECONDS = 60
+
+
+class DrawSalesState:
+    """
+    Snapshot of a draw and its game's rules, as needed to sell tickets
+    """
+
+    __slots__ = (
+        'draw_id', 'draw_number', 'status', 'draw_date', 'sales_close_at',
+        'lottery_game_id', 'lottery_game_name', 'ticket_price',
+        'main_numbers_count', 'main_numbers_range',
+        'extra_numbers_count', 'extra_numbers_range',
+    )
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields[name])
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    @classmethod
+    def from_draw(cls, draw) -> 'DrawSalesState':
+        game = draw.lottery_game
+        return cls(
+            draw_id=draw.pk,
+            draw_number=draw.draw_number,
+            status=draw.status,
+            draw_date=draw.draw_date,
+            sales_close_at=draw.sales_close_at,
+            lottery_game_id=game.pk,
+            lottery_game_name=game.name,
+            ticket_price=Decimal(game.ticket_price),
+            main_numbers_count=game.main_numbers_count,
+            main_numbers_range=game.main_numbers_range,
+            extra_numbers_count=game.extra_numbers_count,
+            extra_numbers_range=game.extra_numbers_range,
+        )
+
+    def is_open(self, now=None) -> bool:
+        """Same rule as Draw.is_open_for_tickets, without touching the database"""
+        return self.status == 'scheduled' and self.sales_close_at > (now or timezone.now())
+
+    def price_for(self, ticket_count: int) -> Decimal:
+        return self.ticket_price * ticket_count
+
+    def numbers_error(self, main_numbers: Iterable[int], extra_numbers: Iterable[int]) -> Optional[str]:
+        """Validation message for an invalid combination, or None if it is valid"""
+        return combination_error(self, main_numbers, extra_numbers)
+
+
+def combination_error(rules, main_numbers: Iterable[int], extra_numbers: Iterable[int]) -> Optional[str]:
+    """
+    Check a ticket combination against ``rules`` - a LotteryGame or a
+    DrawSalesState. Returns the validation message, or None if it is valid.
+    """
+    main_numbers = list(main_numbers)
+    extra_numbers = list(extra_numbers)
+
+    if len(main_numbers) != rules.main_numbers_count:
+        return f"You must select exactly {rules.main_numbers_count} main numbers"
+    if len(extra_numbers) != rules.extra_numbers_count:
+        return f"You must select exactly {rules.extra_numbers_count} extra numbers"
+    if any(not (1 <= number <= rules.main_numbers_range) for number in main_numbers):
+        return f"Main numbers must be between 1 and {rules.main_numbers_range}"
+    if any(not (1 <= number <= rules.extra_numbers_range) for number in extra_numbers):
+        return f"Extra numbers must be between 1 and {rules.extra_numbers_range}"
+    if len(set(main_numbers)) != len(main_numbers):
+        return "Main numbers must be unique"
+    if len(set(extra_numbers)) != len(extra_numbers):
+        return "Extra numbers must be unique"
+    return None
+
+
+def _cache_key(draw_id) -> str:
+    return SALES_STATE_CACHE_KEY.format(draw_id=draw_id)
+
+
+def invalidate_sales_state(*draw_ids) -> None:
+    if draw_ids:
+        cache.delete_many([_cache_key(draw_id) for draw_id in draw_ids])
+
+
+def invalidate_game_sales_state(lottery_game_id) -> None:
+    """Drop the cached state of a game's draws that are still on sale"""
+    from lottery.models import Draw
+
+    draw_ids = Draw.objects.filter(
+        lottery_game_id=lottery_game_id, status='scheduled'
+    ).values_list('id', flat=True)
+    invalidate_sales_state(*draw_ids)
+
+
+def get_draw_sales_state(draw_id) -> Optional[DrawSalesState]:
+    """Sales state of a draw, or None if the draw does not exist"""
+    from lottery.models import Draw
+
+    key = _cache_key(draw_id)
+    state = cache.get(key)
+    if state is not None:
+        return state
+
+    draw = Draw.objects.select_related('lottery_game').filter(pk=draw_id).first()
+    if draw is None:
+        return None
+
+    state = DrawSalesState.from_draw(draw)
+    timeout = getattr(settings, 'LOTTERY_SETTINGS', {}).get('SALES_STATE_CACHE_SECONDS', DEFAULT_CACHE_SECONDS)
+    cache.set(key, state, timeout)
+    return state
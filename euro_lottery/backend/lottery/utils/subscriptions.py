@@ -0,0 +1,187 @@
+"""
+Materialization of multi-draw subscriptions.
+
+Regular players used to buy the same lines draw after draw, one purchase
+request each. A Subscription stores the lines once; when schedule_next_draws
+creates a draw, every active subscription of the game is turned into
+tickets for it in one pass:
+
+- subscriptions are grouped by user, and each user is charged once for all
+  of their lines (ticket cap, spend limits and debit in one savepoint);
+- the tickets of all users are written with one bulk insert, the purchase
+  transactions with another.
+
+A user whose charge is refused (insufficient funds, limits, self-exclusion)
+gets no tickets for the draw and a notification; after
+MAX_SUBSCRIPTION_FAILURES refusals in a row the subscriptions are
+suspended. ``last_draw_number`` is advanced for every subscription that was
+considered, so running the materialization again for the same draw is a
+no-op.
+"""
+
+import logging
+import uuid
+from collections import defaultdict
+from typing import Dict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from payments import wallet
+from users import spending
+
+from . import ticket_limits
+from .sales_state import get_draw_sales_state
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_FAILURES = 3
+INSERT_BATCH_SIZE = 1000
+
+
+def _max_failures() -> int:
+    return settings.LOTTERY_SETTINGS.get('MAX_SUBSCRIPTION_FAILURES', DEFAULT_MAX_FAILURES)
+
+
+def _refusal_reason(error: Exception) -> str:
+    if isinstance(error, wallet.InsufficientFundsError):
+        return "Insufficient funds"
+    return str(error)
+
+
+def materialize_subscriptions(draw) -> Dict[str, int]:
+    """
+    Issue the tickets of all active subscriptions of the draw's game.
+
+    Returns counts of the subscriptions played and refused, the users
+    charged and the tickets issued.
+    """
+    from lottery.models import Draw, Subscription, Ticket
+    from payments.models import Transaction
+    from users.models import Notification
+
+    stats = {'played': 0, 'refused': 0, 'users': 0, 'tickets': 0}
+    sales_state = get_draw_sales_state(draw.pk)
+    if sales_state is None or not sales_state.is_open():
+        return stats
+
+    with transaction.atomic():
+        queryset = Subscription.objects.filter(
+            lottery_game_id=sales_state.lottery_game_id,
+            status='active',
+            last_draw_number__lt=sales_state.draw_number,
+        )
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True, of=('self',))
+        subscriptions = list(queryset.select_related('user').order_by('user_id', 'id'))
+        if not subscriptions:
+            return stats
+
+        by_user = defaultdict(list)
+        for subscription in subscriptions:
+            by_user[subscription.user_id].append(subscription)
+
+        tickets = []
+        purchases = []
+        notifications = []
+        max_failures = _max_failures()
+
+        for user_subscriptions in by_user.values():
+            user = user_subscriptions[0].user
+            line_count = sum(len(subscription.lines) for subscription in user_subscriptions)
+            total_price = sales_state.price_for(line_count)
+
+            try:
+                with transaction.atomic():
+                    ticket_limits.reserve_tickets(user.pk, sales_state.draw_id, line_count)
+                    spending.reserve_spend(user, total_price)
+                    balance_change = wallet.debit(user, total_price)
+            except (ticket_limits.TicketLimitExceededError, spending.SpendingBlockedError,
+                    wallet.InsufficientFundsError) as e:
+                reason = _refusal_reason(e)
+                suspended = False
+                for subscription in user_subscriptions:
+                    subscription.consecutive_failures += 1
+                    subscription.last_failure_reason = reason[:255]
+                    if subscription.consecutive_failures >= max_failures:
+                        subscription.status = 'suspended'
+                        suspended = True
+                notifications.append(Notification(
+                    user=user,
+                    notification_type='system',
+                    title="Subscription tickets not purchased",
+                    message=(
+                        f"Your subscription tickets for {sales_state.lottery_game_name} "
+                        f"Draw #{sales_state.draw_number} could not be purchased: {reason}."
+                        + (" Your subscription has been suspended." if suspended else "")
+                    ),
+                    related_object_id=sales_state.draw_id,
+                    related_object_type='draw',
+                    priority='high',
+                    data={'reason': reason, 'suspended': suspended},
+                ))
+                stats['refused'] += len(user_subscriptions)
+                continue
+
+            purchase_id = uuid.uuid4()
+            purchases.append(Transaction(
+                transaction_id=purchase_id,
+                user=user,
+                transaction_type='ticket_purchase',
+                amount=total_price,
+                balance_before=balance_change.balance_before,
+                balance_after=balance_change.balance_after,
+                status='completed',
+                description=(
+                    f"Subscription purchase of {line_count} ticket(s) for "
+                    f"{sales_state.lottery_game_name} Draw #{sales_state.draw_number}"
+                ),
+                metadata={
+                    'subscription_ids': [str(subscription.subscription_id) for subscription in user_subscriptions],
+                    'ticket_count': line_count,
+                },
+            ))
+            for subscription in user_subscriptions:
+                tickets.extend(
+                    Ticket(
+                        user=user,
+                        draw_id=sales_state.draw_id,
+                        main_numbers=line['main_numbers'],
+                        extra_numbers=line['extra_numbers'],
+                        price=sales_state.ticket_price,
+                        transaction_id=str(purchase_id),
+                    )
+                    for line in subscription.lines
+                )
+                subscription.draws_played += 1
+                subscription.consecutive_failures = 0
+                subscription.last_failure_reason = ''
+                if subscription.draws_total is not None and subscription.draws_played >= subscription.draws_total:
+                    subscription.status = 'completed'
+            stats['played'] += len(user_subscriptions)
+            stats['users'] += 1
+
+        now = timezone.now()
+        for subscription in subscriptions:
+            subscription.last_draw_number = sales_state.draw_number
+            subscription.updated_at = now
+
+        Ticket.objects.bulk_create(tickets, batch_size=INSERT_BATCH_SIZE)
+        Transaction.objects.bulk_create(purchases, batch_size=INSERT_BATCH_SIZE)
+        Notification.objects.bulk_create(notifications, batch_size=INSERT_BATCH_SIZE)
+        Subscription.objects.bulk_update(subscriptions, [
+            'last_draw_number', 'draws_played', 'status', 'consecutive_failures',
+            'last_failure_reason', 'updated_at',
+        ], batch_size=INSERT_BATCH_SIZE)
+        if tickets:
+            # bulk_create bypasses Ticket.save(), so the draw counter is advanced once here
+            Draw.objects.filter(pk=sales_state.draw_id).update(ticket_count=F('ticket_count') + len(tickets))
+        stats['tickets'] = len(tickets)
+
+    logger.info(
+        f"Subscriptions for draw {sales_state.draw_id}: {stats['played']} played, "
+        f"{stats['refused']} refused, {stats['tickets']} tickets issued"
+    )
+    return stats
@@ -0,0 +1,165 @@
+"""
+Batch ticket checking.
+
+Checking tickets one request at a time re-reads the ticket, its draw, the
+prize category and the draw result for every ticket. Here the winning
+numbers and the tier table (matched main/extra -> prize category and
+amount) of each completed draw are resolved once, cached, and all pending
+tickets of a user are matched in memory and persisted with bulk writes.
+"""
+
+import logging
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+DRAW_OUTCOME_CACHE_KEY = 'lottery:draw_outcome:{draw_id}'
+DRAW_OUTCOME_CACHE_TIMEOUT = 60 * 60
+
+
+def invalidate_draw_outcome(draw_id) -> None:
+    cache.delete(DRAW_OUTCOME_CACHE_KEY.format(draw_id=draw_id))
+
+
+def get_draw_outcome(draw_id) -> Optional[Dict[str, Any]]:
+    """
+    Winning numbers and tier table of a completed draw, or None if the draw
+    has not been completed yet. Only completed outcomes are cached.
+    """
+    from lottery.models import Draw, DrawResult
+
+    key = DRAW_OUTCOME_CACHE_KEY.format(draw_id=draw_id)
+    outcome = cache.get(key)
+    if outcome is not None:
+        return outcome
+
+    draw = Draw.objects.filter(pk=draw_id).only('id', 'status', 'main_numbers', 'extra_numbers').first()
+    if draw is None or not draw.is_completed:
+        return None
+
+    tiers = {}
+    results = DrawResult.objects.filter(draw_id=draw_id).select_related('prize_category')
+    for result in results:
+        category = result.prize_category
+        tiers[(category.main_numbers_matched, category.extra_numbers_matched)] = {
+            'prize_category_id': category.id,
+            'prize_category': category.name,
+            'amount': result.prize_amount,
+        }
+
+    outcome = {
+        'main_numbers': frozenset(draw.main_numbers or []),
+        'extra_numbers': frozenset(draw.extra_numbers or []),
+        'tiers': tiers,
+    }
+    cache.set(key, outcome, DRAW_OUTCOME_CACHE_TIMEOUT)
+    return outcome
+
+
+def _result_row(ticket, prize_category: Optional[str] = None) -> Dict[str, Any]:
+    return {
+        'ticket_id': str(ticket.ticket_id),
+        'draw_id': ticket.draw_id,
+        'result_status': ticket.result_status,
+        'matched_main_numbers': ticket.matched_main_numbers,
+        'matched_extra_numbers': ticket.matched_extra_numbers,
+        'prize_category': prize_category,
+        'winning_amount': ticket.winning_amount,
+    }
+
+
+def check_user_tickets(user, ticket_ids: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """
+    Check the user's pending tickets of completed draws (optionally limited
+    to ``ticket_ids``) and return the combined outcome.
+    """
+    from lottery.models import Ticket, WinningTicket
+
+    ticket_fields = (
+        'id', 'ticket_id', 'draw_id', 'main_numbers', 'extra_numbers', 'result_status',
+        'matched_main_numbers', 'matched_extra_numbers', 'winning_amount',
+    )
+    queryset = Ticket.objects.filter(user=user)
+    requested = None
+    if ticket_ids is not None:
+        requested = {str(ticket_id) for ticket_id in ticket_ids}
+        queryset = queryset.filter(ticket_id__in=requested)
+    else:
+        queryset = queryset.filter(result_status='pending', draw__status='completed')
+
+    results: List[Dict[str, Any]] = []
+    not_ready: List[str] = []
+    checked = 0
+    total_winnings = Decimal('0')
+
+    with transaction.atomic():
+        # Row locks keep a concurrent check from matching the same tickets twice
+        tickets = list(queryset.select_for_update(of=('self',)).only(*ticket_fields))
+
+        outcomes = {
+            draw_id: get_draw_outcome(draw_id)
+            for draw_id in {ticket.draw_id for ticket in tickets if ticket.result_status == 'pending'}
+        }
+
+        to_update = []
+        winnings = []
+        for ticket in tickets:
+            if ticket.result_status != 'pending':
+                results.append(_result_row(ticket))
+                continue
+
+            outcome = outcomes.get(ticket.draw_id)
+            if outcome is None:
+                not_ready.append(str(ticket.ticket_id))
+                continue
+
+            ticket.matched_main_numbers = len(outcome['main_numbers'].intersection(ticket.main_numbers))
+            ticket.matched_extra_numbers = len(outcome['extra_numbers'].intersection(ticket.extra_numbers or []))
+            tier = outcome['tiers'].get((ticket.matched_main_numbers, ticket.matched_extra_numbers))
+
+            if tier:
+                ticket.result_status = 'winning'
+                ticket.winning_amount = tier['amount']
+                total_winnings += tier['amount']
+                winnings.append(WinningTicket(
+                    ticket=ticket,
+                    prize_category_id=tier['prize_category_id'],
+                    amount=tier['amount'],
+                    main_numbers_matched=ticket.matched_main_numbers,
+                    extra_numbers_matched=ticket.matched_extra_numbers,
+                ))
+            else:
+                ticket.result_status = 'non_winning'
+
+            to_update.append(ticket)
+            checked += 1
+            results.append(_result_row(ticket, tier['prize_category'] if tier else None))
+
+        if to_update:
+            Ticket.objects.bulk_update(
+                to_update,
+                ['matched_main_numbers', 'matched_extra_numbers', 'result_status', 'winning_amount'],
+                batch_size=500
+            )
+        if winnings:
+            WinningTicket.objects.bulk_create(winnings, batch_size=500, ignore_conflicts=True)
+
+    not_found = []
+    if requested is not None:
+        found = {str(ticket.ticket_id) for ticket in tickets}
+        not_found = sorted(requested - found)
+
+    logger.info(f"Batch check for user {user.pk}: {checked} tickets checked, {len(winnings)} winning")
+
+    return {
+        'checked': checked,
+        'winning_count': len(winnings),
+        'total_winnings': total_winnings,
+        'results': results,
+        'not_ready': not_ready,
+        'not_found': not_found,
+    }
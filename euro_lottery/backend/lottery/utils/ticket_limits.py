@@ -0,0 +1,87 @@
+"""
+Per-(user, draw) ticket counters for MAX_TICKETS_PER_USER.
+
+The cap used to be checked by counting the user's tickets (and queued
+orders) for the draw inside the purchase transaction. Two concurrent
+purchases could both pass that count before either inserted its tickets.
+Here the check and the reservation are one conditional statement::
+
+    UPDATE lottery_userdrawticketcount SET count = count + n
+    WHERE user_id = ? AND draw_id = ? AND count <= max - n
+
+The first purchase of a user for a draw inserts the row instead; a unique
+(user, draw) constraint makes a racing insert fall back to the UPDATE.
+Reservations are made in the same transaction as the debit, so a refused
+or failed purchase rolls its reservation back with it.
+"""
+
+import logging
+from typing import Optional
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_TICKETS = 10
+
+
+class TicketLimitExceededError(Exception):
+    """Raised when a purchase would take a user over the per-draw ticket cap"""
+
+    def __init__(self, user_id, draw_id, max_tickets: int):
+        self.user_id = user_id
+        self.draw_id = draw_id
+        self.max_tickets = max_tickets
+        super().__init__(f"You can buy a maximum of {max_tickets} tickets per draw")
+
+
+def max_tickets_per_user() -> int:
+    return settings.LOTTERY_SETTINGS.get('MAX_TICKETS_PER_USER', DEFAULT_MAX_TICKETS)
+
+
+def _conditional_increment(user_id, draw_id, count: int, max_tickets: int) -> bool:
+    from lottery.models import UserDrawTicketCount
+
+    return bool(UserDrawTicketCount.objects.filter(
+        user_id=user_id, draw_id=draw_id, count__lte=max_tickets - count
+    ).update(count=F('count') + count))
+
+
+def reserve_tickets(user_id, draw_id, count: int, max_tickets: Optional[int] = None) -> None:
+    """
+    Count ``count`` more tickets of the user for the draw.
+
+    Raises TicketLimitExceededError (reserving nothing) if the cap would be
+    exceeded.
+    """
+    from lottery.models import UserDrawTicketCount
+
+    max_tickets = max_tickets_per_user() if max_tickets is None else max_tickets
+    if count > max_tickets:
+        raise TicketLimitExceededError(user_id, draw_id, max_tickets)
+
+    if _conditional_increment(user_id, draw_id, count, max_tickets):
+        return
+
+    if not UserDrawTicketCount.objects.filter(user_id=user_id, draw_id=draw_id).exists():
+        try:
+            with transaction.atomic():
+                UserDrawTicketCount.objects.create(user_id=user_id, draw_id=draw_id, count=count)
+            return
+        except IntegrityError:
+            # A concurrent first purchase created the row: retry the conditional UPDATE
+            if _conditional_increment(user_id, draw_id, count, max_tickets):
+                return
+
+    raise TicketLimitExceededError(user_id, draw_id, max_tickets)
+
+
+def release_tickets(user_id, draw_id, count: int) -> None:
+    """Give back reserved tickets, e.g. when a queued order is refunded"""
+    from lottery.models import UserDrawTicketCount
+
+    UserDrawTicketCount.objects.filter(
+        user_id=user_id, draw_id=draw_id, count__gte=count
+    ).update(count=F('count') - count)
@@ -0,0 +1,141 @@
+"""
+Version stamps and HTTP conditional responses for lottery read endpoints.
+
+Every cacheable resource is covered by one or more *scopes* (all games, all
+draws, the draws of one game, a single draw). Each scope has a version stamp
+in the Django cache: the latest ``updated_at`` seen for an object in that
+scope, bumped by model signals. The cache must be shared by all processes
+(see ``CACHES``): a bump made by a Celery worker or another web worker has
+to reach the process answering the poll. Views derive their ETag and Last-Modified
+from these stamps, so a poll carrying a matching ``If-None-Match`` is
+answered with 304 without querying or serializing anything.
+"""
+
+import hashlib
+from datetime import datetime, timezone as dt_timezone
+from typing import Iterable, List, Optional
+
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+VERSION_KEY_PREFIX = 'lottery:version:'
+
+SCOPE_GAMES = 'games'
+SCOPE_DRAWS = 'draws'
+
+
+def game_draws_scope(lottery_game_id) -> str:
+    return f'draws:game:{lottery_game_id}'
+
+
+def draw_scope(draw_id) -> str:
+    return f'draw:{draw_id}'
+
+
+def _key(scope: str) -> str:
+    return f'{VERSION_KEY_PREFIX}{scope}'
+
+
+def get_version(scope: str) -> float:
+    """
+    Return the version stamp of a scope as a POSIX timestamp.
+
+    A missing stamp (cold or evicted cache) is seeded with the current time:
+    that can only cause a spurious full response, never a stale 304.
+    """
+    key = _key(scope)
+    stamp = cache.get(key)
+    if stamp is None:
+        cache.add(key, timezone.now().timestamp(), timeout=None)
+        stamp = cache.get(key)
+    return stamp
+
+
+def bump_version(*scopes: str, modified: Optional[datetime] = None) -> None:
+    """Advance the version stamp of the given scopes to ``modified`` (or now)"""
+    stamp = (modified or timezone.now()).timestamp()
+    for scope in scopes:
+        key = _key(scope)
+        current = cache.get(key)
+        # Stamps only move forward; an equal stamp still has to change the ETag
+        if current is not None and current >= stamp:
+            stamp_for_scope = current + 0.001
+        else:
+            stamp_for_scope = stamp
+        cache.set(key, stamp_for_scope, timeout=None)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an ``If-None-Match`` header matches ``etag`` (weak comparison)"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(',') if tag.strip()]
+    # Proxies may prefix W/ to our strong tag
+    return '*' in candidates or any(tag.removeprefix('W/') == etag for tag in candidates)
+
+
+class ConditionalGetMixin:
+    """
+    Adds ETag / Last-Modified handling to read-only DRF views.
+
+    Views implement ``get_version_scopes()``; the ETag is derived from the
+    scope stamps plus the request path and query string, so paginated and
+    filtered variants get distinct tags. ``version_time_bucket`` (seconds)
+    folds a coarse clock into the tag for payloads that change with time
+    alone, e.g. ``is_open_for_tickets`` flipping at the draw date.
+    """
+
+    version_time_bucket: Optional[int] = None
+
+    def get_version_scopes(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def get_resource_versions(self) -> List[float]:
+        return [get_version(scope) for scope in self.get_version_scopes()]
+
+    def compute_etag(self, request, versions: List[float]) -> str:
+        parts = [request.path, request.META.get('QUERY_STRING', '')]
+        parts.extend(f'{version:.6f}' for version in versions)
+        if self.version_time_bucket:
+            parts.append(str(int(timezone.now().timestamp() // self.version_time_bucket)))
+        digest = hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+        return quote_etag(digest)
+
+    def _not_modified_since(self, request, last_modified: int) -> bool:
+        if 'HTTP_IF_NONE_MATCH' in request.META:
+            # If-None-Match takes precedence over If-Modified-Since (RFC 7232)
+            return False
+        since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        return since is not None and not self.version_time_bucket and last_modified <= since
+
+    def get(self, request, *args, **kwargs):
+        versions = self.get_resource_versions()
+        etag = self.compute_etag(request, versions)
+        last_modified = int(max(versions)) if versions else None
+
+        if etag_matches(request.META.get('HTTP_IF_NONE_MATCH'), etag) or (
+            last_modified is not None and self._not_modified_since(request, last_modified)
+        ):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+def updated_at_or_now(instance) -> datetime:
+    value = getattr(instance, 'updated_at', None) or getattr(instance, 'created_at', None)
+    if value is None:
+        return timezone.now()
+    if timezone.is_naive(value):
+        value = value.replace(tzinfo=dt_timezone.utc)
+    return value
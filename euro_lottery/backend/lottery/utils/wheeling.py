@@ -0,0 +1,193 @@
+"""
+Wheeling systems: many tickets from a larger pool of chosen numbers.
+
+A player picks ``v`` main numbers, more than the ``k`` a ticket holds.
+
+- A full wheel plays every k-combination of the pool, C(v, k) lines.
+- An abbreviated wheel with guarantee ``t`` plays the blocks of a covering
+  design C(v, k, t): every t-subset of the pool lies in at least one line,
+  so if ``t`` of the drawn main numbers are in the pool, some line matches
+  at least ``t`` of them. It needs far fewer lines than the full wheel.
+
+Covering designs are computed once per (v, k, t) on points ``0..v-1``,
+stored in WheelDesign and cached; a wheel maps the design's blocks onto
+the player's numbers. Only ``precompute_wheel_designs`` builds designs
+(``store_covering_design``); the request path looks them up with
+``get_covering_design``, which rejects a design that was not precomputed.
+
+Lines are produced lazily (itertools.combinations / product for the
+extra numbers), so a 10k-line wheel is priced from its length and fed to
+bulk_purchase.purchase_lines without ever being materialized as a whole.
+"""
+
+import logging
+from itertools import combinations, product
+from math import comb
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+DESIGN_CACHE_KEY = 'lottery:wheel_design:{v}:{k}:{t}'
+DESIGN_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Designs beyond this pool size take too long to build greedily
+MAX_DESIGN_POINTS = 30
+
+Line = Tuple[List[int], List[int]]
+
+
+class WheelError(ValueError):
+    """Invalid wheel request (pool size, numbers or guarantee)"""
+
+
+def build_covering_design(v: int, k: int, t: int) -> List[Tuple[int, ...]]:
+    """
+    Greedy covering design C(v, k, t) on points ``0..v-1``.
+
+    The first uncovered t-subset in lexicographic order is extended by the
+    k - t points that cover the most still-uncovered t-subsets. The result
+    is a valid covering, though not always a minimal one.
+    """
+    if not 1 <= t <= k <= v:
+        raise WheelError(f"Covering design requires 1 <= t <= k <= v, got v={v}, k={k}, t={t}")
+    if t == k:
+        return list(combinations(range(v), k))
+
+    uncovered = set(combinations(range(v), t))
+    blocks = []
+    for target in combinations(range(v), t):
+        if target not in uncovered:
+            continue
+        rest = [point for point in range(v) if point not in target]
+        best_block, best_gain = None, -1
+        for extension in combinations(rest, k - t):
+            block = tuple(sorted(target + extension))
+            gain = sum(1 for subset in combinations(block, t) if subset in uncovered)
+            if gain > best_gain:
+                best_block, best_gain = block, gain
+        blocks.append(best_block)
+        uncovered.difference_update(combinations(best_block, t))
+    return blocks
+
+
+def get_covering_design(v: int, k: int, t: int) -> List[Tuple[int, ...]]:
+    """
+    Blocks of a precomputed C(v, k, t) from the cache or WheelDesign.
+
+    Never builds a design: raises WheelError if it was not precomputed.
+    """
+    from lottery.models import WheelDesign
+
+    key = DESIGN_CACHE_KEY.format(v=v, k=k, t=t)
+    blocks = cache.get(key)
+    if blocks is not None:
+        return blocks
+
+    design = WheelDesign.objects.filter(points=v, block_size=k, guarantee=t).first()
+    if design is None:
+        if v > MAX_DESIGN_POINTS:
+            raise WheelError(f"Abbreviated wheels support at most {MAX_DESIGN_POINTS} numbers")
+        raise WheelError(f"An abbreviated wheel of {v} numbers with guarantee {t} is not available")
+
+    blocks = [tuple(block) for block in design.blocks]
+    cache.set(key, blocks, DESIGN_CACHE_TIMEOUT)
+    return blocks
+
+
+def store_covering_design(v: int, k: int, t: int) -> Tuple[List[Tuple[int, ...]], bool]:
+    """Build C(v, k, t) unless WheelDesign already has it; returns the blocks and whether they were built"""
+    from lottery.models import WheelDesign
+
+    if v > MAX_DESIGN_POINTS:
+        raise WheelError(f"Abbreviated wheels support at most {MAX_DESIGN_POINTS} numbers")
+    design = WheelDesign.objects.filter(points=v, block_size=k, guarantee=t).first()
+    if design is not None:
+        return [tuple(block) for block in design.blocks], False
+
+    logger.info(f"Building covering design C({v}, {k}, {t})")
+    blocks = build_covering_design(v, k, t)
+    _, created = WheelDesign.objects.get_or_create(
+        points=v, block_size=k, guarantee=t, defaults={'blocks': [list(block) for block in blocks]}
+    )
+    cache.delete(DESIGN_CACHE_KEY.format(v=v, k=k, t=t))
+    return blocks, created
+
+
+class Wheel:
+    """
+    A wheel over a game's rules: lazy iteration of its lines plus their count
+    """
+
+    def __init__(self, main_numbers_count: int, main_numbers_range: int,
+                 extra_numbers_count: int, extra_numbers_range: int,
+                 main_numbers: Sequence[int], extra_numbers: Sequence[int],
+                 guarantee: Optional[int] = None):
+        self.main_numbers_count = main_numbers_count
+        self.extra_numbers_count = extra_numbers_count
+        self.main_numbers = self._validate_pool(
+            main_numbers, main_numbers_count, main_numbers_range, 'main'
+        )
+        self.extra_numbers = self._validate_pool(
+            extra_numbers, extra_numbers_count, extra_numbers_range, 'extra'
+        )
+
+        if guarantee is not None and not 1 <= guarantee <= main_numbers_count:
+            raise WheelError(f"Guarantee must be between 1 and {main_numbers_count}")
+        # A guarantee of k is the full wheel
+        self.guarantee = None if guarantee == main_numbers_count else guarantee
+        self._blocks = None
+
+    @classmethod
+    def for_sales_state(cls, sales_state, main_numbers, extra_numbers, guarantee=None) -> 'Wheel':
+        return cls(
+            sales_state.main_numbers_count, sales_state.main_numbers_range,
+            sales_state.extra_numbers_count, sales_state.extra_numbers_range,
+            main_numbers, extra_numbers, guarantee,
+        )
+
+    @staticmethod
+    def _validate_pool(numbers: Sequence[int], count: int, range_max: int, label: str) -> List[int]:
+        pool = sorted(numbers)
+        if len(pool) < count:
+            raise WheelError(f"Select at least {count} {label} numbers")
+        if len(set(pool)) != len(pool):
+            raise WheelError(f"{label.capitalize()} numbers must be unique")
+        if pool and not (1 <= pool[0] and pool[-1] <= range_max):
+            raise WheelError(f"{label.capitalize()} numbers must be between 1 and {range_max}")
+        return pool
+
+    @property
+    def is_full(self) -> bool:
+        return self.guarantee is None
+
+    @property
+    def blocks(self) -> Optional[List[Tuple[int, ...]]]:
+        if self.is_full:
+            return None
+        if self._blocks is None:
+            self._blocks = get_covering_design(len(self.main_numbers), self.main_numbers_count, self.guarantee)
+        return self._blocks
+
+    def main_line_count(self) -> int:
+        if self.is_full:
+            return comb(len(self.main_numbers), self.main_numbers_count)
+        return len(self.blocks)
+
+    def extra_line_count(self) -> int:
+        return comb(len(self.extra_numbers), self.extra_numbers_count)
+
+    def __len__(self) -> int:
+        return self.main_line_count() * self.extra_line_count()
+
+    def _main_lines(self) -> Iterator[Tuple[int, ...]]:
+        if self.is_full:
+            return combinations(self.main_numbers, self.main_numbers_count)
+        numbers = self.main_numbers
+        return (tuple(numbers[point] for point in block) for block in self.blocks)
+
+    def __iter__(self) -> Iterator[Line]:
+        extra_lines = list(combinations(self.extra_numbers, self.extra_numbers_count))
+        for main_line, extra_line in product(self._main_lines(), extra_lines):
+            yield list(main_line), list(extra_line)
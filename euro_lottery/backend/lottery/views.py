@@ -3,7 +3,8 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.conf import settings
 from django.db import transaction
-from django.db.models import Count, Sum, F, Q
+from django.db.models import Count, Sum, F, Q, Max
+from django.urls import reverse
 from django.utils import timezone
 import random
 import json
@@ -11,21 +12,42 @@ from collections import Counter
 
 from .models import (
     LotteryGame, Draw, Ticket, PrizeCategory, 
-    DrawResult, WinningTicket, SavedNumberCombination
+    DrawResult, WinningTicket, SavedNumberCombination, PurchaseOrder, Subscription
 )
 from .serializers import (
-    LotteryGameSerializer, DrawSerializer, TicketSerializer,
-    PurchaseTicketSerializer, DrawResultSerializer, WinningTicketSerializer,
-    SavedNumberCombinationSerializer, LotteryStatisticsSerializer
+    LotteryGameSerializer, DrawSerializer, TicketSerializer, CompactTicketSerializer,
+    PurchaseTicketSerializer, BatchCheckTicketsSerializer, DrawResultSerializer, WinningTicketSerializer,
+    SavedNumberCombinationSerializer, LotteryStatisticsSerializer, PurchaseOrderSerializer,
+    WheelPurchaseSerializer, SubscriptionSerializer
+)
+from .utils.number_index import get_number_index
+from .utils.draw_calendar import get_draw_calendar, get_next_draw_info
+from .utils.ticket_check import check_user_tickets
+from .utils.purchase_queue import enqueue_purchase
+from .utils.bulk_purchase import purchase_lines
+from .utils.client_ip import get_client_ip
+from .utils import ticket_limits
+from .utils.versioning import (
+    ConditionalGetMixin, SCOPE_GAMES, SCOPE_DRAWS, game_draws_scope, draw_scope
 )
 from payments.models import Transaction
+from payments import wallet
+from users import spending
+from lottery_core.idempotency import idempotent
+from lottery_core.pagination import KeysetPagination
+
+# Дат расписания в ответе обратного отсчета
+UPCOMING_DRAW_DATES = 5
 
 
-class LotteryGameListView(generics.ListAPIView):
+class LotteryGameListView(ConditionalGetMixin, generics.ListAPIView):
     """Представление для списка лотерейных игр"""
     permission_classes = (permissions.IsAuthenticated,)
     serializer_class = LotteryGameSerializer
     queryset = LotteryGame.objects.filter(is_active=True)
+    
+    def get_version_scopes(self):
+        return [SCOPE_GAMES]
 
 
 class LotteryGameDetailView(generics.RetrieveAPIView):
@@ -35,6 +57,24 @@ class LotteryGameDetailView(generics.RetrieveAPIView):
     queryset = LotteryGame.objects.filter(is_active=True)
 
 
+class NextDrawView(generics.RetrieveAPIView):
+    """Представление для обратного отсчета до следующего розыгрыша лотереи"""
+    permission_classes = (permissions.IsAuthenticated,)
+    queryset = LotteryGame.objects.filter(is_active=True)
+    
+    def retrieve(self, request, *args, **kwargs):
+        game = self.get_object()
+        info = get_next_draw_info(game)
+        return Response({
+            'lottery_game_id': game.pk,
+            'draw_id': info['draw_id'],
+            'draw_number': info['draw_number'],
+            'draw_date': info['draw_date'],
+            'seconds_until_draw': info['seconds_until_draw'],
+            'upcoming_draw_dates': get_draw_calendar(game).upcoming(UPCOMING_DRAW_DATES),
+        })
+
+
 class DrawListView(generics.ListAPIView):
     """Представление для списка розыгрышей"""
     permission_classes = (permissions.IsAuthenticated,)
@@ -57,11 +97,16 @@ class DrawListView(generics.ListAPIView):
         return queryset
 
 
-class DrawDetailView(generics.RetrieveAPIView):
+class DrawDetailView(ConditionalGetMixin, generics.RetrieveAPIView):
     """Представление для детальной информации о розыгрыше"""
     permission_classes = (permissions.IsAuthenticated,)
     serializer_class = DrawSerializer
     queryset = Draw.objects.all()
+    # is_open_for_tickets меняется со временем без записи в БД
+    version_time_bucket = 60
+    
+    def get_version_scopes(self):
+        return [SCOPE_GAMES, draw_scope(self.kwargs['pk'])]
     
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -78,10 +123,18 @@ class DrawDetailView(generics.RetrieveAPIView):
         return Response(serializer.data)
 
 
-class UpcomingDrawsView(generics.ListAPIView):
+class UpcomingDrawsView(ConditionalGetMixin, generics.ListAPIView):
     """Представление для предстоящих розыгрышей"""
     permission_classes = (permissions.IsAuthenticated,)
     serializer_class = DrawSerializer
+    # Розыгрыши выпадают из списка по draw_date без записи в БД
+    version_time_bucket = 60
+    
+    def get_version_scopes(self):
+        lottery_id = self.request.query_params.get('lottery_id', None)
+        if lottery_id:
+            return [game_draws_scope(lottery_id)]
+        return [SCOPE_DRAWS]
     
     def get_queryset(self):
         queryset = Draw.objects.filter(
@@ -97,11 +150,17 @@ class UpcomingDrawsView(generics.ListAPIView):
         return queryset
 
 
-class DrawResultsView(generics.ListAPIView):
+class DrawResultsView(ConditionalGetMixin, generics.ListAPIView):
     """Представление для результатов розыгрышей"""
     permission_classes = (permissions.IsAuthenticated,)
     serializer_class = DrawSerializer
     
+    def get_version_scopes(self):
+        lottery_id = self.request.query_params.get('lottery_id', None)
+        if lottery_id:
+            return [game_draws_scope(lottery_id)]
+        return [SCOPE_DRAWS]
+    
     def get_queryset(self):
         queryset = Draw.objects.filter(
             status='completed'
@@ -150,9 +209,38 @@ class TicketListView(generics.ListAPIView):
     """Представление для списка билетов пользователя"""
     permission_classes = (permissions.IsAuthenticated,)
     serializer_class = TicketSerializer
+    pagination_class = KeysetPagination
+    keyset_field = 'purchase_date'
+    
+    # Поля, которые реально нужны TicketSerializer (без ip_address, user_agent и т.п.)
+    list_only_fields = (
+        'id', 'ticket_id', 'user', 'draw', 'main_numbers', 'extra_numbers',
+        'is_quick_pick', 'purchase_date', 'price', 'result_status',
+        'matched_main_numbers', 'matched_extra_numbers', 'winning_amount',
+        'draw__draw_number', 'draw__draw_date', 'draw__status', 'draw__lottery_game__name',
+    )
+    
+    def is_compact(self):
+        return self.request.query_params.get('view') == 'compact'
+    
+    def list(self, request, *args, **kwargs):
+        if not self.is_compact():
+            return super().list(request, *args, **kwargs)
+        
+        # Компактный режим: values() вместо моделей и ModelSerializer
+        queryset = CompactTicketSerializer.project(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(CompactTicketSerializer(page).data)
+        return Response(CompactTicketSerializer(queryset).data)
     
     def get_queryset(self):
-        queryset = Ticket.objects.filter(user=self.request.user).order_by('-purchase_date')
+        queryset = (
+            Ticket.objects.filter(user=self.request.user)
+            .select_related('draw__lottery_game')
+            .only(*self.list_only_fields)
+            .order_by('-purchase_date')
+        )
         
         # Фильтрация по розыгрышу
         draw_id = self.request.query_params.get('draw_id', None)
@@ -173,33 +261,19 @@ class PurchaseTicketView(generics.CreateAPIView):
     permission_classes = (permissions.IsAuthenticated,)
     serializer_class = PurchaseTicketSerializer
     
+    @idempotent('lottery.purchase_ticket')
     @transaction.atomic
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
         user = request.user
-        draw_id = serializer.validated_data['draw_id']
         use_quick_pick = serializer.validated_data.get('use_quick_pick', False)
         saved_combination_id = serializer.validated_data.get('saved_combination_id', None)
         
-        # Получение розыгрыша и проверка его доступности
-        try:
-            draw = Draw.objects.get(pk=draw_id)
-            if not draw.is_open_for_tickets:
-                return Response(
-                    {"error": "This draw is no longer open for ticket purchases"},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-        except Draw.DoesNotExist:
-            return Response(
-                {"error": "Invalid draw ID"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Получение информации о лотерее
-        lottery_game = draw.lottery_game
-        ticket_price = lottery_game.ticket_price
+        # Доступность розыгрыша, правила игры и цена уже проверены по кэшу состояния продаж
+        sales_state = serializer.validated_data['sales_state']
+        ticket_price = sales_state.ticket_price
         
         # Формирование списка билетов для покупки
         tickets_data = []
@@ -207,8 +281,8 @@ class PurchaseTicketView(generics.CreateAPIView):
         if use_quick_pick:
             # Генерация случайных чисел для quick pick
             tickets_data.append({
-                'main_numbers': self.generate_random_numbers(lottery_game.main_numbers_count, lottery_game.main_numbers_range),
-                'extra_numbers': self.generate_random_numbers(lottery_game.extra_numbers_count, lottery_game.extra_numbers_range),
+                'main_numbers': self.generate_random_numbers(sales_state.main_numbers_count, sales_state.main_numbers_range),
+                'extra_numbers': self.generate_random_numbers(sales_state.extra_numbers_count, sales_state.extra_numbers_range),
                 'is_quick_pick': True
             })
         elif saved_combination_id:
@@ -217,7 +291,7 @@ class PurchaseTicketView(generics.CreateAPIView):
                 saved_combination = SavedNumberCombination.objects.get(
                     pk=saved_combination_id,
                     user=user,
-                    lottery_game=lottery_game
+                    lottery_game_id=sales_state.lottery_game_id
                 )
                 tickets_data.append({
                     'main_numbers': saved_combination.main_numbers,
@@ -239,18 +313,29 @@ class PurchaseTicketView(generics.CreateAPIView):
                     'is_quick_pick': False
                 })
         
-        # Проверка лимита на количество билетов
-        max_tickets = settings.LOTTERY_SETTINGS.get('MAX_TICKETS_PER_USER', 10)
-        user_tickets_count = Ticket.objects.filter(user=user, draw=draw).count()
-        if user_tickets_count + len(tickets_data) > max_tickets:
+        # Асинхронный режим: резервирование средств и постановка заказа в очередь
+        if serializer.validated_data.get('async_purchase') or settings.LOTTERY_SETTINGS.get('ASYNC_PURCHASES'):
+            return self.enqueue(request, sales_state, tickets_data)
+        
+        # Лимит билетов на розыгрыш, лимиты ответственной игры и списание средств:
+        # при отказе любой проверки откатываются вместе
+        total_price = sales_state.price_for(len(tickets_data))
+        try:
+            with transaction.atomic():
+                ticket_limits.reserve_tickets(user.pk, sales_state.draw_id, len(tickets_data))
+                spending.reserve_spend(user, total_price)
+                balance_change = wallet.debit(user, total_price)
+        except ticket_limits.TicketLimitExceededError as e:
             return Response(
-                {"error": f"You can buy a maximum of {max_tickets} tickets per draw"},
+                {"error": str(e)},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        # Проверка баланса пользователя
-        total_price = ticket_price * len(tickets_data)
-        if user.balance < total_price:
+        except spending.SpendingBlockedError as e:
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        except wallet.InsufficientFundsError:
             return Response(
                 {"error": "Insufficient funds"},
                 status=status.HTTP_400_BAD_REQUEST
@@ -259,27 +344,22 @@ class PurchaseTicketView(generics.CreateAPIView):
         # Создание билетов и транзакции
         created_tickets = []
         
-        # Обновление баланса пользователя
-        balance_before = user.balance
-        user.balance -= total_price
-        user.save()
-        
         # Создание транзакции
-        transaction = Transaction.objects.create(
+        purchase_transaction = Transaction.objects.create(
             user=user,
             transaction_type='ticket_purchase',
             amount=total_price,
-            balance_before=balance_before,
-            balance_after=user.balance,
+            balance_before=balance_change.balance_before,
+            balance_after=balance_change.balance_after,
             status='completed',
-            description=f"Purchase of {len(tickets_data)} ticket(s) for {lottery_game.name} Draw #{draw.draw_number}"
+            description=f"Purchase of {len(tickets_data)} ticket(s) for {sales_state.lottery_game_name} Draw #{sales_state.draw_number}"
         )
         
         # Создание билетов
         for ticket_data in tickets_data:
             ticket = Ticket.objects.create(
                 user=user,
-                draw=draw,
+                draw_id=sales_state.draw_id,
                 main_numbers=ticket_data['main_numbers'],
                 extra_numbers=ticket_data['extra_numbers'],
                 is_quick_pick=ticket_data['is_quick_pick'],
@@ -288,11 +368,11 @@ class PurchaseTicketView(generics.CreateAPIView):
             created_tickets.append(ticket)
             
             # Связывание билета с транзакцией
-            transaction.related_ticket = ticket
-            transaction.save()
+            purchase_transaction.related_ticket = ticket
+            purchase_transaction.save()
         
         # Формирование ответа
-        ticket_serializer = TicketSerializer(created_tickets, many=True)
+        ticket_serializer = TicketSerializer(created_tickets, many=True, context={'sales_state': sales_state})
         
         return Response({
             'tickets': ticket_serializer.data,
@@ -300,11 +380,108 @@ class PurchaseTicketView(generics.CreateAPIView):
             'current_balance': user.balance
         }, status=status.HTTP_201_CREATED)
     
+    def enqueue(self, request, sales_state, tickets_data):
+        """Постановка покупки в очередь; билеты выпускает process_purchase_queue"""
+        try:
+            order = enqueue_purchase(
+                request.user, sales_state.draw_id, tickets_data, sales_state.ticket_price,
+                ip_address=get_client_ip(request),
+                user_agent=request.META.get('HTTP_USER_AGENT', '')
+            )
+        except ticket_limits.TicketLimitExceededError as e:
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except spending.SpendingBlockedError as e:
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        except wallet.InsufficientFundsError:
+            return Response(
+                {"error": "Insufficient funds"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response({
+            'order_id': order.order_id,
+            'status': order.status,
+            'total_price': order.total_amount,
+            'current_balance': order.balance_after,
+            'status_url': reverse('purchase-order-status', args=[order.order_id])
+        }, status=status.HTTP_202_ACCEPTED)
+    
     def generate_random_numbers(self, count, range_max, start=1):
         """Генерация случайных уникальных чисел"""
         return sorted(random.sample(range(start, range_max + 1), count))
 
 
+class WheelPurchaseView(generics.CreateAPIView):
+    """Представление для покупки системной ставки: все билеты одной транзакцией"""
+    permission_classes = (permissions.IsAuthenticated,)
+    serializer_class = WheelPurchaseSerializer
+    
+    @idempotent('lottery.purchase_wheel')
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        sales_state = serializer.validated_data['sales_state']
+        wheel = serializer.validated_data['wheel']
+        line_count = len(wheel)
+        summary = {
+            'line_count': line_count,
+            'guarantee': wheel.guarantee or sales_state.main_numbers_count,
+            'is_full_wheel': wheel.is_full,
+            'total_price': sales_state.price_for(line_count),
+        }
+        
+        # Предварительный расчет без покупки
+        if serializer.validated_data['dry_run']:
+            return Response(summary)
+        
+        try:
+            purchase = purchase_lines(
+                request.user, sales_state, wheel, line_count,
+                description=(
+                    f"Wheel of {line_count} ticket(s) for {sales_state.lottery_game_name} "
+                    f"Draw #{sales_state.draw_number}"
+                ),
+                metadata={
+                    'wheel': {
+                        'main_numbers': wheel.main_numbers,
+                        'extra_numbers': wheel.extra_numbers,
+                        'guarantee': wheel.guarantee,
+                    }
+                },
+                ip_address=get_client_ip(request),
+                user_agent=request.META.get('HTTP_USER_AGENT', '')
+            )
+        except ticket_limits.TicketLimitExceededError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except spending.SpendingBlockedError as e:
+            return Response({"error": str(e)}, status=status.HTTP_403_FORBIDDEN)
+        except wallet.InsufficientFundsError:
+            return Response({"error": "Insufficient funds"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response(dict(
+            summary,
+            transaction_id=purchase.transaction.transaction_id,
+            current_balance=purchase.balance_change.balance_after,
+        ), status=status.HTTP_201_CREATED)
+
+
+class PurchaseOrderStatusView(generics.RetrieveAPIView):
+    """Представление для статуса заказа билетов в асинхронном режиме"""
+    permission_classes = (permissions.IsAuthenticated,)
+    serializer_class = PurchaseOrderSerializer
+    lookup_field = 'order_id'
+    
+    def get_queryset(self):
+        return PurchaseOrder.objects.filter(user=self.request.user)
+
+
 class TicketDetailView(generics.RetrieveAPIView):
     """Представление для детальной информации о билете"""
     permission_classes = (permissions.IsAuthenticated,)
@@ -391,6 +568,23 @@ class CheckTicketView(APIView):
             )
 
 
+class BatchCheckTicketsView(APIView):
+    """
+    Пакетная проверка билетов пользователя.
+    
+    Без параметров проверяет все ожидающие билеты завершенных розыгрышей,
+    с ticket_ids - только указанные билеты.
+    """
+    permission_classes = (permissions.IsAuthenticated,)
+    
+    def post(self, request):
+        serializer = BatchCheckTicketsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        result = check_user_tickets(request.user, serializer.validated_data.get('ticket_ids'))
+        return Response(result)
+
+
 class SavedCombinationListView(generics.ListAPIView):
     """Представление для списка сохраненных комбинаций"""
     permission_classes = (permissions.IsAuthenticated,)
@@ -433,10 +627,60 @@ class DeleteSavedCombinationView(generics.DestroyAPIView):
         return SavedNumberCombination.objects.filter(user=self.request.user)
 
 
+class SubscriptionListView(generics.ListCreateAPIView):
+    """Представление для списка и создания подписок на несколько розыгрышей"""
+    permission_classes = (permissions.IsAuthenticated,)
+    serializer_class = SubscriptionSerializer
+    
+    def get_queryset(self):
+        return Subscription.objects.filter(user=self.request.user).order_by('-created_at')
+    
+    def perform_create(self, serializer):
+        # Подписка начинает играть со следующего созданного розыгрыша
+        lottery_game = serializer.validated_data['lottery_game']
+        latest_draw_number = Draw.objects.filter(
+            lottery_game=lottery_game
+        ).aggregate(latest=Max('draw_number'))['latest'] or 0
+        serializer.save(user=self.request.user, last_draw_number=latest_draw_number)
+
+
+class SubscriptionStatusView(APIView):
+    """Представление для отмены и возобновления подписки"""
+    permission_classes = (permissions.IsAuthenticated,)
+    
+    # Разрешенные переходы: действие -> (исходные статусы, новый статус)
+    transitions = {
+        'cancel': (('active', 'suspended'), 'cancelled'),
+        'resume': (('suspended',), 'active'),
+    }
+    
+    def post(self, request, subscription_id, action):
+        from_statuses, new_status = self.transitions[action]
+        
+        updated = Subscription.objects.filter(
+            subscription_id=subscription_id,
+            user=request.user,
+            status__in=from_statuses
+        ).update(status=new_status, consecutive_failures=0, updated_at=timezone.now())
+        
+        subscription = Subscription.objects.filter(subscription_id=subscription_id, user=request.user).first()
+        if subscription is None:
+            return Response({"error": "Subscription not found"}, status=status.HTTP_404_NOT_FOUND)
+        if not updated:
+            return Response(
+                {"error": f"Cannot {action} a subscription with status '{subscription.status}'"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response(SubscriptionSerializer(subscription).data)
+
+
 class WinningsListView(generics.ListAPIView):
     """Представление для списка выигрышей"""
     permission_classes = (permissions.IsAuthenticated,)
     serializer_class = WinningTicketSerializer
+    pagination_class = KeysetPagination
+    keyset_field = 'created_at'
     
     def get_queryset(self):
         return WinningTicket.objects.filter(
@@ -598,6 +842,121 @@ class HotNumbersView(APIView):
         })
 
 
+class NumberSearchView(APIView):
+    """
+    Поиск комбинации номеров по истории розыгрышей через инвертированный индекс.
+    
+    Режимы (параметр mode):
+    - contains: розыгрыши, в которых выпали все указанные номера;
+    - at_least: розыгрыши, где совпало не меньше min_matches основных номеров;
+    - best: розыгрыши с максимальным числом совпадений основных номеров.
+    """
+    permission_classes = (permissions.IsAuthenticated,)
+    search_modes = ('contains', 'at_least', 'best')
+    max_limit = 100
+    
+    def _parse_numbers(self, value):
+        if not value:
+            return []
+        numbers = [int(item) for item in value.split(',') if item.strip()]
+        if any(number < 1 for number in numbers):
+            raise ValueError(value)
+        return sorted(set(numbers))
+    
+    def get(self, request):
+        lottery_id = request.query_params.get('lottery_id', None)
+        mode = request.query_params.get('mode', 'contains')
+        
+        if not lottery_id:
+            return Response(
+                {"error": "Lottery ID is required"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if mode not in self.search_modes:
+            return Response(
+                {"error": f"Mode must be one of: {', '.join(self.search_modes)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            lottery_id = int(lottery_id)
+            if lottery_id < 1:
+                raise ValueError(lottery_id)
+            main_numbers = self._parse_numbers(request.query_params.get('main_numbers'))
+            extra_numbers = self._parse_numbers(request.query_params.get('extra_numbers'))
+            min_matches = int(request.query_params.get('min_matches', len(main_numbers)))
+            limit = int(request.query_params.get('limit', 20))
+            if limit < 1:
+                raise ValueError(limit)
+            limit = min(limit, self.max_limit)
+        except ValueError:
+            return Response(
+                {"error": "Lottery ID, numbers, min_matches and limit must be positive integers"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if not main_numbers:
+            return Response(
+                {"error": "At least one main number is required"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not 0 < min_matches <= len(main_numbers):
+            return Response(
+                {"error": "min_matches must be between 1 and the number of main numbers"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            index = get_number_index(lottery_id)
+        except LotteryGame.DoesNotExist:
+            return Response(
+                {"error": "Lottery not found"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        counters = index.at_least(main_numbers)
+        best_match = max((k for k, bitmap in enumerate(counters) if bitmap), default=0)
+        
+        if mode == 'contains':
+            matched = index.contains(main_numbers, extra_numbers)
+        elif mode == 'at_least':
+            matched = counters[min_matches]
+        else:
+            matched = counters[best_match] if best_match else 0
+        
+        draw_ids = list(index.draw_ids_for(matched, limit=limit))
+        draws = Draw.objects.filter(id__in=draw_ids).only(
+            'id', 'draw_number', 'draw_date', 'main_numbers', 'extra_numbers'
+        ).in_bulk()
+        
+        main_set = set(main_numbers)
+        extra_set = set(extra_numbers)
+        results = []
+        for draw_id in draw_ids:
+            draw = draws.get(draw_id)
+            if draw is None:
+                continue
+            results.append({
+                'draw_id': draw.id,
+                'draw_number': draw.draw_number,
+                'draw_date': draw.draw_date,
+                'main_numbers': draw.main_numbers,
+                'extra_numbers': draw.extra_numbers,
+                'matched_main_numbers': len(main_set.intersection(draw.main_numbers or [])),
+                'matched_extra_numbers': len(extra_set.intersection(draw.extra_numbers or [])),
+            })
+        
+        return Response({
+            'mode': mode,
+            'main_numbers': main_numbers,
+            'extra_numbers': extra_numbers,
+            'indexed_draws': index.size,
+            'matched_draws_count': matched.bit_count(),
+            'best_match': best_match,
+            'match_histogram': index.histogram(counters),
+            'draws': results
+        })
+
+
 class AdminDrawControlView(APIView):
     """Admin view for manually conducting lottery draws"""
     permission_classes = (permissions.IsAdminUser,)
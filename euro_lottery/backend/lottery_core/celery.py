@@ -14,6 +14,9 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Auto-discover tasks from all installed apps
 app.autodiscover_tasks(lambda: settings.INSTALLED_APPS)
 
+# Task instrumentation (durations, DB time, lag) via Celery signals
+from . import task_metrics  # noqa: E402,F401
+
 @app.task(bind=True, ignore_result=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
\ No newline at end of file
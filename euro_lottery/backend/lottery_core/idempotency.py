@@ -0,0 +1,216 @@
+"""
+Idempotency-Key support for money-moving endpoints.
+
+Mobile clients retry requests on flaky networks. Without protection a retry
+of a purchase, deposit or withdrawal runs the whole view again, repeats
+provider calls and can charge twice. Handlers decorated with
+``@idempotent(...)`` honour an ``Idempotency-Key`` header:
+
+- the first request with a key runs normally, and its response is stored
+  with a fingerprint of the request (method, path, body) in the shared
+  cache and, for durable endpoints, in the IdempotencyRecord table;
+- a replay with the same key and fingerprint gets the stored response back
+  (with ``Idempotent-Replayed: true``) without re-executing the view;
+- reusing a key for a different request is rejected with 422;
+- concurrent duplicates are single-flighted: one request holds a cache lock
+  while the others wait for its stored response.
+
+Keys are scoped per user and per endpoint. Requests without the header
+behave exactly as before.
+"""
+
+import functools
+import hashlib
+import json
+import logging
+import time
+import uuid
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+DEFAULTS = {
+    'CACHE_TTL': 60 * 60 * 24,
+    'RECORD_TTL': 60 * 60 * 24 * 7,
+    'LOCK_TIMEOUT': 60,
+    'WAIT_TIMEOUT': 10,
+    'POLL_INTERVAL': 0.05,
+}
+
+
+def _setting(name: str):
+    return getattr(settings, 'IDEMPOTENCY_SETTINGS', {}).get(name, DEFAULTS[name])
+
+
+def request_fingerprint(request) -> str:
+    try:
+        body = json.dumps(request.data, sort_keys=True, default=str)
+    except (TypeError, ValueError):
+        body = request.body.decode('utf-8', 'replace')
+    raw = f"{request.method}|{request.path}|{body}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _cache_keys(user_id, endpoint: str, key: str):
+    digest = hashlib.sha256(f"{user_id}|{endpoint}|{key}".encode('utf-8')).hexdigest()
+    return f"idempotency:response:{digest}", f"idempotency:lock:{digest}"
+
+
+def _should_store(response) -> bool:
+    # Server errors and throttling are transient: a retry must be able to run again
+    return response.status_code < 500 and response.status_code not in (
+        status.HTTP_409_CONFLICT, status.HTTP_429_TOO_MANY_REQUESTS
+    )
+
+
+def _serialize(response) -> Dict[str, Any]:
+    data = getattr(response, 'data', None)
+    if data is not None:
+        # Round-trip through the renderer so replays match the original bytes
+        data = json.loads(JSONRenderer().render(data))
+    return {'status': response.status_code, 'data': data}
+
+
+class IdempotencyStore:
+    """Cache plus optional database storage of stored responses"""
+
+    def __init__(self, user, endpoint: str, key: str, durable: bool):
+        self.user = user
+        self.endpoint = endpoint
+        self.key = key
+        self.durable = durable
+        self.response_key, self.lock_key = _cache_keys(user.pk, endpoint, key)
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        record = cache.get(self.response_key)
+        if record is not None or not self.durable:
+            return record
+
+        from payments.models import IdempotencyRecord
+
+        stored = IdempotencyRecord.objects.filter(
+            user=self.user, endpoint=self.endpoint, key=self.key, expires_at__gt=timezone.now()
+        ).first()
+        if stored is None:
+            return None
+
+        record = {
+            'fingerprint': stored.fingerprint,
+            'status': stored.response_status,
+            'data': stored.response_body,
+        }
+        cache.set(self.response_key, record, _setting('CACHE_TTL'))
+        return record
+
+    def save(self, fingerprint: str, response) -> None:
+        record = dict(_serialize(response), fingerprint=fingerprint)
+        cache.set(self.response_key, record, _setting('CACHE_TTL'))
+
+        if self.durable:
+            from payments.models import IdempotencyRecord
+
+            try:
+                IdempotencyRecord.objects.update_or_create(
+                    user=self.user,
+                    endpoint=self.endpoint,
+                    key=self.key,
+                    defaults={
+                        'fingerprint': fingerprint,
+                        'response_status': record['status'],
+                        'response_body': record['data'],
+                        'expires_at': timezone.now() + timedelta(seconds=_setting('RECORD_TTL')),
+                    }
+                )
+            except IntegrityError:
+                logger.warning(f"Idempotency record for key {self.key} was stored concurrently")
+
+    def acquire(self) -> Optional[str]:
+        token = uuid.uuid4().hex
+        if cache.add(self.lock_key, token, _setting('LOCK_TIMEOUT')):
+            return token
+        return None
+
+    def release(self, token: str) -> None:
+        if cache.get(self.lock_key) == token:
+            cache.delete(self.lock_key)
+
+
+def _replay(record: Dict[str, Any], fingerprint: str) -> Response:
+    if record['fingerprint'] != fingerprint:
+        return Response(
+            {"error": f"{IDEMPOTENCY_HEADER} was already used for a different request"},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    response = Response(record['data'], status=record['status'])
+    response[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def idempotent(endpoint: str, durable: bool = True):
+    """
+    Decorator for DRF handler methods (``post``/``create``).
+
+    Place it above ``@transaction.atomic`` so the stored response is only
+    written once the handler's transaction has committed.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not key or not request.user.is_authenticated:
+                return handler(view, request, *args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return Response(
+                    {"error": f"{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            fingerprint = request_fingerprint(request)
+            store = IdempotencyStore(request.user, endpoint, key, durable)
+            deadline = time.monotonic() + _setting('WAIT_TIMEOUT')
+
+            while True:
+                record = store.load()
+                if record is not None:
+                    return _replay(record, fingerprint)
+
+                token = store.acquire()
+                if token is not None:
+                    break
+
+                # Another request with this key is running: wait for its response
+                if time.monotonic() >= deadline:
+                    return Response(
+                        {"error": "A request with this Idempotency-Key is still being processed"},
+                        status=status.HTTP_409_CONFLICT
+                    )
+                time.sleep(_setting('POLL_INTERVAL'))
+
+            try:
+                # The first holder may have finished between our load and acquire
+                record = store.load()
+                if record is not None:
+                    return _replay(record, fingerprint)
+
+                response = handler(view, request, *args, **kwargs)
+                if _should_store(response):
+                    store.save(fingerprint, response)
+                return response
+            finally:
+                store.release(token)
+
+        return wrapper
+    return decorator
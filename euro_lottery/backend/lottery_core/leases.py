@@ -0,0 +1,162 @@
+"""
+Lease-based work claiming for periodic tasks.
+
+Periodic tasks used to select "all pending X" and process the rows one by
+one, so a second worker running the same task processed the same rows
+again. With leases, workers take disjoint batches instead:
+
+- ``claim`` stamps up to ``limit`` rows whose lease is free or expired
+  with the worker's owner token and an expiry. Candidates are locked with
+  SELECT ... FOR UPDATE SKIP LOCKED where the database supports it; on
+  SQLite the conditional UPDATE alone decides which worker gets a row.
+- ``drain`` claims and processes batches until nothing is left. A full
+  first batch fans the task out to WORKERS copies, so a backlog is drained
+  by several workers in parallel.
+
+A batch can outlive its lease, and the rows it has not reached yet are
+then claimed by another worker. Before a side effect that must not happen
+twice, a batch processor moves the row on with ``transition``: a
+conditional UPDATE that succeeds only while the row is still in the
+expected state and leased to the processor (``drain(..., pass_owner=True)``
+hands it the owner token). A row whose transition matched nothing is
+skipped.
+
+Leases are not released after processing. A row that is still pending
+afterwards (a deposit the provider has not settled yet, a failed payout)
+is retried once its lease expires, so the lease doubles as the retry
+backoff and a worker that dies mid-batch only delays its rows.
+
+Models opt in with two fields, by default ``lease_owner`` (CharField)
+and ``lease_expires_at`` (nullable DateTimeField).
+"""
+
+import logging
+import os
+import socket
+import uuid
+from datetime import timedelta
+from typing import Callable, List, Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'BATCH_SIZE': 100,
+    'LEASE_SECONDS': 300,
+    'WORKERS': 4,
+}
+
+OWNER_FIELD = 'lease_owner'
+EXPIRES_FIELD = 'lease_expires_at'
+
+
+def _setting(name: str):
+    return getattr(settings, 'WORK_CLAIM_SETTINGS', {}).get(name, DEFAULTS[name])
+
+
+def new_owner() -> str:
+    """Owner token of the calling worker process, unique per call"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def lease_is_free(now, expires_field: str = EXPIRES_FIELD) -> Q:
+    return Q(**{f'{expires_field}__isnull': True}) | Q(**{f'{expires_field}__lte': now})
+
+
+def claim(queryset, limit: int, owner: str, lease_seconds: Optional[int] = None,
+          owner_field: str = OWNER_FIELD, expires_field: str = EXPIRES_FIELD, now=None) -> List:
+    """
+    Lease up to ``limit`` rows of ``queryset`` to ``owner``.
+
+    Returns the primary keys of the rows claimed, oldest first.
+    """
+    model = queryset.model
+    now = now or timezone.now()
+    lease_seconds = lease_seconds or _setting('LEASE_SECONDS')
+    stamp = {owner_field: owner, expires_field: now + timedelta(seconds=lease_seconds)}
+    candidates = queryset.filter(lease_is_free(now, expires_field)).order_by('pk')
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            pks = list(
+                candidates.select_for_update(skip_locked=True, of=('self',))
+                .values_list('pk', flat=True)[:limit]
+            )
+            if pks:
+                model._default_manager.filter(pk__in=pks).update(**stamp)
+        return pks
+
+    # No row locks: the conditional UPDATE decides which worker wins a row
+    pks = list(candidates.values_list('pk', flat=True)[:limit])
+    if not pks:
+        return []
+    model._default_manager.filter(lease_is_free(now, expires_field), pk__in=pks).update(**stamp)
+    return list(
+        model._default_manager.filter(pk__in=pks, **{owner_field: owner})
+        .order_by('pk').values_list('pk', flat=True)
+    )
+
+
+def release(model, pks, owner: str, owner_field: str = OWNER_FIELD,
+            expires_field: str = EXPIRES_FIELD) -> int:
+    """Give up the leases of ``owner`` on the rows, making them claimable at once"""
+    return model._default_manager.filter(pk__in=pks, **{owner_field: owner}).update(
+        **{owner_field: '', expires_field: None}
+    )
+
+
+def transition(queryset, pk, owner: str, owner_field: str = OWNER_FIELD, **changes) -> bool:
+    """
+    Apply ``changes`` to row ``pk`` of ``queryset`` if ``owner`` still leases it.
+
+    ``queryset`` carries the expected state (e.g. ``status='approved'``).
+    Returns whether the row was updated.
+    """
+    return bool(queryset.filter(pk=pk, **{owner_field: owner}).update(**changes))
+
+
+def fan_out(task, **kwargs) -> Callable[[], None]:
+    """
+    Callback for ``drain`` that sends WORKERS - 1 more copies of ``task``.
+
+    The copies get ``fan_out=False`` so they do not fan out again. Eager
+    runs (no broker) drain in the calling process only.
+    """
+    def dispatch():
+        if getattr(settings, 'CELERY_TASK_ALWAYS_EAGER', False):
+            return
+        for _ in range(_setting('WORKERS') - 1):
+            task.apply_async(kwargs=dict(kwargs, fan_out=False))
+    return dispatch
+
+
+def drain(queryset, process_batch: Callable[..., int], batch_size: Optional[int] = None,
+          lease_seconds: Optional[int] = None, on_full_batch: Optional[Callable[[], None]] = None,
+          pass_owner: bool = False) -> int:
+    """
+    Claim batches of ``queryset`` and pass their primary keys to
+    ``process_batch`` until no claimable row is left. With ``pass_owner``
+    the owner token is passed too, for ``transition``.
+
+    ``on_full_batch`` is called once, before the first batch is processed,
+    if that batch is full. Returns the sum of what ``process_batch`` returned.
+    """
+    batch_size = batch_size or _setting('BATCH_SIZE')
+    owner = new_owner()
+    processed = 0
+    first = True
+
+    while True:
+        pks = claim(queryset, batch_size, owner, lease_seconds)
+        if not pks:
+            break
+        if first and on_full_batch is not None and len(pks) == batch_size:
+            on_full_batch()
+        first = False
+        processed += process_batch(pks, owner) if pass_owner else process_batch(pks)
+
+    return processed
@@ -0,0 +1,194 @@
+"""
+Keyset (cursor) pagination for user history endpoints.
+
+Page-number pagination issues ``COUNT(*)`` and an ``OFFSET`` scan on every
+request, which gets slower the deeper a heavy player pages into their
+history. Keyset pagination instead remembers the sort key of the last row
+that was returned and asks the database for the rows strictly after it, so
+every page is a single index range scan regardless of depth.
+
+Existing clients keep working: unless the request opts in with ``cursor``
+(or ``pagination=cursor``), responses are produced by the legacy
+``PageNumberPagination`` class with the usual ``count`` field.
+"""
+
+import base64
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginates a queryset newest-first on ``(keyset_field, id)``.
+
+    Views select the timestamp column with a ``keyset_field`` attribute
+    (``created_at`` by default). The ``id`` tiebreaker makes the ordering
+    total, so rows sharing a timestamp are never skipped or repeated.
+    """
+
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    legacy_pagination_class = PageNumberPagination
+    default_keyset_field = 'created_at'
+
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self):
+        self.page_size = settings.REST_FRAMEWORK.get('PAGE_SIZE', 10)
+        self.legacy = None
+        self.base_url = None
+        self.next_position = None
+        self.previous_position = None
+
+    # Mode selection
+
+    def use_keyset(self, request) -> bool:
+        """Keyset mode is opt-in so existing page-number clients are unaffected"""
+        if self.cursor_query_param in request.query_params:
+            return True
+        return request.query_params.get(self.mode_query_param) == 'cursor'
+
+    # Cursor encoding
+
+    def encode_cursor(self, position: Tuple[Any, int], reverse: bool = False) -> str:
+        value, pk = position
+        raw = f"{'p' if reverse else 'n'}|{value.isoformat()}|{pk}"
+        return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+
+    def decode_cursor(self, request) -> Optional[Tuple[bool, Any, int]]:
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            raw = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+            direction, value, pk = raw.split('|')
+            timestamp = parse_datetime(value)
+            if direction not in ('n', 'p') or timestamp is None:
+                raise ValueError(raw)
+            return direction == 'p', timestamp, int(pk)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    # Pagination
+
+    def get_page_size(self, request) -> int:
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+            if size > 0:
+                return min(size, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.use_keyset(request):
+            self.legacy = self.legacy_pagination_class()
+            return self.legacy.paginate_queryset(queryset, request, view)
+
+        field = getattr(view, 'keyset_field', self.default_keyset_field)
+        self.keyset_field = field
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+
+        reverse = False
+        if cursor is not None:
+            reverse, value, pk = cursor
+            if reverse:
+                boundary = Q(**{f'{field}__gt': value}) | Q(**{field: value, 'id__gt': pk})
+            else:
+                boundary = Q(**{f'{field}__lt': value}) | Q(**{field: value, 'id__lt': pk})
+            queryset = queryset.filter(boundary)
+
+        if reverse:
+            queryset = queryset.order_by(field, 'id')
+        else:
+            queryset = queryset.order_by(f'-{field}', '-id')
+
+        # One extra row tells us whether another page exists without COUNT(*)
+        rows: List[Any] = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+
+        first = self._position(rows[0]) if rows else None
+        last = self._position(rows[-1]) if rows else None
+
+        if reverse:
+            self.next_position = last
+            self.previous_position = first if has_more else None
+        else:
+            self.next_position = last if has_more else None
+            self.previous_position = first if cursor is not None else None
+
+        return rows
+
+    def _position(self, row) -> Tuple[Any, int]:
+        if isinstance(row, dict):
+            return row[self.keyset_field], row['id']
+        return getattr(row, self.keyset_field), row.pk
+
+    def get_next_link(self) -> Optional[str]:
+        if self.next_position is None:
+            return None
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, self.encode_cursor(self.next_position)
+        )
+
+    def get_previous_link(self) -> Optional[str]:
+        if self.previous_position is None:
+            return None
+        return replace_query_param(
+            self.base_url, self.cursor_query_param,
+            self.encode_cursor(self.previous_position, reverse=True)
+        )
+
+    def get_paginated_response(self, data):
+        if self.legacy is not None:
+            return self.legacy.get_paginated_response(data)
+
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Keyset cursor from a previous response; an empty value starts at the newest row',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results per page',
+                'schema': {'type': 'integer'},
+            },
+        ]
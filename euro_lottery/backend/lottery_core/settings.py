@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -205,6 +206,48 @@ SUPPORT_EMAIL = os.getenv('SUPPORT_EMAIL', 'support@eurolottery.com')
 LOTTERY_SETTINGS = {
     'DRAW_BUFFER_TIME': int(os.getenv('DRAW_BUFFER_TIME', 60)),  # минуты до начала розыгрыша, когда билеты больше не продаются
     'MAX_TICKETS_PER_USER': int(os.getenv('MAX_TICKETS_PER_USER', 10)),  # максимальное количество билетов на один розыгрыш
+    'ASYNC_PURCHASES': os.getenv('ASYNC_PURCHASES', 'False') == 'True',  # все покупки через очередь заказов (пиковые продажи)
+    'SALES_STATE_CACHE_SECONDS': int(os.getenv('SALES_STATE_CACHE_SECONDS', 60)),  # секунды жизни кэша состояния продаж розыгрыша
+    'PURCHASE_QUEUE_BATCH_SIZE': int(os.getenv('PURCHASE_QUEUE_BATCH_SIZE', 500)),  # заказов за одну пачку обработки очереди
+    'PURCHASE_QUEUE_CLAIM_SECONDS': int(os.getenv('PURCHASE_QUEUE_CLAIM_SECONDS', 300)),  # секунды аренды пачки заказов, затем ее перехватывает другой воркер
+    'MAX_WHEEL_LINES': int(os.getenv('MAX_WHEEL_LINES', 10000)),  # максимальное число билетов в одной системной ставке
+    'MAX_SUBSCRIPTION_FAILURES': int(os.getenv('MAX_SUBSCRIPTION_FAILURES', 3)),  # неудачных списаний подряд до приостановки подписки
+    'SCHEDULED_DRAWS_AHEAD': int(os.getenv('SCHEDULED_DRAWS_AHEAD', 1)),  # будущих розыгрышей, заранее создаваемых для каждой игры
+    'DRAW_LEASE_SECONDS': int(os.getenv('DRAW_LEASE_SECONDS', 600)),  # секунды аренды розыгрыша воркером, после которых ее можно перехватить
+    'PAYOUT_CHUNK_SIZE': int(os.getenv('PAYOUT_CHUNK_SIZE', 1000)),  # выигрышей, зачисляемых одной транзакцией
+    'PAYOUT_CLAIM_SECONDS': int(os.getenv('PAYOUT_CLAIM_SECONDS', 600)),  # секунды, после которых незавершенную пачку выплат можно перехватить
+}
+
+# Idempotency-Key для денежных эндпоинтов (покупка, депозит, вывод)
+IDEMPOTENCY_SETTINGS = {
+    'CACHE_TTL': int(os.getenv('IDEMPOTENCY_CACHE_TTL', 60 * 60 * 24)),  # секунды хранения ответа в кеше
+    'RECORD_TTL': int(os.getenv('IDEMPOTENCY_RECORD_TTL', 60 * 60 * 24 * 7)),  # секунды хранения записи в БД
+    'LOCK_TIMEOUT': 60,  # секунды блокировки single-flight
+    'WAIT_TIMEOUT': 10,  # секунды ожидания параллельного дубликата
+}
+
+# Захват работы периодическими задачами на нескольких воркерах (lottery_core.leases)
+WORK_CLAIM_SETTINGS = {
+    'BATCH_SIZE': int(os.getenv('WORK_CLAIM_BATCH_SIZE', 100)),  # строк в одной захваченной пачке
+    'LEASE_SECONDS': int(os.getenv('WORK_CLAIM_LEASE_SECONDS', 300)),  # секунды аренды пачки, затем строки снова доступны
+    'WORKERS': int(os.getenv('WORK_CLAIM_WORKERS', 4)),  # копий задачи при большом отставании
+}
+
+# Опрос статусов депозитов у платежных провайдеров (payments.polling)
+DEPOSIT_POLLING_SETTINGS = {
+    'THREADS': int(os.getenv('DEPOSIT_POLLING_THREADS', 8)),  # одновременных запросов к провайдерам
+    'RATE_LIMITS': {  # запросов в секунду к каждому провайдеру в пределах процесса
+        'stripe': float(os.getenv('STRIPE_POLLING_RATE', 20)),
+        'paypal': float(os.getenv('PAYPAL_POLLING_RATE', 10)),
+        'crypto': float(os.getenv('COINPAYMENTS_POLLING_RATE', 2)),
+    },
+}
+
+# Входящая очередь вебхуков платежных провайдеров (payments.webhooks)
+WEBHOOK_SETTINGS = {
+    'MAX_ATTEMPTS': int(os.getenv('WEBHOOK_MAX_ATTEMPTS', 8)),  # попыток применить событие, затем статус failed
+    'RETRY_BACKOFF_SECONDS': int(os.getenv('WEBHOOK_RETRY_BACKOFF', 30)),  # пауза перед первым повтором, далее удваивается
+    'MAX_BACKOFF_SECONDS': int(os.getenv('WEBHOOK_MAX_BACKOFF', 60 * 60)),  # предел паузы между повторами
 }
 
 # Настройки для сертифицированного генератора случайных чисел
@@ -234,6 +277,41 @@ PAYMENT_PROVIDERS = {
     },
 }
 
+# HTTP-соединения с платежными провайдерами (payments.integrations.http)
+PAYMENT_HTTP_SETTINGS = {
+    'CONNECT_TIMEOUT': float(os.getenv('PAYMENT_HTTP_CONNECT_TIMEOUT', 5)),  # секунды на установку соединения
+    'READ_TIMEOUT': float(os.getenv('PAYMENT_HTTP_READ_TIMEOUT', 30)),  # секунды ожидания ответа
+    'RETRIES': int(os.getenv('PAYMENT_HTTP_RETRIES', 3)),  # повторов идемпотентных запросов
+    'BACKOFF_FACTOR': float(os.getenv('PAYMENT_HTTP_BACKOFF', 0.5)),  # экспоненциальная пауза между повторами
+    'POOL_SIZE': int(os.getenv('PAYMENT_HTTP_POOL_SIZE', 20)),  # соединений в пуле на хост
+}
+
+# Здоровье платежных провайдеров и автоматический выключатель (payments.provider_health)
+PROVIDER_HEALTH_SETTINGS = {
+    'WINDOW_SECONDS': int(os.getenv('PROVIDER_HEALTH_WINDOW', 60)),  # скользящее окно статистики
+    'BUCKET_SECONDS': int(os.getenv('PROVIDER_HEALTH_BUCKET', 10)),  # шаг окна
+    'MIN_CALLS': int(os.getenv('PROVIDER_HEALTH_MIN_CALLS', 10)),  # вызовов в окне до решения о размыкании
+    'ERROR_RATE': float(os.getenv('PROVIDER_HEALTH_ERROR_RATE', 0.5)),  # доля ошибок, размыкающая автомат
+    'SLOW_MS': int(os.getenv('PROVIDER_HEALTH_SLOW_MS', 3000)),  # средняя задержка деградировавшего провайдера
+    'OPEN_SECONDS': int(os.getenv('PROVIDER_HEALTH_OPEN_SECONDS', 30)),  # пауза перед пробным вызовом
+    'DEGRADED_TIMEOUT': (  # (connect, read) для деградировавшего провайдера
+        float(os.getenv('PROVIDER_HEALTH_CONNECT_TIMEOUT', 2)),
+        float(os.getenv('PROVIDER_HEALTH_READ_TIMEOUT', 5)),
+    ),
+    'AUTO_FAILOVER': os.getenv('PROVIDER_AUTO_FAILOVER', 'False') == 'True',  # выбирать другой провайдер без запроса клиента
+}
+
+# Вызовы провайдеров из депозитных представлений (payments.outbox)
+PAYMENT_OUTBOX_SETTINGS = {
+    'STALE_SECONDS': int(os.getenv('PAYMENT_OUTBOX_STALE_SECONDS', 10 * 60)),  # вызов без результата считается брошенным
+}
+
+# Снимок методов оплаты и конфигурации процессоров (payments.config_snapshot)
+PAYMENT_CONFIG_SNAPSHOT = {
+    'TIMEOUT': int(os.getenv('PAYMENT_CONFIG_SNAPSHOT_TIMEOUT', 15 * 60)),  # секунды жизни снимка (курсы монет)
+    'CHECK_SECONDS': int(os.getenv('PAYMENT_CONFIG_SNAPSHOT_CHECK', 5)),  # как часто процесс сверяет версию в кэше
+}
+
 # Настройки платежных процессоров
 STRIPE_PUBLIC_KEY = os.getenv('STRIPE_PUBLIC_KEY', '')
 STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY', '')
@@ -271,6 +349,13 @@ if DEBUG:
     CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', 'cache')
     CELERY_CACHE_BACKEND = 'django-cache'
     CELERY_TASK_ALWAYS_EAGER = True  # Выполнять задачи немедленно (без воркера)
+
+    # Один процесс разработки: достаточно локального кэша
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
 else:
     # Для продакшн среды используем Redis
     REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
@@ -287,6 +372,22 @@ else:
     
     CELERY_TASK_ALWAYS_EAGER = False  # В продакшне используем асинхронное выполнение
 
+    # Общий кэш всех процессов (веб-воркеры gunicorn и воркеры Celery): блокировки
+    # Idempotency-Key, версии ETag, состояние продаж, снимок методов оплаты и
+    # здоровье провайдеров должны быть одинаковыми в каждом процессе
+    REDIS_CACHE_DB = os.getenv('REDIS_CACHE_DB', '1')
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv(
+                'CACHE_URL',
+                f'redis://:{REDIS_PASSWORD}@{REDIS_HOST}:{REDIS_PORT}/{REDIS_CACHE_DB}' if REDIS_PASSWORD
+                else f'redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_CACHE_DB}'
+            ),
+            'KEY_PREFIX': 'euro_lottery',
+        }
+    }
+
 # Общие настройки Celery
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
@@ -298,12 +399,92 @@ CELERY_TASK_ACKS_LATE = True
 CELERY_TASK_REJECT_ON_WORKER_LOST = True
 CELERY_TASK_TRACK_STARTED = True
 
+# Метрики Celery-задач в формате Prometheus (lottery_core.task_metrics)
+TASK_METRICS = {
+    'ENABLED': os.getenv('TASK_METRICS_ENABLED', 'True') == 'True',
+    'DIR': os.getenv('TASK_METRICS_DIR', os.path.join(tempfile.gettempdir(), 'euro_lottery_task_metrics')),  # общий каталог снимков процессов
+    'WORKER_PORT': int(os.getenv('TASK_METRICS_WORKER_PORT', 8888)),  # порт /metrics воркера, 0 - не запускать
+    'WORKER_BIND': os.getenv('TASK_METRICS_WORKER_BIND', '127.0.0.1'),  # адрес /metrics воркера; не loopback - только с токеном
+    'AUTH_TOKEN': os.getenv('TASK_METRICS_AUTH_TOKEN', ''),  # Bearer-токен для /metrics; пусто - /metrics приложения закрыт
+}
+
+# Очереди Celery по классам нагрузки: розыгрыши и платежи не ждут за массовыми задачами.
+# Каждую очередь обслуживает свой воркер (celery -A lottery_core worker -Q <очередь>)
+# с указанным здесь числом процессов.
+from kombu import Exchange, Queue
+
+CELERY_QUEUE_CONCURRENCY = {
+    'draws': int(os.getenv('CELERY_DRAWS_CONCURRENCY', 2)),
+    'payments': int(os.getenv('CELERY_PAYMENTS_CONCURRENCY', 2)),
+    'settlement': int(os.getenv('CELERY_SETTLEMENT_CONCURRENCY', 2)),
+    'notifications': int(os.getenv('CELERY_NOTIFICATIONS_CONCURRENCY', 2)),
+    'maintenance': int(os.getenv('CELERY_MAINTENANCE_CONCURRENCY', 1)),
+}
+
+CELERY_TASK_QUEUES = [
+    Queue(name, Exchange(name, type='direct'), routing_key=name)
+    for name in CELERY_QUEUE_CONCURRENCY
+]
+CELERY_TASK_DEFAULT_QUEUE = 'maintenance'
+CELERY_TASK_DEFAULT_EXCHANGE = 'maintenance'
+CELERY_TASK_DEFAULT_ROUTING_KEY = 'maintenance'
+
+# Приоритет внутри очереди: в Redis 0 - наивысший, 9 - наименьший
+CELERY_TASK_DEFAULT_PRIORITY = 5
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    'queue_order_strategy': 'priority',
+    # Неподтвержденная задача (acks_late) возвращается в очередь через visibility_timeout:
+    # должен превышать самый дальний ETA (ARM_HORIZON розыгрышей - 1 час)
+    'visibility_timeout': int(os.getenv('CELERY_VISIBILITY_TIMEOUT', 2 * 60 * 60)),
+}
+# Воркер не резервирует задачи впрок, иначе приоритет не работает
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+CELERY_TASK_ROUTES = {
+    # Проведение розыгрышей
+    'lottery.tasks.conduct_draw_at_eta': {'queue': 'draws', 'priority': 0},
+    'lottery.tasks.conduct_pending_draws': {'queue': 'draws', 'priority': 1},
+    'lottery.tasks.arm_draw_executions': {'queue': 'draws', 'priority': 2},
+    'lottery.tasks.process_purchase_queue': {'queue': 'draws', 'priority': 4},
+    'lottery.tasks.schedule_next_draws': {'queue': 'draws', 'priority': 6},
+
+    # Расчет выигрышей
+    'lottery.tasks.check_ticket_winnings': {'queue': 'settlement', 'priority': 3},
+    'lottery.tasks.verify_completed_draws': {'queue': 'settlement', 'priority': 6},
+
+    # Платежи
+    'payments.tasks.check_pending_deposits': {'queue': 'payments', 'priority': 0},
+    'payments.tasks.process_webhook_events': {'queue': 'payments', 'priority': 1},
+    'payments.tasks.process_pending_payouts': {'queue': 'payments', 'priority': 2},
+    'payments.tasks.retry_failed_deposits': {'queue': 'payments', 'priority': 6},
+
+    # Уведомления
+    'users.tasks.create_win_notifications': {'queue': 'notifications', 'priority': 2},
+    'users.tasks.create_payment_notifications': {'queue': 'notifications', 'priority': 2},
+    'users.tasks.send_pending_notifications': {'queue': 'notifications', 'priority': 3},
+    'users.tasks.send_upcoming_draw_reminders': {'queue': 'notifications', 'priority': 7},
+
+    # Обслуживание
+    'payments.tasks.purge_expired_idempotency_records': {'queue': 'maintenance'},
+    'payments.tasks.expire_stale_payment_calls': {'queue': 'maintenance'},
+    'users.tasks.clean_old_notifications': {'queue': 'maintenance'},
+    'users.tasks.reconcile_daily_spend': {'queue': 'maintenance'},
+}
+
 # Celery Beat schedule
+from celery.schedules import crontab
+
 CELERY_BEAT_SCHEDULE = {
     # Задачи для лотереи
     'conduct-pending-draws': {
         'task': 'lottery.tasks.conduct_pending_draws',
-        'schedule': 60.0 * 5,  # Каждые 5 минут
+        'schedule': 60.0 * 30,  # Каждые 30 минут (страховка, розыгрыши проводят ETA-задачи)
+    },
+    'arm-draw-executions': {
+        'task': 'lottery.tasks.arm_draw_executions',
+        'schedule': 60.0 * 10,  # Каждые 10 минут
     },
     'schedule-next-draws': {
         'task': 'lottery.tasks.schedule_next_draws',
@@ -317,6 +498,10 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'lottery.tasks.check_ticket_winnings',
         'schedule': 60.0 * 15,  # Каждые 15 минут
     },
+    'process-purchase-queue': {
+        'task': 'lottery.tasks.process_purchase_queue',
+        'schedule': 60.0,  # Каждую минуту (страховка для потерянных сообщений)
+    },
     
     # Задачи для платежей
     'process-pending-payouts': {
@@ -327,10 +512,22 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'payments.tasks.check_pending_deposits',
         'schedule': 60.0 * 10,  # Каждые 10 минут
     },
+    'process-webhook-events': {
+        'task': 'payments.tasks.process_webhook_events',
+        'schedule': 60.0,  # Каждую минуту (повторы и потерянные сообщения)
+    },
     'retry-failed-deposits': {
         'task': 'payments.tasks.retry_failed_deposits',
         'schedule': 60.0 * 60 * 3,  # Каждые 3 часа
     },
+    'expire-stale-payment-calls': {
+        'task': 'payments.tasks.expire_stale_payment_calls',
+        'schedule': 60.0 * 10,  # Каждые 10 минут
+    },
+    'purge-idempotency-records': {
+        'task': 'payments.tasks.purge_expired_idempotency_records',
+        'schedule': 60.0 * 60 * 24,  # Ежедневно
+    },
     
     # Задачи для уведомлений
     'send-pending-notifications': {
@@ -345,6 +542,12 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'users.tasks.clean_old_notifications',
         'schedule': 60.0 * 60 * 24,  # Ежедневно
     },
+    
+    # Ответственная игра
+    'reconcile-daily-spend': {
+        'task': 'users.tasks.reconcile_daily_spend',
+        'schedule': crontab(hour=0, minute=30),  # Ночью, после смены суток
+    },
 }
 
 # Logging configuration
@@ -0,0 +1,421 @@
+"""
+Celery task instrumentation with Prometheus text exposition.
+
+Tasks used to log only "Completed ... N processed", so a slow or lagging
+beat job went unnoticed. Every task run is now measured through Celery
+signals:
+
+- wall time (task_prerun -> task_postrun);
+- database queries and their time, via an execute wrapper installed on
+  the task's connections for the duration of the run;
+- queue lag, from the ``enqueued_at`` header stamped at publish time (or
+  the ETA, for scheduled tasks) to the start of the run;
+- failures: a raised exception, or the ``False`` the repo's tasks return
+  after logging an error;
+- rows processed, read from the task's return value as declared with the
+  ``@rows_processed`` decorator.
+
+Series are labelled with the task name and, for beat jobs, the
+CELERY_BEAT_SCHEDULE entry name. Each process keeps its own registry and,
+after every run, writes a snapshot to TASK_METRICS['DIR']; ``/metrics`` on
+the Django app and the worker's metrics port (TASK_METRICS['WORKER_PORT'])
+merge all snapshots, like prometheus_client's multiprocess mode. With no
+directory configured only the serving process's own runs are exposed.
+
+Both endpoints require ``Authorization: Bearer <AUTH_TOKEN>``. Without a
+token the app's ``/metrics`` answers 401 to everyone, and the worker port
+is only served on a loopback ``WORKER_BIND``.
+"""
+
+import copy
+import glob
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+from celery.signals import (
+    before_task_publish, task_failure, task_postrun, task_prerun, worker_ready
+)
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+ENQUEUED_HEADER = 'enqueued_at'
+
+SECONDS_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+COUNT_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 10000)
+
+HISTOGRAMS = {
+    'celery_task_duration_seconds': ('Wall time of task runs', SECONDS_BUCKETS),
+    'celery_task_queue_lag_seconds': ('Time from enqueue (or ETA) to task start', SECONDS_BUCKETS),
+    'celery_task_db_queries': ('Database queries per task run', COUNT_BUCKETS),
+    'celery_task_db_time_seconds': ('Database time per task run', SECONDS_BUCKETS),
+    'celery_task_rows_processed': ('Rows processed per task run', COUNT_BUCKETS),
+}
+COUNTERS = {
+    'celery_task_runs_total': 'Task runs',
+    'celery_task_failures_total': 'Task runs that raised or returned False',
+}
+GAUGES = {
+    'celery_task_last_success_timestamp_seconds': 'Unix time of the last successful run',
+}
+
+DEFAULTS = {
+    'ENABLED': True,
+    'DIR': '',
+    'WORKER_PORT': 0,
+    'WORKER_BIND': '127.0.0.1',
+    'AUTH_TOKEN': '',
+}
+
+
+def _setting(name: str):
+    return getattr(settings, 'TASK_METRICS', {}).get(name, DEFAULTS[name])
+
+
+def rows_processed(key: Union[str, Callable[[Any], Optional[int]], None] = None):
+    """
+    Declare how many rows a task run processed, taken from its return value:
+    the value itself (``key=None``), one key of a returned dict, or a
+    callable applied to the result. Place it below ``@shared_task``.
+    """
+    def decorator(func):
+        func.rows_processed = key
+        return func
+    return decorator
+
+
+def _extract_rows(task, retval) -> Optional[int]:
+    run = getattr(task, 'run', None)
+    if not hasattr(run, 'rows_processed'):
+        return None
+    key = run.rows_processed
+    if callable(key):
+        value = key(retval)
+    elif key is None:
+        value = retval
+    else:
+        value = retval.get(key) if isinstance(retval, dict) else None
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return int(value)
+
+
+class Registry:
+    """
+    Metrics of the tasks run in this process
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.histograms = {name: {} for name in HISTOGRAMS}
+            self.counters = {name: {} for name in COUNTERS}
+            self.gauges = {name: {} for name in GAUGES}
+
+    def observe(self, name: str, task: str, value: float) -> None:
+        buckets = HISTOGRAMS[name][1]
+        with self._lock:
+            series = self.histograms[name].setdefault(
+                task, {'buckets': [0] * (len(buckets) + 1), 'sum': 0.0, 'count': 0}
+            )
+            index = next((i for i, bound in enumerate(buckets) if value <= bound), len(buckets))
+            series['buckets'][index] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def inc(self, name: str, task: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name][task] = self.counters[name].get(task, 0) + amount
+
+    def set_gauge(self, name: str, task: str, value: float) -> None:
+        with self._lock:
+            self.gauges[name][task] = value
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return copy.deepcopy({
+                'histograms': self.histograms, 'counters': self.counters, 'gauges': self.gauges,
+            })
+
+
+registry = Registry()
+
+
+def _snapshot_path(directory: str) -> str:
+    return os.path.join(directory, f"{socket.gethostname()}-{os.getpid()}.json")
+
+
+def flush() -> None:
+    """Write this process's snapshot for the metrics endpoints"""
+    directory = _setting('DIR')
+    if not directory:
+        return
+    try:
+        os.makedirs(directory, exist_ok=True)
+        path = _snapshot_path(directory)
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(registry.snapshot(), f)
+        os.replace(f"{path}.tmp", path)
+    except OSError as e:
+        logger.warning(f"Could not write task metrics snapshot: {str(e)}")
+
+
+def collect() -> Dict[str, Any]:
+    """Merged snapshots of all processes (or of this one without a DIR)"""
+    directory = _setting('DIR')
+    if not directory:
+        return registry.snapshot()
+
+    merged = {
+        'histograms': {name: {} for name in HISTOGRAMS},
+        'counters': {name: {} for name in COUNTERS},
+        'gauges': {name: {} for name in GAUGES},
+    }
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, series in snapshot.get('histograms', {}).items():
+            for task, values in series.items():
+                target = merged['histograms'].setdefault(name, {}).get(task)
+                if target is None:
+                    merged['histograms'][name][task] = values
+                    continue
+                target['buckets'] = [a + b for a, b in zip(target['buckets'], values['buckets'])]
+                target['sum'] += values['sum']
+                target['count'] += values['count']
+        for name, series in snapshot.get('counters', {}).items():
+            for task, value in series.items():
+                counters = merged['counters'].setdefault(name, {})
+                counters[task] = counters.get(task, 0) + value
+        for name, series in snapshot.get('gauges', {}).items():
+            for task, value in series.items():
+                gauges = merged['gauges'].setdefault(name, {})
+                gauges[task] = max(gauges.get(task, value), value)
+    return merged
+
+
+def beat_entries() -> Dict[str, str]:
+    """Task name -> CELERY_BEAT_SCHEDULE entry name"""
+    return {
+        entry['task']: name
+        for name, entry in getattr(settings, 'CELERY_BEAT_SCHEDULE', {}).items()
+    }
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(task: str, schedules: Dict[str, str], **extra) -> str:
+    labels = {'task': task, 'schedule': schedules.get(task, '')}
+    labels.update(extra)
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(snapshot: Optional[Dict[str, Any]] = None) -> str:
+    """Prometheus text exposition of a snapshot"""
+    snapshot = collect() if snapshot is None else snapshot
+    schedules = beat_entries()
+    lines = []
+
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for task, series in sorted(snapshot['histograms'].get(name, {}).items()):
+            cumulative = 0
+            for bound, count in zip(tuple(buckets) + (float('inf'),), series['buckets']):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(task, schedules, le=_number(bound))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(task, schedules)} {_number(float(series['sum']))}")
+            lines.append(f"{name}_count{_labels(task, schedules)} {series['count']}")
+
+    for name, help_text in COUNTERS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        values = dict.fromkeys(schedules, 0)
+        values.update(snapshot['counters'].get(name, {}))
+        for task, value in sorted(values.items()):
+            lines.append(f"{name}{_labels(task, schedules)} {value}")
+
+    for name, help_text in GAUGES.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for task, value in sorted(snapshot['gauges'].get(name, {}).items()):
+            lines.append(f"{name}{_labels(task, schedules)} {_number(float(value))}")
+
+    return '\n'.join(lines) + '\n'
+
+
+def authorized(authorization: Optional[str]) -> bool:
+    """Whether an Authorization header carries the metrics token; nobody is without one configured"""
+    token = _setting('AUTH_TOKEN')
+    return bool(token) and hmac.compare_digest((authorization or '').encode(), f"Bearer {token}".encode())
+
+
+def metrics_view(request):
+    """Django view serving the merged task metrics"""
+    if not authorized(request.headers.get('Authorization')):
+        return HttpResponse(status=401)
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
+
+
+class QueryTimer:
+    """Execute wrapper counting the queries of a task run and their time"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+# task_id -> (start, enqueued/eta timestamp, QueryTimer)
+_running: Dict[str, Tuple[float, Optional[float], QueryTimer]] = {}
+
+
+def _enqueued_at(request) -> Optional[float]:
+    eta = getattr(request, 'eta', None)
+    if eta:
+        try:
+            return datetime.fromisoformat(eta).timestamp() if isinstance(eta, str) else eta.timestamp()
+        except ValueError:
+            pass
+    enqueued = getattr(request, ENQUEUED_HEADER, None)
+    if enqueued is None:
+        enqueued = (getattr(request, 'headers', None) or {}).get(ENQUEUED_HEADER)
+    return float(enqueued) if enqueued is not None else None
+
+
+@before_task_publish.connect
+def stamp_enqueued_at(headers=None, **kwargs):
+    if headers is not None:
+        headers.setdefault(ENQUEUED_HEADER, time.time())
+
+
+@task_prerun.connect
+def start_task_run(task_id=None, task=None, **kwargs):
+    if not _setting('ENABLED') or task is None:
+        return
+    timer = QueryTimer()
+    for connection in connections.all():
+        connection.execute_wrappers.append(timer)
+    _running[task_id] = (time.time(), _enqueued_at(task.request), timer)
+
+
+@task_failure.connect
+def record_task_failure(sender=None, **kwargs):
+    if _setting('ENABLED') and sender is not None:
+        registry.inc('celery_task_failures_total', sender.name)
+
+
+@task_postrun.connect
+def finish_task_run(task_id=None, task=None, retval=None, state=None, **kwargs):
+    run = _running.pop(task_id, None)
+    if run is None:
+        return
+    start, enqueued_at, timer = run
+    for connection in connections.all():
+        if timer in connection.execute_wrappers:
+            connection.execute_wrappers.remove(timer)
+
+    name = task.name
+    now = time.time()
+    registry.inc('celery_task_runs_total', name)
+    registry.observe('celery_task_duration_seconds', name, now - start)
+    registry.observe('celery_task_db_queries', name, timer.count)
+    registry.observe('celery_task_db_time_seconds', name, timer.seconds)
+    if enqueued_at is not None:
+        registry.observe('celery_task_queue_lag_seconds', name, max(start - enqueued_at, 0.0))
+    rows = _extract_rows(task, retval)
+    if rows is not None:
+        registry.observe('celery_task_rows_processed', name, rows)
+    if retval is False and state == 'SUCCESS':
+        # The tasks catch their errors, log them and return False
+        registry.inc('celery_task_failures_total', name)
+    elif state == 'SUCCESS':
+        registry.set_gauge('celery_task_last_success_timestamp_seconds', name, now)
+    flush()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        # Without a token the server only listens on loopback (see start_metrics_server)
+        if _setting('AUTH_TOKEN') and not authorized(self.headers.get('Authorization')):
+            self.send_error(401)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _is_loopback(host: str) -> bool:
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def start_metrics_server(port: int, bind: Optional[str] = None) -> ThreadingHTTPServer:
+    """
+    Serve /metrics from a daemon thread of the worker process.
+
+    Raises ValueError for a non-loopback bind address without AUTH_TOKEN.
+    """
+    bind = bind if bind is not None else _setting('WORKER_BIND')
+    if not _setting('AUTH_TOKEN') and not _is_loopback(bind):
+        raise ValueError(f"Task metrics on {bind or 'all interfaces'} need TASK_METRICS['AUTH_TOKEN']")
+    server = ThreadingHTTPServer((bind, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='task-metrics', daemon=True).start()
+    logger.info(f"Task metrics served on {bind}:{server.server_address[1]}")
+    return server
+
+
+@worker_ready.connect
+def serve_worker_metrics(**kwargs):
+    port = _setting('WORKER_PORT')
+    if _setting('ENABLED') and port:
+        try:
+            start_metrics_server(port)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not start task metrics server on port {port}: {str(e)}")
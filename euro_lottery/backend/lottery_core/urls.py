@@ -3,6 +3,7 @@ from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
 from rest_framework import permissions
+from lottery_core.task_metrics import metrics_view
 # Импорты для Swagger/ReDoc документации
 # type: ignore
 from drf_yasg.views import get_schema_view
@@ -27,6 +28,9 @@ urlpatterns = [
     path('api/lottery/', include('lottery.urls')),
     path('api/payments/', include('payments.urls')),
     
+    # Метрики Celery-задач для Prometheus
+    path('metrics', metrics_view, name='task-metrics'),
+    
     # Swagger/ReDoc documentation
     re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
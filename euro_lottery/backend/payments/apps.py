@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class PaymentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'payments'
+    
+    def ready(self):
+        import payments.signals  # Импорт сигналов при загрузке приложения
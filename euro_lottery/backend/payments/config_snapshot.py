@@ -0,0 +1,152 @@
+"""
+Cached snapshot of the payment methods and client configuration.
+
+``PaymentMethodsAPIView`` used to rebuild its payload on every request: the
+processor configuration was computed twice (once directly, once inside
+``get_available_payment_methods``), the CoinPayments coin list was fetched
+from the provider API each time and ``PaymentProvider`` was queried too.
+
+The payload is now built once into a ``ConfigSnapshot`` together with its
+ETag and kept at two levels:
+
+- in the Django cache, shared by all processes, for ``TIMEOUT`` seconds
+  (this bounds how stale the coin rates can get);
+- in process memory. The shared version counter is consulted at most every
+  ``CHECK_SECONDS``, so most requests touch neither the cache nor the
+  database.
+
+Saving or deleting a ``PaymentProvider`` bumps the version (see
+``payments.signals``). The bump reaches the other web and Celery workers
+only because ``CACHES`` is shared (Redis in production settings): each
+process sees it on its next check, within ``CHECK_SECONDS``. The public processor settings are part of the cache
+key, so a deploy with new keys never serves the previous snapshot, and
+``setting_changed`` drops the process copy.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import quote_etag
+
+DEFAULTS = {
+    'TIMEOUT': 15 * 60,
+    'CHECK_SECONDS': 5,
+}
+
+SNAPSHOT_CACHE_KEY = 'payments:config_snapshot:{fingerprint}:{version}'
+VERSION_CACHE_KEY = 'payments:config_snapshot:version'
+
+# Settings that end up in the payload
+SNAPSHOT_SETTINGS = (
+    'STRIPE_PUBLIC_KEY', 'PAYPAL_CLIENT_ID', 'PAYPAL_MODE', 'COINPAYMENTS_PUBLIC_KEY',
+    'COINPAYMENTS_MERCHANT_ID', 'DEFAULT_CURRENCY', 'DEFAULT_PAYMENT_PROVIDER',
+)
+
+
+class ConfigSnapshot:
+    """Payload of the payment methods endpoint and its ETag"""
+
+    __slots__ = ('payload', 'etag', 'version', 'built_at')
+
+    def __init__(self, payload: Dict, version: int, built_at: Optional[float] = None):
+        self.payload = payload
+        self.version = version
+        self.built_at = built_at if built_at is not None else time.time()
+        body = json.dumps(payload, sort_keys=True, default=str)
+        self.etag = quote_etag(hashlib.sha1(body.encode('utf-8')).hexdigest())
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+_local = {'snapshot': None, 'checked_at': 0.0}
+_lock = threading.Lock()
+
+
+def _setting(name: str):
+    return getattr(settings, 'PAYMENT_CONFIG_SNAPSHOT', {}).get(name, DEFAULTS[name])
+
+
+def _fingerprint() -> str:
+    values = [str(getattr(settings, name, '')) for name in SNAPSHOT_SETTINGS]
+    return hashlib.sha1('|'.join(values).encode('utf-8')).hexdigest()[:12]
+
+
+def _current_version() -> int:
+    version = cache.get(VERSION_CACHE_KEY)
+    if version is None:
+        # Seeded from the clock, so a counter lost with the cache never reuses an old version
+        cache.add(VERSION_CACHE_KEY, int(time.time()), timeout=None)
+        version = cache.get(VERSION_CACHE_KEY)
+    return version
+
+
+def build_payload() -> Dict:
+    """Collect methods, active providers and client config from scratch"""
+    from .integrations.factory import get_available_payment_methods, get_processor_config
+    from .models import PaymentProvider
+
+    config = get_processor_config()
+    providers = PaymentProvider.objects.filter(is_active=True).order_by('id').values(
+        'id', 'name', 'provider_type'
+    )
+    return {
+        'methods': get_available_payment_methods(config),
+        'providers': list(providers),
+        'config': config,
+    }
+
+
+def _is_fresh(snapshot: Optional[ConfigSnapshot], version: int, now: float) -> bool:
+    return (
+        snapshot is not None and snapshot.version == version
+        and now - snapshot.built_at < _setting('TIMEOUT')
+    )
+
+
+def get_snapshot() -> ConfigSnapshot:
+    """Current snapshot, from process memory when possible"""
+    now = time.time()
+    snapshot = _local['snapshot']
+    if (snapshot is not None and now - _local['checked_at'] < _setting('CHECK_SECONDS')
+            and now - snapshot.built_at < _setting('TIMEOUT')):
+        return snapshot
+
+    with _lock:
+        version = _current_version()
+        snapshot = _local['snapshot']
+        if not _is_fresh(snapshot, version, now):
+            key = SNAPSHOT_CACHE_KEY.format(fingerprint=_fingerprint(), version=version)
+            snapshot = cache.get(key)
+            if not _is_fresh(snapshot, version, now):
+                snapshot = ConfigSnapshot(build_payload(), version)
+                cache.set(key, snapshot, timeout=_setting('TIMEOUT'))
+            _local['snapshot'] = snapshot
+        _local['checked_at'] = now
+        return snapshot
+
+
+def clear_local_snapshot():
+    """Drop the process copy; the next request reloads it from the cache"""
+    with _lock:
+        _local['snapshot'] = None
+        _local['checked_at'] = 0.0
+
+
+def invalidate_snapshot():
+    """Make every process rebuild the snapshot on its next check"""
+    try:
+        cache.incr(VERSION_CACHE_KEY)
+    except ValueError:
+        # No counter yet (cold or evicted cache)
+        cache.set(VERSION_CACHE_KEY, int(time.time()), timeout=None)
+    clear_local_snapshot()
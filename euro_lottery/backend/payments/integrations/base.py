@@ -54,7 +54,25 @@ class PaymentProcessorInterface(ABC):
             Dictionary with payment status and details
         """
         pass
-    
+
+    # Max IDs per get_payment_statuses call; 0 when the provider has no multi-ID endpoint
+    status_batch_size = 0
+
+    def get_payment_statuses(self, payment_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the status of several payments in one request
+
+        Only providers with a multi-ID endpoint (status_batch_size > 0)
+        implement this.
+
+        Args:
+            payment_ids: IDs of the payments to check, at most status_batch_size
+
+        Returns:
+            Dictionary mapping each payment ID to its status dictionary
+        """
+        raise NotImplementedError
+
     @abstractmethod
     def cancel_payment(self, payment_id: str) -> Dict[str, Any]:
         """
@@ -146,13 +164,14 @@ class WebhookHandlerInterface(ABC):
     """Interface for handling webhooks from payment processors"""
     
     @abstractmethod
-    def parse_webhook(self, payload: Dict, headers: Dict = None) -> Dict[str, Any]:
+    def parse_webhook(self, payload: Dict, headers: Dict = None, raw_body: bytes = None) -> Dict[str, Any]:
         """
         Parse a webhook payload from the payment processor
         
         Args:
             payload: The webhook payload
             headers: HTTP headers from the webhook request
+            raw_body: Request body bytes the signature was computed over
             
         Returns:
             Parsed webhook data
@@ -8,19 +8,44 @@ import hmac
 import hashlib
 import json
 import time
-import requests
 from decimal import Decimal
 from typing import Dict, Any, Optional, List
 import logging
 from django.conf import settings
+from django.core.cache import cache
 from .base import PaymentProcessorInterface, WebhookHandlerInterface
+from .http import get_session
 
 logger = logging.getLogger(__name__)
 
+NONCE_CACHE_KEY = 'payments:coinpayments:nonce'
+
+
+def _next_nonce() -> int:
+    """
+    Строго возрастающий nonce, общий для всех процессов с этим ключом API
+
+    Потоки опроса и дочерние процессы Celery вызывают API одновременно, поэтому
+    nonce берется из счетчика в общем кэше (Redis в продакшене): cache.incr
+    атомарен. Счетчик засевается меткой времени в миллисекундах, чтобы после
+    потери ключа nonce продолжал расти относительно прежних значений.
+    """
+    try:
+        return cache.incr(NONCE_CACHE_KEY)
+    except ValueError:
+        # Ключа еще нет; другой процесс мог засеять его раньше
+        seed = int(time.time() * 1000)
+        if cache.add(NONCE_CACHE_KEY, seed, timeout=None):
+            return seed
+        return cache.incr(NONCE_CACHE_KEY)
+
 
 class CryptoPaymentProcessor(PaymentProcessorInterface, WebhookHandlerInterface):
     """Реализация интерфейсов платежей для криптовалют через CoinPayments"""
     
+    # get_tx_info_multi принимает до 25 ID транзакций
+    status_batch_size = 25
+    
     def __init__(self):
         """Инициализация процессора для криптовалют"""
         self.api_url = "https://www.coinpayments.net/api.php"
@@ -52,7 +77,7 @@ class CryptoPaymentProcessor(PaymentProcessorInterface, WebhookHandlerInterface)
             'cmd': method,
             'key': self.public_key,
             'format': 'json',
-            'nonce': int(time.time())
+            'nonce': _next_nonce()
         }
         
         # Добавляем дополнительные параметры
@@ -74,7 +99,7 @@ class CryptoPaymentProcessor(PaymentProcessorInterface, WebhookHandlerInterface)
         }
         
         try:
-            response = requests.post(
+            response = get_session().post(
                 self.api_url,
                 json=request_params,
                 headers=headers
@@ -197,35 +222,7 @@ class CryptoPaymentProcessor(PaymentProcessorInterface, WebhookHandlerInterface)
             if 'error' in result:
                 return result
             
-            # Статусы CoinPayments:
-            # -1 = cancelled / timed out
-            # 0 = waiting for funds
-            # 1 = coin confirms needed
-            # 2 = confirmed and complete
-            # 3 = complete but waiting for MK Coin confirmations
-            
-            status_map = {
-                -1: 'cancelled',
-                0: 'pending',
-                1: 'confirming',
-                2: 'completed',
-                3: 'completed'
-            }
-            
-            status_code = result.get('status', 0)
-            status = status_map.get(status_code, 'unknown')
-            
-            return {
-                'id': payment_id,
-                'status': status,
-                'amount': Decimal(str(result.get('amount'))),
-                'received': Decimal(str(result.get('received', 0))),
-                'confirms': result.get('confirms', 0),
-                'time_created': result.get('time_created', 0),
-                'time_expires': result.get('time_expires', 0),
-                'success': True,
-                'details': result
-            }
+            return self._status_from_result(payment_id, result)
             
         except Exception as e:
             logger.error(f"Error getting crypto payment status: {str(e)}")
@@ -234,6 +231,68 @@ class CryptoPaymentProcessor(PaymentProcessorInterface, WebhookHandlerInterface)
                 'success': False
             }
     
+    def get_payment_statuses(self, payment_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Получает статусы нескольких криптоплатежей одним запросом get_tx_info_multi
+        
+        Args:
+            payment_ids: ID транзакций (не больше status_batch_size)
+            
+        Returns:
+            Словарь {ID транзакции: словарь со статусом платежа}
+        """
+        try:
+            result = self._make_request('get_tx_info_multi', {'txid': '|'.join(payment_ids)})
+            
+            if 'error' in result:
+                return {payment_id: result for payment_id in payment_ids}
+            
+            statuses = {}
+            for payment_id in payment_ids:
+                info = result.get(payment_id)
+                if info is None or info.get('error', 'ok') != 'ok':
+                    error = info.get('error') if info else 'Transaction not found'
+                    statuses[payment_id] = {'error': error, 'success': False}
+                else:
+                    statuses[payment_id] = self._status_from_result(payment_id, info)
+            return statuses
+            
+        except Exception as e:
+            logger.error(f"Error getting crypto payment statuses: {str(e)}")
+            return {payment_id: {'error': str(e), 'success': False} for payment_id in payment_ids}
+    
+    def _status_from_result(self, payment_id: str, result: Dict) -> Dict[str, Any]:
+        """Преобразует ответ get_tx_info в словарь со статусом платежа"""
+        # Статусы CoinPayments:
+        # -1 = cancelled / timed out
+        # 0 = waiting for funds
+        # 1 = coin confirms needed
+        # 2 = confirmed and complete
+        # 3 = complete but waiting for MK Coin confirmations
+        
+        status_map = {
+            -1: 'cancelled',
+            0: 'pending',
+            1: 'confirming',
+            2: 'completed',
+            3: 'completed'
+        }
+        
+        status_code = result.get('status', 0)
+        status = status_map.get(status_code, 'unknown')
+        
+        return {
+            'id': payment_id,
+            'status': status,
+            'amount': Decimal(str(result.get('amount'))),
+            'received': Decimal(str(result.get('received', 0))),
+            'confirms': result.get('confirms', 0),
+            'time_created': result.get('time_created', 0),
+            'time_expires': result.get('time_expires', 0),
+            'success': True,
+            'details': result
+        }
+    
     def cancel_payment(self, payment_id: str) -> Dict[str, Any]:
         """
         Отменяет ожидающий криптоплатеж
@@ -359,13 +418,14 @@ class CryptoPaymentProcessor(PaymentProcessorInterface, WebhookHandlerInterface)
     
     # Методы для работы с вебхуками
     
-    def parse_webhook(self, payload: Dict, headers: Dict = None) -> Dict[str, Any]:
+    def parse_webhook(self, payload: Dict, headers: Dict = None, raw_body: bytes = None) -> Dict[str, Any]:
         """
         Проверяет и парсит вебхук от CoinPayments
         
         Args:
             payload: Полезная нагрузка вебхука
             headers: HTTP заголовки запроса (HMAC-подпись)
+            raw_body: Исходное тело запроса, по которому считается подпись
             
         Returns:
             Обработанные данные вебхука
@@ -376,16 +436,16 @@ class CryptoPaymentProcessor(PaymentProcessorInterface, WebhookHandlerInterface)
                 # Получаем подпись из заголовка
                 signature = headers['HMAC']
                 
-                # Формируем ожидаемую подпись
-                payload_str = json.dumps(payload)
+                # Формируем ожидаемую подпись по исходным байтам тела
+                body = raw_body if raw_body is not None else json.dumps(payload).encode('utf-8')
                 expected_signature = hmac.new(
                     self.ipn_secret.encode('utf-8'),
-                    payload_str.encode('utf-8'),
+                    body,
                     hashlib.sha512
                 ).hexdigest()
                 
                 # Сравниваем подписи
-                if signature != expected_signature:
+                if not hmac.compare_digest(signature, expected_signature):
                     logger.warning("CoinPayments IPN signature verification failed")
                     return {
                         'error': 'Неверная подпись IPN',
@@ -2,6 +2,8 @@
 Фабрика для создания экземпляров процессоров платежей на основе конфигурации
 """
 
+import os
+import threading
 from typing import Dict, Optional
 from django.conf import settings
 from .base import PaymentProcessorInterface
@@ -9,6 +11,16 @@ from .stripe_integration import StripePaymentProcessor
 from .paypal_integration import PayPalPaymentProcessor
 from .crypto_integration import CryptoPaymentProcessor
 
+PROCESSOR_CLASSES = {
+    'stripe': StripePaymentProcessor,
+    'paypal': PayPalPaymentProcessor,
+    'crypto': CryptoPaymentProcessor,
+}
+
+# Один экземпляр процессора на провайдера в процессе: общий пул соединений и токены
+_processors: Dict[tuple, PaymentProcessorInterface] = {}
+_processors_lock = threading.Lock()
+
 
 def get_payment_processor(provider: str = None) -> PaymentProcessorInterface:
     """
@@ -19,7 +31,8 @@ def get_payment_processor(provider: str = None) -> PaymentProcessorInterface:
                  Если не указано, используется значение по умолчанию из настроек
     
     Returns:
-        Экземпляр класса, реализующего PaymentProcessorInterface
+        Экземпляр класса, реализующего PaymentProcessorInterface,
+        общий для всех вызовов в текущем процессе
     
     Raises:
         ValueError: Если провайдер не поддерживается
@@ -31,15 +44,24 @@ def get_payment_processor(provider: str = None) -> PaymentProcessorInterface:
     # Преобразуем в нижний регистр
     provider = provider.lower()
     
-    # Создаем процессор в зависимости от провайдера
-    if provider == 'stripe':
-        return StripePaymentProcessor()
-    elif provider == 'paypal':
-        return PayPalPaymentProcessor()
-    elif provider == 'crypto':
-        return CryptoPaymentProcessor()
-    else:
+    if provider not in PROCESSOR_CLASSES:
         raise ValueError(f"Неподдерживаемый платежный провайдер: {provider}")
+    
+    # Ключ с PID: дочерние процессы Celery создают свои экземпляры
+    key = (os.getpid(), provider)
+    processor = _processors.get(key)
+    if processor is None:
+        with _processors_lock:
+            processor = _processors.get(key)
+            if processor is None:
+                processor = _processors[key] = PROCESSOR_CLASSES[provider]()
+    return processor
+
+
+def reset_payment_processors():
+    """Сбрасывает созданные процессоры (тесты, смена настроек)"""
+    with _processors_lock:
+        _processors.clear()
 
 
 def get_processor_config() -> Dict[str, Dict]:
@@ -54,33 +76,35 @@ def get_processor_config() -> Dict[str, Dict]:
     
     # Добавляем Stripe, если настроен
     if hasattr(settings, 'STRIPE_PUBLIC_KEY') and settings.STRIPE_PUBLIC_KEY:
-        stripe_processor = StripePaymentProcessor()
-        config['stripe'] = stripe_processor.get_client_config()
+        config['stripe'] = get_payment_processor('stripe').get_client_config()
     
     # Добавляем PayPal, если настроен
     if hasattr(settings, 'PAYPAL_CLIENT_ID') and settings.PAYPAL_CLIENT_ID:
-        paypal_processor = PayPalPaymentProcessor()
-        config['paypal'] = paypal_processor.get_client_config()
+        config['paypal'] = get_payment_processor('paypal').get_client_config()
     
     # Добавляем криптовалютные платежи, если настроены
     if hasattr(settings, 'COINPAYMENTS_PUBLIC_KEY') and settings.COINPAYMENTS_PUBLIC_KEY:
-        crypto_processor = CryptoPaymentProcessor()
-        config['crypto'] = crypto_processor.get_client_config()
+        config['crypto'] = get_payment_processor('crypto').get_client_config()
     
     return config
 
 
-def get_available_payment_methods() -> Dict[str, Dict]:
+def get_available_payment_methods(config: Optional[Dict[str, Dict]] = None) -> Dict[str, Dict]:
     """
     Получает список доступных методов оплаты для отображения пользователю
     
+    Args:
+        config: Уже полученная конфигурация процессоров (get_processor_config),
+                чтобы не собирать ее повторно
+    
     Returns:
         Словарь с информацией о доступных методах оплаты
     """
     methods = {}
     
     # Получаем все настроенные процессоры
-    config = get_processor_config()
+    if config is None:
+        config = get_processor_config()
     
     # Формируем информацию о методах оплаты
     if 'stripe' in config:
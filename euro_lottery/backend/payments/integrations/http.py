@@ -0,0 +1,126 @@
+"""
+Shared HTTP session for payment provider APIs.
+
+Processors used to call ``requests.post``/``requests.request`` directly,
+so every call opened a new TCP/TLS connection and had no timeout. All
+provider traffic now goes through one ``requests.Session`` per process:
+
+- connections are kept alive and pooled per host;
+- idempotent requests (GET, HEAD, OPTIONS, PUT, DELETE) are retried on
+  connection errors and 429/5xx with exponential backoff. POST is never
+  retried here, as that could create a second payment;
+- requests without an explicit timeout get the configured one;
+  ``timeout_override`` caps the timeout of every request a thread makes
+  inside the block (used to fail fast on degraded providers).
+
+The session is created lazily and per process id, so Celery prefork
+children never share a connection pool with their parent.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULTS = {
+    'CONNECT_TIMEOUT': 5,
+    'READ_TIMEOUT': 30,
+    'RETRIES': 3,
+    'BACKOFF_FACTOR': 0.5,
+    'POOL_SIZE': 20,
+}
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+RETRY_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+
+_sessions: Dict[int, requests.Session] = {}
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def _setting(name: str):
+    return getattr(settings, 'PAYMENT_HTTP_SETTINGS', {}).get(name, DEFAULTS[name])
+
+
+def default_timeout():
+    """(connect, read) timeout applied to requests that do not set one"""
+    return (_setting('CONNECT_TIMEOUT'), _setting('READ_TIMEOUT'))
+
+
+def max_retries() -> int:
+    """Retries per idempotent request"""
+    return _setting('RETRIES')
+
+
+@contextmanager
+def timeout_override(timeout):
+    """Use ``timeout`` for the requests this thread makes inside the block (None: no change)"""
+    previous = getattr(_local, 'timeout', None)
+    _local.timeout = timeout if timeout is not None else previous
+    try:
+        yield
+    finally:
+        _local.timeout = previous
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that fills in a default timeout"""
+
+    def __init__(self, *args, timeout=None, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        override = getattr(_local, 'timeout', None)
+        if override is not None:
+            # SDKs such as stripe pass their own timeout; the override wins
+            kwargs['timeout'] = override
+        elif kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super().send(request, **kwargs)
+
+
+def build_session() -> requests.Session:
+    retry = Retry(
+        total=max_retries(),
+        backoff_factor=_setting('BACKOFF_FACTOR'),
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=RETRY_METHODS,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = TimeoutHTTPAdapter(
+        timeout=default_timeout(),
+        max_retries=retry,
+        pool_connections=_setting('POOL_SIZE'),
+        pool_maxsize=_setting('POOL_SIZE'),
+    )
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    """Pooled session of the current process"""
+    pid = os.getpid()
+    session = _sessions.get(pid)
+    if session is None:
+        with _lock:
+            session = _sessions.get(pid)
+            if session is None:
+                session = _sessions[pid] = build_session()
+    return session
+
+
+def reset_sessions():
+    """Drop the pooled sessions (tests, settings changes)"""
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -2,14 +2,15 @@
 PayPal payment integration for Euro Lottery
 """
 
-import requests
 import base64
 import json
 from decimal import Decimal
 from typing import Dict, Any, Optional, List
 import logging
 from django.conf import settings
+from django.core.cache import cache
 from .base import PaymentProcessorInterface, WebhookHandlerInterface
+from .http import get_session
 
 logger = logging.getLogger(__name__)
 
@@ -31,22 +32,28 @@ class PayPalPaymentProcessor(PaymentProcessorInterface, WebhookHandlerInterface)
         else:
             self.base_url = 'https://api-m.sandbox.paypal.com'
         
-        # Cache for access token
-        self._access_token = None
-        self._token_expiry = 0
+        # Access token is shared by all processes through the Django cache
+        self.token_cache_key = f"payments:paypal_token:{self.mode}:{self.client_id}"
     
-    def _get_access_token(self) -> str:
+    def _get_access_token(self, refresh: bool = False) -> str:
         """
         Get an OAuth access token from PayPal
         
+        The token is kept in the Django cache until shortly before it
+        expires. With the Redis cache of production settings all web and
+        Celery workers reuse one token; the local cache of debug runs
+        keeps one token per process.
+        
+        Args:
+            refresh: Ignore the cached token and request a new one
+        
         Returns:
             Access token string
         """
-        import time
-        
-        # If we have a valid token, return it
-        if self._access_token and time.time() < self._token_expiry:
-            return self._access_token
+        if not refresh:
+            token = cache.get(self.token_cache_key)
+            if token:
+                return token
         
         # Otherwise get a new token
         auth = base64.b64encode(f"{self.client_id}:{self.client_secret}".encode()).decode()
@@ -60,7 +67,7 @@ class PayPalPaymentProcessor(PaymentProcessorInterface, WebhookHandlerInterface)
             'grant_type': 'client_credentials'
         }
         
-        response = requests.post(
+        response = get_session().post(
             f"{self.base_url}/v1/oauth2/token",
             headers=headers,
             data=data
@@ -71,11 +78,11 @@ class PayPalPaymentProcessor(PaymentProcessorInterface, WebhookHandlerInterface)
             raise ValueError(f"Failed to authenticate with PayPal: {response.text}")
         
         result = response.json()
-        self._access_token = result['access_token']
+        token = result['access_token']
         # Set expiry with a small buffer
-        self._token_expiry = time.time() + result['expires_in'] - 60
+        cache.set(self.token_cache_key, token, max(result['expires_in'] - 60, 1))
         
-        return self._access_token
+        return token
     
     def _make_request(self, method: str, endpoint: str, data: Dict = None, params: Dict = None) -> Dict:
         """
@@ -92,18 +99,23 @@ class PayPalPaymentProcessor(PaymentProcessorInterface, WebhookHandlerInterface)
         """
         url = f"{self.base_url}{endpoint}"
         
-        headers = {
-            'Authorization': f'Bearer {self._get_access_token()}',
-            'Content-Type': 'application/json',
-        }
+        def send(token):
+            headers = {
+                'Authorization': f'Bearer {token}',
+                'Content-Type': 'application/json',
+            }
+            return get_session().request(
+                method,
+                url,
+                headers=headers,
+                json=data,
+                params=params
+            )
         
-        response = requests.request(
-            method,
-            url,
-            headers=headers,
-            json=data,
-            params=params
-        )
+        response = send(self._get_access_token())
+        if response.status_code == 401:
+            # The shared token was revoked or expired early
+            response = send(self._get_access_token(refresh=True))
         
         if response.status_code >= 400:
             logger.error(f"PayPal API error: {response.text}")
@@ -385,13 +397,14 @@ class PayPalPaymentProcessor(PaymentProcessorInterface, WebhookHandlerInterface)
     
     # Webhook Methods
     
-    def parse_webhook(self, payload: Dict, headers: Dict = None) -> Dict[str, Any]:
+    def parse_webhook(self, payload: Dict, headers: Dict = None, raw_body: bytes = None) -> Dict[str, Any]:
         """
         Parse and validate a webhook from PayPal
         
         Args:
             payload: The webhook payload
             headers: HTTP headers with signature
+            raw_body: Request body bytes (PayPal verifies the parsed event via its API)
             
         Returns:
             Parsed webhook data
@@ -9,6 +9,7 @@ import logging
 import json
 from django.conf import settings
 from .base import PaymentProcessorInterface, PaymentMethodInterface, WebhookHandlerInterface
+from . import http
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +25,13 @@ class StripePaymentProcessor(PaymentProcessorInterface, PaymentMethodInterface,
         self.public_key = settings.STRIPE_PUBLIC_KEY
         self.webhook_secret = settings.STRIPE_WEBHOOK_SECRET
         self.currency = getattr(settings, 'DEFAULT_CURRENCY', 'USD')
+        
+        # Route the SDK through the pooled session; the SDK retries with
+        # idempotency keys, so POSTs are safe to retry there
+        stripe.default_http_client = stripe.RequestsClient(
+            session=http.get_session(), timeout=http.default_timeout()[1]
+        )
+        stripe.max_network_retries = http.max_retries()
 
     # Payment Processing Methods
     
@@ -353,13 +361,14 @@ class StripePaymentProcessor(PaymentProcessorInterface, PaymentMethodInterface,
     
     # Webhook Methods
     
-    def parse_webhook(self, payload: Dict, headers: Dict = None) -> Dict[str, Any]:
+    def parse_webhook(self, payload: Dict, headers: Dict = None, raw_body: bytes = None) -> Dict[str, Any]:
         """
         Parse and validate a webhook from Stripe
         
         Args:
             payload: The webhook payload
             headers: HTTP headers with signature
+            raw_body: Request body bytes; Stripe signs these exact bytes
             
         Returns:
             Parsed webhook data
@@ -369,7 +378,8 @@ class StripePaymentProcessor(PaymentProcessorInterface, PaymentMethodInterface,
                 raise ValueError("Missing Stripe signature in headers")
                 
             signature = headers['stripe-signature']
-            payload_str = json.dumps(payload)
+            # Re-serialized JSON differs from what Stripe signed, use the raw body when we have it
+            payload_str = raw_body if raw_body is not None else json.dumps(payload)
             
             # Verify webhook signature
             event = stripe.Webhook.construct_event(
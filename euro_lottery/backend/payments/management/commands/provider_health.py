@@ -0,0 +1,35 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from payments import provider_health
+
+
+class Command(BaseCommand):
+    help = 'Reports rolling call statistics and circuit state of each payment provider'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='Print the statistics as JSON')
+        parser.add_argument('--fail-open', action='store_true',
+                            help='Exit with an error if any provider circuit is open')
+
+    def handle(self, *args, **options):
+        stats = provider_health.all_stats()
+
+        if options['json']:
+            self.stdout.write(json.dumps(stats, indent=2))
+        else:
+            self.stdout.write(
+                f"{'provider':<10}{'calls':>8}{'errors':>8}{'error %':>9}{'avg ms':>9}{'slow %':>8}  circuit"
+            )
+            for row in stats:
+                self.stdout.write(
+                    f"{row['provider']:<10}{row['calls']:>8}{row['errors']:>8}"
+                    f"{row['error_rate'] * 100:>9.1f}{row['avg_latency_ms']:>9.0f}"
+                    f"{row['slow_rate'] * 100:>8.1f}  {row['circuit']}"
+                )
+
+        if options['fail_open']:
+            open_circuits = [row['provider'] for row in stats if row['circuit'] == 'open']
+            if open_circuits:
+                raise CommandError(f"Open circuit(s): {', '.join(open_circuits)}")
@@ -0,0 +1,53 @@
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from payments import webhooks
+from payments.models import WebhookEvent
+
+
+def _parse_since(value):
+    """Дата или дата со временем в текущей временной зоне"""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"Invalid --since value: {value}")
+        moment = datetime.combine(day, time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class Command(BaseCommand):
+    help = 'Re-queues stored payment webhook events so the worker applies them again'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--id', action='append', type=int, dest='ids',
+                            help='Event to replay (repeatable); other filters are ignored')
+        parser.add_argument('--provider', help='Only events of this provider (stripe, paypal, crypto)')
+        parser.add_argument('--status', default='failed',
+                            choices=[choice for choice, _ in WebhookEvent.STATUS_CHOICES],
+                            help='Only events in this status (default: failed)')
+        parser.add_argument('--since', help='Only events received at or after this date/datetime')
+        parser.add_argument('--process', action='store_true',
+                            help='Apply the events in this process instead of queuing the worker task')
+
+    def handle(self, *args, **options):
+        if options.get('ids'):
+            events = WebhookEvent.objects.filter(id__in=options['ids'])
+        else:
+            events = WebhookEvent.objects.filter(status=options['status'])
+            if options.get('provider'):
+                events = events.filter(provider_type=options['provider'])
+            if options.get('since'):
+                events = events.filter(received_at__gte=_parse_since(options['since']))
+
+        replayed = webhooks.replay(events.only('id'), notify_worker=not options['process'])
+        self.stdout.write(f"Re-queued {replayed} webhook events")
+
+        if options['process'] and replayed:
+            processed = webhooks.process_pending_events()
+            self.stdout.write(f"Applied {processed} webhook events")
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.9 on 2026-10-19 05:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("payments", "0003_paymentmethod_crypto_address_and_more"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["user", "-created_at", "-id"],
+                name="transaction_user_keyset_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.9 on 2026-10-19 06:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("payments", "0005_idempotencyrecord"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="deposittransaction",
+            name="lease_expires_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="deposittransaction",
+            name="lease_owner",
+            field=models.CharField(blank=True, default="", max_length=100),
+        ),
+        migrations.AddField(
+            model_name="withdrawalrequest",
+            name="lease_expires_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="withdrawalrequest",
+            name="lease_owner",
+            field=models.CharField(blank=True, default="", max_length=100),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 4.2.9 on 2026-10-19 06:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("payments", "0006_work_claim_leases"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WebhookEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("provider_type", models.CharField(max_length=20)),
+                ("event_id", models.CharField(max_length=255)),
+                (
+                    "event_type",
+                    models.CharField(blank=True, default="", max_length=100),
+                ),
+                (
+                    "payment_id",
+                    models.CharField(blank=True, default="", max_length=255),
+                ),
+                ("data", models.JSONField(blank=True, default=dict)),
+                ("raw_body", models.TextField(blank=True, default="")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("processed", "Processed"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=20,
+                    ),
+                ),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("last_error", models.TextField(blank=True, default="")),
+                ("next_attempt_at", models.DateTimeField(blank=True, null=True)),
+                ("received_at", models.DateTimeField(auto_now_add=True)),
+                ("processed_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "lease_owner",
+                    models.CharField(blank=True, default="", max_length=100),
+                ),
+                ("lease_expires_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["status", "next_attempt_at"],
+                        name="webhook_event_pending_idx",
+                    ),
+                    models.Index(
+                        fields=["provider_type", "payment_id", "id"],
+                        name="webhook_event_payment_idx",
+                    ),
+                ],
+                "unique_together": {("provider_type", "event_id")},
+            },
+        ),
+    ]
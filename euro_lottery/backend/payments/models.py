@@ -50,6 +50,10 @@ class Transaction(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Backs keyset pagination of a user's transaction history
+            models.Index(fields=['user', '-created_at', '-id'], name='transaction_user_keyset_idx'),
+        ]
 
 
 class PaymentMethod(models.Model):
@@ -174,6 +178,10 @@ class WithdrawalRequest(models.Model):
     processed_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, 
                                      null=True, blank=True, related_name='processed_withdrawals')
     
+    # Аренда строки воркером периодической задачи (lottery_core.leases)
+    lease_owner = models.CharField(max_length=100, blank=True, default='')
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    
     def __str__(self):
         return f"{self.user.email} - {self.amount} - {self.status}"
 
@@ -199,5 +207,105 @@ class DepositTransaction(models.Model):
     # Дополнительные данные от платежного провайдера
     provider_response = models.JSONField(null=True, blank=True)
     
+    # Аренда строки воркером периодической задачи (lottery_core.leases)
+    lease_owner = models.CharField(max_length=100, blank=True, default='')
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.user.email} - {self.amount} - {self.transaction.status}"
+
+class IdempotencyRecord(models.Model):
+    """Сохраненный ответ денежного эндпоинта для повторов с тем же Idempotency-Key"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='idempotency_records')
+    endpoint = models.CharField(max_length=100)
+    key = models.CharField(max_length=255)
+    
+    # Хеш метода, пути и тела запроса: ключ нельзя переиспользовать для другого запроса
+    fingerprint = models.CharField(max_length=64)
+    response_status = models.PositiveSmallIntegerField()
+    response_body = models.JSONField(null=True, blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    
+    class Meta:
+        unique_together = ('user', 'endpoint', 'key')
+        indexes = [
+            models.Index(fields=['expires_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} - {self.endpoint} - {self.key}"
+
+
+class WebhookEvent(models.Model):
+    """Входящее событие вебхука платежной системы, применяемое воркером (payments.webhooks)"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processed', 'Processed'),
+        ('failed', 'Failed'),
+    ]
+    provider_type = models.CharField(max_length=20)
+    # ID события у провайдера: повторные доставки того же события не сохраняются
+    event_id = models.CharField(max_length=255)
+    event_type = models.CharField(max_length=100, blank=True, default='')
+    # ID платежа: события одного платежа применяются по порядку поступления
+    payment_id = models.CharField(max_length=255, blank=True, default='')
+    
+    data = models.JSONField(default=dict, blank=True)
+    raw_body = models.TextField(blank=True, default='')
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    # Аренда строки воркером (lottery_core.leases)
+    lease_owner = models.CharField(max_length=100, blank=True, default='')
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        unique_together = ('provider_type', 'event_id')
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='webhook_event_pending_idx'),
+            models.Index(fields=['provider_type', 'payment_id', 'id'], name='webhook_event_payment_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.provider_type} - {self.event_type} - {self.event_id}"
+
+
+class PaymentOutbox(models.Model):
+    """Исходящий вызов платежного провайдера по депозиту (payments.outbox)"""
+    OPERATION_CHOICES = [
+        ('create', 'Create payment'),
+        ('confirm', 'Confirm payment'),
+        ('cancel', 'Cancel payment'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    deposit = models.ForeignKey(DepositTransaction, on_delete=models.CASCADE, related_name='outbox')
+    operation = models.CharField(max_length=20, choices=OPERATION_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    
+    # Аргументы вызова и ответ провайдера
+    request_data = models.JSONField(default=dict, blank=True)
+    response = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='payment_outbox_status_idx'),
+        ]
+    
     def __str__(self):
-        return f"{self.user.email} - {self.amount} - {self.transaction.status}"
\ No newline at end of file
+        return f"{self.deposit_id} - {self.operation} - {self.status}"
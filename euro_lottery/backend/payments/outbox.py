@@ -0,0 +1,107 @@
+"""
+Outbox records for provider calls made by the deposit views.
+
+The initiate/confirm/cancel deposit views used to run under
+``@transaction.atomic`` and call the payment provider inside it, so a slow
+provider kept a database connection busy and row locks held for the whole
+HTTP round trip. The views now work in three steps:
+
+1. a short transaction writes the local state and a ``PaymentOutbox`` row
+   (``open_call``) describing the call about to be made;
+2. the provider is called with no transaction open;
+3. a second short transaction re-reads the deposit's ``Transaction`` with a
+   row lock, applies the result only if it is still pending (a webhook, the
+   poller or a parallel request may have settled it meanwhile) and closes
+   the outbox row (``close_call``).
+
+A process that dies between steps 1 and 3 leaves a pending outbox row.
+``expire_stale_calls`` marks such rows failed and fails deposits whose
+payment was never created; confirm/cancel leftovers need nothing else, as
+the deposit stays pending and the status poller settles it.
+"""
+
+import json
+import logging
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import PaymentOutbox, Transaction
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'STALE_SECONDS': 10 * 60,
+}
+
+
+def _setting(name: str):
+    return getattr(settings, 'PAYMENT_OUTBOX_SETTINGS', {}).get(name, DEFAULTS[name])
+
+
+def _json(data: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    # Provider responses may hold Decimals, datetimes or SDK objects
+    return json.loads(json.dumps(data, default=str)) if data is not None else None
+
+
+def provider_error(result: Dict[str, Any]) -> Optional[str]:
+    """Error message of a failed provider result, None if the call succeeded"""
+    if not result.get('success', False) and 'error' in result:
+        return str(result.get('error') or 'Unknown payment error')
+    return None
+
+
+def open_call(deposit, operation: str, request_data: Optional[Dict[str, Any]] = None) -> PaymentOutbox:
+    """Record a provider call before it is made"""
+    return PaymentOutbox.objects.create(
+        deposit=deposit, operation=operation, request_data=_json(request_data or {})
+    )
+
+
+def close_call(entry: PaymentOutbox, result: Dict[str, Any]) -> None:
+    """Store the outcome of the call; part of the transaction applying it"""
+    error = provider_error(result)
+    entry.status = 'failed' if error else 'completed'
+    entry.response = _json(result)
+    entry.error = error or ''
+    entry.completed_at = timezone.now()
+    entry.save(update_fields=['status', 'response', 'error', 'completed_at'])
+
+
+def lock_transaction(deposit) -> Transaction:
+    """Current state of the deposit's transaction, locked until commit"""
+    return Transaction.objects.select_for_update().get(pk=deposit.transaction_id)
+
+
+def expire_stale_calls(now=None) -> int:
+    """Fail outbox rows left pending by a crashed request; returns how many"""
+    now = now or timezone.now()
+    stale = PaymentOutbox.objects.filter(
+        status='pending', created_at__lte=now - timedelta(seconds=_setting('STALE_SECONDS'))
+    ).select_related('deposit')
+
+    expired = 0
+    for entry in stale:
+        with transaction.atomic():
+            updated = PaymentOutbox.objects.filter(pk=entry.pk, status='pending').update(
+                status='failed', error='Abandoned before the result was applied', completed_at=now
+            )
+            if not updated:
+                continue
+            expired += 1
+
+            deposit = entry.deposit
+            if entry.operation == 'create' and not deposit.provider_transaction_id:
+                # The client never got payment details, so the deposit cannot complete
+                Transaction.objects.filter(pk=deposit.transaction_id, status='pending').update(
+                    status='failed', description='Failed deposit: payment was not created'
+                )
+                deposit.provider_status = 'failed'
+                deposit.save(update_fields=['provider_status', 'updated_at'])
+
+    if expired:
+        logger.warning(f"Expired {expired} abandoned payment provider calls")
+    return expired
@@ -0,0 +1,236 @@
+"""
+Batched crediting of lottery winnings.
+
+Winnings used to be paid one by one: a transaction per winning ticket, a
+balance update, a Transaction save and a WinningTicket save each. After a
+large draw that is hundreds of thousands of serial transactions.
+
+Here pending winnings are paid in chunks, each in one transaction:
+
+- prizes at or above ``WinningTicket.MANUAL_VERIFICATION_THRESHOLD`` that
+  no admin has verified are moved to ``on_hold`` and never claimed, as in
+  ``WinningTicket.pay_prize``; verified ``on_hold`` winnings are paid;
+- the chunk is claimed with a conditional UPDATE (``pending`` ->
+  ``processing``, stamped with the worker's owner token), so concurrent
+  workers pay disjoint chunks; the payer locks its rows by that stamp and
+  marks them ``paid`` only while the stamp is still its own, so a chunk
+  taken over after ``PAYOUT_CLAIM_SECONDS`` is never credited twice;
+- per-user running totals are computed in the database with a window
+  function (``SUM(amount) OVER (PARTITION BY user ORDER BY id)``);
+- every user's balance is incremented once, by one UPDATE for the whole
+  chunk (``balance = balance + CASE ...``), and read back while the row
+  locks are held;
+- each winning's ``balance_before``/``balance_after`` is derived from the
+  new balance and its running total, the ledger Transactions are
+  bulk-created, the WinningTicket rows updated and the tickets marked
+  ``paid``.
+
+A chunk is paid atomically: ``paid`` status and the balance change commit
+together. A chunk left in ``processing`` by a worker that died was never
+credited, so it is claimed again once the claim is older than
+``PAYOUT_CLAIM_SECONDS``.
+"""
+
+import logging
+from datetime import timedelta
+from decimal import Decimal
+from typing import Callable, List, Optional
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Case, CharField, DecimalField, F, Q, Sum, Value, When, Window
+from django.utils import timezone
+
+from lottery_core import leases
+from .models import Transaction
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_CLAIM_SECONDS = 600
+
+CLAIM_PREFIX = 'claim:'
+PAYMENT_METHOD = 'balance'
+
+
+def _setting(name: str, default: int) -> int:
+    return getattr(settings, 'LOTTERY_SETTINGS', {}).get(name, default)
+
+
+def _needs_verification() -> Q:
+    from lottery.models import WinningTicket
+
+    return Q(amount__gte=WinningTicket.MANUAL_VERIFICATION_THRESHOLD, verified_by__isnull=True)
+
+
+def _claimable(now):
+    stale = now - timedelta(seconds=_setting('PAYOUT_CLAIM_SECONDS', DEFAULT_CLAIM_SECONDS))
+    ready = Q(payment_status='pending') | Q(payment_status='on_hold', verified_by__isnull=False)
+    return (ready | Q(
+        payment_status='processing', payment_reference__startswith=CLAIM_PREFIX, updated_at__lte=stale
+    )) & ~_needs_verification()
+
+
+def hold_unverified_winnings(queryset) -> int:
+    """Put pending prizes awaiting manual verification on hold; returns how many"""
+    held = queryset.filter(_needs_verification(), payment_status='pending').update(
+        payment_status='on_hold', updated_at=timezone.now()
+    )
+    if held:
+        logger.info(f"{held} winnings require manual verification and are on hold")
+    return held
+
+
+def claim_winnings(queryset, limit: int, owner: str, now=None) -> List[int]:
+    """Mark up to ``limit`` claimable winnings as being paid by ``owner``"""
+    from lottery.models import WinningTicket
+
+    now = now or timezone.now()
+    stamp = f'{CLAIM_PREFIX}{owner}'
+    pks = list(queryset.filter(_claimable(now)).order_by('pk').values_list('pk', flat=True)[:limit])
+    if not pks:
+        return []
+    WinningTicket.objects.filter(_claimable(now), pk__in=pks).update(
+        payment_status='processing', payment_reference=stamp, updated_at=now
+    )
+    return list(
+        WinningTicket.objects.filter(pk__in=pks, payment_status='processing', payment_reference=stamp)
+        .order_by('pk').values_list('pk', flat=True)
+    )
+
+
+def credit_winnings_chunk(winning_ids: List[int], owner: str) -> int:
+    """
+    Credit the winnings claimed by ``owner`` in one transaction.
+
+    Rows whose claim was taken over by another worker are skipped. Returns
+    the number of winnings paid.
+    """
+    from lottery.models import Ticket, WinningTicket
+
+    User = get_user_model()
+    now = timezone.now()
+    stamp = f'{CLAIM_PREFIX}{owner}'
+    money = DecimalField(max_digits=14, decimal_places=2)
+
+    with transaction.atomic():
+        # Window functions cannot be combined with FOR UPDATE, so lock first
+        locked = list(
+            WinningTicket.objects.select_for_update()
+            .filter(pk__in=winning_ids, payment_status='processing', payment_reference=stamp)
+            .values_list('pk', flat=True)
+        )
+        if not locked:
+            return 0
+
+        rows = list(
+            WinningTicket.objects.filter(pk__in=locked)
+            .annotate(
+                winner_id=F('ticket__user_id'),
+                ticket_uuid=F('ticket__ticket_id'),
+                draw_number=F('ticket__draw__draw_number'),
+                running_total=Window(
+                    expression=Sum('amount'),
+                    partition_by=[F('ticket__user_id')],
+                    order_by=F('pk').asc(),
+                    output_field=money,
+                ),
+            )
+            .values('pk', 'ticket', 'amount', 'winner_id', 'ticket_uuid', 'draw_number', 'running_total')
+            .order_by('pk')
+        )
+
+        totals = {}
+        for row in rows:
+            # Rows come in id order, so the last running total is the user's sum
+            totals[row['winner_id']] = Decimal(row['running_total'])
+
+        User.objects.filter(pk__in=totals).update(
+            balance=F('balance') + Case(
+                *[When(pk=user_id, then=Value(total)) for user_id, total in totals.items()],
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            )
+        )
+        # The row locks taken by UPDATE are held until commit, so the read-back is exact
+        balances = dict(User.objects.filter(pk__in=totals).values_list('pk', 'balance'))
+
+        ledger = []
+        references = []
+        for row in rows:
+            user_id = row['winner_id']
+            amount = Decimal(row['amount'])
+            balance_after = Decimal(balances[user_id]) - totals[user_id] + Decimal(row['running_total'])
+            trans = Transaction(
+                user_id=user_id,
+                transaction_type='winning',
+                amount=amount,
+                balance_before=balance_after - amount,
+                balance_after=balance_after,
+                status='completed',
+                description=f"Выигрыш по билету #{row['ticket_uuid']} в тираже #{row['draw_number']}",
+                related_ticket_id=row['ticket'],
+                related_winning_id=row['pk'],
+            )
+            ledger.append(trans)
+            references.append(When(pk=row['pk'], then=Value(str(trans.transaction_id))))
+
+        Transaction.objects.bulk_create(ledger, batch_size=500)
+        paid = WinningTicket.objects.filter(
+            pk__in=locked, payment_status='processing', payment_reference=stamp
+        ).update(
+            payment_status='paid',
+            payment_date=now,
+            payment_reference=Case(*references, output_field=CharField()),
+            payment_method=PAYMENT_METHOD,
+            updated_at=now,
+        )
+        if paid != len(rows):
+            # The rows are locked, so this means the claim was lost: roll the chunk back
+            raise RuntimeError(f"Claim {stamp} lost {len(rows) - paid} winnings while crediting")
+        Ticket.objects.filter(pk__in=[row['ticket'] for row in rows]).update(result_status='paid')
+
+    logger.info(f"Credited {len(rows)} winnings to {len(totals)} users")
+    return len(rows)
+
+
+def credit_pending_winnings(draw_id: Optional[int] = None, chunk_size: Optional[int] = None,
+                            on_full_chunk: Optional[Callable[[], None]] = None) -> int:
+    """
+    Pay all claimable winnings (optionally of one draw) chunk by chunk.
+
+    ``on_full_chunk`` is called once if the first chunk is full. Returns the
+    number of winnings paid.
+    """
+    from lottery.models import WinningTicket
+
+    chunk_size = chunk_size or _setting('PAYOUT_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    queryset = WinningTicket.objects.all()
+    if draw_id is not None:
+        queryset = queryset.filter(ticket__draw_id=draw_id)
+
+    hold_unverified_winnings(queryset)
+
+    owner = leases.new_owner()
+    paid = 0
+    first = True
+
+    while True:
+        pks = claim_winnings(queryset, chunk_size, owner)
+        if not pks:
+            break
+        if first and on_full_chunk is not None and len(pks) == chunk_size:
+            on_full_chunk()
+        first = False
+
+        try:
+            paid += credit_winnings_chunk(pks, owner)
+        except Exception as e:
+            # Nothing of the chunk was committed: hand it back and stop
+            WinningTicket.objects.filter(
+                pk__in=pks, payment_status='processing', payment_reference=f'{CLAIM_PREFIX}{owner}'
+            ).update(payment_status='pending', payment_reference=None)
+            logger.error(f"Error crediting winnings chunk of {len(pks)}: {str(e)}")
+            raise
+
+    return paid
@@ -0,0 +1,151 @@
+"""
+Provider status polling for deposits.
+
+Deposit checks used to build a new processor per deposit and call
+``get_payment_status`` one deposit after another, so a few thousand
+pending deposits took longer than the beat interval. ``poll_statuses``
+instead:
+
+- groups the deposits by provider and builds one processor per provider;
+- asks providers with a multi-ID endpoint (``status_batch_size > 0``,
+  e.g. CoinPayments ``get_tx_info_multi``) for a chunk of IDs per call;
+- runs all calls on a bounded thread pool, throttled by a per-provider
+  rate limiter shared by the threads of the process.
+
+Worker threads only talk HTTP; the results are applied to the database
+by the caller, in its own thread.
+"""
+
+import logging
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Tuple
+
+from django.conf import settings
+
+from .integrations.factory import get_payment_processor
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'THREADS': 8,
+    'RATE_LIMITS': {},  # provider_type -> requests per second, missing = unlimited
+}
+
+
+def _setting(name: str):
+    return getattr(settings, 'DEPOSIT_POLLING_SETTINGS', {}).get(name, DEFAULTS[name])
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across threads"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+_limiters: Dict[Tuple[str, float], RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider_type: str) -> RateLimiter:
+    """
+    Rate limiter of the provider, shared within the process.
+
+    Keyed by the configured rate as well, so a changed RATE_LIMITS setting
+    takes effect instead of reusing the limiter built from the old value.
+    """
+    rate = _setting('RATE_LIMITS').get(provider_type, 0)
+    with _limiters_lock:
+        limiter = _limiters.get((provider_type, rate))
+        if limiter is None:
+            limiter = _limiters[(provider_type, rate)] = RateLimiter(rate)
+        return limiter
+
+
+def _error(message) -> Dict:
+    return {'error': message, 'success': False}
+
+
+def _fetch_one(processor, limiter, payment_id) -> Dict[str, Dict]:
+    limiter.wait()
+    try:
+        return {payment_id: processor.get_payment_status(payment_id)}
+    except Exception as e:
+        logger.error(f"Error getting payment status {payment_id}: {str(e)}")
+        return {payment_id: _error(str(e))}
+
+
+def _fetch_many(processor, limiter, payment_ids) -> Dict[str, Dict]:
+    limiter.wait()
+    try:
+        statuses = processor.get_payment_statuses(payment_ids)
+    except Exception as e:
+        logger.error(f"Error getting {len(payment_ids)} payment statuses: {str(e)}")
+        statuses = {}
+    return {
+        payment_id: statuses.get(payment_id) or _error('No status returned')
+        for payment_id in payment_ids
+    }
+
+
+def poll_statuses(deposits: Iterable) -> Dict[int, Dict]:
+    """
+    Fetch the provider status of each deposit.
+
+    ``deposits`` need ``payment_provider`` loaded. Returns a dict of
+    deposit id -> status dict as returned by ``get_payment_status``;
+    failed lookups carry ``success: False``.
+    """
+    by_provider: Dict[str, List] = defaultdict(list)
+    for deposit in deposits:
+        by_provider[deposit.payment_provider.provider_type].append(deposit)
+
+    calls = []
+    for provider_type, provider_deposits in by_provider.items():
+        try:
+            processor = get_payment_processor(provider_type)
+        except ValueError as e:
+            logger.error(str(e))
+            continue
+        limiter = get_rate_limiter(provider_type)
+        payment_ids = list(dict.fromkeys(deposit.provider_transaction_id for deposit in provider_deposits))
+
+        size = processor.status_batch_size
+        if size:
+            for offset in range(0, len(payment_ids), size):
+                calls.append((provider_type, _fetch_many, processor, limiter, payment_ids[offset:offset + size]))
+        else:
+            calls.extend((provider_type, _fetch_one, processor, limiter, payment_id) for payment_id in payment_ids)
+
+    results: Dict[tuple, Dict] = {}
+    if calls:
+        with ThreadPoolExecutor(max_workers=min(_setting('THREADS'), len(calls))) as pool:
+            futures = [
+                (provider_type, pool.submit(fetch, processor, limiter, arg))
+                for provider_type, fetch, processor, limiter, arg in calls
+            ]
+            for provider_type, future in futures:
+                for payment_id, status in future.result().items():
+                    results[(provider_type, payment_id)] = status
+
+    return {
+        deposit.id: results[(provider_type, deposit.provider_transaction_id)]
+        for provider_type, provider_deposits in by_provider.items()
+        for deposit in provider_deposits
+        if (provider_type, deposit.provider_transaction_id) in results
+    }
@@ -0,0 +1,231 @@
+"""
+Rolling health of payment providers and a circuit breaker per provider.
+
+Deposits always went to the provider the client picked. When that provider
+was degraded every deposit hung until the HTTP timeout. Provider calls made
+by the deposit views now go through ``call``, which records each call in
+the shared cache:
+
+- calls, errors (an exception or an ``error`` result), summed latency and
+  slow calls, in time buckets of ``BUCKET_SECONDS``. ``get_stats`` sums the
+  buckets of the last ``WINDOW_SECONDS``;
+- a degraded provider (error rate above half the threshold, or average
+  latency above ``SLOW_MS``) is called with ``DEGRADED_TIMEOUT`` instead of
+  the regular HTTP timeout, so it fails fast;
+- with at least ``MIN_CALLS`` calls and an error rate of ``ERROR_RATE`` the
+  circuit opens for ``OPEN_SECONDS``. Afterwards one request at a time
+  probes the provider (half-open); a successful probe closes the circuit
+  and starts a fresh window, a failed one opens it again.
+
+``InitiateDepositView`` checks ``allow_request`` before creating a deposit
+and uses ``suggest_alternatives`` to offer, or with ``allow_failover`` /
+``AUTO_FAILOVER`` to pick, another active provider that supports the
+currency; the picked provider has to pass ``allow_request`` as well, so a
+half-open one still gets a single probe. The statistics are served to
+admins by ``ProviderHealthView`` and printed by the ``provider_health``
+management command.
+
+The windows and circuit keys live in the Django cache, which has to be
+shared by all processes (``CACHES``, Redis in production settings): every
+worker then sees the same open circuit, and the health view reports the
+whole deployment rather than the process that serves it.
+"""
+
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .integrations import http
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'WINDOW_SECONDS': 60,
+    'BUCKET_SECONDS': 10,
+    'MIN_CALLS': 10,
+    'ERROR_RATE': 0.5,
+    'SLOW_MS': 3000,
+    'OPEN_SECONDS': 30,
+    'DEGRADED_TIMEOUT': (2, 5),
+    'AUTO_FAILOVER': False,
+}
+
+FIELDS = ('calls', 'errors', 'latency_ms', 'slow')
+BUCKET_KEY = 'payments:health:{provider}:{bucket}:{field}'
+OPEN_UNTIL_KEY = 'payments:health:{provider}:open_until'
+PROBE_KEY = 'payments:health:{provider}:probe'
+
+
+def _setting(name: str):
+    return getattr(settings, 'PROVIDER_HEALTH_SETTINGS', {}).get(name, DEFAULTS[name])
+
+
+def _bucket_keys(provider_type: str, now: float) -> Dict[str, List[str]]:
+    size = _setting('BUCKET_SECONDS')
+    last = int(now // size)
+    buckets = range(last - _setting('WINDOW_SECONDS') // size + 1, last + 1)
+    return {
+        field: [BUCKET_KEY.format(provider=provider_type.lower(), bucket=bucket, field=field) for bucket in buckets]
+        for field in FIELDS
+    }
+
+
+def _incr(key: str, delta: int):
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # First hit of the bucket; another process may create it meanwhile
+        if not cache.add(key, delta, timeout=_setting('WINDOW_SECONDS') + _setting('BUCKET_SECONDS')):
+            cache.incr(key, delta)
+
+
+def get_stats(provider_type: str, now: Optional[float] = None) -> Dict[str, Any]:
+    """Call statistics of the rolling window and the circuit state"""
+    now = now if now is not None else time.time()
+    keys = _bucket_keys(provider_type, now)
+    values = cache.get_many([key for field_keys in keys.values() for key in field_keys])
+    totals = {field: sum(values.get(key, 0) for key in field_keys) for field, field_keys in keys.items()}
+
+    calls = totals['calls']
+    return {
+        'provider': provider_type,
+        'calls': calls,
+        'errors': totals['errors'],
+        'error_rate': round(totals['errors'] / calls, 4) if calls else 0.0,
+        'avg_latency_ms': round(totals['latency_ms'] / calls, 1) if calls else 0.0,
+        'slow_rate': round(totals['slow'] / calls, 4) if calls else 0.0,
+        'circuit': circuit_state(provider_type, now),
+    }
+
+
+def circuit_state(provider_type: str, now: Optional[float] = None) -> str:
+    """'closed', 'open' or 'half_open' (open period over, probing allowed)"""
+    open_until = cache.get(OPEN_UNTIL_KEY.format(provider=provider_type.lower()))
+    if open_until is None:
+        return 'closed'
+    return 'open' if (now if now is not None else time.time()) < open_until else 'half_open'
+
+
+def is_degraded(stats: Dict[str, Any]) -> bool:
+    if not stats['calls']:
+        return False
+    return (
+        stats['avg_latency_ms'] >= _setting('SLOW_MS')
+        or (stats['calls'] >= _setting('MIN_CALLS') and stats['error_rate'] >= _setting('ERROR_RATE') / 2)
+    )
+
+
+def allow_request(provider_type: str) -> bool:
+    """Whether a new call may go to the provider; in half-open state one caller at a time gets True"""
+    state = circuit_state(provider_type)
+    if state == 'closed':
+        return True
+    if state == 'open':
+        return False
+    return cache.add(PROBE_KEY.format(provider=provider_type.lower()), 1, timeout=_setting('OPEN_SECONDS'))
+
+
+def _open_circuit(provider_type: str, now: float):
+    cache.set(OPEN_UNTIL_KEY.format(provider=provider_type.lower()), now + _setting('OPEN_SECONDS'),
+              timeout=_setting('OPEN_SECONDS') + _setting('WINDOW_SECONDS'))
+    cache.delete(PROBE_KEY.format(provider=provider_type.lower()))
+    logger.warning(f"Circuit opened for payment provider {provider_type}")
+
+
+def _close_circuit(provider_type: str, now: float):
+    keys = _bucket_keys(provider_type, now)
+    cache.delete_many([key for field_keys in keys.values() for key in field_keys])
+    cache.delete_many([
+        OPEN_UNTIL_KEY.format(provider=provider_type.lower()), PROBE_KEY.format(provider=provider_type.lower())
+    ])
+    logger.info(f"Circuit closed for payment provider {provider_type}")
+
+
+def record(provider_type: str, latency: float, ok: bool, now: Optional[float] = None):
+    """Account one call and open or close the circuit accordingly"""
+    now = now if now is not None else time.time()
+    latency_ms = int(latency * 1000)
+    bucket = _bucket_keys(provider_type, now)
+
+    _incr(bucket['calls'][-1], 1)
+    _incr(bucket['latency_ms'][-1], latency_ms)
+    if latency_ms >= _setting('SLOW_MS'):
+        _incr(bucket['slow'][-1], 1)
+    if not ok:
+        _incr(bucket['errors'][-1], 1)
+
+    state = circuit_state(provider_type, now)
+    if ok:
+        if state == 'half_open':
+            _close_circuit(provider_type, now)
+        return
+
+    if state == 'half_open':
+        _open_circuit(provider_type, now)
+    elif state == 'closed':
+        stats = get_stats(provider_type, now)
+        if stats['calls'] >= _setting('MIN_CALLS') and stats['error_rate'] >= _setting('ERROR_RATE'):
+            _open_circuit(provider_type, now)
+
+
+def call(provider_type: str, func: Callable, *args, **kwargs):
+    """
+    Make a provider call, timed and recorded.
+
+    A degraded provider gets the short timeout. Exceptions propagate after
+    being counted.
+    """
+    timeout = _setting('DEGRADED_TIMEOUT') if is_degraded(get_stats(provider_type)) else None
+    started = time.monotonic()
+    ok = False
+    try:
+        with http.timeout_override(timeout):
+            result = func(*args, **kwargs)
+        ok = not (isinstance(result, dict) and not result.get('success', False) and 'error' in result)
+        return result
+    finally:
+        record(provider_type, time.monotonic() - started, ok)
+
+
+def auto_failover() -> bool:
+    return _setting('AUTO_FAILOVER')
+
+
+def supports_deposit(provider, amount, currency: str) -> bool:
+    """Currency (an empty list means no restriction) and deposit limits of a provider row"""
+    currencies = provider.supported_currencies or []
+    if currencies and currency not in currencies:
+        return False
+    if provider.min_deposit and amount < provider.min_deposit:
+        return False
+    if provider.max_deposit and amount > provider.max_deposit:
+        return False
+    return True
+
+
+def suggest_alternatives(provider, amount, currency: Optional[str] = None) -> List:
+    """Active providers of another type that can take the deposit, healthiest first"""
+    from .models import PaymentProvider
+
+    currency = currency or getattr(settings, 'DEFAULT_CURRENCY', 'USD')
+    now = time.time()
+    candidates = []
+    for candidate in PaymentProvider.objects.filter(is_active=True).exclude(provider_type=provider.provider_type):
+        if not supports_deposit(candidate, amount, currency):
+            continue
+        stats = get_stats(candidate.provider_type, now)
+        if stats['circuit'] == 'open':
+            continue
+        candidates.append(((stats['error_rate'], stats['avg_latency_ms'], candidate.id), candidate))
+    return [candidate for _, candidate in sorted(candidates, key=lambda item: item[0])]
+
+
+def all_stats() -> List[Dict[str, Any]]:
+    """Statistics of every provider type the app integrates with"""
+    from .integrations.factory import PROCESSOR_CLASSES
+
+    now = time.time()
+    return [get_stats(provider_type, now) for provider_type in PROCESSOR_CLASSES]
@@ -88,6 +88,8 @@ class InitiateDepositSerializer(serializers.Serializer):
     amount = serializers.DecimalField(max_digits=12, decimal_places=2, min_value=1)
     payment_method_id = serializers.IntegerField(required=False)
     payment_provider_id = serializers.IntegerField()
+    # Разрешить переключение на другой провайдер, если выбранный недоступен
+    allow_failover = serializers.BooleanField(required=False, default=False)
     
     def validate_amount(self, value):
         payment_provider_id = self.initial_data.get('payment_provider_id')
@@ -0,0 +1,28 @@
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import PaymentProvider
+from .config_snapshot import SNAPSHOT_SETTINGS, invalidate_snapshot, clear_local_snapshot
+from .integrations.factory import reset_payment_processors
+
+
+@receiver([post_save, post_delete], sender=PaymentProvider)
+def invalidate_payment_config(sender, instance, **kwargs):
+    """
+    Сбрасывает снимок методов оплаты при изменении провайдера
+    """
+    invalidate_snapshot()
+    # Повторно после коммита: снимок мог быть собран до фиксации транзакции
+    transaction.on_commit(invalidate_snapshot)
+
+
+@receiver(setting_changed)
+def reload_payment_config(sender, setting, **kwargs):
+    """
+    Пересоздает процессоры и снимок конфигурации при смене настроек
+    """
+    if setting in SNAPSHOT_SETTINGS or setting == 'PAYMENT_CONFIG_SNAPSHOT':
+        reset_payment_processors()
+        clear_local_snapshot()
@@ -9,15 +9,21 @@ from .models import (
     Transaction, DepositTransaction, WithdrawalRequest, 
     PaymentMethod, PaymentProvider
 )
+from . import wallet, payouts, polling, webhooks, outbox
+from lottery_core import leases
+from lottery_core.task_metrics import rows_processed
 
 logger = logging.getLogger(__name__)
 
 
 @shared_task
-def process_pending_payouts():
+def process_pending_payouts(fan_out=True):
     """
     Celery task to process pending payouts to users
     This includes lottery winnings and withdrawal requests
+    
+    Withdrawals are claimed in leased batches, so copies of the task on
+    several workers process disjoint requests.
     """
     from lottery.models import WinningTicket
     
@@ -28,7 +34,9 @@ def process_pending_payouts():
         process_lottery_winnings()
         
         # Process withdrawal requests
-        process_withdrawal_requests()
+        process_withdrawal_requests(
+            on_full_batch=leases.fan_out(process_pending_payouts) if fan_out else None
+        )
         
         logger.info("Completed processing of pending payouts")
         return True
@@ -39,50 +47,14 @@ def process_pending_payouts():
 
 
 def process_lottery_winnings():
-    """Process pending lottery winnings"""
-    from lottery.models import WinningTicket
-    
+    """
+    Process pending lottery winnings
+
+    Winnings are credited in chunks, one transaction and one balance
+    update per user per chunk (see payments.payouts).
+    """
     try:
-        # Get all pending winning tickets
-        pending_winnings = WinningTicket.objects.filter(
-            status='pending',
-            transaction__status='pending'
-        ).select_related('ticket', 'transaction', 'draw')
-        
-        processed_count = 0
-        
-        for winning in pending_winnings:
-            try:
-                with transaction.atomic():
-                    # Get the user and transaction associated with the winning
-                    user = winning.ticket.user
-                    trans = winning.transaction
-                    
-                    # Check if the transaction is still pending
-                    if trans.status != 'pending':
-                        continue
-                    
-                    # Update the user's balance
-                    old_balance = user.balance
-                    user.balance += winning.amount
-                    user.save()
-                    
-                    # Update the transaction
-                    trans.status = 'completed'
-                    trans.balance_before = old_balance
-                    trans.balance_after = user.balance
-                    trans.updated_at = timezone.now()
-                    trans.save()
-                    
-                    # Update the winning ticket
-                    winning.status = 'paid'
-                    winning.payout_date = timezone.now()
-                    winning.save()
-                    
-                    logger.info(f"Processed winning payout of {winning.amount} for ticket #{winning.ticket.ticket_number}")
-                    processed_count += 1
-            except Exception as e:
-                logger.error(f"Error processing winning {winning.id}: {str(e)}")
+        processed_count = payouts.credit_pending_winnings()
         
         logger.info(f"Processed {processed_count} winning payouts")
         return processed_count
@@ -91,55 +63,18 @@ def process_lottery_winnings():
         return 0
 
 
-def process_withdrawal_requests():
+def process_withdrawal_requests(on_full_batch=None):
     """Process pending withdrawal requests"""
     try:
         # Get approved withdrawal requests that haven't been processed
         pending_withdrawals = WithdrawalRequest.objects.filter(
             status='approved',
             transaction__status='pending'
-        ).select_related('transaction', 'payment_method', 'user')
+        )
         
-        processed_count = 0
-        
-        for withdrawal in pending_withdrawals:
-            try:
-                with transaction.atomic():
-                    # Update withdrawal status
-                    withdrawal.status = 'processing'
-                    withdrawal.save()
-                    
-                    # Process the withdrawal based on payment method
-                    result = process_withdrawal_by_method(withdrawal)
-                    
-                    if result.get('success', False):
-                        # Update withdrawal status
-                        withdrawal.status = 'completed'
-                        withdrawal.processed_at = timezone.now()
-                        withdrawal.save()
-                        
-                        # Update transaction status
-                        withdrawal.transaction.status = 'completed'
-                        withdrawal.transaction.updated_at = timezone.now()
-                        withdrawal.transaction.save()
-                        
-                        logger.info(f"Processed withdrawal {withdrawal.id} for {withdrawal.amount}")
-                        processed_count += 1
-                    else:
-                        # Mark as failed
-                        withdrawal.status = 'failed'
-                        withdrawal.rejection_reason = result.get('error', 'Unknown error')
-                        withdrawal.save()
-                        
-                        # Update transaction status
-                        withdrawal.transaction.status = 'failed'
-                        withdrawal.transaction.description += f" - Failed: {result.get('error', 'Unknown error')}"
-                        withdrawal.transaction.updated_at = timezone.now()
-                        withdrawal.transaction.save()
-                        
-                        logger.error(f"Failed to process withdrawal {withdrawal.id}: {result.get('error')}")
-            except Exception as e:
-                logger.error(f"Error processing withdrawal {withdrawal.id}: {str(e)}")
+        processed_count = leases.drain(
+            pending_withdrawals, _process_withdrawal_batch, on_full_batch=on_full_batch, pass_owner=True
+        )
         
         logger.info(f"Processed {processed_count} withdrawals")
         return processed_count
@@ -148,6 +83,62 @@ def process_withdrawal_requests():
         return 0
 
 
+def _process_withdrawal_batch(withdrawal_ids, owner):
+    """Process a batch of withdrawal requests leased to ``owner``"""
+    withdrawals = WithdrawalRequest.objects.filter(
+        id__in=withdrawal_ids
+    ).select_related('transaction', 'payment_method', 'user').order_by('id')
+    
+    processed_count = 0
+    
+    for withdrawal in withdrawals:
+        try:
+            with transaction.atomic():
+                # The batch may have outlived its lease: pay only a request that is still
+                # approved and leased to this worker, otherwise another worker has it
+                if not leases.transition(
+                    WithdrawalRequest.objects.filter(status='approved'), withdrawal.pk, owner,
+                    status='processing', updated_at=timezone.now()
+                ):
+                    logger.info(f"Withdrawal {withdrawal.id} was taken over, skipping")
+                    continue
+                withdrawal.status = 'processing'
+                
+                # Process the withdrawal based on payment method
+                result = process_withdrawal_by_method(withdrawal)
+                
+                if result.get('success', False):
+                    # Update withdrawal status
+                    withdrawal.status = 'completed'
+                    withdrawal.processed_at = timezone.now()
+                    withdrawal.save()
+                    
+                    # Update transaction status
+                    withdrawal.transaction.status = 'completed'
+                    withdrawal.transaction.updated_at = timezone.now()
+                    withdrawal.transaction.save()
+                    
+                    logger.info(f"Processed withdrawal {withdrawal.id} for {withdrawal.amount}")
+                    processed_count += 1
+                else:
+                    # Mark as failed
+                    withdrawal.status = 'failed'
+                    withdrawal.rejection_reason = result.get('error', 'Unknown error')
+                    withdrawal.save()
+                    
+                    # Update transaction status
+                    withdrawal.transaction.status = 'failed'
+                    withdrawal.transaction.description += f" - Failed: {result.get('error', 'Unknown error')}"
+                    withdrawal.transaction.updated_at = timezone.now()
+                    withdrawal.transaction.save()
+                    
+                    logger.error(f"Failed to process withdrawal {withdrawal.id}: {result.get('error')}")
+        except Exception as e:
+            logger.error(f"Error processing withdrawal {withdrawal.id}: {str(e)}")
+    
+    return processed_count
+
+
 def process_withdrawal_by_method(withdrawal):
     """Process withdrawal based on payment method type"""
     method_type = withdrawal.payment_method.method_type
@@ -218,85 +209,27 @@ def process_crypto_withdrawal(withdrawal):
 
 
 @shared_task
-def check_pending_deposits():
+@rows_processed('updated')
+def check_pending_deposits(fan_out=True):
     """
     Celery task to check status of pending deposits
+    
+    Deposits are claimed in leased batches; one the provider has not
+    settled yet is checked again when its lease expires.
     """
     try:
         logger.info("Starting check for pending deposits")
         
-        # Get all pending deposits
+        # Pending deposits that the provider knows about
         pending_deposits = DepositTransaction.objects.filter(
-            transaction__status='pending'
-        ).select_related('transaction', 'payment_provider', 'user')
+            transaction__status='pending',
+            provider_transaction_id__isnull=False
+        ).exclude(provider_transaction_id='')
         
-        updated_count = 0
-        
-        for deposit in pending_deposits:
-            try:
-                # Skip if no provider transaction ID
-                if not deposit.provider_transaction_id:
-                    continue
-                
-                # Get the appropriate payment processor
-                from .integrations.factory import get_payment_processor
-                processor = get_payment_processor(deposit.payment_provider.provider_type)
-                
-                # Check payment status
-                payment_status = processor.get_payment_status(deposit.provider_transaction_id)
-                
-                if not payment_status.get('success', False):
-                    logger.warning(f"Failed to get status for deposit {deposit.id}: {payment_status.get('error')}")
-                    continue
-                
-                # Update deposit status based on provider status
-                status = payment_status.get('status', '').lower()
-                
-                # Update deposit provider info
-                deposit.provider_status = status
-                deposit.provider_response = payment_status
-                deposit.save()
-                
-                # Process based on status
-                if status in ['succeeded', 'completed']:
-                    # Payment is complete, update transaction and balance
-                    with transaction.atomic():
-                        # Update deposit
-                        deposit.completed_at = timezone.now()
-                        deposit.save()
-                        
-                        # Update transaction
-                        trans = deposit.transaction
-                        trans.status = 'completed'
-                        
-                        # Update user balance
-                        old_balance = deposit.user.balance
-                        deposit.user.balance += deposit.amount
-                        deposit.user.save()
-                        
-                        # Set final transaction details
-                        trans.balance_before = old_balance
-                        trans.balance_after = deposit.user.balance
-                        trans.updated_at = timezone.now()
-                        trans.save()
-                        
-                        logger.info(f"Completed deposit {deposit.id} for {deposit.amount}")
-                        updated_count += 1
-                
-                elif status in ['failed', 'canceled', 'cancelled']:
-                    # Payment failed or was cancelled
-                    with transaction.atomic():
-                        # Update transaction
-                        trans = deposit.transaction
-                        trans.status = 'failed' if status == 'failed' else 'cancelled'
-                        trans.updated_at = timezone.now()
-                        trans.save()
-                        
-                        logger.info(f"Marked deposit {deposit.id} as {trans.status}")
-                        updated_count += 1
-            
-            except Exception as e:
-                logger.error(f"Error checking deposit {deposit.id}: {str(e)}")
+        updated_count = leases.drain(
+            pending_deposits, _check_deposit_batch,
+            on_full_batch=leases.fan_out(check_pending_deposits) if fan_out else None
+        )
         
         logger.info(f"Completed checking for pending deposits: {updated_count} updated")
         return {'updated': updated_count}
@@ -306,8 +239,100 @@ def check_pending_deposits():
         return False
 
 
+def _check_deposit_batch(deposit_ids):
+    """Check a claimed batch of pending deposits with their providers"""
+    pending_deposits = list(DepositTransaction.objects.filter(
+        id__in=deposit_ids
+    ).select_related('transaction', 'payment_provider', 'user').order_by('id'))
+    
+    statuses = polling.poll_statuses(pending_deposits)
+    credited, closed = _apply_deposit_statuses(pending_deposits, statuses, 'pending')
+    return credited + closed
+
+
+def _apply_deposit_statuses(deposits, statuses, from_status, retried=False):
+    """
+    Apply polled provider statuses to deposits with bulk updates
+    
+    Deposits whose transaction is still in ``from_status`` are credited
+    when the provider reports them complete; pending deposits are also
+    closed when the provider reports them failed or cancelled.
+    Returns (credited, closed).
+    """
+    checked = []
+    completed = []
+    closed = {'failed': [], 'cancelled': []}
+    
+    for deposit in deposits:
+        payment_status = statuses.get(deposit.id)
+        if not payment_status or not payment_status.get('success', False):
+            if not retried:
+                error = payment_status.get('error') if payment_status else 'no status'
+                logger.warning(f"Failed to get status for deposit {deposit.id}: {error}")
+            continue
+        
+        status = payment_status.get('status', '').lower()
+        if status in ['succeeded', 'completed']:
+            completed.append(deposit)
+        elif retried:
+            continue
+        elif status in ['failed', 'canceled', 'cancelled']:
+            closed['failed' if status == 'failed' else 'cancelled'].append(deposit.transaction_id)
+        
+        deposit.provider_status = status
+        deposit.provider_response = payment_status
+        checked.append(deposit)
+    
+    if not checked:
+        return 0, 0
+    
+    now = timezone.now()
+    credited = []
+    closed_count = 0
+    
+    with transaction.atomic():
+        # Only transactions still in from_status are settled (a webhook may have won)
+        open_ids = set(Transaction.objects.select_for_update().filter(
+            id__in=[deposit.transaction_id for deposit in completed], status=from_status
+        ).values_list('id', flat=True))
+        
+        for deposit in completed:
+            if deposit.transaction_id not in open_ids:
+                continue
+            balance_change = wallet.credit(deposit.user, deposit.amount)
+            
+            trans = deposit.transaction
+            trans.status = 'completed'
+            trans.balance_before = balance_change.balance_before
+            trans.balance_after = balance_change.balance_after
+            trans.updated_at = now
+            if retried:
+                trans.description = f"Deposit of {deposit.amount} via {deposit.payment_provider.name} (retried)"
+            deposit.completed_at = now
+            credited.append(deposit)
+        
+        DepositTransaction.objects.bulk_update(
+            checked, ['provider_status', 'provider_response', 'completed_at'], batch_size=500
+        )
+        if credited:
+            Transaction.objects.bulk_update(
+                [deposit.transaction for deposit in credited],
+                ['status', 'balance_before', 'balance_after', 'description', 'updated_at'],
+                batch_size=500
+            )
+        for status, transaction_ids in closed.items():
+            if transaction_ids:
+                closed_count += Transaction.objects.filter(
+                    id__in=transaction_ids, status='pending'
+                ).update(status=status, updated_at=now)
+    
+    logger.info(f"Deposit statuses applied: {len(credited)} credited, {closed_count} closed")
+    return len(credited), closed_count
+
+
 @shared_task
-def retry_failed_deposits():
+@rows_processed('retried')
+def retry_failed_deposits(fan_out=True):
     """
     Celery task to retry failed deposits that might have been temporary failures
     """
@@ -320,61 +345,90 @@ def retry_failed_deposits():
             transaction__status='failed',
             transaction__created_at__gte=recent_time,
             provider_transaction_id__isnull=False
-        ).select_related('transaction', 'payment_provider', 'user')
+        )
         
-        retry_count = 0
-        success_count = 0
+        counts = {'retried': 0, 'succeeded': 0}
         
-        for deposit in failed_deposits:
-            try:
-                # Get the appropriate payment processor
-                from .integrations.factory import get_payment_processor
-                processor = get_payment_processor(deposit.payment_provider.provider_type)
-                
-                # Check payment status again
-                payment_status = processor.get_payment_status(deposit.provider_transaction_id)
-                
-                if not payment_status.get('success', False):
-                    continue
-                
-                # Get status
-                status = payment_status.get('status', '').lower()
-                
-                # If payment actually succeeded, update the deposit
-                if status in ['succeeded', 'completed']:
-                    with transaction.atomic():
-                        # Update deposit
-                        deposit.provider_status = status
-                        deposit.provider_response = payment_status
-                        deposit.completed_at = timezone.now()
-                        deposit.save()
-                        
-                        # Update transaction
-                        trans = deposit.transaction
-                        trans.status = 'completed'
-                        
-                        # Update user balance
-                        old_balance = deposit.user.balance
-                        deposit.user.balance += deposit.amount
-                        deposit.user.save()
-                        
-                        # Set final transaction details
-                        trans.balance_before = old_balance
-                        trans.balance_after = deposit.user.balance
-                        trans.description = f"Deposit of {deposit.amount} via {deposit.payment_provider.name} (retried)"
-                        trans.updated_at = timezone.now()
-                        trans.save()
-                        
-                        logger.info(f"Successfully retried deposit {deposit.id} for {deposit.amount}")
-                        success_count += 1
-                
-                retry_count += 1
-            except Exception as e:
-                logger.error(f"Error retrying deposit {deposit.id}: {str(e)}")
+        def retry_batch(deposit_ids):
+            retried, succeeded = _retry_deposit_batch(deposit_ids)
+            counts['retried'] += retried
+            counts['succeeded'] += succeeded
+            return retried
+        
+        leases.drain(
+            failed_deposits, retry_batch,
+            on_full_batch=leases.fan_out(retry_failed_deposits) if fan_out else None
+        )
+        retry_count, success_count = counts['retried'], counts['succeeded']
         
         logger.info(f"Completed retrying failed deposits: {retry_count} retried, {success_count} succeeded")
         return {'retried': retry_count, 'succeeded': success_count}
     except Exception as e:
         logger.error(f"Error in retry_failed_deposits task: {str(e)}")
         logger.error(traceback.format_exc())
-        return False
\ No newline at end of file
+        return False
+
+
+def _retry_deposit_batch(deposit_ids):
+    """Re-check a claimed batch of failed deposits; returns (retried, succeeded)"""
+    failed_deposits = list(DepositTransaction.objects.filter(
+        id__in=deposit_ids
+    ).select_related('transaction', 'payment_provider', 'user').order_by('id'))
+    
+    statuses = polling.poll_statuses(failed_deposits)
+    retry_count = sum(1 for status in statuses.values() if status.get('success', False))
+    success_count, _ = _apply_deposit_statuses(failed_deposits, statuses, 'failed', retried=True)
+    
+    return retry_count, success_count
+
+@shared_task
+@rows_processed('processed')
+def process_webhook_events(fan_out=True):
+    """
+    Celery task to apply stored provider webhook events
+    
+    Events are claimed in leased batches; a failed event stays pending
+    with a backoff and is picked up by a later run.
+    """
+    try:
+        processed_count = webhooks.process_pending_events(
+            on_full_batch=leases.fan_out(process_webhook_events) if fan_out else None
+        )
+        
+        logger.info(f"Applied {processed_count} webhook events")
+        return {'processed': processed_count}
+    except Exception as e:
+        logger.error(f"Error in process_webhook_events task: {str(e)}")
+        logger.error(traceback.format_exc())
+        return False
+
+
+@shared_task
+@rows_processed()
+def expire_stale_payment_calls():
+    """
+    Celery task to close provider calls abandoned by crashed deposit requests
+    """
+    try:
+        return outbox.expire_stale_calls()
+    except Exception as e:
+        logger.error(f"Error in expire_stale_payment_calls task: {str(e)}")
+        logger.error(traceback.format_exc())
+        return 0
+
+
+@shared_task
+@rows_processed()
+def purge_expired_idempotency_records():
+    """
+    Celery task to delete stored Idempotency-Key responses past their TTL
+    """
+    from .models import IdempotencyRecord
+    
+    try:
+        deleted, _ = IdempotencyRecord.objects.filter(expires_at__lte=timezone.now()).delete()
+        logger.info(f"Purged {deleted} expired idempotency records")
+        return deleted
+    except Exception as e:
+        logger.error(f"Error in purge_expired_idempotency_records task: {str(e)}")
+        return 0
@@ -0,0 +1,105 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from unittest.mock import patch
+from rest_framework.test import APIClient
+
+from .config_snapshot import VERSION_CACHE_KEY, clear_local_snapshot
+from .integrations import factory
+from .models import PaymentProvider
+
+User = get_user_model()
+
+
+@override_settings(
+    STRIPE_PUBLIC_KEY='pk_test', PAYPAL_CLIENT_ID='', COINPAYMENTS_PUBLIC_KEY='',
+    PAYMENT_CONFIG_SNAPSHOT={'TIMEOUT': 600, 'CHECK_SECONDS': 600}
+)
+class PaymentConfigSnapshotTestCase(TestCase):
+    """Тестирование кэшированного снимка методов оплаты"""
+
+    def setUp(self):
+        cache.clear()
+        clear_local_snapshot()
+        self.addCleanup(clear_local_snapshot)
+        self.user = User.objects.create_user(
+            username='testuser', email='test@example.com', password='testpassword123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('payment-methods-api')
+        PaymentProvider.objects.create(name='Stripe', provider_type='stripe')
+
+        self.builds = 0
+        build = factory.get_processor_config
+
+        def counting_build():
+            self.builds += 1
+            return build()
+
+        patcher = patch.object(factory, 'get_processor_config', side_effect=counting_build)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_payload_built_once_and_served_from_memory(self):
+        """Конфигурация собирается один раз, повторные запросы не ходят в БД"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data['methods']), {'card'})
+        self.assertEqual(response.data['config']['stripe']['public_key'], 'pk_test')
+        self.assertEqual([p['name'] for p in response.data['providers']], ['Stripe'])
+        self.assertEqual(self.builds, 1)
+
+        # Снимок отдается из памяти процесса
+        with self.assertNumQueries(0):
+            again = self.client.get(self.url)
+        self.assertEqual(again.data, response.data)
+        self.assertEqual(again['ETag'], response['ETag'])
+        self.assertEqual(self.builds, 1)
+
+    def test_matching_etag_answered_with_304(self):
+        """Запрос с совпадающим If-None-Match получает 304 без тела"""
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=f'W/{etag}')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_provider_change_invalidates_snapshot(self):
+        """Изменение провайдера сбрасывает снимок во всех процессах"""
+        etag = self.client.get(self.url)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PaymentProvider.objects.create(name='PayPal', provider_type='paypal')
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p['name'] for p in response.data['providers']], ['Stripe', 'PayPal'])
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.builds, 2)
+
+    def test_settings_change_rebuilds_snapshot(self):
+        """Смена публичных ключей процессоров дает новый снимок"""
+        self.client.get(self.url)
+
+        with self.settings(PAYPAL_CLIENT_ID='paypal-client'):
+            response = self.client.get(self.url)
+            self.assertEqual(set(response.data['methods']), {'card', 'paypal'})
+
+        response = self.client.get(self.url)
+        self.assertEqual(set(response.data['methods']), {'card'})
+
+    def test_version_bump_from_other_process_is_picked_up(self):
+        """Сброс версии в общем кэше другим процессом виден при следующей сверке"""
+        with self.settings(PAYMENT_CONFIG_SNAPSHOT={'TIMEOUT': 600, 'CHECK_SECONDS': 0}):
+            etag = self.client.get(self.url)['ETag']
+
+            # Другой воркер сохранил провайдера: меняется только счетчик в кэше
+            PaymentProvider.objects.filter(provider_type='stripe').update(name='Stripe EU')
+            cache.incr(VERSION_CACHE_KEY)
+
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([p['name'] for p in response.data['providers']], ['Stripe EU'])
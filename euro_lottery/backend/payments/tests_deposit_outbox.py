@@ -0,0 +1,192 @@
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+from unittest.mock import patch
+from datetime import timedelta
+from decimal import Decimal
+from rest_framework.test import APIClient
+import time
+
+from . import outbox
+from .models import Transaction, PaymentProvider, DepositTransaction, PaymentOutbox
+
+User = get_user_model()
+
+
+class TransactionClock:
+    """
+    Измеряет, сколько времени соединение держит открытую транзакцию.
+
+    Считается время от входа во внешний atomic-блок до выхода из него.
+    """
+
+    def __init__(self):
+        self.held = 0.0
+        self._started = None
+
+    def __enter__(self):
+        enter, exit_ = transaction.Atomic.__enter__, transaction.Atomic.__exit__
+        clock = self
+
+        def timed_enter(atomic):
+            outermost = not connection.in_atomic_block
+            enter(atomic)
+            if outermost:
+                clock._started = time.monotonic()
+
+        def timed_exit(atomic, *exc_info):
+            try:
+                return exit_(atomic, *exc_info)
+            finally:
+                if not connection.in_atomic_block and clock._started is not None:
+                    clock.held += time.monotonic() - clock._started
+                    clock._started = None
+
+        self._patchers = [
+            patch.object(transaction.Atomic, '__enter__', timed_enter),
+            patch.object(transaction.Atomic, '__exit__', timed_exit),
+        ]
+        for patcher in self._patchers:
+            patcher.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        for patcher in self._patchers:
+            patcher.stop()
+
+
+class SlowProvider:
+    """Медленный провайдер: запоминает, была ли открыта транзакция во время вызова"""
+
+    def __init__(self, delay, status='succeeded', during_call=None):
+        self.delay = delay
+        self.status = status
+        self.during_call = during_call
+        self.in_transaction = []
+
+    def _call(self, result):
+        self.in_transaction.append(connection.in_atomic_block)
+        time.sleep(self.delay)
+        if self.during_call:
+            self.during_call()
+        return result
+
+    def create_payment(self, amount, description, metadata=None):
+        return self._call({'id': 'pi_slow', 'status': 'requires_payment_method',
+                           'client_secret': 'secret', 'success': True})
+
+    def confirm_payment(self, payment_id, payment_data=None):
+        return self._call({'id': payment_id, 'status': self.status, 'success': True})
+
+
+class DepositOutboxTestCase(TransactionTestCase):
+    """Тестирование депозитных запросов с вызовом провайдера вне транзакции"""
+
+    DELAY = 0.3
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser', email='test@example.com', password='testpassword123',
+            balance=Decimal('100.00')
+        )
+        self.provider = PaymentProvider.objects.create(name='Stripe', provider_type='stripe')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def _stub_provider(self, processor):
+        patcher = patch('payments.integrations.factory.get_payment_processor', return_value=processor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _pending_deposit(self):
+        trans = Transaction.objects.create(
+            user=self.user, transaction_type='deposit', amount=Decimal('25.00'),
+            balance_before=Decimal('100.00'), balance_after=Decimal('100.00'),
+            status='pending', description='Deposit'
+        )
+        return DepositTransaction.objects.create(
+            user=self.user, amount=Decimal('25.00'), payment_provider=self.provider,
+            provider_transaction_id='pi_slow', transaction=trans
+        )
+
+    def test_initiate_holds_no_transaction_during_provider_call(self):
+        """Соединение не держит транзакцию, пока провайдер отвечает"""
+        provider = SlowProvider(self.DELAY)
+        self._stub_provider(provider)
+
+        # Прежняя схема: вызов провайдера внутри транзакции
+        with TransactionClock() as inside:
+            with transaction.atomic():
+                provider.create_payment(Decimal('25.00'), 'Deposit')
+        self.assertGreaterEqual(inside.held, self.DELAY)
+
+        with TransactionClock() as clock:
+            response = self.client.post(reverse('initiate-deposit'), {
+                'amount': '25.00', 'payment_provider_id': self.provider.id
+            }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['client_secret'], 'secret')
+        self.assertEqual(provider.in_transaction, [True, False])
+        self.assertLess(clock.held, self.DELAY / 2)
+
+        deposit = DepositTransaction.objects.get()
+        self.assertEqual(deposit.provider_transaction_id, 'pi_slow')
+        call = PaymentOutbox.objects.get()
+        self.assertEqual((call.operation, call.status), ('create', 'completed'))
+
+    def test_confirm_credits_once_when_settled_during_call(self):
+        """Депозит, закрытый во время вызова провайдера, повторно не зачисляется"""
+        deposit = self._pending_deposit()
+
+        def webhook_settles():
+            Transaction.objects.filter(pk=deposit.transaction_id).update(status='completed')
+
+        provider = SlowProvider(0, during_call=webhook_settles)
+        self._stub_provider(provider)
+
+        response = self.client.post(reverse('confirm-deposit'), {
+            'transaction_id': str(deposit.transaction.transaction_id)
+        }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'completed')
+        self.assertEqual(provider.in_transaction, [False])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, Decimal('100.00'))
+        self.assertEqual(PaymentOutbox.objects.get().status, 'completed')
+
+    def test_confirm_applies_result_in_short_transaction(self):
+        """Успешное подтверждение зачисляет депозит"""
+        deposit = self._pending_deposit()
+        self._stub_provider(SlowProvider(self.DELAY))
+
+        with TransactionClock() as clock:
+            response = self.client.post(reverse('confirm-deposit'), {
+                'transaction_id': str(deposit.transaction.transaction_id)
+            }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['new_balance'], Decimal('125.00'))
+        self.assertLess(clock.held, self.DELAY / 2)
+        deposit.transaction.refresh_from_db()
+        self.assertEqual(deposit.transaction.status, 'completed')
+        self.assertEqual(deposit.transaction.balance_after, Decimal('125.00'))
+
+    def test_abandoned_create_call_fails_deposit(self):
+        """Брошенный вызов создания платежа закрывает депозит"""
+        deposit = self._pending_deposit()
+        DepositTransaction.objects.filter(pk=deposit.pk).update(provider_transaction_id=None)
+        deposit.refresh_from_db()
+        fresh = outbox.open_call(deposit, 'confirm')
+        stale = outbox.open_call(deposit, 'create')
+        PaymentOutbox.objects.filter(pk=stale.pk).update(created_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(outbox.expire_stale_calls(), 1)
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual((stale.status, fresh.status), ('failed', 'pending'))
+        deposit.transaction.refresh_from_db()
+        self.assertEqual(deposit.transaction.status, 'failed')
@@ -0,0 +1,184 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from unittest.mock import patch
+from decimal import Decimal
+import threading
+import time
+
+from .models import Transaction, PaymentProvider, DepositTransaction
+from .integrations.crypto_integration import NONCE_CACHE_KEY, _next_nonce
+from .polling import RateLimiter, get_rate_limiter, poll_statuses
+from .tasks import check_pending_deposits, retry_failed_deposits
+
+User = get_user_model()
+
+NO_LIMITS = {'THREADS': 4, 'RATE_LIMITS': {}}
+
+
+class StubProcessor:
+    """Локальный провайдер со статусами из словаря"""
+
+    status_batch_size = 0
+
+    def __init__(self, statuses, delay=0):
+        self.statuses = statuses
+        self.delay = delay
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def _status(self, payment_id):
+        status = self.statuses.get(payment_id)
+        if status is None:
+            return {'error': 'not found', 'success': False}
+        return {'id': payment_id, 'status': status, 'success': True}
+
+    def get_payment_status(self, payment_id):
+        with self._lock:
+            self.calls.append(payment_id)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        return self._status(payment_id)
+
+
+class StubMultiProcessor(StubProcessor):
+    """Локальный провайдер с пакетным запросом статусов"""
+
+    status_batch_size = 25
+
+    def get_payment_status(self, payment_id):
+        raise AssertionError('multi-ID provider polled one by one')
+
+    def get_payment_statuses(self, payment_ids):
+        self.calls.append(list(payment_ids))
+        return {payment_id: self._status(payment_id) for payment_id in payment_ids}
+
+
+@override_settings(DEPOSIT_POLLING_SETTINGS=NO_LIMITS)
+class DepositPollingTestCase(TestCase):
+    """Тестирование опроса статусов депозитов по провайдерам"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser', email='test@example.com', password='testpassword123',
+            balance=Decimal('100.00')
+        )
+        self.stripe = PaymentProvider.objects.create(name='Stripe', provider_type='stripe')
+        self.crypto = PaymentProvider.objects.create(name='Crypto', provider_type='crypto')
+
+    def _deposit(self, provider, provider_id, status='pending', amount='10.00'):
+        trans = Transaction.objects.create(
+            user=self.user, transaction_type='deposit', amount=Decimal(amount),
+            balance_before=Decimal('100.00'), balance_after=Decimal('100.00'),
+            status=status, description='Deposit'
+        )
+        return DepositTransaction.objects.create(
+            user=self.user, amount=Decimal(amount), payment_provider=provider,
+            provider_transaction_id=provider_id, transaction=trans
+        )
+
+    def _stub_providers(self, **processors):
+        patcher = patch('payments.polling.get_payment_processor', side_effect=lambda name: processors[name])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_grouped_by_provider_with_multi_id_calls(self):
+        """Провайдер с пакетным запросом опрашивается пачками, остальные по одному"""
+        crypto_statuses = {f'tx{i}': 'pending' for i in range(30)}
+        crypto_statuses['tx0'] = 'completed'
+        crypto = StubMultiProcessor(crypto_statuses)
+        stripe = StubProcessor({'pi_ok': 'succeeded', 'pi_failed': 'failed', 'pi_wait': 'processing'})
+        self._stub_providers(crypto=crypto, stripe=stripe)
+
+        for i in range(30):
+            self._deposit(self.crypto, f'tx{i}')
+        ok = self._deposit(self.stripe, 'pi_ok')
+        failed = self._deposit(self.stripe, 'pi_failed')
+        self._deposit(self.stripe, 'pi_wait')
+
+        self.assertEqual(check_pending_deposits(), {'updated': 3})
+        self.assertEqual([len(call) for call in crypto.calls], [25, 5])
+        self.assertEqual(sorted(stripe.calls), ['pi_failed', 'pi_ok', 'pi_wait'])
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, Decimal('120.00'))
+        ok.transaction.refresh_from_db()
+        self.assertEqual(ok.transaction.status, 'completed')
+        self.assertEqual(ok.transaction.balance_after - ok.transaction.balance_before, Decimal('10.00'))
+        failed.transaction.refresh_from_db()
+        self.assertEqual(failed.transaction.status, 'failed')
+        self.assertEqual(
+            DepositTransaction.objects.filter(provider_status='pending').count(), 29
+        )
+
+    def test_thread_pool_is_bounded(self):
+        """Одновременных запросов не больше размера пула"""
+        stripe = StubProcessor({f'pi_{i}': 'processing' for i in range(8)}, delay=0.02)
+        self._stub_providers(stripe=stripe)
+        deposits = [self._deposit(self.stripe, f'pi_{i}') for i in range(8)]
+
+        with self.settings(DEPOSIT_POLLING_SETTINGS={'THREADS': 2, 'RATE_LIMITS': {}}):
+            statuses = poll_statuses(DepositTransaction.objects.select_related('payment_provider'))
+        self.assertEqual(len(statuses), 8)
+        self.assertEqual(statuses[deposits[0].id]['status'], 'processing')
+        self.assertGreater(stripe.max_active, 1)
+        self.assertLessEqual(stripe.max_active, 2)
+
+    def test_rate_limiter_spaces_calls(self):
+        """Ограничитель частоты разносит вызовы по времени"""
+        limiter = RateLimiter(50)
+        started = time.monotonic()
+        for _ in range(5):
+            limiter.wait()
+        self.assertGreaterEqual(time.monotonic() - started, 4 / 50 - 0.005)
+
+    def test_rate_limiter_follows_settings(self):
+        """Ограничитель строится по текущей настройке, а не по первой прочитанной"""
+        with self.settings(DEPOSIT_POLLING_SETTINGS={'THREADS': 2, 'RATE_LIMITS': {'stripe': 20}}):
+            self.assertEqual(get_rate_limiter('stripe').interval, 1 / 20)
+        with self.settings(DEPOSIT_POLLING_SETTINGS={'THREADS': 2, 'RATE_LIMITS': {}}):
+            self.assertEqual(get_rate_limiter('stripe').interval, 0.0)
+
+    def test_coinpayments_nonce_strictly_increasing(self):
+        """Одновременные вызовы CoinPayments получают разные возрастающие nonce из общего счетчика"""
+        cache.delete(NONCE_CACHE_KEY)
+        self.assertGreaterEqual(_next_nonce(), int(time.time() * 1000) - 1000)
+        nonces = []
+        threads = [threading.Thread(target=lambda: nonces.extend(_next_nonce() for _ in range(50))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(nonces)), 200)
+        self.assertGreater(_next_nonce(), max(nonces))
+
+        # Другой процесс уже продвинул общий счетчик
+        cache.set(NONCE_CACHE_KEY, max(nonces) + 10 ** 6, timeout=None)
+        self.assertEqual(_next_nonce(), max(nonces) + 10 ** 6 + 1)
+
+    def test_retry_credits_once(self):
+        """Повтор зачисляет депозит, а закрытый вебхуком во время опроса не трогает"""
+        stripe = StubProcessor({'pi_late': 'succeeded', 'pi_settled': 'succeeded'})
+        self._stub_providers(stripe=stripe)
+        late = self._deposit(self.stripe, 'pi_late', status='failed')
+        settled = self._deposit(self.stripe, 'pi_settled', status='failed')
+
+        def poll_while_webhook_settles(deposits):
+            statuses = poll_statuses(deposits)
+            # Вебхук успел закрыть депозит, пока шел опрос
+            Transaction.objects.filter(pk=settled.transaction_id).update(status='completed')
+            return statuses
+
+        with patch('payments.tasks.polling.poll_statuses', side_effect=poll_while_webhook_settles):
+            self.assertEqual(retry_failed_deposits(), {'retried': 2, 'succeeded': 1})
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, Decimal('110.00'))
+        late.transaction.refresh_from_db()
+        self.assertEqual(late.transaction.status, 'completed')
+        self.assertIn('(retried)', late.transaction.description)
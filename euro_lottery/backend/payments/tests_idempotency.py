@@ -0,0 +1,152 @@
+import datetime
+import threading
+import time
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory, APITestCase
+
+from lottery.models import LotteryGame, Draw, Ticket
+from lottery_core.idempotency import IdempotencyStore, request_fingerprint, REPLAYED_HEADER
+from .models import IdempotencyRecord, PaymentMethod, WithdrawalRequest
+
+User = get_user_model()
+
+
+class IdempotencyKeyTestCase(APITestCase):
+    """Тестирование заголовка Idempotency-Key на денежных эндпоинтах"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='user@example.com',
+            username='testuser',
+            password='testpassword'
+        )
+        User.objects.filter(pk=self.user.pk).update(balance=Decimal('100.00'))
+        self.user.refresh_from_db()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        lottery_game = LotteryGame.objects.create(
+            name="Test Lottery",
+            main_numbers_count=5,
+            main_numbers_range=50,
+            extra_numbers_count=2,
+            extra_numbers_range=12,
+            ticket_price=Decimal('2.50'),
+            draw_days="Tuesday,Friday",
+            draw_time="20:00:00",
+        )
+        self.draw = Draw.objects.create(
+            lottery_game=lottery_game,
+            draw_number=1,
+            draw_date=timezone.now() + datetime.timedelta(days=2),
+            jackpot_amount=Decimal('1000000.00')
+        )
+        self.purchase_url = reverse('purchase-ticket')
+        self.payload = {
+            'draw_id': self.draw.id,
+            'tickets': [{'main_numbers': [1, 2, 3, 4, 5], 'extra_numbers': [1, 2]}]
+        }
+
+    def _purchase(self, key, payload=None):
+        return self.client.post(self.purchase_url, payload or self.payload, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_replay_returns_stored_response_without_reexecuting(self):
+        first = self._purchase('purchase-1')
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+
+        second = self._purchase('purchase-1')
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second[REPLAYED_HEADER], 'true')
+        self.assertEqual(second.data['tickets'][0]['ticket_id'], first.data['tickets'][0]['ticket_id'])
+
+        self.assertEqual(Ticket.objects.count(), 1)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, Decimal('97.50'))
+
+    def test_requests_without_key_are_not_deduplicated(self):
+        self.client.post(self.purchase_url, self.payload, format='json')
+        self.client.post(self.purchase_url, self.payload, format='json')
+        self.assertEqual(Ticket.objects.count(), 2)
+
+    def test_key_reuse_with_different_body(self):
+        self._purchase('purchase-1')
+        payload = dict(self.payload, tickets=[{'main_numbers': [6, 7, 8, 9, 10], 'extra_numbers': [1, 2]}])
+        response = self._purchase('purchase-1', payload)
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Ticket.objects.count(), 1)
+
+    def test_keys_are_scoped_per_user(self):
+        self._purchase('shared-key')
+        other = User.objects.create_user(email='other@example.com', username='other', password='password')
+        User.objects.filter(pk=other.pk).update(balance=Decimal('10.00'))
+        client = APIClient()
+        client.force_authenticate(user=other)
+        response = client.post(self.purchase_url, self.payload, format='json', HTTP_IDEMPOTENCY_KEY='shared-key')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn(REPLAYED_HEADER, response)
+        self.assertEqual(Ticket.objects.count(), 2)
+
+    def test_database_record_survives_cache_loss(self):
+        first = self._purchase('purchase-1')
+        self.assertTrue(IdempotencyRecord.objects.filter(user=self.user, key='purchase-1').exists())
+
+        cache.clear()
+        second = self._purchase('purchase-1')
+        self.assertEqual(second[REPLAYED_HEADER], 'true')
+        self.assertEqual(second.data['tickets'][0]['ticket_id'], str(first.data['tickets'][0]['ticket_id']))
+        self.assertEqual(Ticket.objects.count(), 1)
+
+    def test_withdrawal_replay(self):
+        payment_method = PaymentMethod.objects.create(user=self.user, method_type='bank_account', is_verified=True)
+        url = reverse('request-withdrawal')
+        payload = {'amount': '20.00', 'payment_method': payment_method.id}
+        first = self.client.post(url, payload, format='json', HTTP_IDEMPOTENCY_KEY='withdraw-1')
+        second = self.client.post(url, payload, format='json', HTTP_IDEMPOTENCY_KEY='withdraw-1')
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.data['withdrawal_id'], first.data['withdrawal_id'])
+        self.assertEqual(WithdrawalRequest.objects.count(), 1)
+
+    @override_settings(IDEMPOTENCY_SETTINGS={'WAIT_TIMEOUT': 2, 'POLL_INTERVAL': 0.01})
+    def test_concurrent_duplicate_waits_for_first_request(self):
+        # Первый запрос "в процессе": блокировка занята, ответ появится позже
+        store = IdempotencyStore(self.user, 'lottery.purchase_ticket', 'in-flight', durable=False)
+        token = store.acquire()
+        fingerprint = request_fingerprint(Request(
+            APIRequestFactory().post(self.purchase_url, self.payload, format='json'),
+            parsers=[JSONParser()]
+        ))
+        stored_response = Response({'tickets': [], 'total_price': '2.50'}, status=status.HTTP_201_CREATED)
+
+        def finish_first_request():
+            time.sleep(0.2)
+            store.save(fingerprint, stored_response)
+            store.release(token)
+
+        worker = threading.Thread(target=finish_first_request)
+        worker.start()
+        response = self._purchase('in-flight')
+        worker.join()
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response[REPLAYED_HEADER], 'true')
+        self.assertEqual(response.data, {'tickets': [], 'total_price': '2.50'})
+        self.assertEqual(Ticket.objects.count(), 0)
+
+    @override_settings(IDEMPOTENCY_SETTINGS={'WAIT_TIMEOUT': 0.1, 'POLL_INTERVAL': 0.01})
+    def test_concurrent_duplicate_times_out_with_conflict(self):
+        store = IdempotencyStore(self.user, 'lottery.purchase_ticket', 'stuck', durable=True)
+        store.acquire()
+        response = self._purchase('stuck')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Ticket.objects.count(), 0)
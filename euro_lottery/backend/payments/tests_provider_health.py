@@ -0,0 +1,183 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from unittest.mock import MagicMock, patch
+from io import StringIO
+from rest_framework.test import APIClient
+import requests
+import time
+
+from . import provider_health
+from .integrations import http
+from .models import PaymentProvider, DepositTransaction
+
+User = get_user_model()
+
+HEALTH = {
+    'WINDOW_SECONDS': 60, 'BUCKET_SECONDS': 10, 'MIN_CALLS': 4, 'ERROR_RATE': 0.5,
+    'SLOW_MS': 1000, 'OPEN_SECONDS': 30, 'DEGRADED_TIMEOUT': (1, 2), 'AUTO_FAILOVER': False,
+}
+
+
+def _open_circuit(provider_type):
+    for _ in range(HEALTH['MIN_CALLS']):
+        provider_health.record(provider_type, 0.1, ok=False)
+
+
+@override_settings(PROVIDER_HEALTH_SETTINGS=HEALTH)
+class ProviderHealthTestCase(TestCase):
+    """Тестирование статистики провайдеров и автоматического выключателя"""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_circuit_opens_then_probe_closes_it(self):
+        """Автомат размыкается по доле ошибок, пробный вызов после паузы замыкает его"""
+        now = time.time()
+        provider_health.record('stripe', 0.2, ok=True, now=now)
+        provider_health.record('stripe', 0.2, ok=False, now=now)
+        provider_health.record('stripe', 0.2, ok=False, now=now)
+        self.assertEqual(provider_health.circuit_state('stripe', now), 'closed')
+
+        provider_health.record('stripe', 0.2, ok=False, now=now)
+        stats = provider_health.get_stats('stripe', now)
+        self.assertEqual((stats['calls'], stats['errors'], stats['circuit']), (4, 3, 'open'))
+        self.assertEqual(stats['avg_latency_ms'], 200)
+        self.assertFalse(provider_health.allow_request('stripe'))
+        self.assertTrue(provider_health.allow_request('paypal'))
+
+        # Пауза прошла: пропускается один пробный вызов
+        later = now + HEALTH['OPEN_SECONDS'] + 1
+        with patch('payments.provider_health.time.time', return_value=later):
+            self.assertTrue(provider_health.allow_request('stripe'))
+            self.assertFalse(provider_health.allow_request('stripe'))
+        provider_health.record('stripe', 0.1, ok=True, now=later)
+
+        stats = provider_health.get_stats('stripe', later)
+        self.assertEqual((stats['circuit'], stats['calls']), ('closed', 0))
+
+    def test_degraded_provider_gets_short_timeout(self):
+        """Медленный провайдер вызывается с коротким таймаутом"""
+        timeouts = []
+
+        def provider_call():
+            timeouts.append(getattr(http._local, 'timeout', None))
+            return {'success': True}
+
+        provider_health.call('stripe', provider_call)
+        provider_health.record('stripe', 2.5, ok=True)
+        provider_health.call('stripe', provider_call)
+        self.assertEqual(timeouts, [None, (1, 2)])
+        self.assertEqual(provider_health.get_stats('stripe')['slow_rate'], 0.3333)
+
+        # Переопределение сильнее таймаута, который передает SDK
+        adapter = http.TimeoutHTTPAdapter(timeout=(5, 30))
+        with patch.object(requests.adapters.HTTPAdapter, 'send', return_value='ok') as send:
+            with http.timeout_override((1, 2)):
+                adapter.send(MagicMock(), timeout=80)
+            self.assertEqual(send.call_args.kwargs['timeout'], (1, 2))
+            adapter.send(MagicMock(), timeout=80)
+            self.assertEqual(send.call_args.kwargs['timeout'], 80)
+
+    def test_exception_counted_as_error(self):
+        """Исключение провайдера учитывается и пробрасывается дальше"""
+        def failing_call():
+            raise requests.Timeout('read timed out')
+
+        with self.assertRaises(requests.Timeout):
+            provider_health.call('paypal', failing_call)
+        provider_health.call('paypal', lambda: {'error': 'declined', 'success': False})
+        self.assertEqual(provider_health.get_stats('paypal')['errors'], 2)
+
+
+@override_settings(PROVIDER_HEALTH_SETTINGS=HEALTH, DEFAULT_CURRENCY='EUR')
+class DepositFailoverTestCase(TestCase):
+    """Тестирование переключения депозита на исправный провайдер"""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(
+            username='testuser', email='test@example.com', password='testpassword123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.stripe = PaymentProvider.objects.create(
+            name='Stripe', provider_type='stripe', supported_currencies=['EUR']
+        )
+        self.paypal = PaymentProvider.objects.create(
+            name='PayPal', provider_type='paypal', supported_currencies=['EUR', 'USD']
+        )
+        PaymentProvider.objects.create(name='Crypto', provider_type='crypto', supported_currencies=['BTC'])
+
+        self.processor = MagicMock()
+        self.processor.create_payment.return_value = {
+            'id': 'ORDER1', 'status': 'created', 'approval_url': 'https://paypal.test/approve', 'success': True
+        }
+        patcher = patch('payments.integrations.factory.get_payment_processor', return_value=self.processor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _initiate(self, **extra):
+        return self.client.post(reverse('initiate-deposit'), {
+            'amount': '20.00', 'payment_provider_id': self.stripe.id, **extra
+        }, format='json')
+
+    def test_open_circuit_suggests_alternatives(self):
+        """Без согласия клиента депозит не создается, предлагается другой провайдер"""
+        _open_circuit('stripe')
+
+        response = self._initiate()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual([p['provider_type'] for p in response.data['alternatives']], ['paypal'])
+        self.assertFalse(DepositTransaction.objects.exists())
+        self.processor.create_payment.assert_not_called()
+
+    def test_failover_to_healthy_provider(self):
+        """С allow_failover депозит уходит исправному провайдеру с нужной валютой"""
+        _open_circuit('stripe')
+
+        response = self._initiate(allow_failover=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['redirect_url'], 'https://paypal.test/approve')
+        deposit = DepositTransaction.objects.get()
+        self.assertEqual(deposit.payment_provider, self.paypal)
+        self.assertEqual(provider_health.get_stats('paypal')['calls'], 1)
+
+    def test_failover_respects_half_open_probe(self):
+        """Переключение на полуоткрытый провайдер занимает его единственный пробный вызов"""
+        _open_circuit('paypal')
+        later = time.time() + HEALTH['OPEN_SECONDS'] + 1
+        for _ in range(HEALTH['MIN_CALLS']):
+            provider_health.record('stripe', 0.1, ok=False, now=later)
+
+        with patch('payments.provider_health.time.time', return_value=later):
+            self.assertEqual(provider_health.circuit_state('paypal'), 'half_open')
+            # Пробный вызов PayPal уже занят другим запросом
+            self.assertTrue(provider_health.allow_request('paypal'))
+            response = self._initiate(allow_failover=True)
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(DepositTransaction.objects.exists())
+        self.processor.create_payment.assert_not_called()
+
+    def test_health_exposed_for_monitoring(self):
+        """Статистика доступна администратору и команде мониторинга"""
+        _open_circuit('stripe')
+
+        self.assertEqual(self.client.get(reverse('provider-health')).status_code, 403)
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='adminpassword123'
+        )
+        self.client.force_authenticate(user=admin)
+        response = self.client.get(reverse('provider-health'))
+        self.assertEqual(response.status_code, 200)
+        circuits = {row['provider']: row['circuit'] for row in response.data['providers']}
+        self.assertEqual(circuits, {'stripe': 'open', 'paypal': 'closed', 'crypto': 'closed'})
+
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, 'stripe'):
+            call_command('provider_health', '--fail-open', stdout=out)
+        self.assertIn('open', out.getvalue())
@@ -0,0 +1,93 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from unittest.mock import MagicMock, patch
+import requests
+
+from .integrations import http
+from .integrations.factory import get_payment_processor, reset_payment_processors
+from .integrations.paypal_integration import PayPalPaymentProcessor
+
+
+def _response(status_code, payload):
+    response = MagicMock(status_code=status_code, text=str(payload))
+    response.json.return_value = payload
+    return response
+
+
+class ProcessorSingletonTestCase(TestCase):
+    """Тестирование общих экземпляров процессоров и HTTP-сессии"""
+
+    def tearDown(self):
+        reset_payment_processors()
+        http.reset_sessions()
+
+    def test_processor_reused_within_process(self):
+        """Фабрика возвращает один экземпляр процессора на провайдера"""
+        processor = get_payment_processor('paypal')
+        self.assertIs(get_payment_processor('PayPal'), processor)
+        self.assertIsNot(get_payment_processor('crypto'), processor)
+
+        reset_payment_processors()
+        self.assertIsNot(get_payment_processor('paypal'), processor)
+
+    @override_settings(PAYMENT_HTTP_SETTINGS={'RETRIES': 2, 'CONNECT_TIMEOUT': 1, 'READ_TIMEOUT': 7})
+    def test_session_pooled_with_retries_and_timeout(self):
+        """Сессия общая, повторяет только идемпотентные запросы и ставит таймаут"""
+        session = http.get_session()
+        self.assertIs(http.get_session(), session)
+
+        adapter = session.get_adapter('https://api-m.paypal.com')
+        self.assertEqual(adapter.max_retries.total, 2)
+        self.assertIn('GET', adapter.max_retries.allowed_methods)
+        self.assertNotIn('POST', adapter.max_retries.allowed_methods)
+
+        with patch.object(requests.adapters.HTTPAdapter, 'send', return_value='ok') as send:
+            adapter.send(MagicMock())
+            self.assertEqual(send.call_args.kwargs['timeout'], (1, 7))
+            adapter.send(MagicMock(), timeout=3)
+            self.assertEqual(send.call_args.kwargs['timeout'], 3)
+
+
+class PayPalTokenCacheTestCase(TestCase):
+    """Тестирование общего OAuth-токена PayPal"""
+
+    def setUp(self):
+        cache.clear()
+        self.session = MagicMock()
+        self.session.post.side_effect = [
+            _response(200, {'access_token': 'token-1', 'expires_in': 3600}),
+            _response(200, {'access_token': 'token-2', 'expires_in': 3600}),
+        ]
+        patcher = patch('payments.integrations.paypal_integration.get_session', return_value=self.session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _authorization(self, call):
+        return call.kwargs['headers']['Authorization']
+
+    def test_token_shared_between_instances(self):
+        """Токен получается один раз и используется всеми экземплярами"""
+        self.session.request.return_value = _response(200, {'id': 'ORDER123'})
+
+        PayPalPaymentProcessor()._make_request('GET', '/v2/checkout/orders/ORDER123')
+        PayPalPaymentProcessor()._make_request('GET', '/v2/checkout/orders/ORDER123')
+
+        self.assertEqual(self.session.post.call_count, 1)
+        self.assertEqual(
+            [self._authorization(call) for call in self.session.request.call_args_list],
+            ['Bearer token-1', 'Bearer token-1']
+        )
+
+    def test_rejected_token_refreshed_once(self):
+        """При 401 токен обновляется и запрос повторяется"""
+        self.session.request.side_effect = [
+            _response(401, {'message': 'expired'}),
+            _response(200, {'id': 'ORDER123'}),
+        ]
+
+        result = PayPalPaymentProcessor()._make_request('GET', '/v2/checkout/orders/ORDER123')
+
+        self.assertEqual(result, {'id': 'ORDER123'})
+        self.assertEqual(self.session.post.call_count, 2)
+        self.assertEqual(self._authorization(self.session.request.call_args), 'Bearer token-2')
+        self.assertEqual(cache.get(PayPalPaymentProcessor().token_cache_key), 'token-2')
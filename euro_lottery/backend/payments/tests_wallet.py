@@ -0,0 +1,144 @@
+import threading
+import time
+from decimal import Decimal
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction, OperationalError
+from django.test import TestCase, TransactionTestCase
+
+from . import wallet
+
+User = get_user_model()
+
+
+class WalletTestCase(TestCase):
+    """Тестирование атомарных операций с балансом"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='wallet@example.com',
+            username='walletuser',
+            password='testpassword'
+        )
+        User.objects.filter(pk=self.user.pk).update(balance=Decimal('100.00'))
+        self.user.refresh_from_db()
+
+    def test_debit(self):
+        change = wallet.debit(self.user, Decimal('30.50'))
+        self.assertEqual(change.balance_before, Decimal('100.00'))
+        self.assertEqual(change.balance_after, Decimal('69.50'))
+        self.assertEqual(self.user.balance, Decimal('69.50'))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, Decimal('69.50'))
+
+    def test_debit_insufficient_funds_writes_nothing(self):
+        with self.assertRaises(wallet.InsufficientFundsError):
+            wallet.debit(self.user, Decimal('100.01'))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, Decimal('100.00'))
+
+    def test_debit_ignores_stale_instance_balance(self):
+        # Баланс в памяти устарел: решение принимает только строка в БД
+        self.user.balance = Decimal('1000.00')
+        with self.assertRaises(wallet.InsufficientFundsError):
+            wallet.debit(self.user, Decimal('500.00'))
+
+    def test_credit(self):
+        change = wallet.credit(self.user, Decimal('25.00'))
+        self.assertEqual(change.balance_before, Decimal('100.00'))
+        self.assertEqual(change.balance_after, Decimal('125.00'))
+
+    def test_single_statement(self):
+        with self.assertNumQueries(1 if wallet._supports_returning() else 2):
+            wallet.debit(self.user, Decimal('1.00'))
+
+    def test_rejects_non_positive_amounts(self):
+        with self.assertRaises(ValueError):
+            wallet.debit(self.user, Decimal('0'))
+        with self.assertRaises(ValueError):
+            wallet.credit(self.user, Decimal('-5'))
+
+
+@pytest.mark.slow
+class WalletConcurrencyTestCase(TransactionTestCase):
+    """
+    Стресс-тест конкурентных списаний с одного счета.
+
+    Сравнивает условный UPDATE с прежней схемой чтение-изменение-запись
+    (с блокировкой строки, иначе она теряет обновления).
+    """
+
+    THREADS = 8
+    ATTEMPTS_PER_THREAD = 25
+    AMOUNT = Decimal('1.00')
+    INITIAL_BALANCE = Decimal('150.00')
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='stress@example.com',
+            username='stressuser',
+            password='testpassword'
+        )
+
+    def _reset_balance(self):
+        User.objects.filter(pk=self.user.pk).update(balance=self.INITIAL_BALANCE)
+
+    def _run(self, debit_once):
+        successes = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(self.THREADS)
+
+        def worker():
+            user = User.objects.get(pk=self.user.pk)
+            barrier.wait()
+            count = 0
+            for _ in range(self.ATTEMPTS_PER_THREAD):
+                while True:
+                    try:
+                        if debit_once(user):
+                            count += 1
+                        break
+                    except OperationalError:
+                        # SQLite сериализует писателей блокировкой всей базы
+                        time.sleep(0.001)
+            with lock:
+                successes.append(count)
+            connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sum(successes), time.perf_counter() - started
+
+    def _wallet_debit(self, user):
+        try:
+            wallet.debit(user, self.AMOUNT)
+            return True
+        except wallet.InsufficientFundsError:
+            return False
+
+    def _locked_read_modify_write(self, user):
+        with transaction.atomic():
+            locked = User.objects.select_for_update().get(pk=user.pk)
+            if locked.balance < self.AMOUNT:
+                return False
+            locked.balance -= self.AMOUNT
+            locked.save()
+            return True
+
+    def test_no_lost_updates_under_contention(self):
+        expected_successes = int(self.INITIAL_BALANCE / self.AMOUNT)
+
+        self._reset_balance()
+        successes, _ = self._run(self._wallet_debit)
+        balance = User.objects.get(pk=self.user.pk).balance
+        self.assertEqual(successes, expected_successes)
+        self.assertEqual(balance, Decimal('0.00'))
+
+        self._reset_balance()
+        baseline_successes, _ = self._run(self._locked_read_modify_write)
+        self.assertEqual(baseline_successes, expected_successes)
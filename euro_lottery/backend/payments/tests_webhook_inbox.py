@@ -0,0 +1,170 @@
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from unittest.mock import patch
+from decimal import Decimal
+from io import StringIO
+import hashlib
+import hmac
+import json
+import time
+
+from .integrations.factory import reset_payment_processors
+from .models import Transaction, PaymentProvider, DepositTransaction, WebhookEvent
+from . import webhooks
+
+User = get_user_model()
+
+WEBHOOK_SECRET = 'whsec_test'
+
+
+def _stripe_signature(payload, secret=WEBHOOK_SECRET):
+    timestamp = int(time.time())
+    signed = hmac.new(secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signed}"
+
+
+class StubProcessor:
+    """Провайдер, который падает на заданных событиях заданное число раз"""
+
+    def __init__(self, failures=None):
+        self.failures = dict(failures or {})
+        self.handled = []
+
+    def handle_webhook_event(self, event_type, event_data):
+        key = (event_type, event_data.get('id'))
+        if self.failures.get(key):
+            self.failures[key] -= 1
+            raise RuntimeError('provider unavailable')
+        self.handled.append(key)
+        return True
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True, STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET)
+class WebhookInboxTestCase(TestCase):
+    """Тестирование входящей очереди вебхуков"""
+
+    def setUp(self):
+        reset_payment_processors()
+        self.addCleanup(reset_payment_processors)
+        self.user = User.objects.create_user(
+            username='testuser', email='test@example.com', password='testpassword123',
+            balance=Decimal('100.00')
+        )
+        self.provider = PaymentProvider.objects.create(name='Stripe', provider_type='stripe')
+
+    def _deposit(self, provider_id, amount='25.00'):
+        trans = Transaction.objects.create(
+            user=self.user, transaction_type='deposit', amount=Decimal(amount),
+            balance_before=Decimal('100.00'), balance_after=Decimal('100.00'),
+            status='pending', description='Deposit'
+        )
+        return DepositTransaction.objects.create(
+            user=self.user, amount=Decimal(amount), payment_provider=self.provider,
+            provider_transaction_id=provider_id, transaction=trans
+        )
+
+    def _stripe_body(self, event_id, event_type, payment_id):
+        # Отступы и порядок ключей отличаются от json.dumps разобранного тела
+        return json.dumps({
+            'type': event_type,
+            'id': event_id,
+            'object': 'event',
+            'created': int(time.time()),
+            'data': {'object': {'object': 'payment_intent', 'id': payment_id}},
+        }, indent=2)
+
+    def _post(self, body, signature):
+        return self.client.post(
+            reverse('stripe-webhook'), data=body, content_type='application/json',
+            HTTP_STRIPE_SIGNATURE=signature
+        )
+
+    def _record(self, event_id, event_type, payment_id):
+        data = {'id': event_id, 'type': event_type, 'data': {'id': payment_id}}
+        event, _ = webhooks.record_event('stripe', data, json.dumps(data).encode())
+        return event
+
+    def _stub_provider(self, processor):
+        patcher = patch('payments.integrations.factory.get_payment_processor', return_value=processor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_signed_raw_body_stored_and_applied(self):
+        """Подпись проверяется по исходному телу, событие применяется после ответа"""
+        deposit = self._deposit('pi_1')
+        body = self._stripe_body('evt_1', 'payment_intent.succeeded', 'pi_1')
+
+        response = self._post(body, _stripe_signature('{"tampered": true}'))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self._post(body, _stripe_signature(body))
+        self.assertEqual(response.status_code, 200)
+
+        event = WebhookEvent.objects.get()
+        self.assertEqual((event.event_id, event.payment_id, event.status), ('evt_1', 'pi_1', 'processed'))
+        self.assertEqual(event.raw_body, body)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, Decimal('125.00'))
+        deposit.transaction.refresh_from_db()
+        self.assertEqual(deposit.transaction.status, 'completed')
+        self.assertEqual(deposit.transaction.balance_after, Decimal('125.00'))
+
+    def test_redelivered_event_stored_once(self):
+        """Повторная доставка подтверждается, но не сохраняется и не зачисляется"""
+        self._deposit('pi_1')
+        body = self._stripe_body('evt_1', 'payment_intent.succeeded', 'pi_1')
+
+        for _ in range(3):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(self._post(body, _stripe_signature(body)).status_code, 200)
+
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, Decimal('125.00'))
+
+    def test_events_of_payment_applied_in_order_with_retry(self):
+        """Событие ждет неприменённое предыдущее событие того же платежа"""
+        processor = StubProcessor({('payment_intent.processing', 'pi_1'): 1})
+        self._stub_provider(processor)
+        first = self._record('evt_1', 'payment_intent.processing', 'pi_1')
+        self._record('evt_2', 'payment_intent.succeeded', 'pi_1')
+        self._record('evt_3', 'payment_intent.succeeded', 'pi_2')
+
+        self.assertEqual(webhooks.process_pending_events(), 1)
+        self.assertEqual(processor.handled, [('payment_intent.succeeded', 'pi_2')])
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.attempts), ('pending', 1))
+        self.assertGreater(first.next_attempt_at, timezone.now())
+
+        # Пауза перед повтором вышла
+        WebhookEvent.objects.filter(pk=first.pk).update(next_attempt_at=timezone.now())
+        WebhookEvent.objects.filter(status='pending').update(lease_expires_at=None)
+        self.assertEqual(webhooks.process_pending_events(), 2)
+        self.assertEqual(processor.handled[1:], [
+            ('payment_intent.processing', 'pi_1'), ('payment_intent.succeeded', 'pi_1')
+        ])
+        self.assertFalse(WebhookEvent.objects.exclude(status='processed').exists())
+
+    @override_settings(WEBHOOK_SETTINGS={'MAX_ATTEMPTS': 1})
+    def test_failed_event_replayed_by_command(self):
+        """После исчерпания попыток событие помечается failed и переигрывается командой"""
+        processor = StubProcessor({('payment_intent.succeeded', 'pi_1'): 1})
+        self._stub_provider(processor)
+        event = self._record('evt_1', 'payment_intent.succeeded', 'pi_1')
+
+        self.assertEqual(webhooks.process_pending_events(), 0)
+        event.refresh_from_db()
+        self.assertEqual(event.status, 'failed')
+        self.assertIn('provider unavailable', event.last_error)
+
+        out = StringIO()
+        call_command('replay_webhooks', '--provider', 'stripe', '--process', stdout=out)
+        self.assertIn('Re-queued 1', out.getvalue())
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), ('processed', 1))
+        self.assertEqual(processor.handled, [('payment_intent.succeeded', 'pi_1')])
@@ -0,0 +1,169 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+from unittest.mock import patch
+from decimal import Decimal
+import datetime
+
+from lottery.models import LotteryGame, Draw, Ticket, PrizeCategory, WinningTicket
+from .models import Transaction
+from .payouts import claim_winnings, credit_pending_winnings, credit_winnings_chunk
+from .tasks import process_lottery_winnings
+
+User = get_user_model()
+
+
+class WinningsPayoutTestCase(TestCase):
+    """Тестирование пакетного зачисления выигрышей"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user(
+            username='alice', email='alice@example.com', password='testpassword123',
+            balance=Decimal('10.00')
+        )
+        self.bob = User.objects.create_user(
+            username='bob', email='bob@example.com', password='testpassword123',
+            balance=Decimal('0.00')
+        )
+        self.lottery_game = LotteryGame.objects.create(
+            name="Test Lottery",
+            main_numbers_count=5,
+            main_numbers_range=50,
+            extra_numbers_count=2,
+            extra_numbers_range=12,
+            ticket_price=Decimal('2.50'),
+            draw_days="Tuesday,Friday",
+            draw_time="20:00:00",
+        )
+        self.draw = Draw.objects.create(
+            lottery_game=self.lottery_game,
+            draw_number=1,
+            draw_date=timezone.now() - datetime.timedelta(hours=1),
+            jackpot_amount=Decimal('1000000.00'),
+            status='completed',
+        )
+        self.category = PrizeCategory.objects.create(
+            lottery_game=self.lottery_game,
+            name="2+0",
+            main_numbers_matched=2,
+            extra_numbers_matched=0,
+            odds="1:22",
+            prize_type='fixed',
+            fixed_amount=Decimal('5.00')
+        )
+
+    def _winning(self, user, amount):
+        ticket = Ticket.objects.create(
+            user=user, draw=self.draw, main_numbers=[1, 2, 3, 4, 5], extra_numbers=[1, 2],
+            price=Decimal('2.50'), result_status='winning', winning_amount=Decimal(amount)
+        )
+        return WinningTicket.objects.create(
+            ticket=ticket, prize_category=self.category, amount=Decimal(amount),
+            main_numbers_matched=2
+        )
+
+    def test_winnings_credited_with_running_balances(self):
+        """Баланс увеличивается один раз на пользователя, история баланса последовательна"""
+        first = self._winning(self.alice, '5.00')
+        second = self._winning(self.alice, '7.50')
+        third = self._winning(self.bob, '3.00')
+
+        self.assertEqual(process_lottery_winnings(), 3)
+
+        self.alice.refresh_from_db()
+        self.bob.refresh_from_db()
+        self.assertEqual(self.alice.balance, Decimal('22.50'))
+        self.assertEqual(self.bob.balance, Decimal('3.00'))
+
+        ledger = {t.related_winning_id: t for t in Transaction.objects.filter(transaction_type='winning')}
+        self.assertEqual(
+            (ledger[first.id].balance_before, ledger[first.id].balance_after),
+            (Decimal('10.00'), Decimal('15.00'))
+        )
+        self.assertEqual(
+            (ledger[second.id].balance_before, ledger[second.id].balance_after),
+            (Decimal('15.00'), Decimal('22.50'))
+        )
+        self.assertEqual(ledger[third.id].balance_after, Decimal('3.00'))
+
+        for winning in (first, second, third):
+            winning.refresh_from_db()
+            self.assertEqual(winning.payment_status, 'paid')
+            self.assertEqual(winning.ticket.result_status, 'paid')
+            self.assertEqual(winning.payment_reference, str(ledger[winning.id].transaction_id))
+            self.assertEqual(ledger[winning.id].status, 'completed')
+
+        # Повторный запуск ничего не зачисляет
+        self.assertEqual(process_lottery_winnings(), 0)
+        self.alice.refresh_from_db()
+        self.assertEqual(self.alice.balance, Decimal('22.50'))
+
+    def test_chunks_and_claims(self):
+        """Выигрыши зачисляются пачками, захваченные другим воркером пропускаются"""
+        winnings = [self._winning(self.bob, '1.00') for _ in range(5)]
+        self.assertEqual(claim_winnings(WinningTicket.objects.all(), 2, 'worker-a'), [w.id for w in winnings[:2]])
+
+        # Перевод крупных выигрышей на проверку, затем на пачку постоянное
+        # число запросов: захват (3), точка сохранения, блокировка, выборка
+        # с оконной суммой, обновление и чтение балансов, вставка проводок,
+        # обновление выигрышей и билетов, освобождение точки; пустой захват
+        with self.assertNumQueries(1 + 2 * 12 + 1):
+            paid = credit_pending_winnings(chunk_size=2)
+        self.assertEqual(paid, 3)
+        self.bob.refresh_from_db()
+        self.assertEqual(self.bob.balance, Decimal('3.00'))
+
+        # Захват умершего воркера перехватывается после истечения
+        later = timezone.now() + datetime.timedelta(hours=1)
+        self.assertEqual(
+            claim_winnings(WinningTicket.objects.all(), 10, 'worker-b', now=later),
+            [w.id for w in winnings[:2]]
+        )
+
+    def test_failed_chunk_is_returned(self):
+        """При ошибке пачка не зачисляется и возвращается в ожидание"""
+        winning = self._winning(self.bob, '4.00')
+        with patch('payments.payouts.Transaction.objects.bulk_create', side_effect=RuntimeError('boom')):
+            self.assertEqual(process_lottery_winnings(), 0)
+
+        winning.refresh_from_db()
+        self.bob.refresh_from_db()
+        self.assertEqual(winning.payment_status, 'pending')
+        self.assertEqual(self.bob.balance, Decimal('0.00'))
+        self.assertEqual(process_lottery_winnings(), 1)
+
+    def test_large_prizes_wait_for_verification(self):
+        """Крупный выигрыш без проверки администратора уходит на удержание"""
+        small = self._winning(self.bob, '5.00')
+        large = self._winning(self.alice, '1000.00')
+
+        self.assertEqual(process_lottery_winnings(), 1)
+        large.refresh_from_db()
+        small.refresh_from_db()
+        self.assertEqual((small.payment_status, large.payment_status), ('paid', 'on_hold'))
+        self.assertEqual(large.ticket.result_status, 'winning')
+        self.alice.refresh_from_db()
+        self.assertEqual(self.alice.balance, Decimal('10.00'))
+
+        # После проверки выигрыш выплачивается
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='adminpassword123'
+        )
+        WinningTicket.objects.filter(pk=large.pk).update(verified_by=admin)
+        self.assertEqual(process_lottery_winnings(), 1)
+        self.alice.refresh_from_db()
+        self.assertEqual(self.alice.balance, Decimal('1010.00'))
+
+    def test_taken_over_claim_is_not_credited(self):
+        """Пачку, перехваченную другим воркером, прежний владелец не зачисляет"""
+        winning = self._winning(self.bob, '2.00')
+        pks = claim_winnings(WinningTicket.objects.all(), 10, 'worker-a')
+
+        later = timezone.now() + datetime.timedelta(hours=1)
+        self.assertEqual(claim_winnings(WinningTicket.objects.all(), 10, 'worker-b', now=later), pks)
+        self.assertEqual(credit_winnings_chunk(pks, 'worker-a'), 0)
+        self.assertEqual(credit_winnings_chunk(pks, 'worker-b'), 1)
+
+        self.bob.refresh_from_db()
+        self.assertEqual(self.bob.balance, Decimal('2.00'))
+        self.assertEqual(Transaction.objects.filter(related_winning_id=winning.id).count(), 1)
@@ -0,0 +1,149 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+from unittest.mock import patch
+from decimal import Decimal
+import datetime
+
+from lottery_core import leases
+from .models import Transaction, PaymentMethod, PaymentProvider, DepositTransaction, WithdrawalRequest
+from .integrations.stripe_integration import StripePaymentProcessor
+from .tasks import check_pending_deposits, process_withdrawal_requests, _process_withdrawal_batch
+
+User = get_user_model()
+
+
+class WorkClaimingTestCase(TestCase):
+    """Тестирование захвата работы периодическими задачами через аренду строк"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser', email='test@example.com', password='testpassword123',
+            balance=Decimal('100.00')
+        )
+        self.payment_method = PaymentMethod.objects.create(
+            user=self.user, method_type='bank_account', is_verified=True
+        )
+        self.provider = PaymentProvider.objects.create(name='Stripe', provider_type='stripe')
+
+    def _withdrawal(self, amount='10.00'):
+        trans = Transaction.objects.create(
+            user=self.user, transaction_type='withdrawal', amount=Decimal(amount),
+            balance_before=Decimal('100.00'), balance_after=Decimal('100.00'),
+            status='pending', description='Withdrawal'
+        )
+        return WithdrawalRequest.objects.create(
+            user=self.user, amount=Decimal(amount), payment_method=self.payment_method,
+            status='approved', transaction=trans
+        )
+
+    def _deposit(self, provider_id):
+        trans = Transaction.objects.create(
+            user=self.user, transaction_type='deposit', amount=Decimal('50.00'),
+            balance_before=Decimal('100.00'), balance_after=Decimal('100.00'),
+            status='pending', description='Deposit'
+        )
+        return DepositTransaction.objects.create(
+            user=self.user, amount=Decimal('50.00'), payment_provider=self.provider,
+            provider_transaction_id=provider_id, transaction=trans
+        )
+
+    def test_workers_claim_disjoint_batches(self):
+        """Воркеры получают непересекающиеся пачки, истекшая аренда перехватывается"""
+        ids = [self._withdrawal().id for _ in range(5)]
+        queryset = WithdrawalRequest.objects.filter(status='approved')
+
+        first = leases.claim(queryset, 3, 'worker-a')
+        second = leases.claim(queryset, 3, 'worker-b')
+        self.assertEqual(first, ids[:3])
+        self.assertEqual(second, ids[3:])
+        self.assertEqual(leases.claim(queryset, 3, 'worker-c'), [])
+
+        later = timezone.now() + datetime.timedelta(hours=1)
+        self.assertEqual(leases.claim(queryset, 10, 'worker-c', now=later), ids)
+
+    def test_release_makes_rows_claimable(self):
+        """Освобожденные владельцем строки сразу доступны другим"""
+        withdrawal = self._withdrawal()
+        queryset = WithdrawalRequest.objects.all()
+        leases.claim(queryset, 1, 'worker-a')
+
+        self.assertEqual(leases.release(WithdrawalRequest, [withdrawal.id], 'worker-b'), 0)
+        self.assertEqual(leases.release(WithdrawalRequest, [withdrawal.id], 'worker-a'), 1)
+        self.assertEqual(leases.claim(queryset, 1, 'worker-b'), [withdrawal.id])
+
+    def test_drain_processes_batches_once(self):
+        """drain обрабатывает все строки пачками и один раз сообщает о полной пачке"""
+        for _ in range(5):
+            self._withdrawal()
+        batches = []
+        full_batch_calls = []
+
+        processed = leases.drain(
+            WithdrawalRequest.objects.all(),
+            lambda pks: batches.append(pks) or len(pks),
+            batch_size=2,
+            on_full_batch=lambda: full_batch_calls.append(True),
+        )
+        self.assertEqual(processed, 5)
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertEqual(len(full_batch_calls), 1)
+        # Аренда держится после обработки: повторный проход ничего не берет
+        self.assertEqual(leases.drain(WithdrawalRequest.objects.all(), len), 0)
+
+    def test_withdrawals_processed_once(self):
+        """Одобренные выводы обрабатываются один раз"""
+        withdrawals = [self._withdrawal() for _ in range(3)]
+        self.assertEqual(process_withdrawal_requests(), 3)
+        self.assertEqual(process_withdrawal_requests(), 0)
+        for withdrawal in withdrawals:
+            withdrawal.refresh_from_db()
+            self.assertEqual(withdrawal.status, 'completed')
+            self.assertEqual(withdrawal.transaction.status, 'completed')
+
+    def test_overrun_batch_skips_taken_over_withdrawals(self):
+        """Пачка, пережившая аренду, не выплачивает выводы, перехваченные другим воркером"""
+        withdrawals = [self._withdrawal() for _ in range(2)]
+        queryset = WithdrawalRequest.objects.filter(status='approved')
+        ids = leases.claim(queryset, 10, 'worker-a')
+
+        # Аренда истекла, второй вывод захватил другой воркер
+        later = timezone.now() + datetime.timedelta(hours=1)
+        self.assertEqual(
+            leases.claim(queryset.filter(pk=withdrawals[1].pk), 10, 'worker-b', now=later), [withdrawals[1].id]
+        )
+
+        with patch('payments.tasks.process_withdrawal_by_method', return_value={'success': True}) as payout:
+            self.assertEqual(_process_withdrawal_batch(ids, 'worker-a'), 1)
+            self.assertEqual(_process_withdrawal_batch([withdrawals[1].id], 'worker-b'), 1)
+            # Вывод, уже выплаченный другим воркером, не повторяется
+            self.assertEqual(_process_withdrawal_batch(ids, 'worker-b'), 0)
+        self.assertEqual([call.args[0].id for call in payout.call_args_list], [w.id for w in withdrawals])
+
+    @patch.object(StripePaymentProcessor, 'get_payment_status')
+    def test_pending_deposit_rechecked_after_lease(self, mock_status):
+        """Неподтвержденный депозит проверяется снова только после истечения аренды"""
+        settled = self._deposit('pi_settled')
+        waiting = self._deposit('pi_waiting')
+        self._deposit('')
+        mock_status.side_effect = lambda payment_id: {
+            'id': payment_id,
+            'success': True,
+            'status': 'succeeded' if payment_id == 'pi_settled' else 'processing',
+        }
+
+        self.assertEqual(check_pending_deposits(), {'updated': 1})
+        self.assertEqual(mock_status.call_count, 2)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, Decimal('150.00'))
+
+        check_pending_deposits()
+        self.assertEqual(mock_status.call_count, 2)
+
+        DepositTransaction.objects.filter(pk=waiting.pk).update(
+            lease_expires_at=timezone.now() - datetime.timedelta(seconds=1)
+        )
+        check_pending_deposits()
+        self.assertEqual(mock_status.call_count, 3)
+        settled.transaction.refresh_from_db()
+        self.assertEqual(settled.transaction.status, 'completed')
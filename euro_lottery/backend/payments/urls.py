@@ -29,4 +29,7 @@ urlpatterns = [
     
     # API для получения доступных методов оплаты
     path('methods/', views.PaymentMethodsAPIView.as_view(), name='payment-methods-api'),
+    
+    # Состояние платежных провайдеров для мониторинга
+    path('providers/health/', views.ProviderHealthView.as_view(), name='provider-health'),
 ]
\ No newline at end of file
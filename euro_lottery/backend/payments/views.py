@@ -23,12 +23,18 @@ from .serializers import (
     AddCryptoWalletSerializer
 )
 from users.models import UserActivity
+from . import wallet, outbox, provider_health
+from lottery_core.idempotency import idempotent
+from lottery_core.pagination import KeysetPagination
+from lottery.utils.client_ip import get_client_ip
 
 
 class TransactionListView(generics.ListAPIView):
     """Представление для списка транзакций пользователя"""
     permission_classes = (permissions.IsAuthenticated,)
     serializer_class = TransactionSerializer
+    pagination_class = KeysetPagination
+    keyset_field = 'created_at'
     
     def get_queryset(self):
         queryset = Transaction.objects.filter(user=self.request.user).order_by('-created_at')
@@ -152,7 +158,7 @@ class AddPaymentMethodView(APIView):
             UserActivity.objects.create(
                 user=user,
                 activity_type='add_payment_method',
-                ip_address=self._get_client_ip(request),
+                ip_address=get_client_ip(request),
                 user_agent=request.META.get('HTTP_USER_AGENT', ''),
                 details={'method_type': 'credit_card', 'card_brand': card_info.card.brand}
             )
@@ -203,7 +209,7 @@ class AddPaymentMethodView(APIView):
         UserActivity.objects.create(
             user=user,
             activity_type='add_payment_method',
-            ip_address=self._get_client_ip(request),
+            ip_address=get_client_ip(request),
             user_agent=request.META.get('HTTP_USER_AGENT', ''),
             details={'method_type': 'bank_account', 'bank_name': bank_name}
         )
@@ -236,7 +242,7 @@ class AddPaymentMethodView(APIView):
         UserActivity.objects.create(
             user=user,
             activity_type='add_payment_method',
-            ip_address=self._get_client_ip(request),
+            ip_address=get_client_ip(request),
             user_agent=request.META.get('HTTP_USER_AGENT', ''),
             details={'method_type': 'e_wallet', 'provider': e_wallet_provider}
         )
@@ -280,7 +286,7 @@ class AddPaymentMethodView(APIView):
         UserActivity.objects.create(
             user=user,
             activity_type='add_payment_method',
-            ip_address=self._get_client_ip(request),
+            ip_address=get_client_ip(request),
             user_agent=request.META.get('HTTP_USER_AGENT', ''),
             details={
                 'method_type': 'crypto_wallet', 
@@ -325,14 +331,6 @@ class AddPaymentMethodView(APIView):
         data = f"{account_number}:{routing_number}:{account_holder_name}"
         token = base64.b64encode(data.encode()).decode()
         return token
-    
-    def _get_client_ip(self, request):
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = request.META.get('REMOTE_ADDR')
-        return ip
 
 
 class DeletePaymentMethodView(generics.DestroyAPIView):
@@ -347,21 +345,13 @@ class DeletePaymentMethodView(generics.DestroyAPIView):
         UserActivity.objects.create(
             user=self.request.user,
             activity_type='delete_payment_method',
-            ip_address=self._get_client_ip(self.request),
+            ip_address=get_client_ip(self.request),
             user_agent=self.request.META.get('HTTP_USER_AGENT', ''),
             details={'method_type': instance.method_type, 'id': instance.id}
         )
         
         # Удаление метода оплаты
         instance.delete()
-    
-    def _get_client_ip(self, request):
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = request.META.get('REMOTE_ADDR')
-        return ip
 
 
 class SetDefaultPaymentMethodView(APIView):
@@ -383,7 +373,7 @@ class SetDefaultPaymentMethodView(APIView):
             UserActivity.objects.create(
                 user=request.user,
                 activity_type='set_default_payment_method',
-                ip_address=self._get_client_ip(request),
+                ip_address=get_client_ip(request),
                 user_agent=request.META.get('HTTP_USER_AGENT', ''),
                 details={'method_type': payment_method.method_type, 'id': payment_method.id}
             )
@@ -398,21 +388,19 @@ class SetDefaultPaymentMethodView(APIView):
                 {"error": "Payment method not found"},
                 status=status.HTTP_404_NOT_FOUND
             )
-    
-    def _get_client_ip(self, request):
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = request.META.get('REMOTE_ADDR')
-        return ip
 
 
 class InitiateDepositView(APIView):
-    """Представление для инициации депозита"""
+    """
+    Представление для инициации депозита
+    
+    Платеж у провайдера создается вне транзакции БД: сначала короткая
+    транзакция сохраняет депозит и запись outbox, затем идет вызов
+    провайдера, затем вторая короткая транзакция применяет результат.
+    """
     permission_classes = (permissions.IsAuthenticated,)
     
-    @transaction.atomic
+    @idempotent('payments.initiate_deposit')
     def post(self, request):
         serializer = InitiateDepositSerializer(data=request.data)
         if not serializer.is_valid():
@@ -443,29 +431,52 @@ class InitiateDepositView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
         
-        # Создание транзакции
-        transaction = Transaction.objects.create(
-            user=user,
-            transaction_type='deposit',
-            amount=amount,
-            balance_before=user.balance,
-            balance_after=user.balance,  # Будет обновлено после подтверждения
-            status='pending',
-            description=f"Deposit of {amount} via {payment_provider.name}",
-            payment_method=payment_method
-        )
+        # Провайдер с разомкнутым автоматом не вызываем: предлагаем или выбираем другой
+        if not provider_health.allow_request(payment_provider.provider_type):
+            alternatives = provider_health.suggest_alternatives(payment_provider, amount)
+            failover = serializer.validated_data.get('allow_failover') or provider_health.auto_failover()
+            # Выбранный провайдер тоже проходит проверку: в полуоткрытом состоянии пропускается один пробный вызов
+            chosen = next(
+                (provider for provider in alternatives if provider_health.allow_request(provider.provider_type)), None
+            ) if failover else None
+            if chosen is None:
+                return Response({
+                    "error": "Payment provider is temporarily unavailable",
+                    "alternatives": [
+                        {'id': provider.id, 'name': provider.name, 'provider_type': provider.provider_type}
+                        for provider in alternatives
+                    ]
+                }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            
+            payment_provider = chosen
+            # Сохраненный метод оплаты относится к прежнему провайдеру
+            payment_method = None
         
-        # Создание депозитной транзакции
-        deposit = DepositTransaction.objects.create(
-            user=user,
-            amount=amount,
-            payment_provider=payment_provider,
-            payment_method=payment_method,
-            transaction=transaction
-        )
+        # Короткая транзакция: депозит и запись о предстоящем вызове провайдера
+        with transaction.atomic():
+            trans = Transaction.objects.create(
+                user=user,
+                transaction_type='deposit',
+                amount=amount,
+                balance_before=user.balance,
+                balance_after=user.balance,  # Будет обновлено после подтверждения
+                status='pending',
+                description=f"Deposit of {amount} via {payment_provider.name}",
+                payment_method=payment_method
+            )
+            
+            deposit = DepositTransaction.objects.create(
+                user=user,
+                amount=amount,
+                payment_provider=payment_provider,
+                payment_method=payment_method,
+                transaction=trans
+            )
+            
+            call = outbox.open_call(deposit, 'create', {'amount': str(amount)})
         
+        # Вызов провайдера без открытой транзакции
         try:
-            # Используем фабрику для получения нужного процессора платежей
             from payments.integrations.factory import get_payment_processor
             
             payment_processor = get_payment_processor(payment_provider.provider_type)
@@ -473,87 +484,96 @@ class InitiateDepositView(APIView):
             # Метаданные для платежа
             metadata = {
                 "deposit_id": deposit.id,
-                "transaction_id": str(deposit.transaction.transaction_id),
-                "user_id": deposit.user.id
+                "transaction_id": str(trans.transaction_id),
+                "user_id": user.id
             }
             
-            # Создаем платеж через общий интерфейс
-            payment_result = payment_processor.create_payment(
+            payment_result = provider_health.call(
+                payment_provider.provider_type, payment_processor.create_payment,
                 amount=deposit.amount,
                 description=f"Deposit to Euro Lottery account",
                 metadata=metadata
             )
+        except Exception as e:
+            payment_result = {'error': str(e), 'success': False}
+        
+        error = outbox.provider_error(payment_result)
+        
+        # Вторая короткая транзакция: применяем результат
+        with transaction.atomic():
+            outbox.close_call(call, payment_result)
             
-            if not payment_result.get('success', False) and 'error' in payment_result:
-                # Обработка ошибки
-                raise ValueError(payment_result.get('error', 'Unknown payment error'))
-            
-            # Обновляем информацию о депозите
-            deposit.provider_transaction_id = payment_result.get('id')
-            deposit.provider_status = payment_result.get('status', 'pending')
-            deposit.provider_response = payment_result
-            deposit.save()
-            
-            # Регистрация активности пользователя
-            UserActivity.objects.create(
-                user=request.user,
-                activity_type='initiate_deposit',
-                ip_address=self._get_client_ip(request),
-                user_agent=request.META.get('HTTP_USER_AGENT', ''),
-                details={
-                    'amount': str(deposit.amount),
-                    'provider': payment_provider.provider_type,
-                    'transaction_id': str(deposit.transaction.transaction_id)
-                }
-            )
-            
-            # Формируем ответ в зависимости от провайдера
-            if payment_provider.provider_type == 'stripe':
-                return Response({
-                    'client_secret': payment_result.get('client_secret'),
-                    'transaction_id': deposit.transaction.transaction_id
-                })
-            elif payment_provider.provider_type == 'paypal':
-                return Response({
-                    'redirect_url': payment_result.get('approval_url'),
-                    'transaction_id': deposit.transaction.transaction_id
-                })
+            if error:
+                trans.status = 'failed'
+                trans.description = f"Failed deposit: {error}"
+                trans.save(update_fields=['status', 'description', 'updated_at'])
+                
+                deposit.provider_status = 'failed'
+                deposit.provider_response = {'error': error}
+                deposit.save()
             else:
-                # Общий случай
-                return Response({
-                    'payment_data': payment_result,
-                    'transaction_id': deposit.transaction.transaction_id
-                })
+                deposit.provider_transaction_id = payment_result.get('id')
+                deposit.provider_status = payment_result.get('status', 'pending')
+                deposit.provider_response = call.response
+                deposit.save()
                 
-        except Exception as e:
-            # Обработка любых ошибок
-            deposit.transaction.status = 'failed'
-            deposit.transaction.description = f"Failed deposit: {str(e)}"
-            deposit.transaction.save()
-            
-            deposit.provider_status = 'failed'
-            deposit.provider_response = {'error': str(e)}
-            deposit.save()
-            
+                # Регистрация активности пользователя
+                UserActivity.objects.create(
+                    user=request.user,
+                    activity_type='initiate_deposit',
+                    ip_address=get_client_ip(request),
+                    user_agent=request.META.get('HTTP_USER_AGENT', ''),
+                    details={
+                        'amount': str(deposit.amount),
+                        'provider': payment_provider.provider_type,
+                        'transaction_id': str(trans.transaction_id)
+                    }
+                )
+        
+        if error:
             return Response(
-                {"error": str(e)},
+                {"error": error},
                 status=status.HTTP_400_BAD_REQUEST
             )
-    
-    def _get_client_ip(self, request):
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
+        
+        # Формируем ответ в зависимости от провайдера
+        if payment_provider.provider_type == 'stripe':
+            return Response({
+                'client_secret': payment_result.get('client_secret'),
+                'transaction_id': trans.transaction_id
+            })
+        elif payment_provider.provider_type == 'paypal':
+            return Response({
+                'redirect_url': payment_result.get('approval_url'),
+                'transaction_id': trans.transaction_id
+            })
         else:
-            ip = request.META.get('REMOTE_ADDR')
-        return ip
+            # Общий случай
+            return Response({
+                'payment_data': payment_result,
+                'transaction_id': trans.transaction_id
+            })
+
+
+def _settled_deposit_response(trans):
+    """Ответ, если депозит закрыли, пока шел вызов провайдера"""
+    return Response({
+        'message': f"Deposit is already {trans.status}",
+        'status': trans.status,
+        'transaction_id': trans.transaction_id
+    })
 
 
 class ConfirmDepositView(APIView):
-    """Представление для подтверждения депозита"""
+    """
+    Представление для подтверждения депозита
+    
+    Подтверждение у провайдера идет вне транзакции БД; результат
+    применяется в короткой транзакции с блокировкой строки, только если
+    депозит все еще ожидает оплаты.
+    """
     permission_classes = (permissions.IsAuthenticated,)
     
-    @transaction.atomic
     def post(self, request):
         transaction_id = request.data.get('transaction_id')
         payment_data = request.data
@@ -566,7 +586,7 @@ class ConfirmDepositView(APIView):
         
         try:
             # Получение транзакции
-            transaction = Transaction.objects.get(
+            trans = Transaction.objects.get(
                 transaction_id=transaction_id,
                 user=request.user,
                 transaction_type='deposit',
@@ -574,136 +594,135 @@ class ConfirmDepositView(APIView):
             )
             
             # Получение депозитной транзакции
-            deposit = DepositTransaction.objects.get(transaction=transaction)
-            
-            # Используем фабрику для получения нужного процессора платежей
+            deposit = DepositTransaction.objects.select_related('payment_provider').get(transaction=trans)
+        except Transaction.DoesNotExist:
+            return Response(
+                {"error": "Transaction not found"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        except DepositTransaction.DoesNotExist:
+            return Response(
+                {"error": "Deposit transaction not found"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        provider_type = deposit.payment_provider.provider_type
+        
+        # Получаем ID платежа в зависимости от провайдера
+        if provider_type == 'stripe':
+            payment_id = payment_data.get('payment_intent_id', deposit.provider_transaction_id)
+        elif provider_type == 'paypal':
+            payment_id = payment_data.get('paypal_order_id', deposit.provider_transaction_id)
+        else:
+            payment_id = deposit.provider_transaction_id
+        
+        call = outbox.open_call(deposit, 'confirm', {'payment_id': payment_id})
+        
+        # Подтверждаем платеж у провайдера без открытой транзакции
+        try:
             from payments.integrations.factory import get_payment_processor
             
-            payment_processor = get_payment_processor(deposit.payment_provider.provider_type)
-            
-            # Получаем ID платежа в зависимости от провайдера
-            if deposit.payment_provider.provider_type == 'stripe':
-                payment_id = payment_data.get('payment_intent_id', deposit.provider_transaction_id)
-            elif deposit.payment_provider.provider_type == 'paypal':
-                payment_id = payment_data.get('paypal_order_id', deposit.provider_transaction_id)
-            else:
-                payment_id = deposit.provider_transaction_id
-            
-            # Подтверждаем платеж через интерфейс
-            payment_result = payment_processor.confirm_payment(payment_id, payment_data)
+            payment_processor = get_payment_processor(provider_type)
+            payment_result = provider_health.call(
+                provider_type, payment_processor.confirm_payment, payment_id, payment_data
+            )
+        except Exception as e:
+            payment_result = {'error': str(e), 'success': False}
+        
+        error = outbox.provider_error(payment_result)
+        payment_status = (payment_result.get('status') or '').lower()
+        user = request.user
+        
+        with transaction.atomic():
+            outbox.close_call(call, payment_result)
             
-            if not payment_result.get('success', False) and 'error' in payment_result:
-                # Обработка ошибки
-                raise ValueError(payment_result.get('error', 'Payment confirmation failed'))
+            trans = outbox.lock_transaction(deposit)
+            if trans.status != 'pending':
+                # Депозит закрыт вебхуком, опросом или параллельным запросом
+                return _settled_deposit_response(trans)
             
-            # Определяем статус платежа
-            payment_status = payment_result.get('status', '').lower()
+            deposit.provider_response = call.response
             
-            if payment_status in ['succeeded', 'completed']:
+            if error:
+                deposit.provider_status = 'failed'
+                deposit.provider_response = {'error': error}
+                deposit.save()
+                
+                trans.status = 'failed'
+                trans.description = f"Failed deposit: {error}"
+                trans.save()
+                
+            elif payment_status in ['succeeded', 'completed']:
                 # Платеж успешен, обновляем транзакцию и баланс пользователя
                 deposit.provider_status = payment_status
-                deposit.provider_response = payment_result
                 deposit.completed_at = timezone.now()
                 deposit.save()
                 
-                transaction.status = 'completed'
-                
-                user = request.user
-                user.balance += deposit.amount
-                transaction.balance_after = user.balance
-                
-                transaction.save()
-                user.save()
+                balance_change = wallet.credit(user, deposit.amount)
+                trans.status = 'completed'
+                trans.balance_before = balance_change.balance_before
+                trans.balance_after = balance_change.balance_after
+                trans.save()
                 
                 # Регистрация активности пользователя
                 UserActivity.objects.create(
                     user=user,
                     activity_type='deposit_completed',
-                    ip_address=self._get_client_ip(request),
+                    ip_address=get_client_ip(request),
                     user_agent=request.META.get('HTTP_USER_AGENT', ''),
                     details={
                         'amount': str(deposit.amount),
-                        'provider': deposit.payment_provider.provider_type,
-                        'transaction_id': str(transaction.transaction_id)
+                        'provider': provider_type,
+                        'transaction_id': str(trans.transaction_id)
                     }
                 )
                 
-                return Response({
-                    'message': 'Deposit completed successfully',
-                    'transaction_id': transaction.transaction_id,
-                    'amount': deposit.amount,
-                    'new_balance': user.balance
-                })
-                
             elif payment_status in ['canceled', 'cancelled']:
                 # Платеж отменен
                 deposit.provider_status = payment_status
-                deposit.provider_response = payment_result
                 deposit.save()
                 
-                transaction.status = 'cancelled'
-                transaction.save()
-                
-                return Response({
-                    'message': 'Deposit was canceled',
-                    'transaction_id': transaction.transaction_id
-                })
+                trans.status = 'cancelled'
+                trans.save()
                 
             else:
                 # Платеж в процессе или другой статус
                 deposit.provider_status = payment_status
-                deposit.provider_response = payment_result
                 deposit.save()
-                
-                return Response({
-                    'message': 'Payment is still processing',
-                    'status': payment_status,
-                    'transaction_id': deposit.transaction.transaction_id
-                })
-                
-        except Transaction.DoesNotExist:
-            return Response(
-                {"error": "Transaction not found"},
-                status=status.HTTP_404_NOT_FOUND
-            )
-        except DepositTransaction.DoesNotExist:
-            return Response(
-                {"error": "Deposit transaction not found"},
-                status=status.HTTP_404_NOT_FOUND
-            )
-        except Exception as e:
-            # Обработка любых ошибок
-            try:
-                # Если транзакция и депозит найдены, обновляем их статус
-                deposit.provider_status = 'failed'
-                deposit.provider_response = {'error': str(e)}
-                deposit.save()
-                
-                transaction.status = 'failed'
-                transaction.description = f"Failed deposit: {str(e)}"
-                transaction.save()
-            except:
-                pass
-            
+        
+        if error:
             return Response(
-                {"error": str(e)},
+                {"error": error},
                 status=status.HTTP_400_BAD_REQUEST
             )
-    
-    def _get_client_ip(self, request):
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = request.META.get('REMOTE_ADDR')
-        return ip
+        if trans.status == 'completed':
+            return Response({
+                'message': 'Deposit completed successfully',
+                'transaction_id': trans.transaction_id,
+                'amount': deposit.amount,
+                'new_balance': user.balance
+            })
+        if trans.status == 'cancelled':
+            return Response({
+                'message': 'Deposit was canceled',
+                'transaction_id': trans.transaction_id
+            })
+        return Response({
+            'message': 'Payment is still processing',
+            'status': payment_status,
+            'transaction_id': trans.transaction_id
+        })
 
 
 class CancelDepositView(APIView):
-    """Представление для отмены депозита"""
+    """
+    Представление для отмены депозита
+    
+    Запросы к провайдеру идут вне транзакции БД, отмена применяется
+    в короткой транзакции, только если депозит все еще ожидает оплаты.
+    """
     permission_classes = (permissions.IsAuthenticated,)
     
-    @transaction.atomic
     def post(self, request):
         transaction_id = request.data.get('transaction_id')
         
@@ -715,7 +734,7 @@ class CancelDepositView(APIView):
         
         try:
             # Получение транзакции
-            transaction = Transaction.objects.get(
+            trans = Transaction.objects.get(
                 transaction_id=transaction_id,
                 user=request.user,
                 transaction_type='deposit',
@@ -723,96 +742,107 @@ class CancelDepositView(APIView):
             )
             
             # Получение депозитной транзакции
-            deposit = DepositTransaction.objects.get(transaction=transaction)
-            
-            # Используем фабрику для получения нужного процессора платежей
+            deposit = DepositTransaction.objects.select_related('payment_provider').get(transaction=trans)
+        except Transaction.DoesNotExist:
+            return Response(
+                {"error": "Transaction not found"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        except DepositTransaction.DoesNotExist:
+            return Response(
+                {"error": "Deposit transaction not found"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        call = outbox.open_call(deposit, 'cancel', {'payment_id': deposit.provider_transaction_id})
+        
+        # Запросы к провайдеру без открытой транзакции
+        try:
             from payments.integrations.factory import get_payment_processor
             
             payment_processor = get_payment_processor(deposit.payment_provider.provider_type)
             
+            provider_type = deposit.payment_provider.provider_type
+            
             # Получаем информацию о платеже
-            payment_status = payment_processor.get_payment_status(deposit.provider_transaction_id)
+            payment_status = provider_health.call(
+                provider_type, payment_processor.get_payment_status, deposit.provider_transaction_id
+            )
             
             # Попытка отменить платеж через платежную систему
+            # (отказ отменить завершенный платеж - не сбой провайдера, поэтому вне статистики)
             payment_result = payment_processor.cancel_payment(deposit.provider_transaction_id)
+        except Exception as e:
+            with transaction.atomic():
+                outbox.close_call(call, {'error': str(e), 'success': False})
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Проверяем результат
+        if not payment_result.get('success', False):
+            error_msg = payment_result.get('error', f"Cannot cancel payment with status {payment_status.get('status')}")
             
-            # Проверяем результат
-            if not payment_result.get('success', False):
-                error_msg = payment_result.get('error', f"Cannot cancel payment with status {payment_status.get('status')}")
-                
-                # Проверяем, не относится ли ошибка к уже завершенному или отмененному платежу
-                current_status = payment_status.get('status', '').lower()
-                if current_status in ['succeeded', 'completed', 'cancelled', 'canceled', 'failed']:
-                    return Response(
-                        {"error": error_msg},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                else:
-                    # Если это какая-то другая ошибка, но платеж не завершен, 
-                    # все равно отменяем его в нашей системе
-                    payment_result = {
-                        'status': 'cancelled',
-                        'success': True,
-                        'message': 'Payment cancelled locally due to: ' + error_msg
-                    }
+            # Проверяем, не относится ли ошибка к уже завершенному или отмененному платежу
+            current_status = payment_status.get('status', '').lower()
+            if current_status in ['succeeded', 'completed', 'cancelled', 'canceled', 'failed']:
+                with transaction.atomic():
+                    outbox.close_call(call, payment_result)
+                return Response(
+                    {"error": error_msg},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            else:
+                # Если это какая-то другая ошибка, но платеж не завершен, 
+                # все равно отменяем его в нашей системе
+                payment_result = {
+                    'status': 'cancelled',
+                    'success': True,
+                    'message': 'Payment cancelled locally due to: ' + error_msg
+                }
+        
+        with transaction.atomic():
+            outbox.close_call(call, payment_result)
+            
+            trans = outbox.lock_transaction(deposit)
+            if trans.status != 'pending':
+                # Депозит закрыт вебхуком, опросом или параллельным запросом
+                return _settled_deposit_response(trans)
             
             # Обновление депозитной транзакции
             deposit.provider_status = 'canceled'
-            deposit.provider_response = payment_result
+            deposit.provider_response = call.response
             deposit.save()
             
             # Обновление транзакции
-            transaction.status = 'cancelled'
-            transaction.save()
+            trans.status = 'cancelled'
+            trans.save()
             
             # Регистрация активности пользователя
             UserActivity.objects.create(
                 user=request.user,
                 activity_type='deposit_cancelled',
-                ip_address=self._get_client_ip(request),
+                ip_address=get_client_ip(request),
                 user_agent=request.META.get('HTTP_USER_AGENT', ''),
                 details={
                     'amount': str(deposit.amount),
                     'provider': deposit.payment_provider.provider_type,
-                    'transaction_id': str(transaction.transaction_id)
+                    'transaction_id': str(trans.transaction_id)
                 }
             )
-            
-            return Response({
-                'message': 'Deposit cancelled successfully',
-                'transaction_id': transaction.transaction_id
-            })
-                
-        except Transaction.DoesNotExist:
-            return Response(
-                {"error": "Transaction not found"},
-                status=status.HTTP_404_NOT_FOUND
-            )
-        except DepositTransaction.DoesNotExist:
-            return Response(
-                {"error": "Deposit transaction not found"},
-                status=status.HTTP_404_NOT_FOUND
-            )
-        except Exception as e:
-            # Обработка любых ошибок
-            return Response(
-                {"error": str(e)},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-    
-    def _get_client_ip(self, request):
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = request.META.get('REMOTE_ADDR')
-        return ip
+        
+        return Response({
+            'message': 'Deposit cancelled successfully',
+            'transaction_id': trans.transaction_id
+        })
 
 
 class RequestWithdrawalView(APIView):
     """Представление для запроса на вывод средств"""
     permission_classes = (permissions.IsAuthenticated,)
     
+    @idempotent('payments.request_withdrawal')
     @transaction.atomic
     def post(self, request):
         serializer = WithdrawalRequestSerializer(
@@ -827,8 +857,10 @@ class RequestWithdrawalView(APIView):
         amount = serializer.validated_data.get('amount')
         payment_method = serializer.validated_data.get('payment_method')
         
-        # Проверка баланса
-        if user.balance < amount:
+        # Резервирование средств: проверка баланса и списание одним условным UPDATE
+        try:
+            balance_change = wallet.debit(user, amount)
+        except wallet.InsufficientFundsError:
             return Response(
                 {"error": "Insufficient funds"},
                 status=status.HTTP_400_BAD_REQUEST
@@ -839,17 +871,13 @@ class RequestWithdrawalView(APIView):
             user=user,
             transaction_type='withdrawal',
             amount=amount,
-            balance_before=user.balance,
-            balance_after=user.balance - amount,  # Резервируем средства
+            balance_before=balance_change.balance_before,
+            balance_after=balance_change.balance_after,
             status='pending',
             description=f"Withdrawal of {amount}",
             payment_method=payment_method
         )
         
-        # Обновление баланса пользователя
-        user.balance -= amount
-        user.save()
-        
         # Создание запроса на вывод средств
         withdrawal = WithdrawalRequest.objects.create(
             user=user,
@@ -862,7 +890,7 @@ class RequestWithdrawalView(APIView):
         UserActivity.objects.create(
             user=user,
             activity_type='withdrawal_request',
-            ip_address=self._get_client_ip(request),
+            ip_address=get_client_ip(request),
             user_agent=request.META.get('HTTP_USER_AGENT', ''),
             details={
                 'amount': str(amount),
@@ -879,14 +907,6 @@ class RequestWithdrawalView(APIView):
             'amount': amount,
             'current_balance': user.balance
         }, status=status.HTTP_201_CREATED)
-    
-    def _get_client_ip(self, request):
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = request.META.get('REMOTE_ADDR')
-        return ip
 
 
 class WithdrawalStatusView(generics.RetrieveAPIView):
@@ -917,8 +937,7 @@ class CancelWithdrawalView(APIView):
             
             # Возврат средств пользователю
             user = request.user
-            user.balance += withdrawal.amount
-            user.save()
+            wallet.credit(user, withdrawal.amount)
             
             # Обновление статуса запроса и транзакции
             withdrawal.status = 'cancelled'
@@ -933,7 +952,7 @@ class CancelWithdrawalView(APIView):
             UserActivity.objects.create(
                 user=user,
                 activity_type='withdrawal_cancelled',
-                ip_address=self._get_client_ip(request),
+                ip_address=get_client_ip(request),
                 user_agent=request.META.get('HTTP_USER_AGENT', ''),
                 details={
                     'amount': str(withdrawal.amount),
@@ -953,163 +972,61 @@ class CancelWithdrawalView(APIView):
                 {"error": "Withdrawal request not found or already processed"},
                 status=status.HTTP_404_NOT_FOUND
             )
-    
-    def _get_client_ip(self, request):
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = request.META.get('REMOTE_ADDR')
-        return ip
 
 
 class WebhookBaseView(APIView):
-    """Базовый класс для обработки webhook-уведомлений от платежных систем"""
+    """Базовый класс для приема webhook-уведомлений от платежных систем"""
     permission_classes = (permissions.AllowAny,)
     
-    @transaction.atomic
     def process_webhook(self, request, provider_type):
         """
-        Обрабатывает webhook-запрос от платежного провайдера
+        Принимает webhook-запрос от платежного провайдера
+        
+        Проверяет подпись по исходному телу запроса, сохраняет событие
+        во входящую очередь и сразу отвечает 200. Само событие применяет
+        воркер (см. payments.webhooks).
         
         Args:
             request: HTTP запрос
-            provider_type: Тип платежного провайдера (stripe, paypal)
+            provider_type: Тип платежного провайдера (stripe, paypal, crypto)
             
         Returns:
             HTTP ответ
         """
+        from payments.integrations.factory import get_payment_processor
+        from payments import webhooks
+        import logging
+        logger = logging.getLogger(__name__)
+        
+        # Подпись считается по байтам тела, поэтому сохраняем их как есть
+        raw_body = request.body
+        try:
+            body = json.loads(raw_body.decode('utf-8'))
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            return Response({"error": "Invalid payload"}, status=status.HTTP_400_BAD_REQUEST)
+        
         try:
-            # Используем фабрику для получения процессора платежей
-            from payments.integrations.factory import get_payment_processor
             payment_processor = get_payment_processor(provider_type)
-            
-            # Получаем заголовки и тело запроса
-            headers = request.headers
-            # Преобразуем тело запроса в JSON, если это еще не сделано
-            try:
-                if isinstance(request.body, bytes):
-                    body = json.loads(request.body.decode('utf-8'))
-                else:
-                    body = json.loads(request.body)
-            except json.JSONDecodeError:
-                body = request.body
-            
-            # Парсим webhook с помощью процессора
-            webhook_data = payment_processor.parse_webhook(body, headers)
-            
-            # Проверяем результат парсинга
-            if not webhook_data.get('success', False):
-                return Response(
-                    {"error": webhook_data.get('error', 'Failed to parse webhook')},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            # Получаем тип события и данные
-            event_type = webhook_data.get('type')
-            event_data = webhook_data.get('data', {})
-            
-            # Обрабатываем событие
-            if payment_processor.handle_webhook_event(event_type, event_data):
-                # Если событие успешно обработано процессором, 
-                # дополнительно обновляем статус транзакции в нашей БД
-                self._update_transaction_status(event_type, event_data, provider_type)
-                return Response(status=status.HTTP_200_OK)
-            else:
-                # Если событие не обработано, просто возвращаем успешный статус
-                # (webhook всегда должен отвечать 200 OK, чтобы не вызывать повторных отправок)
-                return Response(status=status.HTTP_200_OK)
-                
+            webhook_data = payment_processor.parse_webhook(body, request.headers, raw_body=raw_body)
         except Exception as e:
-            # Логируем ошибку, но возвращаем 200 OK
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.error(f"Error processing {provider_type} webhook: {str(e)}")
-            return Response(status=status.HTTP_200_OK)
-    
-    def _update_transaction_status(self, event_type, event_data, provider_type):
-        """
-        Обновляет статус транзакции в нашей системе на основе события webhook
+            logger.error(f"Error verifying {provider_type} webhook: {str(e)}")
+            webhook_data = {'success': False, 'error': 'Failed to parse webhook'}
         
-        Args:
-            event_type: Тип события webhook
-            event_data: Данные события
-            provider_type: Тип платежного провайдера
-        """
-        # Получаем ID платежа из данных события
-        payment_id = None
+        if not webhook_data.get('success', False):
+            return Response(
+                {"error": webhook_data.get('error', 'Failed to parse webhook')},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        # Извлекаем ID платежа в зависимости от типа провайдера и события
-        if provider_type == 'stripe':
-            if event_type == 'payment_intent.succeeded':
-                payment_id = event_data.get('id')
-            elif event_type == 'payment_intent.payment_failed':
-                payment_id = event_data.get('id')
-        elif provider_type == 'paypal':
-            if event_type == 'PAYMENT.CAPTURE.COMPLETED':
-                payment_id = event_data.get('id')
-            elif event_type == 'PAYMENT.CAPTURE.DENIED':
-                payment_id = event_data.get('id')
+        try:
+            webhooks.record_event(provider_type, webhook_data, raw_body)
+        except Exception as e:
+            # Событие не сохранено: отвечаем ошибкой, чтобы провайдер повторил отправку
+            logger.error(f"Error storing {provider_type} webhook: {str(e)}")
+            return Response(status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
-        # Если ID платежа найден, обновляем транзакцию
-        if payment_id:
-            try:
-                # Найти депозитную транзакцию
-                deposit = DepositTransaction.objects.get(provider_transaction_id=payment_id)
-                
-                # Обновить статус в зависимости от типа события
-                if event_type in ['payment_intent.succeeded', 'PAYMENT.CAPTURE.COMPLETED']:
-                    # Платеж успешен
-                    
-                    # Если транзакция уже обработана, игнорируем
-                    if deposit.transaction.status == 'completed':
-                        return
-                    
-                    # Обновление депозитной транзакции
-                    deposit.provider_status = 'succeeded'
-                    deposit.provider_response = event_data
-                    deposit.completed_at = timezone.now()
-                    deposit.save()
-                    
-                    # Обновление транзакции и баланса пользователя
-                    transaction = deposit.transaction
-                    transaction.status = 'completed'
-                    
-                    user = transaction.user
-                    user.balance += deposit.amount
-                    transaction.balance_after = user.balance
-                    
-                    transaction.save()
-                    user.save()
-                    
-                elif event_type in ['payment_intent.payment_failed', 'PAYMENT.CAPTURE.DENIED']:
-                    # Платеж неудачен
-                    
-                    # Если транзакция уже обработана, игнорируем
-                    if deposit.transaction.status in ['failed', 'cancelled']:
-                        return
-                    
-                    # Обновление депозитной транзакции
-                    deposit.provider_status = 'failed'
-                    deposit.provider_response = event_data
-                    deposit.save()
-                    
-                    # Обновление транзакции
-                    transaction = deposit.transaction
-                    transaction.status = 'failed'
-                    
-                    # Получаем сообщение об ошибке в зависимости от провайдера
-                    if provider_type == 'stripe':
-                        error_msg = event_data.get('last_payment_error', {}).get('message', 'Payment failed')
-                    else:
-                        error_msg = 'Payment failed'
-                        
-                    transaction.description = f"Failed deposit: {error_msg}"
-                    transaction.save()
-                
-            except DepositTransaction.DoesNotExist:
-                # Транзакция не найдена, возможно, это не наш платеж
-                pass
+        # Повторно доставленное событие тоже подтверждаем
+        return Response(status=status.HTTP_200_OK)
 
 
 class StripeWebhookView(WebhookBaseView):
@@ -1143,22 +1060,28 @@ class PaymentMethodsAPIView(APIView):
         """
         Возвращает список всех доступных методов оплаты для клиентской части.
         Включает информацию о платежных системах и их конфигурацию.
-        """
-        from payments.integrations.factory import get_available_payment_methods, get_processor_config
         
-        # Получаем доступные методы оплаты
-        payment_methods = get_available_payment_methods()
-        
-        # Получаем конфигурации процессоров для клиентской части
-        processor_config = get_processor_config()
+        Ответ берется из снимка в памяти процесса (payments.config_snapshot);
+        запрос с совпадающим If-None-Match получает 304.
+        """
+        from payments.config_snapshot import get_snapshot
+        from lottery.utils.versioning import etag_matches
         
-        # Получаем активные платежные провайдеры из БД
-        active_providers = PaymentProvider.objects.filter(is_active=True).values('id', 'name', 'provider_type', 'logo')
+        snapshot = get_snapshot()
         
-        response_data = {
-            'methods': payment_methods,
-            'providers': [provider for provider in active_providers],
-            'config': processor_config
-        }
+        if etag_matches(request.META.get('HTTP_IF_NONE_MATCH'), snapshot.etag):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(snapshot.payload)
         
-        return Response(response_data)
\ No newline at end of file
+        response['ETag'] = snapshot.etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+class ProviderHealthView(APIView):
+    """Статистика вызовов платежных провайдеров и состояние автоматов для мониторинга"""
+    permission_classes = (permissions.IsAdminUser,)
+    
+    def get(self, request):
+        return Response({'providers': provider_health.all_stats()})
@@ -0,0 +1,114 @@
+"""
+Wallet service: atomic balance changes on the User row.
+
+Balances used to be changed by reading ``user.balance``, adjusting it in
+Python and calling ``user.save()``. Two concurrent requests for the same
+account could both pass the funds check and the last save won (lost update
+/ double spend), and a full-row save rewrote every column of the user.
+
+Here every change is a single conditional statement::
+
+    UPDATE users_user SET balance = balance - x WHERE id = ? AND balance >= x
+    RETURNING balance
+
+The database serializes concurrent updates of the row, the ``WHERE`` clause
+makes the funds check and the debit one atomic step, and only the balance
+column is written. On backends without ``RETURNING`` the new balance is read
+back inside the same transaction, while the row lock is still held.
+"""
+
+import logging
+from collections import namedtuple
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+BalanceChange = namedtuple('BalanceChange', ['balance_before', 'balance_after'])
+
+CENT = Decimal('0.01')
+
+
+class InsufficientFundsError(Exception):
+    """Raised when a debit would take the balance below zero"""
+
+    def __init__(self, user_id, amount):
+        self.user_id = user_id
+        self.amount = amount
+        super().__init__(f"Insufficient funds for user {user_id} to debit {amount}")
+
+
+def _supports_returning() -> bool:
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        import sqlite3
+        return sqlite3.sqlite_version_info >= (3, 35, 0)
+    return False
+
+
+def _to_decimal(value) -> Decimal:
+    return Decimal(str(value)).quantize(CENT)
+
+
+def _apply(user, delta: Decimal, require_funds: bool) -> BalanceChange:
+    User = get_user_model()
+    amount = abs(delta)
+
+    if _supports_returning():
+        table = connection.ops.quote_name(User._meta.db_table)
+        balance = connection.ops.quote_name(User._meta.get_field('balance').column)
+        pk = connection.ops.quote_name(User._meta.pk.column)
+        sql = f"UPDATE {table} SET {balance} = {balance} + %s WHERE {pk} = %s"
+        params = [delta, user.pk]
+        if require_funds:
+            sql += f" AND {balance} >= %s"
+            params.append(amount)
+        sql += f" RETURNING {balance}"
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+        new_balance = _to_decimal(row[0]) if row else None
+    else:
+        # The row lock taken by UPDATE is held until commit, so the read-back is exact
+        with transaction.atomic():
+            queryset = User.objects.filter(pk=user.pk)
+            if require_funds:
+                queryset = queryset.filter(balance__gte=amount)
+            updated = queryset.update(balance=F('balance') + delta)
+            new_balance = None
+            if updated:
+                new_balance = _to_decimal(User.objects.filter(pk=user.pk).values_list('balance', flat=True).get())
+
+    if new_balance is None:
+        if not require_funds:
+            raise User.DoesNotExist(f"User {user.pk} does not exist")
+        raise InsufficientFundsError(user.pk, amount)
+
+    # Keep the in-memory instance in step with the row
+    user.balance = new_balance
+    return BalanceChange(balance_before=new_balance - delta, balance_after=new_balance)
+
+
+def debit(user, amount) -> BalanceChange:
+    """
+    Take ``amount`` from the user's balance if it is covered.
+
+    Raises InsufficientFundsError otherwise; nothing is written in that case.
+    """
+    amount = _to_decimal(amount)
+    if amount <= 0:
+        raise ValueError("Debit amount must be positive")
+    return _apply(user, -amount, require_funds=True)
+
+
+def credit(user, amount) -> BalanceChange:
+    """Add ``amount`` to the user's balance"""
+    amount = _to_decimal(amount)
+    if amount <= 0:
+        raise ValueError("Credit amount must be positive")
+    return _apply(user, amount, require_funds=False)
@@ -0,0 +1,232 @@
+"""
+Webhook inbox for payment provider events.
+
+Webhooks used to be parsed, verified and applied inside one database
+transaction on the request thread, so provider retries piled up whenever
+applying was slow. Now the request only:
+
+1. verifies the signature against the raw body bytes (``parse_webhook``
+   gets ``raw_body``; re-serializing the parsed JSON changes the bytes and
+   breaks HMAC checks);
+2. inserts a ``WebhookEvent`` row, deduplicated by (provider, event id),
+   so a redelivered event is stored once;
+3. answers 200.
+
+A worker (``process_pending_events``) applies stored events. Events of one
+payment are applied in the order they arrived: an event waits while an
+earlier event of the same payment is still pending. A failing event is
+retried with exponential backoff and marked ``failed`` after
+``MAX_ATTEMPTS``; ``replay`` puts events back in the queue.
+"""
+
+import hashlib
+import json
+import logging
+from datetime import timedelta
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from lottery_core import leases
+from . import wallet
+from .models import DepositTransaction, Transaction, WebhookEvent
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'MAX_ATTEMPTS': 8,
+    'RETRY_BACKOFF_SECONDS': 30,
+    'MAX_BACKOFF_SECONDS': 60 * 60,
+}
+
+SUCCEEDED_EVENTS = {'payment_intent.succeeded', 'PAYMENT.CAPTURE.COMPLETED'}
+FAILED_EVENTS = {'payment_intent.payment_failed', 'PAYMENT.CAPTURE.DENIED'}
+
+
+def _setting(name: str) -> int:
+    return getattr(settings, 'WEBHOOK_SETTINGS', {}).get(name, DEFAULTS[name])
+
+
+def event_key(provider_type: str, webhook_data: Dict, raw_body: bytes) -> str:
+    """Provider event id used for deduplication"""
+    if provider_type == 'crypto':
+        # txn_id is shared by all status updates of a payment; ipn_id is per notification
+        event_id = (webhook_data.get('data') or {}).get('ipn_id')
+    else:
+        event_id = webhook_data.get('id')
+    return str(event_id) if event_id else hashlib.sha256(raw_body).hexdigest()
+
+
+def payment_key(provider_type: str, webhook_data: Dict) -> str:
+    """ID of the payment the event belongs to"""
+    data = webhook_data.get('data') or {}
+    if provider_type == 'stripe':
+        payment_id = data.get('payment_intent') or data.get('id')
+    elif provider_type == 'crypto':
+        payment_id = data.get('txn_id')
+    else:
+        payment_id = data.get('id')
+    return str(payment_id or '')
+
+
+def record_event(provider_type: str, webhook_data: Dict, raw_body: bytes) -> Tuple[Optional[WebhookEvent], bool]:
+    """
+    Store a verified event in the inbox.
+
+    Returns (event, created); a redelivered event is not stored again.
+    """
+    key = event_key(provider_type, webhook_data, raw_body)
+    try:
+        with transaction.atomic():
+            event = WebhookEvent.objects.create(
+                provider_type=provider_type,
+                event_id=key,
+                event_type=webhook_data.get('type') or '',
+                payment_id=payment_key(provider_type, webhook_data),
+                data=json.loads(json.dumps(webhook_data.get('data') or {}, default=str)),
+                raw_body=raw_body.decode('utf-8', errors='replace'),
+            )
+    except IntegrityError:
+        logger.info(f"Duplicate {provider_type} webhook {key} ignored")
+        return None, False
+
+    dispatch()
+    return event, True
+
+
+def dispatch():
+    """Have a worker apply the stored events once the insert is committed"""
+    if getattr(settings, 'CELERY_TASK_ALWAYS_EAGER', False):
+        # Local runs without a broker: apply in-process after the response data is committed
+        transaction.on_commit(process_pending_events)
+    else:
+        from .tasks import process_webhook_events
+        transaction.on_commit(lambda: process_webhook_events.delay())
+
+
+def _due(now) -> Q:
+    return Q(status='pending') & (Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now))
+
+
+def process_pending_events(on_full_batch: Optional[Callable[[], None]] = None) -> int:
+    """Apply due inbox events; returns the number applied"""
+    return leases.drain(
+        WebhookEvent.objects.filter(_due(timezone.now())), _process_batch, on_full_batch=on_full_batch
+    )
+
+
+def _process_batch(event_ids) -> int:
+    """Apply a claimed batch of events in arrival order"""
+    events = WebhookEvent.objects.filter(id__in=event_ids, status='pending').order_by('id')
+    applied = 0
+    blocked = set()
+
+    for event in events:
+        key = (event.provider_type, event.payment_id)
+        if event.payment_id:
+            if key in blocked:
+                continue
+            earlier_pending = WebhookEvent.objects.filter(
+                provider_type=event.provider_type, payment_id=event.payment_id,
+                status='pending', id__lt=event.id
+            ).exists()
+            if earlier_pending:
+                # An earlier event of this payment has not been applied yet
+                blocked.add(key)
+                continue
+
+        if _apply_with_retry(event):
+            applied += 1
+        elif event.payment_id:
+            blocked.add(key)
+
+    return applied
+
+
+def _apply_with_retry(event: WebhookEvent) -> bool:
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            apply_event(event)
+            event.status = 'processed'
+            event.processed_at = now
+            event.last_error = ''
+            event.attempts += 1
+            event.save(update_fields=['status', 'processed_at', 'last_error', 'attempts'])
+        return True
+    except Exception as e:
+        event.attempts += 1
+        event.last_error = str(e)
+        if event.attempts >= _setting('MAX_ATTEMPTS'):
+            event.status = 'failed'
+            logger.error(f"Webhook event {event.id} failed after {event.attempts} attempts: {str(e)}")
+        else:
+            backoff = min(
+                _setting('RETRY_BACKOFF_SECONDS') * 2 ** (event.attempts - 1), _setting('MAX_BACKOFF_SECONDS')
+            )
+            event.next_attempt_at = now + timedelta(seconds=backoff)
+            logger.warning(f"Webhook event {event.id} failed, retry in {backoff}s: {str(e)}")
+        event.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+        return False
+
+
+def apply_event(event: WebhookEvent):
+    """Let the processor handle the event and update the deposit it belongs to"""
+    from .integrations.factory import get_payment_processor
+
+    processor = get_payment_processor(event.provider_type)
+    if processor.handle_webhook_event(event.event_type, event.data):
+        _update_deposit(event)
+
+
+def _update_deposit(event: WebhookEvent):
+    """Update the deposit and its transaction from a payment event"""
+    if not event.payment_id or event.event_type not in SUCCEEDED_EVENTS | FAILED_EVENTS:
+        return
+
+    deposit = DepositTransaction.objects.filter(
+        provider_transaction_id=event.payment_id
+    ).select_related('user', 'payment_provider').first()
+    if deposit is None:
+        # Not one of our payments
+        return
+
+    # Row lock: the deposit poller may settle the same transaction concurrently
+    trans = Transaction.objects.select_for_update().get(pk=deposit.transaction_id)
+    if trans.status != 'pending':
+        return
+
+    deposit.provider_response = event.data
+    if event.event_type in SUCCEEDED_EVENTS:
+        balance_change = wallet.credit(deposit.user, deposit.amount)
+        deposit.provider_status = 'succeeded'
+        deposit.completed_at = timezone.now()
+        trans.status = 'completed'
+        trans.balance_before = balance_change.balance_before
+        trans.balance_after = balance_change.balance_after
+    else:
+        deposit.provider_status = 'failed'
+        if event.provider_type == 'stripe':
+            error_msg = (event.data.get('last_payment_error') or {}).get('message', 'Payment failed')
+        else:
+            error_msg = 'Payment failed'
+        trans.status = 'failed'
+        trans.description = f"Failed deposit: {error_msg}"
+
+    deposit.save(update_fields=['provider_status', 'provider_response', 'completed_at', 'updated_at'])
+    trans.save()
+
+
+def replay(events: Iterable[WebhookEvent], notify_worker: bool = True) -> int:
+    """Queue events again, from their stored data, regardless of their status"""
+    ids = [event.id for event in events]
+    replayed = WebhookEvent.objects.filter(id__in=ids).update(
+        status='pending', attempts=0, last_error='', next_attempt_at=None,
+        processed_at=None, lease_owner='', lease_expires_at=None
+    )
+    if replayed and notify_worker:
+        dispatch()
+    return replayed
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.9 on 2026-10-19 05:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0002_notification"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="notification",
+            index=models.Index(
+                fields=["user", "-created_at", "-id"],
+                name="notification_user_keyset_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="useractivity",
+            index=models.Index(
+                fields=["user", "-created_at", "-id"], name="activity_user_keyset_idx"
+            ),
+        ),
+    ]
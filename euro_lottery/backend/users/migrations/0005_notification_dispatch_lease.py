@@ -0,0 +1,43 @@
+# Generated by Django 4.2.9 on 2026-10-19 06:01
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_dispatched(apps, schema_editor):
+    """Notifications already sent on some channel were handled by the old task"""
+    Notification = apps.get_model("users", "Notification")
+    Notification.objects.exclude(
+        is_email_sent=False, is_sms_sent=False, is_push_sent=False
+    ).update(dispatched_at=F("updated_at"))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0004_dailyspend"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="notification",
+            name="dispatched_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="lease_expires_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="lease_owner",
+            field=models.CharField(blank=True, default="", max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name="notification",
+            index=models.Index(
+                fields=["dispatched_at", "created_at"], name="notification_pending_idx"
+            ),
+        ),
+        migrations.RunPython(backfill_dispatched, migrations.RunPython.noop),
+    ]
@@ -75,6 +75,12 @@ class UserActivity(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     details = models.JSONField(default=dict)
     
+    class Meta:
+        indexes = [
+            # Backs keyset pagination of a user's activity history
+            models.Index(fields=['user', '-created_at', '-id'], name='activity_user_keyset_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.user.email} - {self.activity_type} - {self.created_at}"
 
@@ -100,6 +106,21 @@ class Referral(models.Model):
         return f"{self.referrer.email} referred {self.referred_user.email}"
 
 
+class DailySpend(models.Model):
+    """Сумма покупок билетов пользователя за день для лимитов ответственной игры"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_spend')
+    day = models.DateField()
+    amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ('user', 'day')
+        ordering = ['-day']
+    
+    def __str__(self):
+        return f"{self.user.email} - {self.day}: {self.amount}"
+
+
 class Notification(models.Model):
     """Модель для управления уведомлениями пользователей"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
@@ -131,6 +152,12 @@ class Notification(models.Model):
     is_email_sent = models.BooleanField(default=False)
     is_sms_sent = models.BooleanField(default=False)
     is_push_sent = models.BooleanField(default=False)
+    # Когда задача рассылки обработала уведомление по всем включенным каналам
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    
+    # Аренда уведомления воркером рассылки (lottery_core.leases)
+    lease_owner = models.CharField(max_length=100, blank=True, default='')
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
     
     # Связи с другими моделями
     related_object_id = models.IntegerField(null=True, blank=True)
@@ -152,6 +179,10 @@ class Notification(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='notification_user_keyset_idx'),
+            models.Index(fields=['dispatched_at', 'created_at'], name='notification_pending_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.email} - {self.notification_type} - {self.created_at.strftime('%Y-%m-%d %H:%M')}"
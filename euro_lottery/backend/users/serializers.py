@@ -1,7 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model, authenticate
 from django.utils.translation import gettext_lazy as _
-from .models import UserDocument, UserActivity, ReferralCode, Referral
+from .models import UserDocument, UserActivity, ReferralCode, Referral, Notification
 
 User = get_user_model()
 
@@ -112,6 +112,15 @@ class UserActivitySerializer(serializers.ModelSerializer):
         read_only_fields = fields
 
 
+class NotificationSerializer(serializers.ModelSerializer):
+    """Сериализатор для уведомлений пользователя"""
+    class Meta:
+        model = Notification
+        fields = ('id', 'notification_type', 'title', 'message', 'is_read', 'read_at',
+                  'priority', 'related_object_id', 'related_object_type', 'data', 'created_at')
+        read_only_fields = fields
+
+
 class ReferralCodeSerializer(serializers.ModelSerializer):
     """Сериализатор для реферального кода пользователя"""
     class Meta:
@@ -0,0 +1,211 @@
+"""
+Responsible-gaming spend limits.
+
+Ticket purchases are accumulated per user in DailySpend rows, one per
+calendar day. The rolling windows are read from at most 30 of these rows
+through the (user, day) unique index instead of summing the Transaction
+ledger on every purchase:
+
+- daily: today's bucket;
+- weekly: the last 7 buckets, today included;
+- monthly: the last 30 buckets, today included.
+
+``reserve_spend`` adds the amount to today's bucket first and then checks
+the windows. The UPDATE locks the bucket row until the surrounding
+transaction ends, so concurrent purchases of one user are checked one after
+another and cannot overshoot a limit together. When a limit would be
+exceeded the savepoint is rolled back and nothing is recorded.
+
+``reconcile_spend`` rebuilds the buckets of past days from the ledger and
+is run nightly. Today's bucket is left alone: purchases are still writing it.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict, Optional, Tuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+WINDOWS = (
+    ('daily', 'daily_limit', 1),
+    ('weekly', 'weekly_limit', 7),
+    ('monthly', 'monthly_limit', 30),
+)
+LONGEST_WINDOW_DAYS = max(days for _, _, days in WINDOWS)
+
+CENT = Decimal('0.01')
+
+
+class SpendingBlockedError(Exception):
+    """Base class for purchases refused by responsible-gaming rules"""
+
+
+class SelfExcludedError(SpendingBlockedError):
+    def __init__(self, user_id, end_date: Optional[date]):
+        self.user_id = user_id
+        self.end_date = end_date
+        until = f" until {end_date}" if end_date else ""
+        super().__init__(f"Account is self-excluded{until}")
+
+
+class SpendLimitExceededError(SpendingBlockedError):
+    def __init__(self, user_id, period: str, limit: Decimal, spent: Decimal):
+        self.user_id = user_id
+        self.period = period
+        self.limit = limit
+        self.spent = spent
+        super().__init__(f"This purchase would exceed your {period} spending limit of {limit}")
+
+
+def is_self_excluded(user, today: Optional[date] = None) -> bool:
+    """Self-exclusion is active until (and including) its end date"""
+    if not user.is_self_excluded:
+        return False
+    end_date = user.self_exclusion_end_date
+    return end_date is None or end_date >= (today or timezone.localdate())
+
+
+def spend_totals(user, today: Optional[date] = None) -> Dict[str, Decimal]:
+    """Spend of the daily, weekly and monthly windows in a single query"""
+    from users.models import DailySpend
+
+    today = today or timezone.localdate()
+    aggregates = {
+        period: Sum('amount', filter=Q(day__gt=today - timedelta(days=days)))
+        for period, _, days in WINDOWS
+    }
+    totals = DailySpend.objects.filter(
+        user_id=user.pk,
+        day__gt=today - timedelta(days=LONGEST_WINDOW_DAYS),
+        day__lte=today,
+    ).aggregate(**aggregates)
+    return {period: totals[period] or Decimal('0') for period in totals}
+
+
+def _add_to_bucket(user_id, day: date, amount: Decimal) -> None:
+    from users.models import DailySpend
+
+    updated = DailySpend.objects.filter(user_id=user_id, day=day).update(
+        amount=F('amount') + amount, updated_at=timezone.now()
+    )
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            DailySpend.objects.create(user_id=user_id, day=day, amount=amount)
+    except IntegrityError:
+        # A concurrent purchase created the bucket first
+        DailySpend.objects.filter(user_id=user_id, day=day).update(
+            amount=F('amount') + amount, updated_at=timezone.now()
+        )
+
+
+def reserve_spend(user, amount, today: Optional[date] = None) -> Dict[str, Decimal]:
+    """
+    Record a ticket purchase of ``amount`` against the user's limits.
+
+    Raises SelfExcludedError or SpendLimitExceededError (recording nothing)
+    if the purchase is not allowed. Returns the window totals including it.
+    """
+    today = today or timezone.localdate()
+    amount = Decimal(str(amount)).quantize(CENT)
+
+    if is_self_excluded(user, today):
+        raise SelfExcludedError(user.pk, user.self_exclusion_end_date)
+
+    with transaction.atomic():
+        _add_to_bucket(user.pk, today, amount)
+        totals = spend_totals(user, today)
+        for period, limit_field, _ in WINDOWS:
+            limit = getattr(user, limit_field)
+            if limit is not None and totals[period] > limit:
+                raise SpendLimitExceededError(user.pk, period, limit, totals[period] - amount)
+
+    return totals
+
+
+def release_spend(user_id, amount, day: date) -> None:
+    """Take back a reserved amount, e.g. when a queued purchase is refunded"""
+    from users.models import DailySpend
+
+    amount = Decimal(str(amount)).quantize(CENT)
+    DailySpend.objects.filter(user_id=user_id, day=day).update(
+        amount=F('amount') - amount, updated_at=timezone.now()
+    )
+
+
+def _ledger_spend(since: date, until: date) -> Dict[Tuple[int, date], Decimal]:
+    """Ticket spend per (user, day) in [since, until) according to the ledger"""
+    from lottery.models import PurchaseOrder
+    from payments.models import Transaction
+
+    expected = defaultdict(Decimal)
+
+    purchases = Transaction.objects.filter(
+        transaction_type='ticket_purchase',
+        status='completed',
+        created_at__date__gte=since,
+        created_at__date__lt=until,
+    ).annotate(day=TruncDate('created_at')).values('user_id', 'day').annotate(total=Sum('amount'))
+    for row in purchases:
+        expected[(row['user_id'], row['day'])] += row['total']
+
+    # Queued orders already hold their reservation but have no transaction yet
+    pending = PurchaseOrder.objects.filter(
+        status__in=('queued', 'processing'),
+        created_at__date__gte=since,
+        created_at__date__lt=until,
+    ).annotate(day=TruncDate('created_at')).values('user_id', 'day').annotate(total=Sum('total_amount'))
+    for row in pending:
+        expected[(row['user_id'], row['day'])] += row['total']
+
+    return expected
+
+
+def reconcile_spend(days: int = LONGEST_WINDOW_DAYS) -> int:
+    """
+    Rebuild the buckets of the ``days`` days before today from the ledger.
+
+    Returns the number of buckets that had drifted and were corrected.
+    """
+    from users.models import DailySpend
+
+    today = timezone.localdate()
+    since = today - timedelta(days=days)
+    expected = _ledger_spend(since, today)
+
+    with transaction.atomic():
+        buckets = {
+            (bucket.user_id, bucket.day): bucket
+            for bucket in DailySpend.objects.select_for_update().filter(day__gte=since, day__lt=today)
+        }
+
+        to_update = []
+        for key, bucket in buckets.items():
+            amount = expected.pop(key, Decimal('0'))
+            if bucket.amount != amount:
+                bucket.amount = amount
+                to_update.append(bucket)
+
+        to_create = [
+            DailySpend(user_id=user_id, day=day, amount=amount)
+            for (user_id, day), amount in expected.items()
+            if amount
+        ]
+
+        if to_update:
+            DailySpend.objects.bulk_update(to_update, ['amount'], batch_size=500)
+        if to_create:
+            DailySpend.objects.bulk_create(to_create, batch_size=500)
+        corrected = len(to_update) + len(to_create)
+
+    if corrected:
+        logger.warning(f"Spend reconciliation corrected {corrected} daily bucket(s)")
+    return corrected
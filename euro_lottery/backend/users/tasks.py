@@ -8,14 +8,20 @@ import logging
 import traceback
 
 from .models import User, Notification
+from lottery_core import leases
+from lottery_core.task_metrics import rows_processed
 
 logger = logging.getLogger(__name__)
 
 
 @shared_task
-def send_pending_notifications():
+@rows_processed('sent')
+def send_pending_notifications(fan_out=True):
     """
     Celery task to send pending notifications via email, SMS, and push
+    
+    Notifications are claimed in leased batches, so copies of the task on
+    several workers send disjoint notifications.
     """
     try:
         logger.info("Starting to send pending notifications")
@@ -24,42 +30,16 @@ def send_pending_notifications():
         now = timezone.now()
         one_minute_ago = now - timezone.timedelta(minutes=1)
         
-        # Find notifications created at least a minute ago and not yet sent
+        # Find notifications created at least a minute ago and not yet dispatched
         pending_notifications = Notification.objects.filter(
+            dispatched_at__isnull=True,
             created_at__lte=one_minute_ago,
-        ).exclude(
-            is_email_sent=True,
-            is_sms_sent=True,
-            is_push_sent=True
-        ).select_related('user')
-        
-        sent_count = 0
+        )
         
-        for notification in pending_notifications:
-            try:
-                user = notification.user
-                
-                # Send via email if user has email notifications enabled
-                if user.email_notifications and not notification.is_email_sent:
-                    send_email_notification(notification)
-                    notification.is_email_sent = True
-                    notification.save(update_fields=['is_email_sent'])
-                
-                # Send via SMS if user has SMS notifications enabled
-                if user.sms_notifications and user.phone_number and not notification.is_sms_sent:
-                    send_sms_notification(notification)
-                    notification.is_sms_sent = True
-                    notification.save(update_fields=['is_sms_sent'])
-                
-                # Send via push if user has push notifications enabled
-                if user.push_notifications and not notification.is_push_sent:
-                    send_push_notification(notification)
-                    notification.is_push_sent = True
-                    notification.save(update_fields=['is_push_sent'])
-                
-                sent_count += 1
-            except Exception as e:
-                logger.error(f"Error sending notification {notification.id}: {str(e)}")
+        sent_count = leases.drain(
+            pending_notifications, _send_notification_batch,
+            on_full_batch=leases.fan_out(send_pending_notifications) if fan_out else None
+        )
         
         logger.info(f"Sent {sent_count} pending notifications")
         return {'sent': sent_count}
@@ -69,6 +49,47 @@ def send_pending_notifications():
         return False
 
 
+def _send_notification_batch(notification_ids):
+    """Send a claimed batch of notifications on the channels each user enabled"""
+    notifications = Notification.objects.filter(
+        id__in=notification_ids
+    ).select_related('user').order_by('id')
+    
+    sent_count = 0
+    
+    for notification in notifications:
+        try:
+            user = notification.user
+            
+            # Send via email if user has email notifications enabled
+            if user.email_notifications and not notification.is_email_sent:
+                send_email_notification(notification)
+                notification.is_email_sent = True
+                notification.save(update_fields=['is_email_sent'])
+            
+            # Send via SMS if user has SMS notifications enabled
+            if user.sms_notifications and user.phone_number and not notification.is_sms_sent:
+                send_sms_notification(notification)
+                notification.is_sms_sent = True
+                notification.save(update_fields=['is_sms_sent'])
+            
+            # Send via push if user has push notifications enabled
+            if user.push_notifications and not notification.is_push_sent:
+                send_push_notification(notification)
+                notification.is_push_sent = True
+                notification.save(update_fields=['is_push_sent'])
+            
+            # Disabled channels are not retried; failed ones are, after the lease expires
+            notification.dispatched_at = timezone.now()
+            notification.save(update_fields=['dispatched_at'])
+            
+            sent_count += 1
+        except Exception as e:
+            logger.error(f"Error sending notification {notification.id}: {str(e)}")
+    
+    return sent_count
+
+
 def send_email_notification(notification):
     """Send notification via email"""
     user = notification.user
@@ -171,6 +192,7 @@ def send_push_notification(notification):
 
 
 @shared_task
+@rows_processed('created')
 def send_upcoming_draw_reminders():
     """
     Celery task to send reminders about upcoming draws
@@ -245,6 +267,7 @@ def send_upcoming_draw_reminders():
 
 
 @shared_task
+@rows_processed(lambda result: sum(result.values()) if result else None)
 def clean_old_notifications():
     """
     Celery task to clean up old read notifications to keep the database size manageable
@@ -283,6 +306,7 @@ def clean_old_notifications():
 
 
 @shared_task
+@rows_processed('created')
 def create_win_notifications():
     """
     Celery task to create notifications for winning tickets
@@ -344,6 +368,7 @@ def create_win_notifications():
 
 
 @shared_task
+@rows_processed('created')
 def create_payment_notifications():
     """
     Celery task to create notifications for payment events
@@ -451,4 +476,22 @@ def create_payment_notifications():
     except Exception as e:
         logger.error(f"Error in create_payment_notifications task: {str(e)}")
         logger.error(traceback.format_exc())
-        return False
\ No newline at end of file
+        return False
+
+@shared_task
+@rows_processed('corrected')
+def reconcile_daily_spend():
+    """
+    Celery task to rebuild responsible-gaming spend buckets from the transaction ledger
+    """
+    from .spending import reconcile_spend
+    
+    try:
+        logger.info("Starting daily spend reconciliation")
+        corrected = reconcile_spend()
+        logger.info(f"Daily spend reconciliation finished, {corrected} bucket(s) corrected")
+        return {'corrected': corrected}
+    except Exception as e:
+        logger.error(f"Error in reconcile_daily_spend task: {str(e)}")
+        logger.error(traceback.format_exc())
+        return False
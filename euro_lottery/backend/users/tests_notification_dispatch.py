@@ -0,0 +1,60 @@
+from django.core import mail
+from django.test import TestCase
+from django.utils import timezone
+import datetime
+
+from .models import User, Notification
+from .tasks import send_pending_notifications
+
+
+class NotificationDispatchTestCase(TestCase):
+    """Тестирование рассылки уведомлений пачками с арендой"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser', email='test@example.com', password='testpassword123'
+        )
+        self.quiet_user = User.objects.create_user(
+            username='quietuser', email='quiet@example.com', password='testpassword123',
+            email_notifications=False, push_notifications=False
+        )
+
+    def _notification(self, user, minutes_ago=5):
+        notification = Notification.objects.create(
+            user=user, notification_type='system', title='Hello', message='Test message'
+        )
+        Notification.objects.filter(pk=notification.pk).update(
+            created_at=timezone.now() - datetime.timedelta(minutes=minutes_ago)
+        )
+        return notification
+
+    def test_notifications_dispatched_once(self):
+        """Уведомление отправляется один раз, свежие ждут минуту"""
+        notification = self._notification(self.user)
+        fresh = self._notification(self.user, minutes_ago=0)
+
+        self.assertEqual(send_pending_notifications(), {'sent': 1})
+        self.assertEqual(len(mail.outbox), 1)
+        notification.refresh_from_db()
+        self.assertTrue(notification.is_email_sent)
+        self.assertIsNotNone(notification.dispatched_at)
+
+        fresh.refresh_from_db()
+        self.assertIsNone(fresh.dispatched_at)
+
+        # Истекшая аренда не приводит к повторной отправке
+        Notification.objects.update(lease_expires_at=None)
+        Notification.objects.filter(pk=fresh.pk).delete()
+        self.assertEqual(send_pending_notifications(), {'sent': 0})
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_disabled_channels_do_not_keep_notification_pending(self):
+        """Уведомление пользователя без каналов не обрабатывается повторно"""
+        notification = self._notification(self.quiet_user)
+        self.assertEqual(send_pending_notifications(), {'sent': 1})
+
+        Notification.objects.update(lease_expires_at=None)
+        self.assertEqual(send_pending_notifications(), {'sent': 0})
+        notification.refresh_from_db()
+        self.assertFalse(notification.is_email_sent)
+        self.assertIsNotNone(notification.dispatched_at)
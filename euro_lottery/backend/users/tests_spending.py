@@ -0,0 +1,139 @@
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+from decimal import Decimal
+import datetime
+
+from lottery.models import LotteryGame, Draw, Ticket
+from payments.models import Transaction
+from .models import DailySpend
+from .spending import reserve_spend, spend_totals, reconcile_spend, SpendLimitExceededError
+
+User = get_user_model()
+
+
+class SpendLimitsTestCase(APITestCase):
+    """Тестирование лимитов ответственной игры при покупке билетов"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='user@example.com',
+            username='testuser',
+            password='testpassword',
+            daily_limit=Decimal('10.00'),
+            weekly_limit=Decimal('30.00'),
+            monthly_limit=Decimal('60.00'),
+        )
+        User.objects.filter(pk=self.user.pk).update(balance=Decimal('100.00'))
+        self.user.refresh_from_db()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        lottery_game = LotteryGame.objects.create(
+            name="Test Lottery",
+            main_numbers_count=5,
+            main_numbers_range=50,
+            extra_numbers_count=2,
+            extra_numbers_range=12,
+            ticket_price=Decimal('2.50'),
+            draw_days="Tuesday,Friday",
+            draw_time="20:00:00",
+        )
+        self.draw = Draw.objects.create(
+            lottery_game=lottery_game,
+            draw_number=1,
+            draw_date=timezone.now() + datetime.timedelta(days=2),
+            jackpot_amount=Decimal('1000000.00')
+        )
+        self.url = reverse('purchase-ticket')
+        self.today = timezone.localdate()
+
+    def _purchase(self, count=1):
+        tickets = [
+            {'main_numbers': [i + 1, i + 2, i + 3, i + 4, i + 5], 'extra_numbers': [1, 2]}
+            for i in range(count)
+        ]
+        return self.client.post(self.url, {'draw_id': self.draw.id, 'tickets': tickets}, format='json')
+
+    def test_purchase_is_recorded_in_daily_bucket(self):
+        response = self._purchase(2)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(DailySpend.objects.get(user=self.user, day=self.today).amount, Decimal('5.00'))
+
+    def test_daily_limit_blocks_purchase_without_charging(self):
+        self.assertEqual(self._purchase(4).status_code, status.HTTP_201_CREATED)
+
+        response = self._purchase(1)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertIn('daily', response.data['error'])
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, Decimal('90.00'))
+        self.assertEqual(Ticket.objects.count(), 4)
+        self.assertEqual(DailySpend.objects.get(user=self.user, day=self.today).amount, Decimal('10.00'))
+
+    def test_rolling_windows(self):
+        DailySpend.objects.create(user=self.user, day=self.today - datetime.timedelta(days=3), amount=Decimal('25.00'))
+        DailySpend.objects.create(user=self.user, day=self.today - datetime.timedelta(days=20), amount=Decimal('30.00'))
+        DailySpend.objects.create(user=self.user, day=self.today - datetime.timedelta(days=40), amount=Decimal('99.00'))
+
+        with self.assertNumQueries(1):
+            totals = spend_totals(self.user)
+        self.assertEqual(totals, {'daily': Decimal('0'), 'weekly': Decimal('25.00'), 'monthly': Decimal('55.00')})
+
+        with self.assertRaises(SpendLimitExceededError) as context:
+            reserve_spend(self.user, Decimal('7.50'))
+        self.assertEqual(context.exception.period, 'weekly')
+        self.assertFalse(DailySpend.objects.filter(user=self.user, day=self.today).exists())
+
+        reserve_spend(self.user, Decimal('5.00'))
+        self.assertEqual(spend_totals(self.user)['monthly'], Decimal('60.00'))
+
+    def test_self_exclusion_blocks_purchase(self):
+        User.objects.filter(pk=self.user.pk).update(
+            is_self_excluded=True,
+            self_exclusion_end_date=self.today + datetime.timedelta(days=30)
+        )
+        self.user.refresh_from_db()
+
+        response = self._purchase(1)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertIn('self-excluded', response.data['error'])
+        self.assertEqual(Ticket.objects.count(), 0)
+
+    def test_expired_self_exclusion_allows_purchase(self):
+        User.objects.filter(pk=self.user.pk).update(
+            is_self_excluded=True,
+            self_exclusion_end_date=self.today - datetime.timedelta(days=1)
+        )
+        self.user.refresh_from_db()
+        self.assertEqual(self._purchase(1).status_code, status.HTTP_201_CREATED)
+
+    def test_reconciliation_rebuilds_past_buckets_from_ledger(self):
+        yesterday = self.today - datetime.timedelta(days=1)
+        purchase = Transaction.objects.create(
+            user=self.user,
+            transaction_type='ticket_purchase',
+            amount=Decimal('7.50'),
+            balance_before=Decimal('100.00'),
+            balance_after=Decimal('92.50'),
+            status='completed',
+        )
+        Transaction.objects.filter(pk=purchase.pk).update(created_at=timezone.now() - datetime.timedelta(days=1))
+        DailySpend.objects.create(user=self.user, day=yesterday, amount=Decimal('2.50'))
+        DailySpend.objects.create(user=self.user, day=yesterday - datetime.timedelta(days=1), amount=Decimal('5.00'))
+        DailySpend.objects.create(user=self.user, day=self.today, amount=Decimal('1.00'))
+
+        self.assertEqual(reconcile_spend(), 2)
+
+        self.assertEqual(DailySpend.objects.get(user=self.user, day=yesterday).amount, Decimal('7.50'))
+        self.assertEqual(
+            DailySpend.objects.get(user=self.user, day=yesterday - datetime.timedelta(days=1)).amount, Decimal('0')
+        )
+        # Текущий день не трогается: покупки продолжают в него писать
+        self.assertEqual(DailySpend.objects.get(user=self.user, day=self.today).amount, Decimal('1.00'))
+        self.assertEqual(reconcile_spend(), 0)
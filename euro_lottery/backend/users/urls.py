@@ -31,4 +31,7 @@ urlpatterns = [
     
     # История активности
     path('activity/', views.UserActivityView.as_view(), name='user-activity'),
+    
+    # Уведомления
+    path('notifications/', views.NotificationListView.as_view(), name='notifications-list'),
 ]
\ No newline at end of file
@@ -12,12 +12,14 @@ from django.conf import settings
 import uuid
 import datetime
 
-from .models import UserDocument, UserActivity, ReferralCode, Referral
+from lottery_core.pagination import KeysetPagination
+from lottery.utils.client_ip import get_client_ip
+from .models import UserDocument, UserActivity, ReferralCode, Referral, Notification
 from .serializers import (
     UserRegistrationSerializer, UserLoginSerializer, UserProfileSerializer,
     ChangePasswordSerializer, UserDocumentSerializer, UserActivitySerializer,
     ReferralCodeSerializer, ReferralSerializer, ResponsibleGamingLimitsSerializer,
-    SelfExclusionSerializer
+    SelfExclusionSerializer, NotificationSerializer
 )
 
 User = get_user_model()
@@ -487,11 +489,31 @@ class UserActivityView(generics.ListAPIView):
     """Представление для просмотра активности пользователя"""
     permission_classes = (permissions.IsAuthenticated,)
     serializer_class = UserActivitySerializer
+    pagination_class = KeysetPagination
+    keyset_field = 'created_at'
     
     def get_queryset(self):
         return UserActivity.objects.filter(user=self.request.user).order_by('-created_at')
 
 
+class NotificationListView(generics.ListAPIView):
+    """Представление для истории уведомлений пользователя"""
+    permission_classes = (permissions.IsAuthenticated,)
+    serializer_class = NotificationSerializer
+    pagination_class = KeysetPagination
+    keyset_field = 'created_at'
+    
+    def get_queryset(self):
+        queryset = Notification.objects.filter(user=self.request.user).order_by('-created_at')
+        
+        # Фильтрация по статусу прочтения
+        is_read = self.request.query_params.get('is_read', None)
+        if is_read is not None:
+            queryset = queryset.filter(is_read=is_read.lower() in ('1', 'true'))
+        
+        return queryset
+
+
 class SecureTokenRefreshView(TokenRefreshView):
     """
     Расширенное представление для обновления токенов с улучшенной безопасностью и логированием
@@ -508,7 +530,7 @@ class SecureTokenRefreshView(TokenRefreshView):
                 UserActivity.objects.create(
                     user=user,
                     activity_type='token_refresh_failed',
-                    ip_address=self._get_client_ip(request),
+                    ip_address=get_client_ip(request),
                     user_agent=request.META.get('HTTP_USER_AGENT', ''),
                     details={'error': str(e)}
                 )
@@ -525,21 +547,13 @@ class SecureTokenRefreshView(TokenRefreshView):
             UserActivity.objects.create(
                 user=user,
                 activity_type='token_refresh_success',
-                ip_address=self._get_client_ip(request),
+                ip_address=get_client_ip(request),
                 user_agent=request.META.get('HTTP_USER_AGENT', ''),
                 details={}
             )
         
         return Response(data, status=status.HTTP_200_OK)
     
-    def _get_client_ip(self, request):
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = request.META.get('REMOTE_ADDR')
-        return ip
-    
     def _get_user_from_token(self, token):
         """Безопасно извлекает пользователя из refresh токена"""
         try: